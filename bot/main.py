@@ -7,6 +7,19 @@ from aiogram.enums import ParseMode
 from config.settings import settings
 from handlers import messages, vector_commands, menu_handlers, menu_handlers_ai, yandex_integration, quick_actions, drafts_handlers, email_setup, contacts, fallback_handlers, reminders, auth, web_search_handlers
 from utils.reminder_scheduler import ReminderScheduler
+from utils.openai_client import openai_client
+from database.connection import db
+from database.json_store import flush_all
+from database.storage import close_storage
+from utils.imap_pool import imap_pool
+from utils.smtp_pool import smtp_pool
+from utils.ai_cache import ai_cache
+from utils.embedding_cache import embedding_cache
+from utils.tts_cache import tts_cache
+from utils.caldav_pool import caldav_pool
+from utils.calendar_cache import calendar_cache
+from utils.background_queue import background_queue
+from utils import memory_jobs  # noqa: F401 - регистрирует фоновые задачи памяти
 from middleware.auth_middleware import AuthMiddleware
 
 # Настройка логирования
@@ -27,6 +40,13 @@ async def main():
         settings.validate()
         logger.info("Настройки проверены успешно")
         
+        # Проверяем доступность базы данных
+        if db.enabled:
+            if await db.health_check():
+                logger.info("Подключение к базе данных установлено")
+            else:
+                logger.warning("База данных недоступна, запросы к ней будут завершаться ошибками")
+        
         # Создаем бота и диспетчер
         bot = Bot(
             token=settings.TELEGRAM_BOT_TOKEN,
@@ -60,6 +80,9 @@ async def main():
         await reminder_scheduler.start()
         logger.info("Планировщик напоминаний запущен")
         
+        # Запускаем фоновую очередь (подхватывает задачи, не выполненные до остановки)
+        await background_queue.start()
+        
         # Удаляем webhook и запускаем polling
         await bot.delete_webhook(drop_pending_updates=True)
         logger.info("Бот запущен и готов к работе!")
@@ -69,6 +92,20 @@ async def main():
         finally:
             # Останавливаем планировщик при завершении
             await reminder_scheduler.stop()
+            await background_queue.stop()
+            await openai_client.close()
+            await imap_pool.close()
+            await smtp_pool.close()
+            await flush_all()
+            close_storage()
+            logger.info(f"Кэш AI-переписываний: {ai_cache.get_metrics()}")
+            ai_cache.close()
+            logger.info(f"Кэш embedding: {embedding_cache.get_metrics()}")
+            logger.info(f"Кэш озвучки: {tts_cache.get_metrics()}")
+            tts_cache.close()
+            logger.info(f"Сессии CalDAV: {caldav_pool.get_metrics()}")
+            logger.info(f"Кэш событий календаря: {calendar_cache.get_metrics()}")
+            await db.close()
         
     except Exception as e:
         logger.error(f"Ошибка запуска бота: {e}")
@@ -11,11 +11,65 @@ class Settings:
     # OpenAI
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
     OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
+    OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '60'))
+    OPENAI_AUDIO_TIMEOUT = float(os.getenv('OPENAI_AUDIO_TIMEOUT', '120'))
+    OPENAI_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', '20'))
+    OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', '20'))
     
     # Supabase
     SUPABASE_URL = os.getenv('SUPABASE_URL')
     SUPABASE_KEY = os.getenv('SUPABASE_KEY')
     
+    # Прямое подключение к Postgres (строка подключения Supabase или локальная база)
+    DATABASE_URL = os.getenv('DATABASE_URL')
+    DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '1'))
+    DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+    DB_COMMAND_TIMEOUT = float(os.getenv('DB_COMMAND_TIMEOUT', '10'))
+    # Для pgbouncer в transaction mode подготовленные выражения нужно отключить (0)
+    DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '100'))
+    
+    # Рассылка напоминаний (лимиты Telegram: ~30 сообщений/с всего, 1 сообщение/с в чат)
+    REMINDER_SEND_CONCURRENCY = int(os.getenv('REMINDER_SEND_CONCURRENCY', '10'))
+    TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '25'))
+    TELEGRAM_PER_CHAT_INTERVAL = float(os.getenv('TELEGRAM_PER_CHAT_INTERVAL', '1.0'))
+    
+    # Локальный полнотекстовый индекс писем (SQLite FTS5)
+    EMAIL_INDEX_ENABLED = os.getenv('EMAIL_INDEX_ENABLED', 'true').lower() == 'true'
+    EMAIL_INDEX_PATH = os.getenv('EMAIL_INDEX_PATH', 'data/email_index.db')
+    
+    # Сессии CalDAV по пользователю: клиент пересоздается раз в TTL секунд без поиска календаря
+    CALDAV_SESSION_TTL = float(os.getenv('CALDAV_SESSION_TTL', '1800'))
+    # События календаря хранятся локально; чаще раза в интервал сервер не опрашивается
+    CALENDAR_SYNC_INTERVAL = float(os.getenv('CALENDAR_SYNC_INTERVAL', '60'))
+    
+    # Кэш AI-переписываний (тема письма, правка текста); пустой путь - только память
+    AI_CACHE_ENABLED = os.getenv('AI_CACHE_ENABLED', 'true').lower() == 'true'
+    AI_CACHE_MAX_ENTRIES = int(os.getenv('AI_CACHE_MAX_ENTRIES', '5000'))
+    AI_CACHE_TTL = float(os.getenv('AI_CACHE_TTL', str(7 * 24 * 3600)))
+    AI_CACHE_PATH = os.getenv('AI_CACHE_PATH', 'data/ai_cache.db')
+    
+    # Кэш озвучки: аудио в памяти и на диске, file_id отправленных голосовых
+    TTS_CACHE_ENABLED = os.getenv('TTS_CACHE_ENABLED', 'true').lower() == 'true'
+    TTS_CACHE_MEMORY_MB = int(os.getenv('TTS_CACHE_MEMORY_MB', '32'))
+    TTS_CACHE_DISK_MB = int(os.getenv('TTS_CACHE_DISK_MB', '256'))
+    TTS_CACHE_PATH = os.getenv('TTS_CACHE_PATH', 'data/tts_cache.db')
+    
+    # Кэш векторов embedding и сбор одновременных запросов в один вызов API
+    EMBEDDING_CACHE_ENABLED = os.getenv('EMBEDDING_CACHE_ENABLED', 'true').lower() == 'true'
+    EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', '1000'))
+    EMBEDDING_BATCH_WINDOW_MS = float(os.getenv('EMBEDDING_BATCH_WINDOW_MS', '10'))
+    EMBEDDING_BATCH_MAX = int(os.getenv('EMBEDDING_BATCH_MAX', '64'))
+    
+    # Фоновая очередь работы после ответа (запись в память, извлечение знаний)
+    BACKGROUND_WORKERS = int(os.getenv('BACKGROUND_WORKERS', '2'))
+    BACKGROUND_QUEUE_SIZE = int(os.getenv('BACKGROUND_QUEUE_SIZE', '1000'))
+    BACKGROUND_MAX_ATTEMPTS = int(os.getenv('BACKGROUND_MAX_ATTEMPTS', '5'))
+    BACKGROUND_SPOOL_PATH = os.getenv('BACKGROUND_SPOOL_PATH', 'data/background_jobs.db')
+    
+    # Локальное хранилище: json (файл на пользователя в data/) или sqlite (одна база)
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'json')
+    SQLITE_PATH = os.getenv('SQLITE_PATH', 'data/bot.db')
+    
     # Yandex (опционально)
     YANDEX_CLIENT_ID = os.getenv('YANDEX_CLIENT_ID')
     YANDEX_CLIENT_SECRET = os.getenv('YANDEX_CLIENT_SECRET')
@@ -25,10 +79,24 @@ class Settings:
     
     # Настройки бота
     MAX_MESSAGE_LENGTH = 4000
+    # Потоковый вывод ответа AI правками сообщения (не чаще раза в STREAM_EDIT_INTERVAL секунд)
+    STREAM_RESPONSES = os.getenv('STREAM_RESPONSES', 'true').lower() == 'true'
+    STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', '1.0'))
+    # Бюджет входных токенов промпта; старше PROMPT_RECENT_TURNS ходов - краткое изложение
+    PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', '3000'))
+    PROMPT_RECENT_TURNS = int(os.getenv('PROMPT_RECENT_TURNS', '6'))
+    PROMPT_SUMMARY_BATCH = int(os.getenv('PROMPT_SUMMARY_BATCH', '4'))
+    PROMPT_SUMMARY_MAX_TOKENS = int(os.getenv('PROMPT_SUMMARY_MAX_TOKENS', '300'))
     MAX_HISTORY_MESSAGES = 20
     VOICE_ENABLED = True
+    # Длинные голосовые распознаются частями по VOICE_CHUNK_SECONDS параллельно
+    VOICE_CHUNK_SECONDS = float(os.getenv('VOICE_CHUNK_SECONDS', '30'))
+    VOICE_TRANSCRIBE_CONCURRENCY = int(os.getenv('VOICE_TRANSCRIBE_CONCURRENCY', '4'))
     MEMORY_ENABLED = True
     VECTOR_MEMORY_ENABLED = os.getenv('VECTOR_MEMORY_ENABLED', 'false').lower() == 'true'
+    # Сроки источников контекста векторной памяти, секунды (не успел - нет контекста)
+    CONTEXT_HISTORY_TIMEOUT = float(os.getenv('CONTEXT_HISTORY_TIMEOUT', '2'))
+    CONTEXT_VECTOR_TIMEOUT = float(os.getenv('CONTEXT_VECTOR_TIMEOUT', '1.5'))
     
     # Логирование
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
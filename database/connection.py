@@ -0,0 +1,122 @@
+"""
+Общий асинхронный слой доступа к базе данных Postgres (Supabase)
+
+Один пул соединений asyncpg используется всеми модулями: ReminderDB,
+VectorMemory и SupabaseMemory. asyncpg кэширует подготовленные выражения
+на каждом соединении, поэтому повторяющиеся запросы не разбираются заново.
+"""
+import asyncio
+import json
+import logging
+from typing import Optional, List, Dict, Any
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Database:
+    """Пул соединений asyncpg с ленивой инициализацией и проверкой здоровья"""
+
+    def __init__(self, dsn: Optional[str] = None):
+        self.dsn = dsn or settings.DATABASE_URL
+        self._pool = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def enabled(self) -> bool:
+        """Настроено ли подключение к базе"""
+        return bool(self.dsn)
+
+    @staticmethod
+    async def _init_connection(conn):
+        """Настройка нового соединения пула"""
+        # jsonb приходит и уходит как обычные dict/list
+        await conn.set_type_codec(
+            'jsonb',
+            encoder=json.dumps,
+            decoder=json.loads,
+            schema='pg_catalog'
+        )
+
+    async def get_pool(self):
+        """Получить пул соединений, создав его при первом обращении"""
+        if self._pool is not None:
+            return self._pool
+
+        if not self.enabled:
+            raise ValueError("DATABASE_URL не настроен")
+
+        # Пул создается внутри работающего event loop, поэтому лениво
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            if self._pool is None:
+                import asyncpg
+                self._pool = await asyncpg.create_pool(
+                    dsn=self.dsn,
+                    min_size=settings.DB_POOL_MIN_SIZE,
+                    max_size=settings.DB_POOL_MAX_SIZE,
+                    command_timeout=settings.DB_COMMAND_TIMEOUT,
+                    statement_cache_size=settings.DB_STATEMENT_CACHE_SIZE,
+                    max_inactive_connection_lifetime=300,
+                    init=self._init_connection
+                )
+                logger.info("Пул соединений с базой данных создан")
+
+        return self._pool
+
+    async def fetch(self, query: str, *args) -> List[Dict[str, Any]]:
+        """Выполнить запрос и вернуть все строки"""
+        pool = await self.get_pool()
+        rows = await pool.fetch(query, *args)
+        return [dict(row) for row in rows]
+
+    async def fetchrow(self, query: str, *args) -> Optional[Dict[str, Any]]:
+        """Выполнить запрос и вернуть первую строку"""
+        pool = await self.get_pool()
+        row = await pool.fetchrow(query, *args)
+        return dict(row) if row else None
+
+    async def fetchval(self, query: str, *args) -> Any:
+        """Выполнить запрос и вернуть одно значение"""
+        pool = await self.get_pool()
+        return await pool.fetchval(query, *args)
+
+    async def execute(self, query: str, *args) -> str:
+        """Выполнить запрос без результата, вернуть статус команды"""
+        pool = await self.get_pool()
+        return await pool.execute(query, *args)
+
+    async def executemany(self, query: str, args: List[tuple]) -> None:
+        """Выполнить один запрос для набора параметров"""
+        pool = await self.get_pool()
+        await pool.executemany(query, args)
+
+    async def health_check(self) -> bool:
+        """Проверить доступность базы данных"""
+        if not self.enabled:
+            return False
+
+        try:
+            return await self.fetchval("SELECT 1") == 1
+        except Exception as e:
+            logger.error(f"Проверка базы данных не прошла: {e}")
+            return False
+
+    async def close(self):
+        """Закрыть пул соединений"""
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+            logger.info("Пул соединений с базой данных закрыт")
+
+
+def vector_to_pg(embedding: Optional[List[float]]) -> Optional[str]:
+    """Преобразовать embedding в текстовый литерал pgvector"""
+    if embedding is None:
+        return None
+    return '[' + ','.join(str(x) for x in embedding) + ']'
+
+
+db = Database()
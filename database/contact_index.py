@@ -0,0 +1,210 @@
+"""
+Индекс контактов пользователя в памяти
+
+Строится один раз из документа контактов и пересобирается, только когда
+документ заменен (после добавления, изменения или удаления контакта).
+Поиск идет по словарям и спискам вхождений, а не перебором всех контактов:
+
+- полное имя и email -> контакт (точное совпадение);
+- основа каждого слова имени -> контакты ("Леониду" находит "Леонид");
+- тег -> контакты;
+- триграммы основ -> основы (нечеткий поиск с опечатками);
+- триграммы всех полей -> контакты (поиск подстроки, как раньше).
+
+Индекс хранит исходные словари контактов и не отдает их наружу: результаты
+превращает в новые объекты Contact вызывающий код.
+"""
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from utils.russian_names import name_stem
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Оценки совпадений (как в прежнем ContactFinder: > 0.8 - уверенное совпадение)
+SCORE_EXACT = 1.0
+SCORE_ALL_WORDS = 0.95
+SCORE_SUBSET_WORDS = 0.85
+SCORE_SUBSTRING = 0.8
+SCORE_COMPANY = 0.6
+# Опечатка: от 0.4 при минимальной похожести до 0.8 (никогда не "уверенное")
+SCORE_FUZZY_MIN = 0.4
+SCORE_FUZZY_MAX = 0.8
+FUZZY_THRESHOLD = 0.3
+
+_SEARCH_FIELDS = ('name', 'email', 'phone', 'company', 'telegram')
+
+
+def normalize(text: str) -> str:
+    """Нижний регистр, ё -> е, без лишних пробелов"""
+    return ' '.join((text or '').lower().replace('ё', 'е').split())
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class ContactIndex:
+    """Индекс контактов одного пользователя"""
+
+    def __init__(self, contacts: List[Dict], source: object = None):
+        """
+        Args:
+            contacts: Словари контактов (Contact.to_dict)
+            source: Документ, из которого построен индекс (для проверки актуальности)
+        """
+        self.source = source
+        self.contacts = sorted(contacts, key=lambda c: (c.get('name') or '').lower())
+        self.by_id: Dict[str, int] = {}
+        self.names: Dict[str, Set[int]] = {}
+        self.emails: Dict[str, Set[int]] = {}
+        self.tags: Dict[str, Set[int]] = {}
+        self.stems: Dict[str, Set[int]] = {}
+        self.stem_trigrams: Dict[str, Set[str]] = {}
+        self.text_trigrams: Dict[str, Set[int]] = {}
+        self._name_stems: List[Set[str]] = []
+        self._texts: List[str] = []
+
+        for position, contact in enumerate(self.contacts):
+            self._add(position, contact)
+
+    def _add(self, position: int, contact: Dict):
+        if contact.get('id'):
+            self.by_id[contact['id']] = position
+
+        name = normalize(contact.get('name'))
+        self.names.setdefault(name, set()).add(position)
+
+        email = normalize(contact.get('email'))
+        if email:
+            self.emails.setdefault(email, set()).add(position)
+
+        for tag in contact.get('tags') or []:
+            self.tags.setdefault(normalize(tag), set()).add(position)
+
+        stems = {name_stem(word) for word in _WORD_RE.findall(name)}
+        self._name_stems.append(stems)
+        for stem in stems:
+            self.stems.setdefault(stem, set()).add(position)
+            for trigram in trigrams(f" {stem} "):
+                self.stem_trigrams.setdefault(trigram, set()).add(stem)
+
+        # Поля разделены символом, которого нет в запросах, чтобы подстрока не склеивала поля
+        text = '\x00'.join(
+            [normalize(contact.get(field)) for field in _SEARCH_FIELDS] +
+            [normalize(tag) for tag in contact.get('tags') or []]
+        )
+        self._texts.append(text)
+        for trigram in trigrams(text):
+            self.text_trigrams.setdefault(trigram, set()).add(position)
+
+    def __len__(self) -> int:
+        return len(self.contacts)
+
+    def get(self, contact_id: str) -> Optional[Dict]:
+        position = self.by_id.get(contact_id)
+        return None if position is None else self.contacts[position]
+
+    def names_list(self, limit: Optional[int] = None) -> List[str]:
+        """Имена контактов по алфавиту"""
+        contacts = self.contacts if limit is None else self.contacts[:limit]
+        return [c.get('name', '') for c in contacts]
+
+    def by_tag(self, tag: str) -> List[Dict]:
+        return self._ordered(self.tags.get(normalize(tag), ()))
+
+    def search(self, query: str) -> List[Dict]:
+        """Контакты, в полях или тегах которых есть подстрока query"""
+        return self._ordered(self._substring_positions(normalize(query)))
+
+    def resolve(self, query: str, limit: int = 5) -> List[Tuple[Dict, float, str]]:
+        """Контакты, подходящие под имя или адрес, по убыванию оценки
+
+        Returns:
+            [(контакт, оценка 0..1, тип совпадения 'name'|'email'|'company')]
+        """
+        query_norm = normalize(query)
+        if not query_norm:
+            return []
+
+        scores: Dict[int, Tuple[float, str]] = {}
+
+        def score(positions: Iterable[int], value: float, match_type: str):
+            for position in positions:
+                if value > scores.get(position, (0.0, ''))[0]:
+                    scores[position] = (value, match_type)
+
+        score(self.names.get(query_norm, ()), SCORE_EXACT, 'name')
+        score(self.emails.get(query_norm, ()), SCORE_EXACT, 'email')
+
+        # Слова имени с учетом падежа
+        query_stems = {name_stem(word) for word in _WORD_RE.findall(query_norm)}
+        candidates: Set[int] = set()
+        for stem in query_stems:
+            candidates |= self.stems.get(stem, set())
+        for position in candidates:
+            contact_stems = self._name_stems[position]
+            common = len(query_stems & contact_stems)
+            if common == len(query_stems):
+                value = SCORE_ALL_WORDS if common == len(contact_stems) else SCORE_SUBSET_WORDS
+            else:
+                value = common / len(query_stems | contact_stems)
+            score((position,), value, 'name')
+
+        # Опечатки: похожие основы по триграммам
+        for stem in query_stems:
+            for similar, similarity in self._similar_stems(stem):
+                value = SCORE_FUZZY_MIN + (SCORE_FUZZY_MAX - SCORE_FUZZY_MIN) * similarity
+                score(self.stems.get(similar, ()), value, 'name')
+
+        # Подстрока в имени, адресе или компании (как раньше)
+        for position in self._substring_positions(query_norm):
+            contact = self.contacts[position]
+            if query_norm in normalize(contact.get('name')):
+                score((position,), SCORE_SUBSTRING, 'name')
+            elif query_norm in normalize(contact.get('email')):
+                score((position,), SCORE_SUBSTRING, 'email')
+            elif query_norm in normalize(contact.get('company')):
+                score((position,), SCORE_COMPANY, 'company')
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1][0], item[0]))
+        return [(self.contacts[position], value, match_type)
+                for position, (value, match_type) in ranked[:limit]]
+
+    def _similar_stems(self, stem: str) -> List[Tuple[str, float]]:
+        """Основы из индекса с похожестью триграмм не ниже FUZZY_THRESHOLD"""
+        if len(stem) < 3:
+            return []
+        query_trigrams = trigrams(f" {stem} ")
+        shared: Dict[str, int] = {}
+        for trigram in query_trigrams:
+            for candidate in self.stem_trigrams.get(trigram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+
+        similar = []
+        for candidate, count in shared.items():
+            similarity = count / (len(query_trigrams) + len(trigrams(f" {candidate} ")) - count)
+            if similarity >= FUZZY_THRESHOLD and candidate != stem:
+                similar.append((candidate, similarity))
+        return similar
+
+    def _substring_positions(self, query: str) -> Set[int]:
+        """Контакты с подстрокой query; кандидаты берутся из индекса триграмм"""
+        if not query:
+            return set(range(len(self.contacts)))
+        if len(query) < 3:
+            # Короткий запрос не разбивается на триграммы - проверяем все поля
+            return {position for position, text in enumerate(self._texts) if query in text}
+
+        candidates: Optional[Set[int]] = None
+        for trigram in trigrams(query):
+            positions = self.text_trigrams.get(trigram)
+            if not positions:
+                return set()
+            candidates = set(positions) if candidates is None else candidates & positions
+            if not candidates:
+                return set()
+        return {position for position in candidates if query in self._texts[position]}
+
+    def _ordered(self, positions: Iterable[int]) -> List[Dict]:
+        return [self.contacts[position] for position in sorted(positions)]
@@ -1,8 +1,9 @@
-import json
-import os
-from typing import Dict, List, Optional
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 import uuid
+from database.contact_index import ContactIndex
+from database.storage import create_document_store
 
 class Contact:
     """Класс для представления контакта"""
@@ -48,7 +49,7 @@ class Contact:
             company=data.get('company', ''),
             position=data.get('position', ''),
             notes=data.get('notes', ''),
-            tags=data.get('tags', []),
+            tags=list(data.get('tags', [])),
             created_at=data.get('created_at', datetime.now().isoformat()),
             updated_at=data.get('updated_at', datetime.now().isoformat())
         )
@@ -85,22 +86,33 @@ class ContactsManager:
     
     def __init__(self):
         self.storage_dir = "data/contacts"
-        os.makedirs(self.storage_dir, exist_ok=True)
+        self.store = create_document_store("contacts", self.storage_dir, "user_{user_id}_contacts.json", lambda: {'contacts': []})
+        # Индексы для поиска; индекс устаревает, когда хранилище получает новый документ
+        self._indexes: "OrderedDict[int, ContactIndex]" = OrderedDict()
+        self.max_indexes = 1000
+    
+    async def _index(self, user_id: int) -> ContactIndex:
+        """Индекс контактов пользователя (пересобирается после изменений)"""
+        await self.store.preload(user_id)
+        data = self.store.view(user_id)
+        index = self._indexes.get(user_id)
+        if index is None or index.source is not data:
+            index = ContactIndex(data.get('contacts', []), source=data)
+            self._indexes[user_id] = index
+            if len(self._indexes) > self.max_indexes:
+                self._indexes.popitem(last=False)
+        self._indexes.move_to_end(user_id)
+        return index
     
     def _get_user_file(self, user_id: int) -> str:
         """Получить путь к файлу контактов пользователя"""
-        return os.path.join(self.storage_dir, f"user_{user_id}_contacts.json")
+        return self.store.path(user_id)
     
     async def get_all_contacts(self, user_id: int) -> List[Contact]:
         """Получить все контакты пользователя"""
-        user_file = self._get_user_file(user_id)
-        
-        if not os.path.exists(user_file):
-            return []
-        
         try:
-            with open(user_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            await self.store.preload(user_id)
+            data = self.store.view(user_id)
             
             contacts = []
             for contact_data in data.get('contacts', []):
@@ -114,15 +126,16 @@ class ContactsManager:
     async def add_contact(self, user_id: int, contact: Contact) -> bool:
         """Добавить новый контакт"""
         try:
-            contacts = await self.get_all_contacts(user_id)
-            
-            # Проверяем, нет ли уже контакта с таким именем
-            existing = next((c for c in contacts if c.name.lower() == contact.name.lower()), None)
-            if existing:
-                return False  # Контакт уже существует
-            
-            contacts.append(contact)
-            return await self._save_contacts(user_id, contacts)
+            async with self.store.lock(user_id):
+                contacts = await self.get_all_contacts(user_id)
+                
+                # Проверяем, нет ли уже контакта с таким именем
+                existing = next((c for c in contacts if c.name.lower() == contact.name.lower()), None)
+                if existing:
+                    return False  # Контакт уже существует
+                
+                contacts.append(contact)
+                return await self._save_contacts(user_id, contacts)
         except Exception as e:
             print(f"Ошибка добавления контакта: {e}")
             return False
@@ -130,16 +143,17 @@ class ContactsManager:
     async def update_contact(self, user_id: int, contact: Contact) -> bool:
         """Обновить существующий контакт"""
         try:
-            contacts = await self.get_all_contacts(user_id)
-            
-            # Найти контакт по ID
-            for i, existing_contact in enumerate(contacts):
-                if existing_contact.id == contact.id:
-                    contact.updated_at = datetime.now().isoformat()
-                    contacts[i] = contact
-                    return await self._save_contacts(user_id, contacts)
-            
-            return False  # Контакт не найден
+            async with self.store.lock(user_id):
+                contacts = await self.get_all_contacts(user_id)
+                
+                # Найти контакт по ID
+                for i, existing_contact in enumerate(contacts):
+                    if existing_contact.id == contact.id:
+                        contact.updated_at = datetime.now().isoformat()
+                        contacts[i] = contact
+                        return await self._save_contacts(user_id, contacts)
+                
+                return False  # Контакт не найден
         except Exception as e:
             print(f"Ошибка обновления контакта: {e}")
             return False
@@ -147,46 +161,56 @@ class ContactsManager:
     async def delete_contact(self, user_id: int, contact_id: str) -> bool:
         """Удалить контакт"""
         try:
-            contacts = await self.get_all_contacts(user_id)
-            original_count = len(contacts)
-            
-            contacts = [c for c in contacts if c.id != contact_id]
-            
-            if len(contacts) < original_count:
-                return await self._save_contacts(user_id, contacts)
-            
-            return False  # Контакт не найден
+            async with self.store.lock(user_id):
+                contacts = await self.get_all_contacts(user_id)
+                original_count = len(contacts)
+                
+                contacts = [c for c in contacts if c.id != contact_id]
+                
+                if len(contacts) < original_count:
+                    return await self._save_contacts(user_id, contacts)
+                
+                return False  # Контакт не найден
         except Exception as e:
             print(f"Ошибка удаления контакта: {e}")
             return False
     
     async def find_contact(self, user_id: int, contact_id: str) -> Optional[Contact]:
         """Найти контакт по ID"""
-        contacts = await self.get_all_contacts(user_id)
-        return next((c for c in contacts if c.id == contact_id), None)
+        data = (await self._index(user_id)).get(contact_id)
+        return Contact.from_dict(data) if data else None
     
     async def search_contacts(self, user_id: int, query: str) -> List[Contact]:
-        """Поиск контактов по запросу"""
-        contacts = await self.get_all_contacts(user_id)
-        query_lower = query.lower()
-        
-        results = []
-        for contact in contacts:
-            # Поиск по имени, email, телефону, компании, тегам
-            if (query_lower in contact.name.lower() or
-                query_lower in contact.email.lower() or
-                query_lower in contact.phone.lower() or
-                query_lower in contact.company.lower() or
-                query_lower in contact.telegram.lower() or
-                any(query_lower in tag.lower() for tag in contact.tags)):
-                results.append(contact)
-        
-        return results
+        """Поиск контактов по запросу (подстрока в имени, email, телефоне, компании, тегах)"""
+        return [Contact.from_dict(data) for data in (await self._index(user_id)).search(query)]
     
     async def get_contacts_by_tag(self, user_id: int, tag: str) -> List[Contact]:
         """Получить контакты по тегу"""
-        contacts = await self.get_all_contacts(user_id)
-        return [c for c in contacts if tag.lower() in [t.lower() for t in c.tags]]
+        return [Contact.from_dict(data) for data in (await self._index(user_id)).by_tag(tag)]
+    
+    async def resolve_name(self, user_id: int, query: str, limit: int = 5) -> List[Tuple[Contact, float, str]]:
+        """Контакты по имени (с учетом падежа и опечаток) или адресу, лучшие первыми
+        
+        Returns:
+            [(контакт, оценка 0..1, тип совпадения 'name'|'email'|'company')]
+        """
+        return [
+            (Contact.from_dict(data), score, match_type)
+            for data, score, match_type in (await self._index(user_id)).resolve(query, limit)
+        ]
+    
+    async def find_email_by_name(self, user_id: int, name: str, min_score: float = 0.8) -> Optional[str]:
+        """Email лучшего уверенного совпадения по имени"""
+        for data, score, _ in (await self._index(user_id)).resolve(name, limit=5):
+            if score < min_score:
+                break
+            if data.get('email'):
+                return data['email']
+        return None
+    
+    async def get_contact_names(self, user_id: int, limit: Optional[int] = None) -> List[str]:
+        """Имена контактов по алфавиту"""
+        return (await self._index(user_id)).names_list(limit)
     
     async def get_stats(self, user_id: int) -> Dict:
         """Получить статистику контактов"""
@@ -215,19 +239,15 @@ class ContactsManager:
         }
     
     async def _save_contacts(self, user_id: int, contacts: List[Contact]) -> bool:
-        """Сохранить контакты в файл"""
+        """Сохранить контакты (запись на диск выполняет хранилище)"""
         try:
-            user_file = self._get_user_file(user_id)
-            
             data = {
                 'user_id': user_id,
                 'updated_at': datetime.now().isoformat(),
                 'contacts': [contact.to_dict() for contact in contacts]
             }
             
-            with open(user_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            
+            self.store.put(user_id, data)
             return True
         except Exception as e:
             print(f"Ошибка сохранения контактов: {e}")
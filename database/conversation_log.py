@@ -0,0 +1,227 @@
+"""
+Журнал переписки пользователя в формате JSONL (одна запись - одна строка)
+
+Новое сообщение дописывается в конец файла, поэтому сохранение не зависит от
+длины истории. Последние сообщения читаются с конца файла блоками, пока не
+наберется нужное количество строк. Когда в журнале накапливается больше
+compact_after записей, он переписывается атомарно (временный файл + os.replace)
+и в нем остаются только последние keep записей.
+
+Строка, оборванная при падении процесса, при чтении пропускается, а следующая
+запись начинается с новой строки.
+
+Асинхронный код пользуется методами *_async: файловые операции (включая fsync
+при сжатии) выполняются по очереди в отдельном потоке журнала, не блокируя
+event loop.
+"""
+import asyncio
+import json
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_BLOCK_SIZE = 4096
+
+
+class ConversationLog:
+    """Журналы переписки пользователей с чтением с конца и сжатием"""
+
+    def __init__(self, directory: str, keep: int, compact_after: Optional[int] = None):
+        """
+        Args:
+            directory: Каталог с журналами
+            keep: Сколько последних записей оставлять при сжатии
+            compact_after: После скольких записей сжимать журнал (по умолчанию 2 * keep)
+        """
+        self.directory = directory
+        self.keep = keep
+        self.compact_after = compact_after or keep * 2
+        # Число строк в журнале пользователя (считается при первом обращении)
+        self._counts: Dict[int, int] = {}
+        # Пользователи, для которых старая история уже перенесена (или ее не было)
+        self._migrated: set = set()
+        # Один поток: операции с журналами выполняются по очереди
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='conversation_log')
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, user_id: int) -> str:
+        """Путь к журналу пользователя"""
+        return os.path.join(self.directory, f"user_{user_id}.jsonl")
+
+    def _legacy_path(self, user_id: int) -> str:
+        """Путь к истории в старом формате (JSON-массив)"""
+        return os.path.join(self.directory, f"user_{user_id}.json")
+
+    def append(self, user_id: int, record: Dict):
+        """Дописать запись в конец журнала"""
+        path = self.path(user_id)
+        self._migrate_legacy(user_id)
+        count = self._count(user_id)
+
+        line = json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n'
+        with open(path, 'ab+') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    # Предыдущая запись оборвана - начинаем с новой строки
+                    line = b'\n' + line
+            f.write(line)
+
+        self._counts[user_id] = count + 1
+        if self._counts[user_id] > self.compact_after:
+            self.compact(user_id)
+
+    def tail(self, user_id: int, limit: int) -> List[Dict]:
+        """Последние limit записей (в хронологическом порядке)"""
+        self._migrate_legacy(user_id)
+        path = self.path(user_id)
+        if limit <= 0 or not os.path.exists(path):
+            return []
+
+        records = []
+        for line in reversed(self._read_tail_lines(path, limit)):
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue  # Оборванная строка
+            if len(records) == limit:
+                break
+        records.reverse()
+        return records
+
+    def compact(self, user_id: int):
+        """Оставить в журнале только последние keep записей"""
+        path = self.path(user_id)
+        if not os.path.exists(path):
+            return
+
+        lines = self._read_tail_lines(path, self.keep)
+        records = []
+        for line in lines:
+            try:
+                json.loads(line)
+            except ValueError:
+                continue
+            records.append(line)
+        records = records[-self.keep:]
+
+        self._write_atomic(path, b''.join(line + b'\n' for line in records))
+        self._counts[user_id] = len(records)
+
+    def clear(self, user_id: int):
+        """Удалить журнал пользователя"""
+        for path in (self.path(user_id), self._legacy_path(user_id)):
+            if os.path.exists(path):
+                os.remove(path)
+        self._counts.pop(user_id, None)
+
+    async def append_async(self, user_id: int, record: Dict):
+        """append в потоке журнала"""
+        await self._run(self.append, user_id, record)
+
+    async def tail_async(self, user_id: int, limit: int) -> List[Dict]:
+        """tail в потоке журнала"""
+        return await self._run(self.tail, user_id, limit)
+
+    async def clear_async(self, user_id: int):
+        """clear в потоке журнала"""
+        await self._run(self.clear, user_id)
+
+    async def _run(self, operation: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, operation, *args)
+
+    def remove_older_than(self, cutoff: float) -> List[int]:
+        """Удалить журналы, не менявшиеся с cutoff (timestamp); вернуть ID пользователей"""
+        removed = []
+        for file_name in os.listdir(self.directory):
+            if not (file_name.startswith('user_') and file_name.endswith(('.json', '.jsonl'))):
+                continue
+            file_path = os.path.join(self.directory, file_name)
+            if os.path.getmtime(file_path) >= cutoff:
+                continue
+
+            os.remove(file_path)
+            logger.info(f"Удален старый файл: {file_name}")
+            user_id = file_name[len('user_'):].split('.')[0]
+            if user_id.isdigit():
+                self._counts.pop(int(user_id), None)
+                removed.append(int(user_id))
+        return removed
+
+    def _count(self, user_id: int) -> int:
+        """Число строк в журнале"""
+        count = self._counts.get(user_id)
+        if count is None:
+            count = 0
+            path = self.path(user_id)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    for block in iter(lambda: f.read(64 * 1024), b''):
+                        count += block.count(b'\n')
+            self._counts[user_id] = count
+        return count
+
+    @staticmethod
+    def _read_tail_lines(path: str, limit: int) -> List[bytes]:
+        """Не меньше limit последних непустых строк файла (с запасом на оборванные)"""
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            data = b''
+            # Читаем блоки с конца, пока не наберется limit + 1 переводов строки:
+            # первая строка прочитанного куска может быть неполной
+            while position > 0 and data.count(b'\n') <= limit:
+                size = min(_BLOCK_SIZE, position)
+                position -= size
+                f.seek(position)
+                data = f.read(size) + data
+
+        lines = data.split(b'\n')
+        if position > 0:
+            lines = lines[1:]  # Начало первой строки осталось в непрочитанной части
+        return [line for line in lines if line.strip()]
+
+    def _write_atomic(self, path: str, data: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp_', suffix='.jsonl')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _migrate_legacy(self, user_id: int):
+        """Перенести историю из старого user_{id}.json в журнал"""
+        if user_id in self._migrated:
+            return
+        legacy_path = self._legacy_path(user_id)
+        if not os.path.exists(legacy_path):
+            self._migrated.add(user_id)
+            return
+
+        try:
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                history = json.load(f)
+        except Exception as e:
+            logger.error(f"Не удалось прочитать старую историю {legacy_path}: {e}")
+            history = []
+
+        if isinstance(history, list) and history and not os.path.exists(self.path(user_id)):
+            data = b''.join(
+                json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n'
+                for record in history[-self.keep:]
+            )
+            self._write_atomic(self.path(user_id), data)
+            self._counts.pop(user_id, None)
+
+        os.remove(legacy_path)
+        self._migrated.add(user_id)
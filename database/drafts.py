@@ -1,20 +1,18 @@
-import json
-import os
 from datetime import datetime
 from typing import List, Dict, Optional
 from config.settings import settings
+from database.storage import create_document_store
 
 class DraftsManager:
     """Менеджер черновиков писем"""
     
     def __init__(self):
         self.drafts_dir = "data/drafts"
-        if not os.path.exists(self.drafts_dir):
-            os.makedirs(self.drafts_dir, exist_ok=True)
+        self.store = create_document_store("drafts", self.drafts_dir, "drafts_{user_id}.json", list)
     
     def _get_user_drafts_file(self, user_id: int) -> str:
         """Получить путь к файлу черновиков пользователя"""
-        return os.path.join(self.drafts_dir, f"drafts_{user_id}.json")
+        return self.store.path(user_id)
     
     def create_draft(self, user_id: int, draft_data: Dict) -> str:
         """Создать новый черновик"""
@@ -38,9 +36,7 @@ class DraftsManager:
             drafts.append(draft)
             
             # Сохраняем
-            file_path = self._get_user_drafts_file(user_id)
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(drafts, f, ensure_ascii=False, indent=2)
+            self.store.put(user_id, drafts)
             
             return draft_id
             
@@ -63,13 +59,7 @@ class DraftsManager:
     def get_all_drafts(self, user_id: int) -> List[Dict]:
         """Получить все черновики пользователя"""
         try:
-            file_path = self._get_user_drafts_file(user_id)
-            
-            if not os.path.exists(file_path):
-                return []
-            
-            with open(file_path, 'r', encoding='utf-8') as f:
-                drafts = json.load(f)
+            drafts = self.store.get(user_id)
             
             # Сортируем по дате обновления (новые первые)
             drafts.sort(key=lambda x: x.get('updated_at', ''), reverse=True)
@@ -93,9 +83,7 @@ class DraftsManager:
                     drafts[i] = draft
                     
                     # Сохраняем
-                    file_path = self._get_user_drafts_file(user_id)
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        json.dump(drafts, f, ensure_ascii=False, indent=2)
+                    self.store.put(user_id, drafts)
                     
                     return True
             
@@ -115,9 +103,7 @@ class DraftsManager:
             
             if len(new_drafts) < len(drafts):
                 # Сохраняем без удаленного
-                file_path = self._get_user_drafts_file(user_id)
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(new_drafts, f, ensure_ascii=False, indent=2)
+                self.store.put(user_id, new_drafts)
                 return True
             
             return False
@@ -167,9 +153,7 @@ class DraftsManager:
             
             # Сохраняем только новые
             if len(new_drafts) < len(drafts):
-                file_path = self._get_user_drafts_file(user_id)
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(new_drafts, f, ensure_ascii=False, indent=2)
+                self.store.put(user_id, new_drafts)
             
             return len(drafts) - len(new_drafts)
             
@@ -0,0 +1,311 @@
+"""
+Общее хранилище JSON-документов пользователей с отложенной записью
+
+Каждый менеджер (память, контакты, токены, настройки, черновики) хранит один
+JSON-документ на пользователя. Хранилище держит документы в памяти, а на диск
+пишет отложенно: все изменения документа за flush_delay секунд сливаются в одну
+запись. Запись атомарная - во временный файл рядом и os.replace, поэтому
+падение посреди записи не портит файл.
+
+Для последовательностей "прочитать - изменить - сохранить" в асинхронном коде
+есть отдельная блокировка на пользователя (lock/update). Синхронные менеджеры
+в ней не нуждаются: без await внутри их код не прерывается другими задачами.
+
+Асинхронный код перед view/get/exists вызывает preload: документ, которого
+еще нет в памяти, читается в потоке записи, а не в event loop.
+
+Если event loop не запущен (скрипты, тесты), put пишет файл сразу.
+"""
+import asyncio
+import atexit
+import copy
+import json
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_stores: List["JsonDocumentStore"] = []
+
+
+class JsonDocumentStore:
+    """Документы пользователей в памяти с отложенной атомарной записью на диск"""
+
+    def __init__(self, directory: str, filename: str, default: Callable[[], Any],
+                 flush_delay: float = 1.0, max_cached: int = 1000):
+        """
+        Args:
+            directory: Каталог с файлами
+            filename: Шаблон имени файла, например "user_{user_id}.json"
+            default: Фабрика пустого документа
+            flush_delay: Задержка перед записью, за которую изменения сливаются
+            max_cached: Сколько документов держать в памяти (лишние чистые вытесняются)
+        """
+        self.directory = directory
+        self.filename = filename
+        self.default = default
+        self.flush_delay = flush_delay
+        self.max_cached = max_cached
+
+        self._docs: "OrderedDict[int, Any]" = OrderedDict()
+        self._dirty: set = set()
+        self._deleted: set = set()
+        # Документы, снимки которых сняты, но еще не записаны (user_id -> число снимков);
+        # их нельзя вытеснять, иначе повторное чтение вернет старый файл
+        self._writing: Dict[int, int] = {}
+        # Пользователи, для которых preload не нашел сохраненного документа
+        self._absent: set = set()
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._write_lock: Optional[asyncio.Lock] = None
+        self._pending: set = set()
+        # Пул потоков для записи (None - пул event loop по умолчанию)
+        self._executor = None
+
+        os.makedirs(directory, exist_ok=True)
+        _stores.append(self)
+
+    def path(self, user_id: int) -> str:
+        """Путь к файлу документа"""
+        return os.path.join(self.directory, self.filename.format(user_id=user_id))
+
+    def exists(self, user_id: int) -> bool:
+        """Есть ли сохраненный документ пользователя"""
+        if user_id in self._docs:
+            return True
+        if user_id in self._deleted or user_id in self._absent:
+            return False
+        return self._stored_exists(user_id)
+
+    async def preload(self, user_id: int):
+        """Прочитать документ в потоке записи, чтобы view/get/exists не читали в event loop"""
+        if user_id in self._docs or user_id in self._deleted or user_id in self._absent:
+            return
+        try:
+            document = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._read_stored, user_id
+            )
+        except Exception as e:
+            logger.error(f"Ошибка чтения {self.path(user_id)}: {e}")
+            return
+        # Пока шло чтение, документ могли изменить или удалить
+        if user_id in self._docs or user_id in self._deleted:
+            return
+        if document is None:
+            if len(self._absent) >= self.max_cached:
+                self._absent.clear()
+            self._absent.add(user_id)
+            return
+        self._docs[user_id] = document
+        self._evict()
+
+    def get(self, user_id: int) -> Any:
+        """Копия документа (как если бы он был прочитан из файла)"""
+        return copy.deepcopy(self._load(user_id))
+
+    def view(self, user_id: int) -> Any:
+        """Документ без копирования - только для чтения"""
+        return self._load(user_id)
+
+    def put(self, user_id: int, document: Any):
+        """Заменить документ и запланировать запись; документ переходит во владение хранилища"""
+        self._docs[user_id] = document
+        self._docs.move_to_end(user_id)
+        self._dirty.add(user_id)
+        self._deleted.discard(user_id)
+        self._absent.discard(user_id)
+        self._schedule_flush()
+
+    def delete(self, user_id: int):
+        """Удалить документ и его файл"""
+        self._docs.pop(user_id, None)
+        self._dirty.discard(user_id)
+        self._deleted.add(user_id)
+        self._schedule_flush()
+
+    def discard(self, user_id: int):
+        """Забыть документ в памяти без записи (файл удален или изменен снаружи)"""
+        self._docs.pop(user_id, None)
+        self._dirty.discard(user_id)
+        self._absent.discard(user_id)
+
+    def lock(self, user_id: int) -> asyncio.Lock:
+        """Блокировка пользователя для последовательностей с await"""
+        lock = self._locks.get(user_id)
+        if lock is None:
+            lock = self._locks[user_id] = asyncio.Lock()
+        return lock
+
+    async def update(self, user_id: int, mutate: Callable[[Any], Any]) -> Any:
+        """Изменить документ под блокировкой пользователя
+
+        mutate получает копию документа и меняет ее на месте; результат mutate
+        возвращается. Если mutate вернул False, документ не сохраняется.
+        """
+        async with self.lock(user_id):
+            await self.preload(user_id)
+            document = self.get(user_id)
+            result = mutate(document)
+            if result is not False:
+                self.put(user_id, document)
+            return result
+
+    def _load(self, user_id: int) -> Any:
+        """Документ из памяти или с диска"""
+        if user_id in self._docs:
+            self._docs.move_to_end(user_id)
+            return self._docs[user_id]
+
+        document = None
+        if user_id not in self._deleted and user_id not in self._absent:
+            try:
+                document = self._read_stored(user_id)
+            except Exception as e:
+                logger.error(f"Ошибка чтения {self.path(user_id)}: {e}")
+
+        if document is None:
+            document = self.default()
+
+        self._docs[user_id] = document
+        self._evict()
+        return document
+
+    def _stored_exists(self, user_id: int) -> bool:
+        """Есть ли документ на диске"""
+        return os.path.exists(self.path(user_id))
+
+    def _read_stored(self, user_id: int) -> Any:
+        """Прочитать документ с диска (None - документа нет)"""
+        path = self.path(user_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _evict(self):
+        """Вытеснить самые давние чистые и уже записанные документы сверх max_cached"""
+        excess = len(self._docs) - self.max_cached
+        if excess <= 0:
+            return
+        for user_id in list(self._docs):
+            if excess <= 0:
+                break
+            if user_id not in self._dirty and user_id not in self._writing:
+                del self._docs[user_id]
+                excess -= 1
+
+    def _schedule_flush(self):
+        """Запланировать запись; без event loop записать сразу"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.flush_delay, self._start_flush, loop)
+
+    def _take_snapshots(self) -> Dict[int, Optional[bytes]]:
+        """Сериализовать изменения (в потоке event loop, пока документы не меняются)"""
+        snapshots: Dict[int, Optional[bytes]] = {user_id: None for user_id in self._deleted}
+        for user_id in self._dirty:
+            snapshots[user_id] = json.dumps(
+                self._docs[user_id], ensure_ascii=False, separators=(',', ':')
+            ).encode('utf-8')
+            self._writing[user_id] = self._writing.get(user_id, 0) + 1
+        # Удаленные остаются в _deleted до фактического удаления файла (см. _written)
+        self._dirty.clear()
+        return snapshots
+
+    def _written(self, snapshots: Dict[int, Optional[bytes]]):
+        """Отметить удаления и записи как выполненные; записанные документы можно вытеснять"""
+        for user_id, data in snapshots.items():
+            if data is None:
+                self._deleted.discard(user_id)
+            elif self._writing.get(user_id, 0) > 1:
+                self._writing[user_id] -= 1
+            else:
+                self._writing.pop(user_id, None)
+        self._evict()
+
+    def _start_flush(self, loop: asyncio.AbstractEventLoop):
+        self._flush_handle = None
+        snapshots = self._take_snapshots()
+        if snapshots:
+            task = loop.create_task(self._write_async(snapshots))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def _write_async(self, snapshots: Dict[int, Optional[bytes]]):
+        # Записи идут строго по очереди, чтобы старый снимок не перезаписал новый
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        async with self._write_lock:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._write_files, snapshots)
+        self._written(snapshots)
+
+    def _write_files(self, snapshots: Dict[int, Optional[bytes]]):
+        """Атомарно записать снимки (None - удалить файл)"""
+        for user_id, data in snapshots.items():
+            path = self.path(user_id)
+            try:
+                if data is None:
+                    if os.path.exists(path):
+                        os.remove(path)
+                    continue
+
+                fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp_', suffix='.json')
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        f.write(data)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, path)
+                except BaseException:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
+            except Exception as e:
+                logger.error(f"Ошибка записи {path}: {e}")
+
+    def flush(self):
+        """Синхронно записать все изменения"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        snapshots = self._take_snapshots()
+        if snapshots:
+            self._write_files(snapshots)
+            self._written(snapshots)
+
+    async def flush_async(self):
+        """Записать все изменения и дождаться уже начатых записей"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        snapshots = self._take_snapshots()
+        if snapshots:
+            await self._write_async(snapshots)
+        if self._pending:
+            await asyncio.gather(*list(self._pending), return_exceptions=True)
+
+
+async def flush_all():
+    """Записать изменения всех хранилищ (при остановке бота)"""
+    for store in list(_stores):
+        await store.flush_async()
+
+
+def _flush_all_sync():
+    for store in list(_stores):
+        try:
+            store.flush()
+        except Exception as e:
+            logger.error(f"Ошибка записи хранилища {store.directory}: {e}")
+
+
+# Несохраненные изменения записываются и при обычном завершении процесса
+atexit.register(_flush_all_sync)
@@ -1,28 +1,80 @@
 """
 Модуль для работы с напоминаниями в базе данных Supabase
 """
-from typing import Optional, List, Dict, Any
-from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any, Callable
+from datetime import datetime, time, timedelta
 import logging
-from supabase import create_client, Client
-from config.settings import settings
+from database.connection import db, Database
 
 logger = logging.getLogger(__name__)
 
-class ReminderDB:
-    """Класс для работы с напоминаниями в базе данных"""
+# Колонки, которые разрешено менять через update_*
+REMINDER_COLUMNS = {
+    'title', 'description', 'remind_at', 'repeat_type', 'repeat_interval',
+    'repeat_days', 'is_active', 'is_completed', 'notification_sent',
+    'completed_at', 'last_notified_at'
+}
+SETTINGS_COLUMNS = {
+    'enabled', 'default_notification_time', 'timezone', 'sound_enabled',
+    'advance_notification', 'daily_summary', 'daily_summary_time'
+}
+
+
+def _coerce_value(column: str, value: Any) -> Any:
+    """Привести строковые даты и время к типам, которые ожидает asyncpg"""
+    if isinstance(value, str):
+        if column.endswith('_at'):
+            return datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if column.endswith('_time'):
+            return time.fromisoformat(value)
+    return value
+
+
+def _build_set_clause(kwargs: Dict[str, Any], allowed: set) -> tuple:
+    """Собрать SET-часть UPDATE с позиционными параметрами"""
+    columns = [column for column in kwargs if column in allowed]
+    unknown = set(kwargs) - allowed
+    if unknown:
+        logger.warning(f"Игнорируем неизвестные поля: {', '.join(sorted(unknown))}")
     
-    def __init__(self):
-        """Инициализация подключения к Supabase"""
+    assignments = ', '.join(f"{column} = ${i + 2}" for i, column in enumerate(columns))
+    values = [_coerce_value(column, kwargs[column]) for column in columns]
+    return assignments, values
+
+
+# Подписчики на изменения напоминаний (планировщик обновляет по ним свою очередь)
+_change_listeners: List[Callable[[int, bool], None]] = []
+
+
+def add_change_listener(listener: Callable[[int, bool], None]):
+    """Подписаться на изменения напоминаний: listener(reminder_id, deleted)"""
+    if listener not in _change_listeners:
+        _change_listeners.append(listener)
+
+
+def remove_change_listener(listener: Callable[[int, bool], None]):
+    """Отписаться от изменений напоминаний"""
+    if listener in _change_listeners:
+        _change_listeners.remove(listener)
+
+
+def _notify_changed(reminder_id: int, deleted: bool = False):
+    """Сообщить подписчикам об изменении напоминания"""
+    for listener in list(_change_listeners):
         try:
-            self.supabase: Client = create_client(
-                settings.SUPABASE_URL,
-                settings.SUPABASE_KEY
-            )
-            logger.info("Подключение к Supabase для напоминаний установлено")
+            listener(reminder_id, deleted)
         except Exception as e:
-            logger.error(f"Ошибка подключения к Supabase: {e}")
-            self.supabase = None
+            logger.error(f"Ошибка обработчика изменения напоминания {reminder_id}: {e}")
+
+
+class ReminderDB:
+    """Класс для работы с напоминаниями в базе данных"""
+    
+    def __init__(self, database: Optional[Database] = None):
+        """Инициализация доступа к общему пулу соединений"""
+        self.db = database or db
+        if not self.db.enabled:
+            logger.error("DATABASE_URL не настроен, напоминания недоступны")
     
     async def create_reminder(
         self,
@@ -35,33 +87,31 @@ class ReminderDB:
         repeat_days: Optional[List[str]] = None
     ) -> Optional[int]:
         """Создание нового напоминания"""
-        if not self.supabase:
-            logger.error("Нет подключения к Supabase")
+        if not self.db.enabled:
+            logger.error("Нет подключения к базе данных")
             return None
         
         try:
-            data = {
-                'user_id': user_id,
-                'title': title,
-                'description': description,
-                'remind_at': remind_at.isoformat(),
-                'repeat_type': repeat_type,
-                'repeat_interval': repeat_interval,
-                'repeat_days': repeat_days,
-                'is_active': True,
-                'is_completed': False,
-                'notification_sent': False
-            }
-            
-            result = self.supabase.table('reminders').insert(data).execute()
+            reminder_id = await self.db.fetchval(
+                """
+                INSERT INTO reminders (
+                    user_id, title, description, remind_at, repeat_type,
+                    repeat_interval, repeat_days, is_active, is_completed, notification_sent
+                )
+                VALUES ($1, $2, $3, $4, $5, $6, $7, TRUE, FALSE, FALSE)
+                RETURNING id
+                """,
+                user_id, title, description, remind_at, repeat_type,
+                repeat_interval, repeat_days
+            )
             
-            if result.data:
-                reminder_id = result.data[0]['id']
+            if reminder_id:
                 logger.info(f"Создано напоминание {reminder_id} для пользователя {user_id}")
                 
                 # Создаем настройки пользователя если их нет
                 await self.ensure_user_settings(user_id)
                 
+                _notify_changed(reminder_id)
                 return reminder_id
             
             return None
@@ -77,29 +127,26 @@ class ReminderDB:
         limit: int = 50
     ) -> List[Dict[str, Any]]:
         """Получение напоминаний пользователя"""
-        if not self.supabase:
+        if not self.db.enabled:
             return []
         
         try:
-            query = self.supabase.table('reminders').select('*').eq('user_id', user_id)
-            
             if active_only:
-                query = query.eq('is_active', True).eq('is_completed', False)
-            
-            query = query.order('remind_at', desc=False).limit(limit)
-            
-            result = query.execute()
-            
-            if result.data:
-                # Преобразуем строки в datetime объекты
-                for reminder in result.data:
-                    reminder['remind_at'] = datetime.fromisoformat(reminder['remind_at'].replace('Z', '+00:00'))
-                    if reminder.get('created_at'):
-                        reminder['created_at'] = datetime.fromisoformat(reminder['created_at'].replace('Z', '+00:00'))
-                
-                return result.data
-            
-            return []
+                query = """
+                    SELECT * FROM reminders
+                    WHERE user_id = $1 AND is_active = TRUE AND is_completed = FALSE
+                    ORDER BY remind_at ASC
+                    LIMIT $2
+                """
+            else:
+                query = """
+                    SELECT * FROM reminders
+                    WHERE user_id = $1
+                    ORDER BY remind_at ASC
+                    LIMIT $2
+                """
+            
+            return await self.db.fetch(query, user_id, limit)
             
         except Exception as e:
             logger.error(f"Ошибка получения напоминаний: {e}")
@@ -107,20 +154,11 @@ class ReminderDB:
     
     async def get_reminder(self, reminder_id: int) -> Optional[Dict[str, Any]]:
         """Получение конкретного напоминания"""
-        if not self.supabase:
+        if not self.db.enabled:
             return None
         
         try:
-            result = self.supabase.table('reminders').select('*').eq('id', reminder_id).execute()
-            
-            if result.data:
-                reminder = result.data[0]
-                reminder['remind_at'] = datetime.fromisoformat(reminder['remind_at'].replace('Z', '+00:00'))
-                if reminder.get('created_at'):
-                    reminder['created_at'] = datetime.fromisoformat(reminder['created_at'].replace('Z', '+00:00'))
-                return reminder
-            
-            return None
+            return await self.db.fetchrow("SELECT * FROM reminders WHERE id = $1", reminder_id)
             
         except Exception as e:
             logger.error(f"Ошибка получения напоминания {reminder_id}: {e}")
@@ -132,17 +170,23 @@ class ReminderDB:
         **kwargs
     ) -> bool:
         """Обновление напоминания"""
-        if not self.supabase:
+        if not self.db.enabled:
             return False
         
         try:
-            # Преобразуем datetime в строку если есть
-            if 'remind_at' in kwargs and isinstance(kwargs['remind_at'], datetime):
-                kwargs['remind_at'] = kwargs['remind_at'].isoformat()
+            assignments, values = _build_set_clause(kwargs, REMINDER_COLUMNS)
+            if not assignments:
+                return False
             
-            result = self.supabase.table('reminders').update(kwargs).eq('id', reminder_id).execute()
+            status = await self.db.execute(
+                f"UPDATE reminders SET {assignments}, updated_at = NOW() WHERE id = $1",
+                reminder_id, *values
+            )
             
-            return bool(result.data)
+            updated = status != 'UPDATE 0'
+            if updated:
+                _notify_changed(reminder_id)
+            return updated
             
         except Exception as e:
             logger.error(f"Ошибка обновления напоминания {reminder_id}: {e}")
@@ -150,12 +194,16 @@ class ReminderDB:
     
     async def delete_reminder(self, reminder_id: int) -> bool:
         """Удаление напоминания"""
-        if not self.supabase:
+        if not self.db.enabled:
             return False
         
         try:
-            result = self.supabase.table('reminders').delete().eq('id', reminder_id).execute()
-            return bool(result.data)
+            status = await self.db.execute("DELETE FROM reminders WHERE id = $1", reminder_id)
+            
+            deleted = status != 'DELETE 0'
+            if deleted:
+                _notify_changed(reminder_id, deleted=True)
+            return deleted
             
         except Exception as e:
             logger.error(f"Ошибка удаления напоминания {reminder_id}: {e}")
@@ -166,7 +214,7 @@ class ReminderDB:
         return await self.update_reminder(
             reminder_id,
             is_completed=True,
-            completed_at=datetime.now().isoformat()
+            completed_at=datetime.now()
         )
     
     async def get_active_reminders(
@@ -174,38 +222,68 @@ class ReminderDB:
         time_window_minutes: int = 5
     ) -> List[Dict[str, Any]]:
         """Получение активных напоминаний для отправки"""
-        if not self.supabase:
+        if not self.db.enabled:
             return []
         
         try:
             # Вызываем функцию базы данных
-            result = self.supabase.rpc(
-                'get_active_reminders',
-                {'time_window_minutes': time_window_minutes}
-            ).execute()
-            
-            if result.data:
-                for reminder in result.data:
-                    reminder['remind_at'] = datetime.fromisoformat(reminder['remind_at'].replace('Z', '+00:00'))
-                return result.data
+            return await self.db.fetch(
+                "SELECT * FROM get_active_reminders(time_window_minutes => $1)",
+                time_window_minutes
+            )
             
+        except Exception as e:
+            logger.error(f"Ошибка получения активных напоминаний: {e}")
             return []
+    
+    async def get_upcoming_reminders(
+        self,
+        until: datetime,
+        grace_minutes: int = 5,
+        reminder_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Получение неотправленных напоминаний до момента until
+        
+        Args:
+            until: Верхняя граница окна загрузки
+            grace_minutes: Сколько минут назад еще можно отправить пропущенное напоминание
+            reminder_id: Ограничить выборку одним напоминанием
+        """
+        if not self.db.enabled:
+            return []
+        
+        try:
+            return await self.db.fetch(
+                """
+                SELECT r.id, r.user_id, r.title, r.description, r.remind_at,
+                       r.repeat_type, r.is_active
+                FROM reminders r
+                INNER JOIN reminder_settings rs ON r.user_id = rs.user_id
+                WHERE r.is_active = TRUE
+                    AND r.is_completed = FALSE
+                    AND r.notification_sent = FALSE
+                    AND rs.enabled = TRUE
+                    AND r.remind_at <= $1
+                    AND r.remind_at >= NOW() - INTERVAL '1 minute' * $2
+                    AND ($3::bigint IS NULL OR r.id = $3)
+                ORDER BY r.remind_at ASC
+                """,
+                until, grace_minutes, reminder_id
+            )
             
         except Exception as e:
-            logger.error(f"Ошибка получения активных напоминаний: {e}")
+            logger.error(f"Ошибка получения ближайших напоминаний: {e}")
             return []
     
     async def mark_reminder_sent(self, reminder_id: int) -> bool:
         """Отметить напоминание как отправленное"""
-        if not self.supabase:
+        if not self.db.enabled:
             return False
         
         try:
             # Вызываем функцию базы данных
-            result = self.supabase.rpc(
-                'mark_reminder_sent',
-                {'reminder_id': reminder_id}
-            ).execute()
+            await self.db.execute("SELECT mark_reminder_sent($1)", reminder_id)
             
             return True
             
@@ -213,9 +291,26 @@ class ReminderDB:
             logger.error(f"Ошибка отметки напоминания {reminder_id} как отправленного: {e}")
             return False
     
+    async def mark_reminders_sent(self, reminder_ids: List[int]) -> bool:
+        """Отметить пачку напоминаний как отправленные одним запросом"""
+        if not self.db.enabled or not reminder_ids:
+            return False
+        
+        try:
+            await self.db.execute(
+                "SELECT mark_reminder_sent(id) FROM unnest($1::bigint[]) AS id",
+                list(reminder_ids)
+            )
+            
+            return True
+            
+        except Exception as e:
+            logger.error(f"Ошибка отметки {len(reminder_ids)} напоминаний как отправленных: {e}")
+            return False
+    
     async def get_user_stats(self, user_id: int) -> Dict[str, int]:
         """Получение статистики напоминаний пользователя"""
-        if not self.supabase:
+        if not self.db.enabled:
             return {
                 'total_reminders': 0,
                 'active_reminders': 0,
@@ -225,13 +320,13 @@ class ReminderDB:
             }
         
         try:
-            result = self.supabase.rpc(
-                'get_user_reminder_stats',
-                {'user_id_param': user_id}
-            ).execute()
+            stats = await self.db.fetchrow(
+                "SELECT * FROM get_user_reminder_stats($1)",
+                user_id
+            )
             
-            if result.data:
-                return result.data[0]
+            if stats:
+                return stats
             
             return {
                 'total_reminders': 0,
@@ -253,24 +348,23 @@ class ReminderDB:
     
     async def ensure_user_settings(self, user_id: int) -> bool:
         """Создание настроек пользователя если их нет"""
-        if not self.supabase:
+        if not self.db.enabled:
             return False
         
         try:
-            # Проверяем существование настроек
-            result = self.supabase.table('reminder_settings').select('user_id').eq('user_id', user_id).execute()
+            # Создаем настройки по умолчанию, если их еще нет
+            status = await self.db.execute(
+                """
+                INSERT INTO reminder_settings (
+                    user_id, enabled, sound_enabled, timezone, advance_notification, daily_summary
+                )
+                VALUES ($1, TRUE, TRUE, 'Europe/Moscow', 10, FALSE)
+                ON CONFLICT (user_id) DO NOTHING
+                """,
+                user_id
+            )
             
-            if not result.data:
-                # Создаем настройки по умолчанию
-                self.supabase.table('reminder_settings').insert({
-                    'user_id': user_id,
-                    'enabled': True,
-                    'sound_enabled': True,
-                    'timezone': 'Europe/Moscow',
-                    'advance_notification': 10,
-                    'daily_summary': False
-                }).execute()
-                
+            if status != 'INSERT 0 0':
                 logger.info(f"Созданы настройки напоминаний для пользователя {user_id}")
             
             return True
@@ -281,19 +375,19 @@ class ReminderDB:
     
     async def get_user_settings(self, user_id: int) -> Dict[str, Any]:
         """Получение настроек пользователя"""
-        if not self.supabase:
+        if not self.db.enabled:
             return {}
         
         try:
             # Сначала убеждаемся что настройки существуют
             await self.ensure_user_settings(user_id)
             
-            result = self.supabase.table('reminder_settings').select('*').eq('user_id', user_id).execute()
-            
-            if result.data:
-                return result.data[0]
+            settings = await self.db.fetchrow(
+                "SELECT * FROM reminder_settings WHERE user_id = $1",
+                user_id
+            )
             
-            return {}
+            return settings or {}
             
         except Exception as e:
             logger.error(f"Ошибка получения настроек пользователя {user_id}: {e}")
@@ -301,16 +395,23 @@ class ReminderDB:
     
     async def update_user_settings(self, user_id: int, **kwargs) -> bool:
         """Обновление настроек пользователя"""
-        if not self.supabase:
+        if not self.db.enabled:
             return False
         
         try:
             # Убеждаемся что настройки существуют
             await self.ensure_user_settings(user_id)
             
-            result = self.supabase.table('reminder_settings').update(kwargs).eq('user_id', user_id).execute()
+            assignments, values = _build_set_clause(kwargs, SETTINGS_COLUMNS)
+            if not assignments:
+                return False
+            
+            status = await self.db.execute(
+                f"UPDATE reminder_settings SET {assignments}, updated_at = NOW() WHERE user_id = $1",
+                user_id, *values
+            )
             
-            return bool(result.data)
+            return status != 'UPDATE 0'
             
         except Exception as e:
             logger.error(f"Ошибка обновления настроек пользователя {user_id}: {e}")
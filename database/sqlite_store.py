@@ -0,0 +1,270 @@
+"""
+Локальное хранилище в одной базе SQLite (режим WAL)
+
+Заменяет тысячи файлов в data/ одной базой: у каждого вида документов
+(контакты, токены, настройки, черновики) своя таблица с документом
+пользователя, история переписки хранится построчно в таблице conversations.
+
+SqliteDocumentStore повторяет интерфейс JsonDocumentStore (кэш в памяти,
+отложенная запись), поэтому менеджеры не знают, где лежат их данные.
+Все обращения к базе сериализуются блокировкой; асинхронный код выполняет
+запросы в отдельном потоке базы (run_async): документы читаются через
+preload, история переписки - через методы *_async.
+
+Включается настройкой STORAGE_BACKEND=sqlite, перенос существующих
+JSON-файлов - скрипт migrate_to_sqlite.py.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from database.json_store import JsonDocumentStore
+
+logger = logging.getLogger(__name__)
+
+_TABLE_NAME_RE = re.compile(r'^[a-z_]+$')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    user_message TEXT,
+    ai_response TEXT,
+    timestamp TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS conversations_user_idx ON conversations (user_id, id);
+CREATE INDEX IF NOT EXISTS conversations_created_idx ON conversations (created_at);
+"""
+
+
+class SqliteDatabase:
+    """Соединение с базой SQLite, общее для всех хранилищ"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        # Один поток для асинхронных запросов: они выполняются по очереди
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite')
+
+    def connection(self) -> sqlite3.Connection:
+        """Соединение (открывается при первом обращении)"""
+        with self._lock:
+            if self._conn is None:
+                if self.path != ':memory:':
+                    os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                conn.row_factory = sqlite3.Row
+                conn.execute("PRAGMA journal_mode=WAL")
+                # В режиме WAL NORMAL не теряет согласованность базы при сбое
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute("PRAGMA busy_timeout=5000")
+                conn.executescript(_SCHEMA)
+                self._conn = conn
+            return self._conn
+
+    def create_document_table(self, table: str):
+        """Создать таблицу документов вида table"""
+        if not _TABLE_NAME_RE.match(table):
+            raise ValueError(f"Недопустимое имя таблицы: {table}")
+        self.run(lambda conn: conn.executescript(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            f"user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL);"
+            f"CREATE INDEX IF NOT EXISTS {table}_updated_idx ON {table} (updated_at);"
+        ))
+
+    def run(self, operation: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Выполнить operation(conn) в транзакции"""
+        with self._lock:
+            conn = self.connection()
+            try:
+                result = operation(conn)
+                conn.commit()
+                return result
+            except BaseException:
+                conn.rollback()
+                raise
+
+    async def run_async(self, operation: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Выполнить operation(conn) в потоке базы, не блокируя event loop"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.run, operation)
+
+    def close(self):
+        """Закрыть соединение (при следующем обращении откроется заново)"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class SqliteDocumentStore(JsonDocumentStore):
+    """Документы пользователей в таблице SQLite с отложенной записью"""
+
+    def __init__(self, db: SqliteDatabase, table: str, default: Callable[[], Any],
+                 flush_delay: float = 1.0, max_cached: int = 1000):
+        super().__init__(os.path.dirname(db.path) or '.', table, default,
+                         flush_delay=flush_delay, max_cached=max_cached)
+        self.db = db
+        self.table = table
+        self._executor = db.executor
+        db.create_document_table(table)
+
+    def path(self, user_id: int) -> str:
+        """Адрес документа (база и таблица)"""
+        return f"{self.db.path}:{self.table}/{user_id}"
+
+    def _stored_exists(self, user_id: int) -> bool:
+        return self.db.run(lambda conn: conn.execute(
+            f"SELECT 1 FROM {self.table} WHERE user_id = ?", (user_id,)
+        ).fetchone() is not None)
+
+    def _read_stored(self, user_id: int) -> Any:
+        row = self.db.run(lambda conn: conn.execute(
+            f"SELECT data FROM {self.table} WHERE user_id = ?", (user_id,)
+        ).fetchone())
+        return json.loads(row[0]) if row else None
+
+    def _write_files(self, snapshots: Dict[int, Optional[bytes]]):
+        """Записать снимки одной транзакцией (None - удалить документ)"""
+        now = time.time()
+        removed = [(user_id,) for user_id, data in snapshots.items() if data is None]
+        saved = [
+            (user_id, data.decode('utf-8'), now)
+            for user_id, data in snapshots.items() if data is not None
+        ]
+
+        def write(conn: sqlite3.Connection):
+            if removed:
+                conn.executemany(f"DELETE FROM {self.table} WHERE user_id = ?", removed)
+            if saved:
+                conn.executemany(
+                    f"INSERT INTO {self.table} (user_id, data, updated_at) VALUES (?, ?, ?) "
+                    f"ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                    saved
+                )
+
+        try:
+            self.db.run(write)
+        except Exception as e:
+            logger.error(f"Ошибка записи в таблицу {self.table}: {e}")
+
+
+class SqliteConversationLog:
+    """История переписки в таблице conversations (интерфейс ConversationLog)"""
+
+    def __init__(self, db: SqliteDatabase, keep: int, compact_after: Optional[int] = None):
+        """
+        Args:
+            db: База SQLite
+            keep: Сколько последних сообщений оставлять при сжатии
+            compact_after: После скольких сообщений сжимать историю (по умолчанию 2 * keep)
+        """
+        self.db = db
+        self.keep = keep
+        self.compact_after = compact_after or keep * 2
+        self._counts: Dict[int, int] = {}
+
+    def path(self, user_id: int) -> str:
+        """Адрес истории пользователя"""
+        return f"{self.db.path}:conversations/{user_id}"
+
+    def append(self, user_id: int, record: Dict):
+        """Добавить сообщение"""
+        self._counts[user_id] = self.db.run(self._insert(user_id, record))
+        if self._counts[user_id] > self.compact_after:
+            self.compact(user_id)
+
+    def tail(self, user_id: int, limit: int) -> List[Dict]:
+        """Последние limit сообщений (в хронологическом порядке)"""
+        if limit <= 0:
+            return []
+        return self.db.run(self._select_tail(user_id, limit))
+
+    def compact(self, user_id: int):
+        """Оставить только последние keep сообщений"""
+        self.db.run(self._delete_old(user_id))
+        self._counts[user_id] = min(self._counts.get(user_id, self.keep), self.keep)
+
+    def clear(self, user_id: int):
+        """Удалить историю пользователя"""
+        self.db.run(self._delete_all(user_id))
+        self._counts.pop(user_id, None)
+
+    async def append_async(self, user_id: int, record: Dict):
+        """append в потоке базы"""
+        self._counts[user_id] = await self.db.run_async(self._insert(user_id, record))
+        if self._counts[user_id] > self.compact_after:
+            await self.db.run_async(self._delete_old(user_id))
+            self._counts[user_id] = min(self._counts[user_id], self.keep)
+
+    async def tail_async(self, user_id: int, limit: int) -> List[Dict]:
+        """tail в потоке базы"""
+        if limit <= 0:
+            return []
+        return await self.db.run_async(self._select_tail(user_id, limit))
+
+    async def clear_async(self, user_id: int):
+        """clear в потоке базы"""
+        await self.db.run_async(self._delete_all(user_id))
+        self._counts.pop(user_id, None)
+
+    def _insert(self, user_id: int, record: Dict) -> Callable[[sqlite3.Connection], int]:
+        def insert(conn: sqlite3.Connection) -> int:
+            count = self._counts.get(user_id)
+            if count is None:
+                count = conn.execute(
+                    "SELECT COUNT(*) FROM conversations WHERE user_id = ?", (user_id,)
+                ).fetchone()[0]
+            conn.execute(
+                "INSERT INTO conversations (user_id, user_message, ai_response, timestamp, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (user_id, record.get('user_message'), record.get('ai_response'),
+                 record.get('timestamp', ''), time.time())
+            )
+            return count + 1
+        return insert
+
+    @staticmethod
+    def _select_tail(user_id: int, limit: int) -> Callable[[sqlite3.Connection], List[Dict]]:
+        def select(conn: sqlite3.Connection) -> List[Dict]:
+            rows = conn.execute(
+                "SELECT user_message, ai_response, timestamp FROM conversations "
+                "WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                (user_id, limit)
+            ).fetchall()
+            return [dict(row) for row in reversed(rows)]
+        return select
+
+    def _delete_old(self, user_id: int) -> Callable[[sqlite3.Connection], Any]:
+        return lambda conn: conn.execute(
+            "DELETE FROM conversations WHERE user_id = ? AND id NOT IN ("
+            "SELECT id FROM conversations WHERE user_id = ? ORDER BY id DESC LIMIT ?)",
+            (user_id, user_id, self.keep)
+        )
+
+    @staticmethod
+    def _delete_all(user_id: int) -> Callable[[sqlite3.Connection], Any]:
+        return lambda conn: conn.execute("DELETE FROM conversations WHERE user_id = ?", (user_id,))
+
+    def remove_older_than(self, cutoff: float) -> List[int]:
+        """Удалить историю пользователей без сообщений после cutoff (timestamp)"""
+        def remove(conn: sqlite3.Connection) -> List[int]:
+            users = [row[0] for row in conn.execute(
+                "SELECT user_id FROM conversations GROUP BY user_id HAVING MAX(created_at) < ?",
+                (cutoff,)
+            )]
+            conn.executemany("DELETE FROM conversations WHERE user_id = ?", [(u,) for u in users])
+            return users
+
+        removed = self.db.run(remove)
+        for user_id in removed:
+            self._counts.pop(user_id, None)
+        return removed
@@ -0,0 +1,57 @@
+"""
+Выбор локального хранилища по настройке STORAGE_BACKEND
+
+json   - файл на пользователя в data/ (по умолчанию)
+sqlite - одна база SQLite (SQLITE_PATH)
+"""
+from typing import Any, Callable, Optional
+
+from config.settings import settings
+from database.conversation_log import ConversationLog
+from database.json_store import JsonDocumentStore
+
+_sqlite_db = None
+
+
+def use_sqlite() -> bool:
+    """Включено ли хранилище SQLite"""
+    return settings.STORAGE_BACKEND.lower() == 'sqlite'
+
+
+def get_sqlite_database():
+    """Общая база SQLite (создается при первом обращении)"""
+    global _sqlite_db
+    if _sqlite_db is None:
+        from database.sqlite_store import SqliteDatabase
+        _sqlite_db = SqliteDatabase(settings.SQLITE_PATH)
+    return _sqlite_db
+
+
+def create_document_store(table: str, directory: str, filename: str,
+                          default: Callable[[], Any]) -> JsonDocumentStore:
+    """Хранилище документов пользователей
+
+    Args:
+        table: Таблица в SQLite
+        directory: Каталог JSON-файлов
+        filename: Шаблон имени JSON-файла, например "user_{user_id}.json"
+        default: Фабрика пустого документа
+    """
+    if use_sqlite():
+        from database.sqlite_store import SqliteDocumentStore
+        return SqliteDocumentStore(get_sqlite_database(), table, default)
+    return JsonDocumentStore(directory, filename, default)
+
+
+def create_conversation_log(directory: str, keep: int, compact_after: Optional[int] = None):
+    """История переписки: JSONL-журналы или таблица conversations"""
+    if use_sqlite():
+        from database.sqlite_store import SqliteConversationLog
+        return SqliteConversationLog(get_sqlite_database(), keep, compact_after)
+    return ConversationLog(directory, keep, compact_after)
+
+
+def close_storage():
+    """Закрыть базу SQLite (вызывать после flush_all)"""
+    if _sqlite_db is not None:
+        _sqlite_db.close()
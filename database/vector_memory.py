@@ -1,33 +1,27 @@
+import asyncio
 import json
+import logging
+import time
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
 from config.settings import settings
-from utils.openai_client import openai_client
+from database.connection import db, vector_to_pg
+from utils.embedding_cache import embedding_cache
+
+logger = logging.getLogger(__name__)
 
 class VectorMemory:
     """Векторная память для семантического поиска и долгосрочного запоминания"""
     
     def __init__(self):
-        if not settings.SUPABASE_URL or not settings.SUPABASE_KEY:
-            raise ValueError("Supabase не настроен для векторной памяти")
+        if not db.enabled:
+            raise ValueError("DATABASE_URL не настроен для векторной памяти")
         
-        try:
-            from supabase import create_client
-            self.client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
-        except ImportError:
-            raise ImportError("Установите supabase: pip install supabase")
+        self.db = db
     
     async def get_embedding(self, text: str) -> List[float]:
-        """Получить векторное представление текста через OpenAI"""
-        try:
-            response = openai_client.client.embeddings.create(
-                model="text-embedding-ada-002",
-                input=text.replace("\n", " ")
-            )
-            return response.data[0].embedding
-        except Exception as e:
-            print(f"Ошибка получения embedding: {e}")
-            return None
+        """Получить векторное представление текста через OpenAI (с кэшем и пакетами)"""
+        return await embedding_cache.embed(text)
     
     async def save_conversation(self, user_id: int, user_message: str, ai_response: str):
         """Сохранить диалог с векторным представлением"""
@@ -40,15 +34,14 @@ class VectorMemory:
                 print("Не удалось создать embedding, сохраняем без вектора")
                 embedding = None
             
-            data = {
-                'user_id': user_id,
-                'user_message': user_message,
-                'ai_response': ai_response,
-                'embedding': embedding,
-                'created_at': datetime.now().isoformat()
-            }
-            
-            result = self.client.table('conversations').insert(data).execute()
+            result = await self.db.fetchval(
+                """
+                INSERT INTO conversations (user_id, user_message, ai_response, embedding)
+                VALUES ($1, $2, $3, $4::text::vector)
+                RETURNING id
+                """,
+                user_id, user_message, ai_response, vector_to_pg(embedding)
+            )
             
             # Обновляем профиль пользователя
             await self.update_user_profile(user_id, user_message)
@@ -58,25 +51,20 @@ class VectorMemory:
         except Exception as e:
             print(f"Ошибка сохранения разговора: {e}")
     
-    async def search_similar_conversations(self, user_id: int, query: str, limit: int = 5) -> List[Dict]:
+    async def search_similar_conversations(self, user_id: int, query: str, limit: int = 5,
+                                           query_embedding: Optional[List[float]] = None) -> List[Dict]:
         """Найти похожие разговоры для контекста"""
         try:
-            query_embedding = await self.get_embedding(query)
+            if query_embedding is None:
+                query_embedding = await self.get_embedding(query)
             if not query_embedding:
                 return []
             
             # Используем RPC функцию для векторного поиска
-            result = self.client.rpc(
-                'search_similar_conversations',
-                {
-                    'query_embedding': query_embedding,
-                    'user_id_param': user_id,
-                    'match_threshold': 0.7,
-                    'match_count': limit
-                }
-            ).execute()
-            
-            return result.data if result.data else []
+            return await self.db.fetch(
+                "SELECT * FROM search_similar_conversations($1::text::vector, $2, $3, $4)",
+                vector_to_pg(query_embedding), user_id, 0.7, limit
+            )
             
         except Exception as e:
             print(f"Ошибка поиска похожих разговоров: {e}")
@@ -87,39 +75,32 @@ class VectorMemory:
         try:
             embedding = await self.get_embedding(f"{topic}: {content}")
             
-            data = {
-                'user_id': user_id,
-                'topic': topic,
-                'content': content,
-                'embedding': embedding,
-                'importance_score': importance,
-                'created_at': datetime.now().isoformat()
-            }
-            
-            result = self.client.table('knowledge_base').insert(data).execute()
+            result = await self.db.fetchval(
+                """
+                INSERT INTO knowledge_base (user_id, topic, content, embedding, importance_score)
+                VALUES ($1, $2, $3, $4::text::vector, $5)
+                RETURNING id
+                """,
+                user_id, topic, content, vector_to_pg(embedding), importance
+            )
             return result
             
         except Exception as e:
             print(f"Ошибка сохранения в базу знаний: {e}")
     
-    async def search_knowledge_base(self, user_id: int, query: str, limit: int = 3) -> List[Dict]:
+    async def search_knowledge_base(self, user_id: int, query: str, limit: int = 3,
+                                    query_embedding: Optional[List[float]] = None) -> List[Dict]:
         """Поиск в базе знаний пользователя"""
         try:
-            query_embedding = await self.get_embedding(query)
+            if query_embedding is None:
+                query_embedding = await self.get_embedding(query)
             if not query_embedding:
                 return []
             
-            result = self.client.rpc(
-                'search_knowledge_base',
-                {
-                    'query_embedding': query_embedding,
-                    'user_id_param': user_id,
-                    'match_threshold': 0.8,
-                    'match_count': limit
-                }
-            ).execute()
-            
-            return result.data if result.data else []
+            return await self.db.fetch(
+                "SELECT * FROM search_knowledge_base($1::text::vector, $2, $3, $4)",
+                vector_to_pg(query_embedding), user_id, 0.8, limit
+            )
             
         except Exception as e:
             print(f"Ошибка поиска в базе знаний: {e}")
@@ -128,23 +109,17 @@ class VectorMemory:
     async def update_user_profile(self, user_id: int, message: str):
         """Обновить профиль пользователя"""
         try:
-            # Проверяем существует ли профиль
-            existing = self.client.table('user_profiles').select('*').eq('user_id', user_id).execute()
-            
-            if existing.data:
-                # Обновляем существующий профиль
-                self.client.table('user_profiles').update({
-                    'total_messages': existing.data[0]['total_messages'] + 1,
-                    'updated_at': datetime.now().isoformat()
-                }).eq('user_id', user_id).execute()
-            else:
-                # Создаем новый профиль
-                self.client.table('user_profiles').insert({
-                    'user_id': user_id,
-                    'total_messages': 1,
-                    'preferences': {},
-                    'created_at': datetime.now().isoformat()
-                }).execute()
+            # Атомарно создаем профиль или увеличиваем счетчик сообщений
+            await self.db.execute(
+                """
+                INSERT INTO user_profiles (user_id, total_messages, preferences)
+                VALUES ($1, 1, '{}'::jsonb)
+                ON CONFLICT (user_id) DO UPDATE
+                SET total_messages = user_profiles.total_messages + 1,
+                    updated_at = NOW()
+                """,
+                user_id
+            )
                 
         except Exception as e:
             print(f"Ошибка обновления профиля: {e}")
@@ -152,11 +127,11 @@ class VectorMemory:
     async def get_user_stats(self, user_id: int) -> Dict:
         """Получить статистику пользователя"""
         try:
-            # Пробуем использовать RPC функцию
-            result = self.client.rpc('get_user_stats', {'user_id_param': user_id}).execute()
+            # Пробуем использовать функцию базы данных
+            stats = await self.db.fetchrow("SELECT * FROM get_user_stats($1)", user_id)
             
-            if result.data:
-                return result.data[0]
+            if stats:
+                return stats
             return {
                 'total_conversations': 0,
                 'knowledge_entries': 0,
@@ -169,32 +144,26 @@ class VectorMemory:
             print(f"Ошибка получения статистики через RPC: {e}")
             # Fallback: получаем статистику через прямые запросы
             try:
-                # Получаем количество разговоров
-                conversations_result = self.client.table('conversations')\
-                    .select('*', count='exact')\
-                    .eq('user_id', user_id)\
-                    .execute()
-                total_conversations = conversations_result.count or 0
+                # Получаем количество разговоров и даты одним запросом
+                conversations = await self.db.fetchrow(
+                    """
+                    SELECT COUNT(*) AS total,
+                           MIN(created_at) AS first_interaction,
+                           MAX(created_at) AS last_interaction
+                    FROM conversations
+                    WHERE user_id = $1
+                    """,
+                    user_id
+                )
+                total_conversations = conversations['total'] or 0
+                first_interaction = conversations['first_interaction']
+                last_interaction = conversations['last_interaction']
                 
                 # Получаем количество записей знаний
-                knowledge_result = self.client.table('knowledge_base')\
-                    .select('*', count='exact')\
-                    .eq('user_id', user_id)\
-                    .execute()
-                knowledge_entries = knowledge_result.count or 0
-                
-                # Получаем даты
-                dates_result = self.client.table('conversations')\
-                    .select('created_at')\
-                    .eq('user_id', user_id)\
-                    .order('created_at', desc=False)\
-                    .execute()
-                
-                first_interaction = None
-                last_interaction = None
-                if dates_result.data:
-                    first_interaction = dates_result.data[0]['created_at']
-                    last_interaction = dates_result.data[-1]['created_at']
+                knowledge_entries = await self.db.fetchval(
+                    "SELECT COUNT(*) FROM knowledge_base WHERE user_id = $1",
+                    user_id
+                ) or 0
                 
                 return {
                     'total_conversations': total_conversations,
@@ -214,38 +183,76 @@ class VectorMemory:
                     'last_interaction': None
                 }
     
-    async def get_enhanced_context(self, user_id: int, current_message: str, history_limit: int = 5) -> Dict:
-        """Получить расширенный контекст для AI"""
+    async def _timed_source(self, name: str, coro, timeout: float, default, timings: Dict):
+        """Результат одного источника контекста или default, если он не уложился в срок"""
+        started = time.perf_counter()
         try:
-            # Получаем недавнюю историю
-            recent_history = self.client.table('conversations')\
-                .select('user_message, ai_response, created_at')\
-                .eq('user_id', user_id)\
-                .order('created_at', desc=True)\
-                .limit(history_limit)\
-                .execute()
-            
-            # Ищем похожие разговоры
-            similar_conversations = await self.search_similar_conversations(user_id, current_message, 3)
-            
-            # Ищем релевантную информацию в базе знаний
-            knowledge = await self.search_knowledge_base(user_id, current_message, 2)
-            
-            return {
-                'recent_history': recent_history.data[::-1] if recent_history.data else [],
-                'similar_conversations': similar_conversations,
-                'knowledge_base': knowledge,
-                'has_context': bool(recent_history.data or similar_conversations or knowledge)
-            }
-            
+            return await asyncio.wait_for(coro, timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Источник контекста {name} не ответил за {timeout} с")
+            return default
         except Exception as e:
-            print(f"Ошибка получения контекста: {e}")
-            return {
-                'recent_history': [],
-                'similar_conversations': [],
-                'knowledge_base': [],
-                'has_context': False
-            }
+            logger.error(f"Ошибка источника контекста {name}: {e}")
+            return default
+        finally:
+            timings[name] = round((time.perf_counter() - started) * 1000, 1)
+    
+    async def get_enhanced_context(self, user_id: int, current_message: str, history_limit: int = 5) -> Dict:
+        """Получить расширенный контекст для AI
+        
+        История, похожие разговоры и база знаний запрашиваются одновременно, у каждого
+        источника свой срок: медленный векторный поиск дает пустой результат, а не
+        задерживает ответ. Время каждого источника (мс) возвращается в 'timings'.
+        """
+        timings: Dict[str, float] = {}
+        started = time.perf_counter()
+        
+        # Вектор сообщения нужен обоим поискам - получаем его один раз
+        embedding_task = asyncio.ensure_future(self.get_embedding(current_message))
+        
+        async def recent():
+            return await self.db.fetch(
+                """
+                SELECT user_message, ai_response, created_at
+                FROM conversations
+                WHERE user_id = $1
+                ORDER BY created_at DESC
+                LIMIT $2
+                """,
+                user_id, history_limit
+            )
+        
+        async def similar():
+            query_embedding = await asyncio.shield(embedding_task)
+            if not query_embedding:
+                return []
+            return await self.search_similar_conversations(
+                user_id, current_message, 3, query_embedding=query_embedding
+            )
+        
+        async def knowledge():
+            query_embedding = await asyncio.shield(embedding_task)
+            if not query_embedding:
+                return []
+            return await self.search_knowledge_base(
+                user_id, current_message, 2, query_embedding=query_embedding
+            )
+        
+        recent_history, similar_conversations, knowledge_entries = await asyncio.gather(
+            self._timed_source('recent_history', recent(), settings.CONTEXT_HISTORY_TIMEOUT, [], timings),
+            self._timed_source('similar_conversations', similar(), settings.CONTEXT_VECTOR_TIMEOUT, [], timings),
+            self._timed_source('knowledge_base', knowledge(), settings.CONTEXT_VECTOR_TIMEOUT, [], timings)
+        )
+        timings['total'] = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"Контекст для пользователя {user_id} собран, мс: {timings}")
+        
+        return {
+            'recent_history': recent_history[::-1],
+            'similar_conversations': similar_conversations,
+            'knowledge_base': knowledge_entries,
+            'has_context': bool(recent_history or similar_conversations or knowledge_entries),
+            'timings': timings
+        }
     
     async def analyze_and_extract_knowledge(self, user_id: int, conversation_text: str):
         """Анализировать разговор и извлекать важную информацию"""
@@ -273,25 +280,23 @@ class VectorMemory:
     async def cleanup_old_data(self, days_to_keep: int = 90):
         """Очистить старые данные"""
         try:
-            result = self.client.rpc('cleanup_old_data', {'days_to_keep': days_to_keep}).execute()
-            return result.data
+            return await self.db.fetchval("SELECT cleanup_old_data($1)", days_to_keep)
         except Exception as e:
             print(f"Ошибка очистки данных: {e}")
     
     async def clear_user_memory(self, user_id: int):
         """Очистить всю память пользователя"""
         try:
-            # Удаляем разговоры
-            self.client.table('conversations').delete().eq('user_id', user_id).execute()
-            
-            # Удаляем базу знаний
-            self.client.table('knowledge_base').delete().eq('user_id', user_id).execute()
-            
-            # Сбрасываем счетчики в профиле
-            self.client.table('user_profiles').update({
-                'total_messages': 0,
-                'updated_at': datetime.now().isoformat()
-            }).eq('user_id', user_id).execute()
+            # Удаляем разговоры и базу знаний, сбрасываем счетчики в профиле
+            pool = await self.db.get_pool()
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute("DELETE FROM conversations WHERE user_id = $1", user_id)
+                    await conn.execute("DELETE FROM knowledge_base WHERE user_id = $1", user_id)
+                    await conn.execute(
+                        "UPDATE user_profiles SET total_messages = 0, updated_at = NOW() WHERE user_id = $1",
+                        user_id
+                    )
             
             return True
             
@@ -303,9 +308,7 @@ class VectorMemory:
 # Фабрика для создания векторной памяти
 def create_vector_memory():
     """Создать объект векторной памяти если настроена"""
-    if (settings.SUPABASE_URL and 
-        settings.SUPABASE_KEY and 
-        getattr(settings, 'VECTOR_MEMORY_ENABLED', False)):
+    if db.enabled and getattr(settings, 'VECTOR_MEMORY_ENABLED', False):
         try:
             return VectorMemory()
         except (ValueError, ImportError) as e:
@@ -2,106 +2,115 @@
 Исправления для обработки email команд - устранение всех возможных багов
 """
 import re
+from itertools import chain
 from typing import Optional, Dict, Any
+from utils.command_grammar import CommandGrammar, GrammarMatch
 
-async def extract_email_info_fixed(text: str, user_name: str = None) -> Optional[Dict[str, Any]]:
-    """
-    Улучшенная функция извлечения информации о письме с защитой от всех багов
+# Расширенные паттерны с лучшей обработкой (одна грамматика, компилируется при импорте)
+EMAIL_GRAMMAR = CommandGrammar('email', [
+    # НОВЫЕ ПАТТЕРНЫ ДЛЯ ИМЕН (БЕЗ EMAIL)
+    ('write_to_name', r"напиш[иь].*письмо\s+(?P<recipient>[а-яёА-ЯЁa-zA-Z]+(?:у)?)\s+с\s+(?P<subject>.+)"),
+    ('send_to_name', r"отправ[ьи].*письмо\s+(?P<recipient>[а-яёА-ЯЁa-zA-Z]+(?:у)?)\s+с\s+(?P<subject>.+)"),
+    ('letter_to_name', r"письмо\s+(?P<recipient>[а-яёА-ЯЁa-zA-Z]+(?:у)?)\s+с\s+(?P<subject>.+)"),
+
+    # Основные паттерны с "об" и "о" - ИСПРАВЛЕНЫ для лучшего захвата
+    ('send_letter_about', r"отправ[ьи].*письмо\s+(?P<recipient>[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})\s+об?\s+(?P<subject>.+)"),
+    ('send_about', r"отправ[ьи]\s+(?P<recipient>[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})\s+об?\s+(?P<subject>.+)"),
+    ('letter_about', r"письмо\s+(?P<recipient>[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})\s+об?\s+(?P<subject>.+)"),
+
+    # Паттерны с "напиши письмо"
+    ('write_letter_dash_about', r"напиш[иь].*письмо\s+(?P<recipient>[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})\s*[-–—]\s*об?\s+(?P<subject>.+)"),
+    ('write_letter_about', r"напиш[иь].*письмо\s+(?P<recipient>[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})\s+об?\s+(?P<subject>.+)"),
+
+    # Паттерны с "тема"
+    ('send_letter_subject', r"отправ[ьи].*письмо.*(?P<recipient>[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}).*тема[:\s]+(?P<subject>.+)"),
+    ('letter_subject', r"письмо.*(?P<recipient>[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}).*тема[:\s]+(?P<subject>.+)"),
+
+    # Простые паттерны email + тема (fallback)
+    ('address_subject', r"(?P<recipient>[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})\s+(?P<subject>.+)"),
+])
+
+EMAIL_ADDRESS_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
+def match_email_command(text: str) -> Optional[GrammarMatch]:
     """
-    print(f"EXTRACT_EMAIL_INFO_FIXED: Starting with text: '{text}'")
+    Быстрое распознавание команды письма без обращений к AI и контактам
     
+    Возвращает первое сработавшее правило грамматики (получатель и сырая тема).
+    """
     if not text or not text.strip():
-        print("EXTRACT_EMAIL_INFO_FIXED: Empty text")
         return None
     
+    return EMAIL_GRAMMAR.match(text.strip())
+
+async def resolve_email_command(text: str, first_match: GrammarMatch, user_name: str = None,
+                                user_id: int = None) -> Optional[Dict[str, Any]]:
+    """
+    Дорогая часть обработки письма: поиск контакта, AI-форматирование темы, тело письма
+    
+    Вызывается только когда команда письма действительно выбрана маршрутизатором.
+    Если получатель не найден, лениво пробуются следующие правила грамматики.
+    """
     text = text.strip()
+    candidates = chain([first_match], EMAIL_GRAMMAR.iter_matches(text, first_match.rule_index + 1))
     
-    # Расширенные паттерны с лучшей обработкой
-    patterns = [
-        # НОВЫЕ ПАТТЕРНЫ ДЛЯ ИМЕН (БЕЗ EMAIL)
-        r"напиш[иь].*письмо\s+([а-яёА-ЯЁa-zA-Z]+(?:у)?)\s+с\s+(.+)",
-        r"отправ[ьи].*письмо\s+([а-яёА-ЯЁa-zA-Z]+(?:у)?)\s+с\s+(.+)",
-        r"письмо\s+([а-яёА-ЯЁa-zA-Z]+(?:у)?)\s+с\s+(.+)",
+    for match in candidates:
+        recipient = match['recipient'].strip()
+        raw_subject = match['subject'].strip()
         
-        # Основные паттерны с "об" и "о" - ИСПРАВЛЕНЫ для лучшего захвата
-        r"отправ[ьи].*письмо\s+([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})\s+об?\s+(.+)",
-        r"отправ[ьи]\s+([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})\s+об?\s+(.+)",
-        r"письмо\s+([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})\s+об?\s+(.+)",
+        # Проверяем, является ли получатель email-адресом или именем
+        if _is_valid_email(recipient):
+            # Это email-адрес
+            email = recipient
+        else:
+            # Это имя - нужно искать в контактах
+            try:
+                email = await _find_email_by_name(recipient, user_id)
+                if not email:
+                    print(f"Email not found for name: {recipient}")
+                    continue
+            except Exception as e:
+                print(f"Error searching for {recipient}: {e}")
+                continue
         
-        # Паттерны с "напиши письмо"
-        r"напиш[иь].*письмо\s+([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})\s*[-–—]\s*об?\s+(.+)",
-        r"напиш[иь].*письмо\s+([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})\s+об?\s+(.+)",
+        # Валидация темы - не должна быть пустой или слишком короткой
+        if not raw_subject or len(raw_subject.strip()) < 2:
+            print(f"Invalid subject: '{raw_subject}'")
+            continue
         
-        # Паттерны с "тема"
-        r"отправ[ьи].*письмо.*([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}).*тема[:\s]+(.+)",
-        r"письмо.*([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}).*тема[:\s]+(.+)",
+        # Используем AI форматирование темы письма
+        subject = await format_email_subject_safe(raw_subject)
         
-        # Простые паттерны email + тема (fallback)
-        r"([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})\s+(.+)",
-    ]
-    
-    for i, pattern in enumerate(patterns):
-        print(f"Testing pattern {i+1}: {pattern}")
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            print(f"Pattern {i+1} MATCHED!")
-            recipient = match.group(1).strip()
-            raw_subject = match.group(2).strip()
-            
-            # Проверяем, является ли получатель email-адресом или именем
-            if _is_valid_email(recipient):
-                # Это email-адрес
-                email = recipient
-                print(f"Found email address: {email}")
-            else:
-                # Это имя - нужно искать в контактах
-                print(f"Found name: {recipient}, searching in contacts...")
-                try:
-                    email = await _find_email_by_name(recipient)
-                    print(f"Search result for {recipient}: {email}")
-                    if not email:
-                        print(f"Email not found for name: {recipient}")
-                        continue
-                    print(f"Found email for {recipient}: {email}")
-                except Exception as e:
-                    print(f"Error searching for {recipient}: {e}")
-                    continue
-            
-            # Валидация темы - не должна быть пустой или слишком короткой
-            if not raw_subject or len(raw_subject.strip()) < 2:
-                print(f"Invalid subject: '{raw_subject}'")
-                continue
-            
-            # Используем AI форматирование темы письма
-            subject = await format_email_subject_safe(raw_subject)
-            
-            # Ищем дополнительный текст после темы
-            additional_text = _extract_additional_text(text, raw_subject)
-            
-            # Генерируем тело письма с защитой от пустоты
-            body = _generate_email_body(subject, additional_text, user_name)
-            
-            result = {
-                "email": email,
-                "subject": subject,
-                "body": body,
-                "original_text": text
-            }
-            
-            print(f"EXTRACT_EMAIL_INFO_FIXED: Success!")
-            print(f"   Email: {email}")
-            print(f"   Subject: {subject}")
-            print(f"   Body length: {len(body)}")
-            
-            return result
+        # Ищем дополнительный текст после темы
+        additional_text = _extract_additional_text(text, raw_subject)
+        
+        # Генерируем тело письма с защитой от пустоты
+        body = _generate_email_body(subject, additional_text, user_name)
+        
+        print(f"EXTRACT_EMAIL_INFO_FIXED: Success! Email: {email}, Subject: {subject}")
+        
+        return {
+            "email": email,
+            "subject": subject,
+            "body": body,
+            "original_text": text
+        }
     
-    print(f"EXTRACT_EMAIL_INFO_FIXED: No patterns matched")
     return None
 
+async def extract_email_info_fixed(text: str, user_name: str = None, user_id: int = None) -> Optional[Dict[str, Any]]:
+    """
+    Улучшенная функция извлечения информации о письме с защитой от всех багов
+    """
+    first_match = match_email_command(text)
+    if not first_match:
+        return None
+    
+    return await resolve_email_command(text, first_match, user_name, user_id)
+
 def _is_valid_email(email: str) -> bool:
     """Проверка валидности email"""
-    email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return bool(re.match(email_pattern, email.strip()))
+    return bool(EMAIL_ADDRESS_RE.match(email.strip()))
 
 def _clean_subject(raw_subject: str) -> str:
     """Очистка и форматирование темы письма"""
@@ -226,7 +235,10 @@ async def format_email_subject_safe(raw_subject: str) -> str:
 Преобразованная тема:"""
 
         messages = [{"role": "user", "content": prompt}]
-        ai_response = await openai_client.chat_completion(messages, temperature=0.1)
+        # Одни и те же темы ("о встрече", "отчет за месяц") повторяются - ответ берется из кэша
+        ai_response = await openai_client.cached_chat_completion(
+            'email_subject', 1, subject, messages, temperature=0.1
+        )
         
         if ai_response and ai_response.strip():
             formatted = ai_response.strip().strip('"').strip("'")
@@ -240,33 +252,20 @@ async def format_email_subject_safe(raw_subject: str) -> str:
     # Fallback - возвращаем очищенную тему
     return subject
 
-async def _find_email_by_name(name: str) -> str:
-    """Поиск email-адреса по имени в контактах"""
+async def _find_email_by_name(name: str, user_id: int = None) -> Optional[str]:
+    """Поиск email-адреса по имени в контактах пользователя (с учетом падежа: "Леониду")"""
+    if user_id is None:
+        return None
+    
     try:
-        # ВРЕМЕННАЯ ЗАГЛУШКА - добавим простой список контактов
-        # TODO: заменить на реальную базу данных контактов
-        test_contacts = {
-            'леонид': 'egrn0103@yandex.ru',
-            'леониду': 'egrn0103@yandex.ru',
-            'leonid': 'egrn0103@yandex.ru',
-        }
-        
-        name_lower = name.lower().strip()
-        print(f"Searching for name: '{name_lower}' in contacts: {list(test_contacts.keys())}")
+        from database.contacts import contacts_manager
         
-        if name_lower in test_contacts:
-            email = test_contacts[name_lower]
-            print(f"Found email in test contacts: {email}")
-            return email
-        
-        # Поиск частичного совпадения
-        for contact_name, email in test_contacts.items():
-            if contact_name in name_lower or name_lower in contact_name:
-                print(f"Found partial match: {contact_name} -> {email}")
-                return email
-                
-        print(f"No contacts found for: {name_lower}")
-        return None
+        email = await contacts_manager.find_email_by_name(user_id, name)
+        if email:
+            print(f"Found email in contacts: {name} -> {email}")
+        else:
+            print(f"No contacts found for: {name}")
+        return email
                     
     except Exception as e:
         print(f"Error searching contacts: {e}")
@@ -0,0 +1,300 @@
+"""
+Маршрутизатор намерений для текстовых сообщений
+
+Паттерны каждого намерения собраны в грамматику (utils/command_grammar), которая
+компилируется один раз при импорте и проверяется за один проход. Сообщение классифицируется
+дешевыми синхронными проверками, а дорогая работа (поиск контакта, AI-форматирование
+темы письма) выполняется только для победившего намерения.
+"""
+import re
+from typing import Optional, Dict, Any
+from handlers.email_fix import match_email_command, resolve_email_command
+from utils.command_grammar import CommandGrammar
+
+# Признаки команд контактов - такие сообщения не считаются календарем или правкой письма
+CONTACT_EXCLUSIONS = ('контакт', 'номер', 'телефон', '+7', '+3', '+8', '+9')
+
+EMAIL_IN_TEXT_RE = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+
+CALENDAR_GRAMMAR = CommandGrammar('calendar', [
+    # Паттерны с "добавь" и временем (более специфичные)
+    ('add_time_title', r"добав[ьи].*(?:что\s+)?(?:сегодня|завтра|в\s+\w+)\s+(?:в\s+)?(?P<time>\d{1,2}:?\d{0,2}?)\s*(?P<title>.+)"),
+    ('add_title_time', r"добав[ьи].*(?:что\s+)?(?P<title>.+)\s+(?:сегодня|завтра|в\s+\w+)\s+(?:в\s+)?(?P<time>\d{1,2}:?\d{0,2}?)"),
+
+    # Паттерны со "встреча"
+    ('meeting_prefix', r"встреча\s+(?P<title>.+)"),
+    ('meeting_suffix', r"(?P<title>.+)\s+встреча"),
+
+    # Паттерны с указанием времени
+    ('title_at_time', r"(?P<title>.+)\s+в\s+(?P<time>\d{1,2}:?\d{0,2}?)"),
+
+    # Общие паттерны создания событий
+    ('create_event', r"создай\s+событие\s+(?P<title>.+)"),
+    ('plan', r"запланируй\s+(?P<title>.+)"),
+    ('remind', r"напомни\s+(?P<title>.+)"),
+])
+
+CALENDAR_KEYWORDS = ('встреча', 'событие', 'запланируй', 'напомни', 'сегодня', 'завтра')
+
+EDIT_GRAMMAR = CommandGrammar('edit', [
+    # Команды добавления/дописывания
+    ('append', r"допиш[иь].*?(?P<text>.+)"),
+    ('add', r"доба[вь].*?(?P<text>.+)"),
+    ('extend', r"дополн[иь].*?(?P<text>.+)"),
+    ('add_strict', r"добавь\s+(?P<text>.+)"),
+    ('append_inf', r"дописать\s+(?P<text>.+)"),
+    ('extend_inf', r"дополнить\s+(?P<text>.+)"),
+    ('increase', r"приба[вь].*?(?P<text>.+)"),
+    ('include', r"включ[иь].*?(?P<text>.+)"),
+    ('insert', r"вста[вь].*?(?P<text>.+)"),
+
+    # Команды изменения/замены
+    ('change', r"измен[иь].*?(?P<text>.+)"),
+    ('replace', r"замен[иь].*?(?P<text>.+)"),
+    ('swap', r"поменя[йь].*?(?P<text>.+)"),
+    ('switch', r"смен[иь].*?(?P<text>.+)"),
+    ('update', r"обнов[иь].*?(?P<text>.+)"),
+
+    # Команды исправления/редактирования
+    ('fix', r"исправ[ьи].*?(?P<text>.+)"),
+    ('correct', r"поправ[ьи].*?(?P<text>.+)"),
+    ('proofread', r"откорректир.*?(?P<text>.+)"),
+    ('edit', r"редактир.*?(?P<text>.+)"),
+    ('revision', r"правк[аи].*?(?P<text>.+)"),
+
+    # Команды переписывания
+    ('rewrite', r"перепиш[иь].*?(?P<text>.+)"),
+    ('paraphrase', r"перефразир.*?(?P<text>.+)"),
+    ('reformulate', r"переформулир.*?(?P<text>.+)"),
+    ('rework', r"переработ.*?(?P<text>.+)"),
+
+    # Команды улучшения
+    ('improve', r"улучш[иь].*?(?P<text>.+)"),
+    ('polish', r"доработа[йь].*?(?P<text>.+)"),
+    ('perfect', r"усовершенств.*?(?P<text>.+)"),
+
+    # Альтернативные формы
+    ('make', r"сдела[йь].*?(?P<text>.+)"),
+    ('write_more', r"напиш[иь].*?(?P<text>еще|также|тоже|дополнительно).*?(?P<rest>.+)"),
+])
+
+EDIT_GREETINGS = ('добрый день', 'доброе утро', 'здравствуйте')
+
+SEARCH_GRAMMAR = CommandGrammar('search', [
+    ('find_from', r"найди письма от (?P<query>.+)"),
+    ('find_inf_from', r"найти письма от (?P<query>.+)"),
+    ('find', r"найди письма (?P<query>.+)"),
+    ('find_inf', r"найти письма (?P<query>.+)"),
+    ('search_from', r"поиск писем от (?P<query>.+)"),
+    ('search', r"поиск писем (?P<query>.+)"),
+    ('show_from', r"покажи письма от (?P<query>.+)"),
+    ('show', r"покажи письма (?P<query>.+)"),
+    ('letters_from', r"письма от (?P<query>.+)"),
+    ('seek', r"ищи письма (?P<query>.+)"),
+])
+
+SEARCH_STOP_WORDS_RE = re.compile(r'\b(письма|письмо|от|об|про|о|в|за|с)\b', re.IGNORECASE)
+
+# Исключения веб-поиска - запросы на создание письма/календаря/контактов
+WEB_SEARCH_EXCLUSIONS = (
+    'написать письмо', 'напиши письмо', 'отправить письмо', 'отправь письмо',
+    'создать письмо', 'создай письмо', 'составить письмо', 'составь письмо',
+    'email', 'мейл', 'почта',
+    'создать событие', 'создай событие', 'добавить событие', 'добавь событие',
+    'календарь', 'встреча', 'напоминание'
+)
+
+# Ключевые слова для новостей
+NEWS_KEYWORDS = (
+    'новости', 'актуальные новости', 'свежие новости', 'последние новости',
+    'что происходит', 'события сегодня', 'новости сегодня', 'новости на сегодня',
+    'что нового', 'актуальная информация', 'сводка новостей', 'новостная сводка'
+)
+
+# Ключевые слова для обычного поиска
+WEB_SEARCH_KEYWORDS = (
+    'найди информацию', 'поищи информацию', 'найди в интернете', 'поиск в интернете',
+    'что такое', 'расскажи о', 'информация о', 'найди данные о', 'поищи данные о',
+    'актуальная информация о', 'последняя информация о'
+)
+
+# Вопросительные конструкции, которые могут быть поиском
+WEB_QUESTION_GRAMMAR = CommandGrammar('web_search', [
+    ('what_is', r'что такое (?P<query>.+)\??'),
+    ('who_is_m', r'кто такой (?P<query>.+)\??'),
+    ('who_is_f', r'кто такая (?P<query>.+)\??'),
+    ('where_is', r'где находится (?P<query>.+)\??'),
+    ('how_works', r'как работает (?P<query>.+)\??'),
+    ('how_much', r'сколько стоит (?P<query>.+)\??'),
+    ('when_happens', r'когда происходит (?P<query>.+)\??'),
+    ('what_it_is', r'(?P<query>.+) это что\??'),
+    ('actual', r'актуальные (?P<query>.+)\??'),
+    ('tell_about', r'расскажи про (?P<query>.+)'),
+    ('tell_of', r'расскажи о (?P<query>.+)'),
+    ('info_about', r'информация про (?P<query>.+)'),
+    ('info_of', r'информация о (?P<query>.+)'),
+], flags=0)
+
+PROPER_NAME_RE = re.compile(r'[А-Я][а-я]+ [А-Я][а-я]+')  # Имя Фамилия
+
+
+def _has_contact_exclusion(text_lower: str) -> bool:
+    """Проверить признаки команды контакта"""
+    return any(ex in text_lower for ex in CONTACT_EXCLUSIONS)
+
+
+def match_calendar_command(text: str) -> Optional[Dict[str, Any]]:
+    """Распознать команду создания события календаря"""
+    # Проверяем что это НЕ email команда (содержит @ символ)
+    if '@' in text:
+        return None
+
+    text_lower = text.lower()
+    if _has_contact_exclusion(text_lower):
+        return None
+
+    # Для команд с "добавь" требуем дополнительные календарные признаки
+    if not any(word in text_lower for word in CALENDAR_KEYWORDS):
+        return None
+
+    match = CALENDAR_GRAMMAR.match(text)
+    if match:
+        return {
+            "text": text,
+            "match": match.groups,
+            "rule": match.rule,
+            "is_calendar": True
+        }
+
+    return None
+
+
+def match_email_edit_command(text: str) -> Optional[Dict[str, Any]]:
+    """Распознать команду редактирования email"""
+    # Если текст содержит email адрес, это команда создания письма, а не редактирования
+    if EMAIL_IN_TEXT_RE.search(text):
+        return None
+
+    if _has_contact_exclusion(text.lower()):
+        return None
+
+    # Нормализуем текст для голосовых команд: убираем "пиши" в начале
+    normalized_text = text.strip()
+    if normalized_text.lower().startswith(('пиши,', 'пиши ', 'напиши,', 'напиши ')):
+        parts = normalized_text.split(' ', 1)
+        if len(parts) > 1:
+            normalized_text = parts[1].strip()
+            if normalized_text.startswith(','):
+                normalized_text = normalized_text[1:].strip()
+
+    # Проверяем оба варианта - исходный текст и нормализованный
+    for text_to_check in (text, normalized_text):
+        match = EDIT_GRAMMAR.match(text_to_check)
+        if match:
+            return {
+                "type": "edit",
+                "text": match['text'].strip(),
+                "original_command": text  # Всегда возвращаем исходную команду
+            }
+
+    # Проверяем, не является ли весь текст обращением после "пиши"
+    if normalized_text != text and any(word in normalized_text.lower() for word in EDIT_GREETINGS):
+        return {
+            "type": "edit",
+            "text": normalized_text,
+            "original_command": text
+        }
+
+    return None
+
+
+def match_search_query(text: str) -> Optional[str]:
+    """Распознать запрос поиска писем"""
+    match = SEARCH_GRAMMAR.match(text)
+    if match:
+        # Убираем лишние слова
+        query = SEARCH_STOP_WORDS_RE.sub('', match['query'].strip()).strip()
+        return query if query else None
+
+    return None
+
+
+def match_web_search_query(text: str) -> Optional[Dict[str, str]]:
+    """Распознать веб-поиск и его тип"""
+    text_lower = text.lower().strip()
+
+    # Если запрос содержит команды создания письма или календаря - НЕ веб-поиск
+    if any(keyword in text_lower for keyword in WEB_SEARCH_EXCLUSIONS):
+        return None
+
+    for keyword in NEWS_KEYWORDS:
+        if keyword in text_lower:
+            # Убираем ключевое слово и возвращаем остальное как запрос
+            query = text_lower.replace(keyword, '').strip()
+            return {'type': 'news', 'query': query or 'последние новости'}
+
+    for keyword in WEB_SEARCH_KEYWORDS:
+        if keyword in text_lower:
+            query = text_lower.replace(keyword, '').strip()
+            if query:
+                return {'type': 'search', 'query': query}
+
+    match = WEB_QUESTION_GRAMMAR.match(text_lower)
+    if match:
+        query = match['query'].strip()
+        # Если упоминаются новости - это поиск новостей
+        if 'новост' in query:
+            return {'type': 'news', 'query': query}
+        return {'type': 'search', 'query': query}
+
+    # Имена собственные и организации в вопросительном предложении
+    if (('?' in text or 'что' in text_lower or 'кто' in text_lower or
+         'где' in text_lower or 'как' in text_lower or 'расскажи' in text_lower) and
+            PROPER_NAME_RE.search(text)):
+        return {'type': 'search', 'query': text.strip()}
+
+    return None
+
+
+async def route_message(text: str, user_name: str = None, user_id: int = None) -> Dict[str, Any]:
+    """
+    Определить намерение сообщения
+
+    Приоритет: календарь → редактирование письма → веб-поиск → поиск писем →
+    создание письма → обычный чат. Редактирование проверяется только если
+    сообщение не похоже на создание письма.
+
+    Returns:
+        {'intent': 'calendar'|'edit'|'web_search'|'search'|'email'|'chat', 'payload': ...}
+    """
+    calendar_command = match_calendar_command(text)
+    if calendar_command:
+        return {'intent': 'calendar', 'payload': calendar_command}
+
+    email_match = match_email_command(text)
+
+    if not email_match:
+        edit_command = match_email_edit_command(text)
+        if edit_command:
+            return {'intent': 'edit', 'payload': edit_command}
+
+    web_search_info = match_web_search_query(text)
+    if web_search_info:
+        return {'intent': 'web_search', 'payload': web_search_info}
+
+    search_query = match_search_query(text)
+    if search_query:
+        return {'intent': 'search', 'payload': search_query}
+
+    if email_match:
+        # Только здесь тратим время на контакты и AI-форматирование темы
+        email_info = await resolve_email_command(text, email_match, user_name, user_id)
+        if email_info:
+            return {'intent': 'email', 'payload': email_info}
+
+        # Письмо не удалось собрать - возможно, это команда редактирования
+        edit_command = match_email_edit_command(text)
+        if edit_command:
+            return {'intent': 'edit', 'payload': edit_command}
+
+    return {'intent': 'chat', 'payload': None}
@@ -1,4 +1,6 @@
+import io
 import os
+import time
 import aiofiles
 from aiogram import Router, F
 from aiogram.types import Message, Voice, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
@@ -8,16 +10,36 @@ from aiogram.fsm.state import State, StatesGroup
 from utils.openai_client import openai_client
 from database.memory import memory
 from database.vector_memory import vector_memory
+from utils.memory_jobs import schedule_save_turn, schedule_summary_update
+from utils.conversation_summary import conversation_summaries
+from utils.prompt_builder import prompt_builder
+from utils.stream_renderer import ProgressiveReply
+from utils.voice_transcriber import VOICE_GAP, transcribe_voice
 from config.settings import settings
+from database.storage import create_document_store
 from utils.keyboards import keyboards
 from utils.email_sender import email_sender
 from utils.temp_emails import temp_emails
 from utils.email_improver import email_improver
 from utils.web_search import web_searcher
+from utils.russian_names import correct_name_case
+from handlers.intent_router import (
+    route_message, match_calendar_command, match_email_edit_command,
+    match_search_query, match_web_search_query
+)
 import re
 
 router = Router()
 
+# Поиск писем: сколько результатов запрашивать, показывать в кратком списке и на странице деталей
+SEARCH_RESULTS_LIMIT = 50
+SEARCH_SUMMARY_SIZE = 10
+SEARCH_DETAILS_PAGE_SIZE = 5
+
+# Последний поиск пользователя - для постраничного просмотра и возврата к списку
+search_cache = create_document_store("search_cache", "data/search_cache",
+                                     "user_{user_id}_last_search.json", dict)
+
 def fix_transcription_errors(text: str) -> str:
     """Исправляет типичные ошибки транскрипции голосовых сообщений"""
     if not text:
@@ -71,7 +93,8 @@ class EmailStates(StatesGroup):
 async def clear_history(message: Message):
     """Очистить историю диалога"""
     user_id = message.from_user.id
-    memory.clear_history(user_id)
+    await memory.clear_history(user_id)
+    conversation_summaries.clear(user_id)
     await message.answer("✅ История диалога очищена!")
 
 @router.message(Command("cancel"))
@@ -130,28 +153,40 @@ async def handle_voice(message: Message):
         # Уведомляем пользователя о начале обработки
         status_message = await message.answer("🎤 Обрабатываю голосовое сообщение...")
         
-        # Получаем файл
+        # Скачиваем файл в память (без временных файлов на диске)
         voice: Voice = message.voice
-        file_info = await message.bot.get_file(voice.file_id)
+        voice_buffer = await message.bot.download(voice, destination=io.BytesIO())
         
-        # Скачиваем файл
-        voice_file_path = f"temp_voice_{message.from_user.id}.ogg"
-        await message.bot.download_file(file_info.file_path, voice_file_path)
+        # Транскрибируем (длинные сообщения - по частям, показывая распознанное начало)
+        last_progress = 0.0
         
-        # Транскрибируем
-        transcribed_text = await openai_client.transcribe_audio(voice_file_path)
+        async def show_progress(text: str, done: int, total: int):
+            nonlocal last_progress
+            if time.monotonic() - last_progress < settings.STREAM_EDIT_INTERVAL:
+                return
+            last_progress = time.monotonic()
+            preview = text[-3000:] if text else "..."
+            await status_message.edit_text(f"🎤 Распознаю голосовое сообщение ({done}/{total})\n\n{preview}",
+                                           parse_mode=None)
+        
+        transcribed_text = await transcribe_voice(voice_buffer.getvalue(), voice.duration, show_progress)
         
         # Исправляем типичные ошибки транскрипции
         transcribed_text = fix_transcription_errors(transcribed_text)
         
-        # Удаляем временный файл
-        if os.path.exists(voice_file_path):
-            os.remove(voice_file_path)
-        
         if not transcribed_text or transcribed_text == "Не удалось распознать речь.":
             await status_message.edit_text("❌ Не удалось распознать речь. Попробуйте еще раз.")
             return
         
+        if VOICE_GAP in transcribed_text:
+            # Без середины сообщения команда (событие, письмо) может быть понята неверно
+            await status_message.edit_text(
+                f"⚠️ Часть голосового сообщения не распознана:\n\n{transcribed_text}\n\n"
+                "Повторите, пожалуйста, сообщение или отправьте его текстом.",
+                parse_mode=None
+            )
+            return
+        
         # Обновляем статус
         await status_message.edit_text(f"📝 Распознано: {transcribed_text}\n\n🤖 Генерирую ответ...")
         
@@ -168,7 +203,7 @@ async def handle_voice(message: Message):
             return await handle_calendar_command(message, calendar_command, user_id)
         
         # ПРИОРИТЕТ 2: Проверяем команды создания email 
-        email_info = await extract_email_info(transcribed_text, user_name)
+        email_info = await extract_email_info(transcribed_text, user_name, user_id)
         if email_info:
             print(f"DEBUG: Voice message detected as email creation command: {email_info}")
             # Здесь должна быть логика создания email, но пока просто логируем
@@ -187,7 +222,7 @@ async def handle_voice(message: Message):
         print(f"DEBUG: Voice message processed as regular AI chat")
         
         # Получаем историю
-        history = memory.get_history(user_id, limit=10)
+        history = await memory.get_history(user_id, limit=10)
         
         # Подготавливаем сообщения для AI
         messages = openai_client.prepare_messages_with_context(transcribed_text, history)
@@ -196,7 +231,7 @@ async def handle_voice(message: Message):
         ai_response = await openai_client.chat_completion(messages)
         
         # Сохраняем в память
-        memory.save_message(user_id, transcribed_text, ai_response)
+        await memory.save_message(user_id, transcribed_text, ai_response)
         
         # Отправляем ответ с кнопками быстрых действий
         print(f"DEBUG: Sending voice response with quick_actions keyboard")
@@ -231,76 +266,20 @@ async def format_email_subject(raw_subject: str) -> str:
     # Используем исправленную версию
     return await format_email_subject_safe(raw_subject)
 
-async def extract_email_info(text: str, user_name: str = None) -> dict:
+async def extract_email_info(text: str, user_name: str = None, user_id: int = None) -> dict:
     """Извлечь информацию о письме из текста - ИСПРАВЛЕННАЯ ВЕРСИЯ"""
     # Импортируем исправленную функцию
     from handlers.email_fix import extract_email_info_fixed
     
     # Используем исправленную версию
-    result = await extract_email_info_fixed(text, user_name)
+    result = await extract_email_info_fixed(text, user_name, user_id)
     
     # Возвращаем в том же формате что ожидает старый код
     return result
 
 async def extract_calendar_command(text: str) -> dict:
     """Извлечь команду создания события календаря"""
-    text_lower = text.lower()
-    print(f"DEBUG extract_calendar_command: text='{text}', text_lower='{text_lower}'")
-    
-    # Проверяем что это НЕ email команда (содержит @ символ)
-    if '@' in text:
-        print("DEBUG: Rejected - contains @ symbol")
-        return None
-    
-    # ВАЖНО: Проверяем что это НЕ команда контакта
-    contact_exclusions = ['контакт', 'номер', 'телефон', '+7', '+3', '+8', '+9']
-    found_exclusions = [ex for ex in contact_exclusions if ex in text_lower]
-    if found_exclusions:
-        print(f"DEBUG: Rejected - found contact exclusions: {found_exclusions}")
-        return None
-    
-    calendar_patterns = [
-        # Паттерны с "добавь" и временем (более специфичные)
-        r"добав[ьи].*(?:что\s+)?(?:сегодня|завтра|в\s+\w+)\s+(?:в\s+)?(\d{1,2}:?\d{0,2}?)\s*(.+)",
-        r"добав[ьи].*(?:что\s+)?(.+)\s+(?:сегодня|завтра|в\s+\w+)\s+(?:в\s+)?(\d{1,2}:?\d{0,2}?)",
-        
-        # Паттерны со "встреча"
-        r"встреча\s+(.+)",
-        r"(.+)\s+встреча",
-        
-        # Паттерны с указанием времени
-        r"(.+)\s+в\s+(\d{1,2}:?\d{0,2}?)",
-        
-        # Общие паттерны создания событий
-        r"создай\s+событие\s+(.+)",
-        r"запланируй\s+(.+)",
-        r"напомни\s+(.+)",
-        
-        # УБРАЛИ общий паттерн r"добав[ьи].*(?:что\s+)?(.+)" который ловил все команды "добавь"
-        # Теперь "добавь" работает только с конкретными временными указаниями выше
-    ]
-    
-    # Проверяем календарные ключевые слова (но исключаем "добавь" как единственный признак)
-    calendar_keywords = ['встреча', 'событие', 'запланируй', 'напомни', 'сегодня', 'завтра']
-    has_calendar_keywords = any(word in text_lower for word in calendar_keywords)
-    
-    # Для команд с "добавь" требуем дополнительные календарные признаки
-    if 'добавь' in text_lower and not has_calendar_keywords:
-        return None
-    
-    if not has_calendar_keywords and 'добавь' not in text_lower:
-        return None
-    
-    for pattern in calendar_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            return {
-                "text": text,
-                "match": match.groups(),
-                "is_calendar": True
-            }
-    
-    return None
+    return match_calendar_command(text)
 
 async def smart_email_edit(current_body: str, edit_command: str, edit_text: str) -> str:
     """AI-powered умное редактирование письма с анализом контекста"""
@@ -340,7 +319,9 @@ async def smart_email_edit(current_body: str, edit_command: str, edit_text: str)
 
     try:
         messages = [{"role": "user", "content": ai_prompt}]
-        result = await openai_client.chat_completion(messages, temperature=0.1)
+        result = await openai_client.cached_chat_completion(
+            'email_edit', 1, f"{current_body}\n---\n{edit_command}\n---\n{edit_text}", messages, temperature=0.1
+        )
         
         # Проверяем, что результат разумный
         if result and len(result.strip()) > 10:
@@ -538,8 +519,8 @@ async def create_calendar_event_from_text(message: Message, text: str, user_id:
         print(f"DEBUG: Creating calendar client with email: {user_email}, password exists: {bool(app_password)}")
         
         # Создаем событие (используем app_password вместо access_token)
-        from handlers.yandex_integration import YandexCalendar
-        calendar_client = YandexCalendar(app_password, user_email)
+        from utils.caldav_pool import caldav_pool
+        calendar_client = caldav_pool.get(user_email, app_password)
         success = await calendar_client.create_event(
             title=event_data.get("title", "Новое событие"),
             start_time=event_data.get("start_time"),
@@ -572,211 +553,15 @@ async def create_calendar_event_from_text(message: Message, text: str, user_id:
 
 async def extract_email_edit_command(text: str) -> dict:
     """Извлечь команду редактирования email"""
-    
-    # ВАЖНО: Если текст содержит email адрес, это команда создания письма, а не редактирования!
-    import re
-    if re.search(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}', text):
-        print(f"DEBUG: Text contains email address, skipping edit command extraction")
-        return None
-    
-    # ВАЖНО: Проверяем что это НЕ команда контакта
-    text_lower = text.lower()
-    contact_exclusions = ['контакт', 'номер', 'телефон', '+7', '+3', '+8', '+9']
-    found_exclusions = [ex for ex in contact_exclusions if ex in text_lower]
-    if found_exclusions:
-        print(f"DEBUG: Email edit skipped - found contact exclusions: {found_exclusions}")
-        return None
-    
-    # Сначала нормализуем текст для голосовых команд
-    # Убираем лишние слова типа "пиши" в начале
-    normalized_text = text.strip()
-    if normalized_text.lower().startswith(('пиши,', 'пиши ', 'напиши,', 'напиши ')):
-        # Удаляем слово "пиши" из начала
-        parts = normalized_text.split(' ', 1)
-        if len(parts) > 1:
-            normalized_text = parts[1].strip()
-            # Убираем лишнюю запятую
-            if normalized_text.startswith(','):
-                normalized_text = normalized_text[1:].strip()
-    
-    edit_patterns = [
-        # Команды добавления/дописывания
-        r"допиш[иь].*?(.+)",
-        r"доба[вь].*?(.+)",
-        r"дополн[иь].*?(.+)",
-        r"добавь\s+(.+)",
-        r"дописать\s+(.+)",
-        r"дополнить\s+(.+)",
-        r"приба[вь].*?(.+)",
-        r"включ[иь].*?(.+)",
-        r"вста[вь].*?(.+)",
-        
-        # Команды изменения/замены
-        r"измен[иь].*?(.+)",
-        r"замен[иь].*?(.+)",
-        r"поменя[йь].*?(.+)",
-        r"смен[иь].*?(.+)",
-        r"обнов[иь].*?(.+)",
-        
-        # Команды исправления/редактирования
-        r"исправ[ьи].*?(.+)",
-        r"поправ[ьи].*?(.+)",
-        r"откорректир.*?(.+)",
-        r"редактир.*?(.+)",
-        r"правк[аи].*?(.+)",
-        
-        # Команды переписывания
-        r"перепиш[иь].*?(.+)",
-        r"перефразир.*?(.+)",
-        r"переформулир.*?(.+)",
-        r"переработ.*?(.+)",
-        
-        # Команды улучшения
-        r"улучш[иь].*?(.+)",
-        r"доработа[йь].*?(.+)",
-        r"усовершенств.*?(.+)",
-        
-        # Альтернативные формы
-        r"сдела[йь].*?(.+)",
-        r"напиш[иь].*?(еще|также|тоже|дополнительно).*?(.+)"
-    ]
-    
-    # Проверяем оба варианта - исходный текст и нормализованный
-    for text_to_check in [text, normalized_text]:
-        for pattern in edit_patterns:
-            match = re.search(pattern, text_to_check, re.IGNORECASE)
-            if match:
-                edit_text = match.group(1).strip()
-                return {
-                    "type": "edit",
-                    "text": edit_text,
-                    "original_command": text  # Всегда возвращаем исходную команду
-                }
-    
-    # Проверяем, не является ли весь текст обращением после "пиши"
-    if normalized_text != text and any(word in normalized_text.lower() for word in ['добрый день', 'доброе утро', 'здравствуйте']):
-        return {
-            "type": "edit",
-            "text": normalized_text,
-            "original_command": text
-        }
-    
-    return None
+    return match_email_edit_command(text)
 
 async def extract_search_query(text: str) -> str:
     """Извлечь поисковый запрос из текста"""
-    # Паттерны для поиска писем
-    search_patterns = [
-        r"найди письма от (.+)",
-        r"найти письма от (.+)",
-        r"найди письма (.+)",
-        r"найти письма (.+)",
-        r"поиск писем от (.+)",
-        r"поиск писем (.+)",
-        r"покажи письма от (.+)",
-        r"покажи письма (.+)",
-        r"письма от (.+)",
-        r"ищи письма (.+)",
-    ]
-    
-    for pattern in search_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            query = match.group(1).strip()
-            # Убираем лишние слова
-            query = re.sub(r'\b(письма|письмо|от|об|про|о|в|за|с)\b', '', query, flags=re.IGNORECASE).strip()
-            return query if query else None
-    
-    return None
+    return match_search_query(text)
 
 async def extract_web_search_query(text: str) -> dict:
     """Определить, является ли запрос веб-поиском и его тип"""
-    text_lower = text.lower().strip()
-    
-    # Исключения - если это запрос на создание письма/календаря/контактов
-    email_keywords = [
-        'написать письмо', 'напиши письмо', 'отправить письмо', 'отправь письмо',
-        'создать письмо', 'создай письмо', 'составить письмо', 'составь письмо',
-        'email', 'мейл', 'почта'
-    ]
-    
-    calendar_keywords = [
-        'создать событие', 'создай событие', 'добавить событие', 'добавь событие',
-        'календарь', 'встреча', 'напоминание'
-    ]
-    
-    # Если запрос содержит команды создания письма или календаря - НЕ веб-поиск
-    for keyword in email_keywords + calendar_keywords:
-        if keyword in text_lower:
-            return None
-    
-    # Ключевые слова для новостей
-    news_keywords = [
-        'новости', 'актуальные новости', 'свежие новости', 'последние новости',
-        'что происходит', 'события сегодня', 'новости сегодня', 'новости на сегодня',
-        'что нового', 'актуальная информация', 'сводка новостей', 'новостная сводка'
-    ]
-    
-    # Ключевые слова для обычного поиска
-    search_keywords = [
-        'найди информацию', 'поищи информацию', 'найди в интернете', 'поиск в интернете',
-        'что такое', 'расскажи о', 'информация о', 'найди данные о', 'поищи данные о',
-        'актуальная информация о', 'последняя информация о'
-    ]
-    
-    # Проверяем на новости
-    for keyword in news_keywords:
-        if keyword in text_lower:
-            # Убираем ключевое слово и возвращаем остальное как запрос
-            query = text_lower.replace(keyword, '').strip()
-            if not query:
-                query = 'последние новости'
-            return {'type': 'news', 'query': query}
-    
-    # Проверяем на обычный поиск
-    for keyword in search_keywords:
-        if keyword in text_lower:
-            query = text_lower.replace(keyword, '').strip()
-            if query:
-                return {'type': 'search', 'query': query}
-    
-    # Проверяем вопросительные конструкции, которые могут быть поиском
-    question_patterns = [
-        r'что такое (.+)\??',
-        r'кто такой (.+)\??',
-        r'кто такая (.+)\??', 
-        r'где находится (.+)\??',
-        r'как работает (.+)\??',
-        r'сколько стоит (.+)\??',
-        r'когда происходит (.+)\??',
-        r'(.+) это что\??',
-        r'актуальные (.+)\??',
-        r'расскажи про (.+)',
-        r'расскажи о (.+)',
-        r'информация про (.+)',
-        r'информация о (.+)'
-    ]
-    
-    for pattern in question_patterns:
-        match = re.search(pattern, text_lower)
-        if match:
-            query = match.group(1).strip()
-            # Если упоминаются новости - это поиск новостей
-            if 'новост' in query:
-                return {'type': 'news', 'query': query}
-            return {'type': 'search', 'query': query}
-    
-    # Дополнительная проверка на имена собственные и организации
-    # Если сообщение содержит заглавные буквы в середине (признак имен/брендов)
-    # и это вопросительное предложение или информационный запрос
-    if (('?' in text or 'что' in text_lower or 'кто' in text_lower or 
-         'где' in text_lower or 'как' in text_lower or 'расскажи' in text_lower) and
-        re.search(r'[А-Я][а-я]+ [А-Я][а-я]+', text)):  # Имя Фамилия
-        # Убираем вопросительные слова и возвращаем как поисковый запрос
-        query = text.strip()
-        return {'type': 'search', 'query': query}
-    
-    return None
+    return match_web_search_query(text)
 
 def truncate_message(text: str, max_length: int = 3800) -> str:
     """Безопасно обрезать сообщение для Telegram"""
@@ -882,40 +667,26 @@ async def handle_text_message(message: Message):
         if message.from_user.last_name:
             user_name += f" {message.from_user.last_name}"
         
-        # Проверяем, является ли это командой создания события календаря (ПРИОРИТЕТ!)
-        print(f"DEBUG: Checking calendar command for: '{user_message}'")
-        calendar_command = await extract_calendar_command(user_message)
-        print(f"DEBUG: Calendar command result: {calendar_command}")
-        
-        # Проверяем, является ли это командой отправки письма (ПРИОРИТЕТ НАД РЕДАКТИРОВАНИЕМ!)
-        print(f"DEBUG: Checking for email command in text: '{user_message}'")
-        email_info = await extract_email_info(user_message, user_name)
-        print(f"DEBUG: Email extraction result: {email_info}")
-        
-        # Проверяем, является ли это командой редактирования email (ТОЛЬКО если не создание письма)
-        edit_command = None
-        if not email_info:
-            print(f"DEBUG: Checking for email edit command in text: '{user_message}'")
-            edit_command = await extract_email_edit_command(user_message)
-            print(f"DEBUG: Email edit extraction result: {edit_command}")
+        # Определяем намерение за один проход; дорогая обработка письма
+        # (контакты, AI-форматирование темы) выполняется только если письмо победило
+        route = await route_message(user_message, user_name, user_id)
+        intent = route['intent']
+        print(f"DEBUG: Routed message as '{intent}'")
         
-        # Проверяем, является ли это командой поиска писем
-        search_query = await extract_search_query(user_message)
-        
-        # Проверяем, является ли это веб-поисковым запросом
-        web_search_info = await extract_web_search_query(user_message)
-        
-        if calendar_command:
+        if intent == 'calendar':
             # Обрабатываем команду создания события календаря
-            return await handle_calendar_command(message, calendar_command, user_id)
+            return await handle_calendar_command(message, route['payload'], user_id)
         
-        if edit_command:
+        if intent == 'edit':
             # Используем общую функцию обработки редактирования
-            return await handle_email_edit_command(message, edit_command, user_id)
+            return await handle_email_edit_command(message, route['payload'], user_id)
         
-        if web_search_info:
+        if intent == 'web_search':
             # Обрабатываем веб-поиск
-            return await handle_web_search_command(message, web_search_info)
+            return await handle_web_search_command(message, route['payload'])
+        
+        search_query = route['payload'] if intent == 'search' else None
+        email_info = route['payload'] if intent == 'email' else None
         
         if search_query:
             # Проверяем, подключена ли почта
@@ -939,26 +710,14 @@ async def handle_text_message(message: Message):
                 
                 # Выполняем поиск
                 from utils.email_sender_real import real_email_sender
-                search_results = await real_email_sender.search_emails(user_id, search_query, limit=10)
+                search_results = await real_email_sender.search_emails(user_id, search_query, limit=SEARCH_RESULTS_LIMIT)
                 
                 # Сохраняем результаты для детального просмотра
-                import json
-                import os
-                search_cache_dir = "data/search_cache"
-                os.makedirs(search_cache_dir, exist_ok=True)
-                
-                cache_file = os.path.join(search_cache_dir, f"user_{user_id}_last_search.json")
-                cache_data = {
+                search_cache.put(user_id, {
                     'query': search_query,
                     'results': search_results,
                     'timestamp': __import__('datetime').datetime.now().isoformat()
-                }
-                
-                try:
-                    with open(cache_file, 'w', encoding='utf-8') as f:
-                        json.dump(cache_data, f, ensure_ascii=False, indent=2)
-                except Exception as cache_error:
-                    print(f"Ошибка сохранения кэша поиска: {cache_error}")
+                })
                 
                 if not search_results:
                     await status_msg.edit_text(
@@ -980,7 +739,7 @@ async def handle_text_message(message: Message):
                 results_text += f"📝 <b>Запрос:</b> {escape_html(search_query)}\n"
                 results_text += f"📬 <b>Найдено:</b> {len(search_results)} писем\n\n"
                 
-                for i, email_data in enumerate(search_results, 1):
+                for i, email_data in enumerate(search_results[:SEARCH_SUMMARY_SIZE], 1):
                     sender = email_data.get('sender', 'Неизвестный отправитель')
                     subject = email_data.get('subject', 'Без темы')
                     date = email_data.get('date', '')
@@ -1006,7 +765,7 @@ async def handle_text_message(message: Message):
                 # Кнопка детального просмотра
                 builder.button(
                     text="📖 Детальный просмотр", 
-                    callback_data=f"search_details_{len(search_results)}"
+                    callback_data="search_details_0"
                 )
                 
                 # Кнопка в меню входящих
@@ -1193,71 +952,53 @@ async def handle_text_message(message: Message):
                 )
                 return
         
+        # Вопросы об имени обрабатываются без AI - проверяем до запроса к модели
+        name_question_handled = await handle_name_questions(message, user_message, "")
+        if name_question_handled:
+            return  # Выходим, так как вопрос об имени уже обработан
+        
         # Уведомляем о начале обработки
         status_message = await message.answer("🤖 Думаю...")
         
+        # Последние ходы истории идут в промпт целиком, более старые - кратким изложением
+        history_window = settings.PROMPT_RECENT_TURNS + settings.PROMPT_SUMMARY_BATCH
+        await conversation_summaries.store.preload(user_id)
+        summary = conversation_summaries.get(user_id)
+        
         # Используем векторную память если доступна
         if vector_memory:
             # Получаем расширенный контекст
-            context = await vector_memory.get_enhanced_context(user_id, user_message, 5)
+            context = await vector_memory.get_enhanced_context(user_id, user_message, history_window)
+            history = context['recent_history']
             
             # Подготавливаем сообщения с векторным контекстом
-            messages = await prepare_messages_with_vector_context(user_message, context)
+            messages = await prepare_messages_with_vector_context(user_message, context, summary)
         else:
             # Используем обычную память
-            history = memory.get_history(user_id, limit=10)
-            messages = openai_client.prepare_messages_with_context(user_message, history)
+            history = await memory.get_history(user_id, limit=history_window)
+            messages = openai_client.prepare_messages_with_context(user_message, history, summary)
         
-        # Получаем ответ от AI
-        ai_response = await openai_client.chat_completion(messages)
-        
-        # Проверяем вопросы об имени и личной информации ПЕРЕД отправкой ответа
-        name_question_handled = await handle_name_questions(message, user_message, ai_response)
-        if name_question_handled:
-            return  # Выходим, так как вопрос об имени уже обработан
-        
-        # Проверяем, не просит ли пользователь добавить контакт
-        await check_and_create_contact(message, user_message, ai_response)
-        
-        # Сохраняем в память
-        if vector_memory:
-            await vector_memory.save_conversation(user_id, user_message, ai_response)
-            # Анализируем и извлекаем знания
-            await vector_memory.analyze_and_extract_knowledge(user_id, f"{user_message} {ai_response}")
+        # Получаем ответ от AI и показываем его по мере генерации
+        reply = ProgressiveReply(message, status_message)
+        if settings.STREAM_RESPONSES:
+            ai_response = await reply.stream(openai_client.chat_completion_stream(messages))
         else:
-            memory.save_message(user_id, user_message, ai_response)
+            ai_response = await openai_client.chat_completion(messages)
         
-        # Отправляем ответ с кнопками быстрых действий
-        print(f"DEBUG: Sending AI response with quick_actions keyboard")
+        # Окончательный ответ с кнопками быстрых действий (длинный - несколькими сообщениями)
         try:
-            quick_keyboard = keyboards.quick_actions()
-            print(f"DEBUG: Quick keyboard created: {quick_keyboard}")
-            
-            if len(ai_response) > settings.MAX_MESSAGE_LENGTH:
-                # Если ответ слишком длинный, разбиваем на части
-                parts = [ai_response[i:i+settings.MAX_MESSAGE_LENGTH] 
-                        for i in range(0, len(ai_response), settings.MAX_MESSAGE_LENGTH)]
-                
-                print(f"DEBUG: Message too long, sending {len(parts)} parts")
-                await status_message.edit_text(
-                    parts[0], 
-                    reply_markup=quick_keyboard,
-                    parse_mode="HTML"
-                )
-                for part in parts[1:]:
-                    await message.answer(part, parse_mode="HTML")
-            else:
-                print(f"DEBUG: Sending single message with keyboard")
-                await status_message.edit_text(
-                    ai_response,
-                    reply_markup=quick_keyboard,
-                    parse_mode="HTML"
-                )
-                print(f"DEBUG: Message sent successfully with keyboard")
+            await reply.finish(ai_response, reply_markup=keyboards.quick_actions())
         except Exception as keyboard_error:
             print(f"DEBUG: Error sending message with keyboard: {keyboard_error}")
             # Fallback без клавиатуры
-            await status_message.edit_text(ai_response, parse_mode="HTML")
+            await status_message.edit_text(ai_response[:settings.MAX_MESSAGE_LENGTH], parse_mode=None)
+        
+        # Сохранение в память, извлечение знаний и изложение старой переписки - в фоновой очереди
+        await schedule_save_turn(user_id, user_message, ai_response)
+        await schedule_summary_update(user_id, history)
+        
+        # Проверяем, не просит ли пользователь добавить контакт (уже после ответа)
+        await check_and_create_contact(message, user_message, ai_response)
         
         # TTS убран - озвучка только по запросу или для голосовых сообщений
         print(f"DEBUG: Текстовый ответ отправлен без автоматической озвучки")
@@ -1266,140 +1007,21 @@ async def handle_text_message(message: Message):
         print(f"Ошибка обработки текстового сообщения: {e}")
         await message.answer("❌ Произошла ошибка при обработке сообщения. Попробуйте еще раз.")
 
-async def prepare_messages_with_vector_context(current_message: str, context: dict) -> list:
-    """Подготовить сообщения с векторным контекстом"""
-    messages = [
-        {
-            "role": "system",
-            "content": """Ты полезный AI-ассистент с долгосрочной памятью. 
+async def prepare_messages_with_vector_context(current_message: str, context: dict, summary: str = None) -> list:
+    """Подготовить сообщения с векторным контекстом (в пределах бюджета токенов)"""
+    system_prompt = """Ты полезный AI-ассистент с долгосрочной памятью. 
             Используй предоставленный контекст для более персонализированных ответов.
             Отвечай на русском языке естественно и дружелюбно.
             Если есть релевантная информация из прошлых разговоров, используй её."""
-        }
-    ]
-    
-    # Добавляем контекст из базы знаний
-    if context.get('knowledge_base'):
-        knowledge_text = "Важная информация о пользователе:\n"
-        for kb in context['knowledge_base']:
-            knowledge_text += f"- {kb['topic']}: {kb['content']}\n"
-        
-        messages.append({
-            "role": "system", 
-            "content": knowledge_text
-        })
-    
-    # Добавляем похожие разговоры
-    if context.get('similar_conversations'):
-        similar_text = "Похожие темы из прошлого:\n"
-        for conv in context['similar_conversations'][:2]:  # Только первые 2
-            similar_text += f"Пользователь спрашивал: {conv['user_message'][:100]}...\n"
-            similar_text += f"Ответ был: {conv['ai_response'][:100]}...\n\n"
-        
-        messages.append({
-            "role": "system",
-            "content": similar_text
-        })
-    
-    # Добавляем недавнюю историю
-    for item in context.get('recent_history', []):
-        if item.get('user_message'):
-            messages.append({
-                "role": "user",
-                "content": item['user_message']
-            })
-        if item.get('ai_response'):
-            messages.append({
-                "role": "assistant",
-                "content": item['ai_response']
-            })
-    
-    # Добавляем текущее сообщение
-    messages.append({
-        "role": "user",
-        "content": current_message
-    })
-    
-    return messages
-
-def correct_name_case(name: str) -> str:
-    """Исправляет склонение русских имен в именительный падеж"""
-    if not name:
-        return name
-    
-    # Словарь частых окончаний русских имен в разных падежах
-    name_corrections = {
-        # Мужские имена
-        'александра': 'Александр',
-        'леонида': 'Леонид', 
-        'владимира': 'Владимир',
-        'дмитрия': 'Дмитрий',
-        'сергея': 'Сергей',
-        'андрея': 'Андрей',
-        'алексея': 'Алексей',
-        'николая': 'Николай',
-        'михаила': 'Михаил',
-        'павла': 'Павел',
-        'игоря': 'Игорь',
-        'олега': 'Олег',
-        'антона': 'Антон',
-        'романа': 'Роман',
-        'максима': 'Максим',
-        'артема': 'Артем',
-        'ивана': 'Иван',
-        'петра': 'Петр',
-        'юрия': 'Юрий',
-        'виктора': 'Виктор',
-        'евгения': 'Евгений',
-        'константина': 'Константин',
-        'валерия': 'Валерий',
-        
-        # Женские имена
-        'анны': 'Анна',
-        'елены': 'Елена', 
-        'марии': 'Мария',
-        'ольги': 'Ольга',
-        'татьяны': 'Татьяна',
-        'наталии': 'Наталия',
-        'наталье': 'Наталья',
-        'светланы': 'Светлана',
-        'ирины': 'Ирина',
-        'людмилы': 'Людмила',
-        'галины': 'Галина',
-        'валентины': 'Валентина',
-        'нины': 'Нина',
-        'любови': 'Любовь',
-        'екатерины': 'Екатерина',
-        'алены': 'Алена',
-        'юлии': 'Юлия',
-        'анастасии': 'Анастасия',
-        'дарьи': 'Дарья',
-        'веры': 'Вера',
-        'надежды': 'Надежда',
-        'софии': 'София',
-        'виктории': 'Виктория'
-    }
-    
-    name_lower = name.lower().strip()
-    
-    # Проверяем точное совпадение
-    if name_lower in name_corrections:
-        return name_corrections[name_lower]
     
-    # Проверяем по паттернам окончаний
-    if name_lower.endswith('а') and len(name_lower) > 3:
-        # Мужские имена на -а (Леонида -> Леонид)
-        base_name = name_lower[:-1]
-        if base_name + 'а' in name_corrections:
-            return name_corrections[base_name + 'а']
-        # Попробуем добавить "д" (Леонида -> Леонид)
-        if not base_name.endswith('д'):
-            test_name = base_name + 'д'
-            if test_name.capitalize() in ['Леонид', 'Давид', 'Эдуард']:
-                return test_name.capitalize()
-    
-    # Если не нашли соответствие, просто делаем первую букву заглавной
-    return name.strip().capitalize()
+    return prompt_builder.build(
+        system_prompt,
+        current_message,
+        context.get('recent_history', []),
+        summary=summary,
+        knowledge=context.get('knowledge_base'),
+        similar=context.get('similar_conversations')
+    ).messages
 
 async def check_and_create_contact(message: Message, user_message: str, ai_response: str):
     """Проверяет сообщения пользователя и ответы AI на предмет создания контактов"""
@@ -1625,14 +1247,9 @@ async def handle_name_questions(message: Message, user_message: str, ai_response
                 reply_markup=builder.as_markup()
             )
         
-        # Сохраняем в память корректную информацию
-        if vector_memory:
-            corrected_response = f"Пользователь спросил о своем имени. {'Я знаю его имя: ' + user_contact.name if user_contact else 'Я предложил познакомиться.'}"
-            await vector_memory.save_conversation(user_id, user_message, corrected_response)
-        else:
-            from database.memory import memory
-            corrected_response = f"Пользователь спросил о своем имени. {'Я знаю его имя: ' + user_contact.name if user_contact else 'Я предложил познакомиться.'}"
-            memory.save_message(user_id, user_message, corrected_response)
+        # Сохраняем в память корректную информацию (в фоне)
+        corrected_response = f"Пользователь спросил о своем имени. {'Я знаю его имя: ' + user_contact.name if user_contact else 'Я предложил познакомиться.'}"
+        await schedule_save_turn(user_id, user_message, corrected_response, extract=False)
         
         return True
         
@@ -2114,23 +1731,19 @@ async def handle_body_edit(message: Message, state: FSMContext):
 
 @router.callback_query(F.data.startswith("search_details_"))
 async def search_details_callback(callback: CallbackQuery):
-    """Детальный просмотр результатов поиска"""
+    """Детальный просмотр результатов поиска (постранично, из кэша без повторного поиска)"""
     user_id = callback.from_user.id
     
     try:
         # Загружаем кэшированные результаты поиска
-        import json
-        import os
         from utils.html_utils import escape_html, truncate_and_escape
         
-        cache_file = os.path.join("data/search_cache", f"user_{user_id}_last_search.json")
-        
-        if not os.path.exists(cache_file):
+        await search_cache.preload(user_id)
+        if not search_cache.exists(user_id):
             await callback.answer("❌ Результаты поиска не найдены", show_alert=True)
             return
         
-        with open(cache_file, 'r', encoding='utf-8') as f:
-            cache_data = json.load(f)
+        cache_data = search_cache.view(user_id)
         
         search_results = cache_data.get('results', [])
         search_query = cache_data.get('query', 'неизвестно')
@@ -2139,12 +1752,25 @@ async def search_details_callback(callback: CallbackQuery):
             await callback.answer("❌ Нет результатов для детального просмотра", show_alert=True)
             return
         
+        # Номер страницы из callback_data (search_details_<страница>)
+        total_pages = (len(search_results) + SEARCH_DETAILS_PAGE_SIZE - 1) // SEARCH_DETAILS_PAGE_SIZE
+        try:
+            page = int(callback.data.rsplit("_", 1)[1])
+        except ValueError:
+            page = 0
+        page = max(0, min(page, total_pages - 1))
+        start = page * SEARCH_DETAILS_PAGE_SIZE
+        
         # Формируем детальный просмотр
         detailed_text = f"📖 <b>Детальный просмотр поиска</b>\n\n"
         detailed_text += f"🔍 <b>Запрос:</b> {escape_html(search_query)}\n"
-        detailed_text += f"📬 <b>Найдено писем:</b> {len(search_results)}\n\n"
+        detailed_text += f"📬 <b>Найдено писем:</b> {len(search_results)}"
+        if total_pages > 1:
+            detailed_text += f" (страница {page + 1} из {total_pages})"
+        detailed_text += "\n\n"
         
-        for i, email_data in enumerate(search_results, 1):
+        page_results = search_results[start:start + SEARCH_DETAILS_PAGE_SIZE]
+        for i, email_data in enumerate(page_results, start + 1):
             sender = email_data.get('sender', 'Неизвестный отправитель')
             subject = email_data.get('subject', 'Без темы')
             date = email_data.get('date', '')
@@ -2173,12 +1799,21 @@ async def search_details_callback(callback: CallbackQuery):
         from aiogram.utils.keyboard import InlineKeyboardBuilder
         builder = InlineKeyboardBuilder()
         
+        # Листание страниц
+        nav_buttons = 0
+        if page > 0:
+            builder.button(text="⬅️ Назад", callback_data=f"search_details_{page - 1}")
+            nav_buttons += 1
+        if page < total_pages - 1:
+            builder.button(text="Далее ➡️", callback_data=f"search_details_{page + 1}")
+            nav_buttons += 1
+        
         builder.button(text="📨 К входящим", callback_data="mail_inbox")
         builder.button(text="🔍 Новый поиск", callback_data="mail_search")
         builder.button(text="◀️ Назад к результатам", callback_data="search_back")
         builder.button(text="❌ Выйти", callback_data="menu_back")
         
-        builder.adjust(2, 2)
+        builder.adjust(*([nav_buttons] if nav_buttons else []), 2, 2)
         
         await callback.message.edit_text(
             detailed_text,
@@ -2197,18 +1832,14 @@ async def search_back_callback(callback: CallbackQuery):
     user_id = callback.from_user.id
     
     try:
-        import json
-        import os
         from utils.html_utils import escape_html, truncate_and_escape
         
-        cache_file = os.path.join("data/search_cache", f"user_{user_id}_last_search.json")
-        
-        if not os.path.exists(cache_file):
+        await search_cache.preload(user_id)
+        if not search_cache.exists(user_id):
             await callback.answer("❌ Результаты поиска не найдены", show_alert=True)
             return
         
-        with open(cache_file, 'r', encoding='utf-8') as f:
-            cache_data = json.load(f)
+        cache_data = search_cache.view(user_id)
         
         search_results = cache_data.get('results', [])
         search_query = cache_data.get('query', 'неизвестно')
@@ -2218,7 +1849,7 @@ async def search_back_callback(callback: CallbackQuery):
         results_text += f"📝 <b>Запрос:</b> {escape_html(search_query)}\n"
         results_text += f"📬 <b>Найдено:</b> {len(search_results)} писем\n\n"
         
-        for i, email_data in enumerate(search_results, 1):
+        for i, email_data in enumerate(search_results[:SEARCH_SUMMARY_SIZE], 1):
             sender = email_data.get('sender', 'Неизвестный отправитель')
             subject = email_data.get('subject', 'Без темы')
             date = email_data.get('date', '')
@@ -2238,7 +1869,7 @@ async def search_back_callback(callback: CallbackQuery):
         
         builder.button(
             text="📖 Детальный просмотр", 
-            callback_data=f"search_details_{len(search_results)}"
+            callback_data="search_details_0"
         )
         builder.button(text="📨 К входящим", callback_data="mail_inbox")
         builder.button(text="🔍 Новый поиск", callback_data="mail_search")
@@ -1,11 +1,16 @@
 from aiogram import Router, F
-from aiogram.types import CallbackQuery
-from utils.openai_client import openai_client
+from aiogram.types import BufferedInputFile, CallbackQuery
+from aiogram.exceptions import TelegramBadRequest
+from utils.openai_client import openai_client, TTS_MODEL
+from utils.tts_cache import tts_cache, make_key as make_tts_key
 from database.vector_memory import vector_memory
 import os
 
 router = Router()
 
+# Голос озвучки ответов
+TTS_VOICE = "alloy"
+
 @router.callback_query(F.data == "quick_voice")
 async def quick_voice_handler(callback: CallbackQuery):
     """Озвучить последний ответ"""
@@ -28,23 +33,27 @@ async def quick_voice_handler(callback: CallbackQuery):
         
         await callback.answer("🎤 Генерирую голосовой ответ...")
         
-        # Генерируем голосовой ответ
-        voice_response = await openai_client.text_to_speech(clean_text)
+        # Этот текст уже озвучивали - отправляем сообщение повторно по file_id
+        cache_key = make_tts_key(clean_text, TTS_VOICE, TTS_MODEL)
+        file_id = await tts_cache.get_file_id(cache_key)
+        if file_id:
+            try:
+                await callback.message.answer_voice(file_id, caption="🎤 Озвученный ответ")
+                return
+            except TelegramBadRequest:
+                await tts_cache.forget_file_id(cache_key)
+        
+        # Генерируем голосовой ответ (или берем из кэша)
+        voice_response = await tts_cache.get_or_create(
+            cache_key, lambda: openai_client.text_to_speech(clean_text, voice=TTS_VOICE)
+        )
         
         if voice_response:
-            # Сохраняем во временный файл
-            voice_file_path = f"temp_voice_{callback.from_user.id}.mp3"
-            with open(voice_file_path, 'wb') as f:
-                f.write(voice_response)
-            
-            # Отправляем голосовое сообщение
-            from aiogram.types import FSInputFile
-            voice_file = FSInputFile(voice_file_path)
-            await callback.message.answer_voice(voice_file, caption="🎤 Озвученный ответ")
-            
-            # Удаляем временный файл
-            if os.path.exists(voice_file_path):
-                os.remove(voice_file_path)
+            # Отправляем голосовое сообщение прямо из памяти
+            voice_file = BufferedInputFile(voice_response, filename="voice.mp3")
+            sent = await callback.message.answer_voice(voice_file, caption="🎤 Озвученный ответ")
+            if sent.voice:
+                await tts_cache.set_file_id(cache_key, sent.voice.file_id)
         else:
             await callback.message.answer("❌ Не удалось создать голосовой ответ. Возможно, TTS не настроен.")
             
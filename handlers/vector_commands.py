@@ -2,6 +2,7 @@ from aiogram import Router, F
 from aiogram.types import Message
 from aiogram.filters import Command
 from database.vector_memory import vector_memory
+from utils.conversation_summary import conversation_summaries
 from config.settings import settings
 
 router = Router()
@@ -52,6 +53,7 @@ async def clear_memory_command(message: Message):
         success = await vector_memory.clear_user_memory(user_id)
         
         if success:
+            conversation_summaries.clear(user_id)
             await message.answer("✅ Ваша память полностью очищена!\n\n🔄 Начнем знакомство заново.")
         else:
             await message.answer("❌ Ошибка при очистке памяти")
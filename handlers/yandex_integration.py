@@ -1,9 +1,13 @@
 import aiohttp
 import json
+import threading
+import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import caldav
 import requests
+from caldav.elements import dav
+from caldav.elements.base import ValuedBaseElement
 from icalendar import Calendar, Event
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
@@ -15,6 +19,8 @@ from utils.keyboards import BotKeyboards, ReminderKeyboards
 from database.user_tokens import user_tokens
 from utils.html_utils import escape_html, escape_email
 from utils.calendar_reminder_sync import CalendarReminderSync
+from utils.caldav_pool import caldav_pool
+from utils.calendar_cache import calendar_cache, event_dict
 
 router = Router()
 
@@ -178,13 +184,20 @@ class YandexMail:
             async with session.post(url, headers=headers, json=data) as response:
                 return response.status == 200
 
+class GetCtag(ValuedBaseElement):
+    """getctag (CalendarServer): меняется при любом изменении календаря"""
+    tag = "{http://calendarserver.org/ns/}getctag"
+
+
 class YandexCalendar:
     """Надежная реализация Яндекс.Календаря с защитой от всех ошибок"""
     
-    def __init__(self, app_password: str, username: str):
+    def __init__(self, app_password: str, username: str, calendar_url: Optional[str] = None):
         self.app_password = app_password
         self.username = username
         self.caldav_url = "https://caldav.yandex.ru"
+        # Адрес календаря, найденный раньше: с ним подключение обходится без PROPFIND
+        self.calendar_url = calendar_url
         
         # ИСПРАВЛЕНИЕ: НЕ создаем соединение в __init__
         # Это решает проблему с блокирующими вызовами в async контексте
@@ -194,14 +207,30 @@ class YandexCalendar:
         self.default_calendar = None
         self._connection_tested = False
         self._connection_successful = False
+        # Один клиент используется из разных потоков пула (см. utils/caldav_pool.py)
+        self._connect_lock = threading.Lock()
+        # Время последнего изменения календаря через этот клиент (для utils/calendar_cache.py)
+        self.modified_at = 0.0
         
         print(f"DEBUG: YandexCalendar создан для {username}, подключение будет выполнено по требованию")
     
+    @property
+    def connection_failed(self) -> bool:
+        """Подключение уже проверено и не удалось"""
+        return self._connection_tested and not self._connection_successful
+    
     def _ensure_connection(self) -> bool:
         """Проверяет и создает подключение если нужно (синхронный метод)"""
         if self._connection_tested:
             return self._connection_successful
         
+        with self._connect_lock:
+            if self._connection_tested:
+                return self._connection_successful
+            return self._connect()
+    
+    def _connect(self) -> bool:
+        """Создать DAVClient и найти календарь (вызывать под _connect_lock)"""
         try:
             print(f"DEBUG: Подключение к CalDAV для {self.username}...")
             
@@ -215,6 +244,15 @@ class YandexCalendar:
                 timeout=30  # Увеличиваем таймаут
             )
             
+            if self.calendar_url:
+                # Календарь уже найден раньше - обходимся без principal() и calendars()
+                self.default_calendar = self.client.calendar(url=self.calendar_url)
+                self.calendars = [self.default_calendar]
+                self._connection_successful = True
+                self._connection_tested = True
+                print(f"DEBUG: CalDAV подключен по сохраненному адресу календаря")
+                return True
+            
             # Тестируем подключение с повторными попытками
             for attempt in range(3):
                 try:
@@ -230,6 +268,7 @@ class YandexCalendar:
             
             if self.calendars and len(self.calendars) > 0:
                 self.default_calendar = self.calendars[0]
+                self.calendar_url = str(self.default_calendar.url)
                 self._connection_successful = True
                 print(f"DEBUG: CalDAV подключен успешно! Найдено календарей: {len(self.calendars)}")
             else:
@@ -298,21 +337,9 @@ class YandexCalendar:
                     cal = Calendar.from_ical(event.data)
                     for component in cal.walk():
                         if component.name == "VEVENT":
-                            title = str(component.get('summary', 'Без названия'))
-                            start = component.get('dtstart')
-                            end = component.get('dtend')
-                            
-                            event_data = {
-                                "summary": title,
-                                "start": {
-                                    "dateTime": start.dt.isoformat() if start else ""
-                                },
-                                "end": {
-                                    "dateTime": end.dt.isoformat() if end else ""
-                                }
-                            }
+                            event_data = event_dict(component)
                             result.append(event_data)
-                            print(f"DEBUG: Найдено событие: {title}")
+                            print(f"DEBUG: Найдено событие: {event_data['summary']}")
                 
                 except Exception as e:
                     print(f"DEBUG: Ошибка парсинга события: {e}")
@@ -323,8 +350,9 @@ class YandexCalendar:
             
         except Exception as e:
             print(f"DEBUG: Критическая ошибка получения событий: {e}")
-            # Сбрасываем статус подключения для повторной попытки
+            # Сбрасываем статус подключения для повторной попытки (с поиском календаря заново)
             self._connection_tested = False
+            self.calendar_url = None
             return []
     
     async def get_events(self, start_date: str, end_date: str) -> List[Dict]:
@@ -333,6 +361,94 @@ class YandexCalendar:
         loop = asyncio.get_event_loop()
         return await loop.run_in_executor(None, self.get_events_sync, start_date, end_date)
     
+    def sync_events_sync(self, sync_token: Optional[str], ctag: Optional[str],
+                         etags: Dict[str, str]) -> Optional[Dict]:
+        """Изменения календаря с прошлой синхронизации (синхронный метод)
+        
+        Args:
+            sync_token: Токен прошлой синхронизации (None - первая)
+            ctag: getctag календаря на момент прошлой синхронизации
+            etags: Известные ресурсы {href: etag}
+        
+        Returns:
+            {'sync_token', 'ctag', 'changed': {href: (etag, ics)}, 'deleted': [href]}
+            или None при ошибке
+        """
+        if not self._ensure_connection() or not self.default_calendar:
+            return None
+        
+        try:
+            return self._collect_changes(sync_token, ctag, etags)
+        except Exception as e:
+            print(f"DEBUG: Ошибка синхронизации календаря: {e}")
+            error = e
+        
+        if sync_token:
+            # Сервер мог отклонить устаревший токен (RFC 6578 valid-sync-token) -
+            # повторяем полным перечислением, иначе ошибка повторялась бы при каждом обновлении
+            try:
+                return self._collect_changes(None, None, etags)
+            except Exception as e:
+                print(f"DEBUG: Ошибка полной синхронизации календаря: {e}")
+                error = e
+        
+        # Переподключимся при следующем запросе; календарь ищем заново, только если его адрес пропал
+        self._connection_tested = False
+        if isinstance(error, caldav.lib.error.NotFoundError):
+            self.calendar_url = None
+        return None
+    
+    def _collect_changes(self, sync_token: Optional[str], ctag: Optional[str],
+                         etags: Dict[str, str]) -> Dict:
+        """Измененные и удаленные ресурсы относительно etags (исключение - при ошибке сервера)"""
+        # Календарь не менялся - ни списка ресурсов, ни загрузок
+        try:
+            current_ctag = self.default_calendar.get_property(GetCtag())
+        except Exception as e:
+            print(f"DEBUG: getctag недоступен: {e}")
+            current_ctag = None
+        if sync_token and current_ctag and current_ctag == ctag:
+            return {'sync_token': sync_token, 'ctag': ctag, 'changed': {}, 'deleted': []}
+        
+        # REPORT sync-collection; без поддержки sync-token caldav перечисляет все ресурсы
+        # с "fake-" токеном и возвращает пустой список, если ничего не изменилось
+        updates = self.default_calendar.get_objects_by_sync_token(sync_token, load_objects=False)
+        new_token = updates.sync_token
+        full_listing = not sync_token or (
+            isinstance(new_token, str) and new_token.startswith("fake-") and new_token != sync_token
+        )
+        
+        changed, deleted, seen = {}, [], set()
+        for obj in updates:
+            href = str(obj.url.canonical())
+            seen.add(href)
+            etag = obj.props.get(dav.GetEtag.tag)
+            if etag and etags.get(href) == etag:
+                continue
+            
+            # Скачиваем только новые и измененные ресурсы
+            if not obj.data:
+                try:
+                    obj.load()
+                except caldav.lib.error.NotFoundError:
+                    deleted.append(href)
+                    continue
+            etag = obj.props.get(dav.GetEtag.tag) or etag or ""
+            changed[href] = (etag, obj.data)
+        
+        if full_listing:
+            deleted.extend(href for href in etags if href not in seen)
+        
+        print(f"DEBUG: Синхронизация календаря: изменено {len(changed)}, удалено {len(deleted)}")
+        return {'sync_token': new_token, 'ctag': current_ctag, 'changed': changed, 'deleted': deleted}
+    
+    async def sync_events(self, sync_token: Optional[str], ctag: Optional[str],
+                          etags: Dict[str, str]) -> Optional[Dict]:
+        """Асинхронная обертка для синхронизации событий"""
+        import asyncio
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.sync_events_sync, sync_token, ctag, etags)
+    
     def create_event_sync(self, title: str, start_time: str, end_time: str, description: str = "") -> bool:
         """Создать событие через CalDAV (синхронный метод с защитой от ошибок)"""
         try:
@@ -375,6 +491,7 @@ class YandexCalendar:
             for attempt in range(3):  # 3 попытки
                 try:
                     self.default_calendar.add_event(cal.to_ical().decode('utf-8'))
+                    self.modified_at = time.monotonic()
                     print(f"DEBUG: Событие '{title}' успешно создано")
                     return True
                 except Exception as e:
@@ -388,8 +505,9 @@ class YandexCalendar:
             
         except Exception as e:
             print(f"DEBUG: Критическая ошибка создания события: {e}")
-            # Сбрасываем статус подключения для повторной попытки
+            # Сбрасываем статус подключения для повторной попытки (с поиском календаря заново)
             self._connection_tested = False
+            self.calendar_url = None
             return False
     
     async def create_event(self, title: str, start_time: str, end_time: str, description: str = "") -> bool:
@@ -401,22 +519,26 @@ class YandexCalendar:
     def delete_event_sync(self, event_id: str) -> bool:
         """Синхронное удаление события из календаря"""
         try:
-            if not self.client:
-                self._connect()
+            if not self._ensure_connection() or not self.default_calendar:
+                print("DEBUG: Не удалось подключиться к календарю для удаления события")
+                return False
             
-            # Поиск и удаление события по UID
-            for calendar in self.client.calendars():
-                for event in calendar.events():
-                    if event.id == event_id or str(event.id) == event_id:
-                        event.delete()
-                        print(f"DEBUG: Событие {event_id} успешно удалено")
-                        return True
+            # Поиск события по UID - один запрос REPORT
+            try:
+                event = self.default_calendar.event_by_uid(event_id)
+            except caldav.lib.error.NotFoundError:
+                print(f"DEBUG: Событие {event_id} не найдено для удаления")
+                return False
             
-            print(f"DEBUG: Событие {event_id} не найдено для удаления")
-            return False
+            event.delete()
+            self.modified_at = time.monotonic()
+            print(f"DEBUG: Событие {event_id} успешно удалено")
+            return True
             
         except Exception as e:
             print(f"Ошибка удаления события {event_id}: {e}")
+            self._connection_tested = False
+            self.calendar_url = None
             return False
     
     async def delete_event(self, event_id: str) -> bool:
@@ -554,8 +676,8 @@ async def calendar_today_handler(callback: CallbackQuery):
         # Создаем клиент календаря с надежным подключением
         app_password = token_data.get("app_password")
         if app_password:
-            # Создаем надежный клиент с защитой от сбоев
-            calendar_client = YandexCalendar(app_password, user_email)
+            # Клиент из кэша сессий: подключение и найденный календарь переиспользуются
+            calendar_client = caldav_pool.get(user_email, app_password)
             
             # Проверяем подключение перед использованием
             connection_result = await calendar_client.ensure_connection_async()
@@ -593,7 +715,7 @@ async def calendar_today_handler(callback: CallbackQuery):
         end_date = today.strftime("%Y-%m-%dT23:59:59")
         
         print(f"DEBUG: Запрос событий календаря для {user_id}, email: {user_email}...")
-        events = await calendar_client.get_events(start_date, end_date)
+        events = await calendar_cache.get_events(user_id, calendar_client, start_date, end_date)
         print(f"DEBUG: Получено событий: {len(events) if events else 0}")
         
         # Показываем события с интерактивными кнопками
@@ -722,7 +844,7 @@ async def calendar_week_handler(callback: CallbackQuery):
         # Создаем клиент календаря
         app_password = token_data.get("app_password")
         if app_password:
-            calendar_client = YandexCalendar(app_password, user_email)
+            calendar_client = caldav_pool.get(user_email, app_password)
             
             # Проверяем подключение
             connection_result = await calendar_client.ensure_connection_async()
@@ -764,7 +886,7 @@ async def calendar_week_handler(callback: CallbackQuery):
         end_date = week_end.strftime("%Y-%m-%dT23:59:59")
         
         print(f"DEBUG: Запрос событий календаря на неделю для {user_id}, email: {user_email}...")
-        events = await calendar_client.get_events(start_date, end_date)
+        events = await calendar_cache.get_events(user_id, calendar_client, start_date, end_date)
         print(f"DEBUG: Получено событий на неделю: {len(events) if events else 0}")
         
         if events:
@@ -1239,6 +1361,8 @@ async def calendar_setup_save(callback: CallbackQuery, state: FSMContext):
             }
             
             await save_user_token(callback.from_user.id, "calendar", calendar_data)
+            # Проверенное подключение сразу используется обработчиками календаря
+            caldav_pool.put(test_calendar)
             
             await callback.message.edit_text(
                 f"✅ <b>Календарь успешно подключен!</b>\n\n"
@@ -1501,8 +1625,8 @@ async def create_calendar_event(message: Message, state: FSMContext):
             await state.clear()
             return
         
-        # Создаем надежный клиент календаря
-        calendar_client = YandexCalendar(app_password, user_email)
+        # Клиент календаря из кэша сессий
+        calendar_client = caldav_pool.get(user_email, app_password)
         
         # Проверяем подключение перед созданием события
         connection_result = await calendar_client.ensure_connection_async()
@@ -1897,9 +2021,20 @@ async def send_email_confirm(callback: CallbackQuery, state: FSMContext):
             parse_mode="HTML"
         )
         
+        # Показываем повторные попытки, если сервер временно не принимает письмо
+        async def on_status(status: str, to_email: str, info: dict):
+            if status == 'retrying':
+                await callback.message.edit_text(
+                    "📤 <b>Отправляю письмо...</b>\n\n"
+                    f"👤 Кому: {escape_html(recipient_name)}\n"
+                    f"📧 Email: {escape_email(recipient_email)}\n\n"
+                    f"🔁 Сервер временно недоступен, попытка {info['attempt'] + 1} через {info['delay']:.0f} с...",
+                    parse_mode="HTML"
+                )
+        
         # Отправляем письмо
         from utils.email_sender import email_sender
-        success = await email_sender.send_email(user_id, recipient_email, subject, body)
+        success = await email_sender.send_email(user_id, recipient_email, subject, body, on_status=on_status)
         
         if success:
             await callback.message.edit_text(
@@ -2382,7 +2517,7 @@ async def calendar_delete_confirm_handler(callback: CallbackQuery):
         app_password = token_data["app_password"]
         username = token_data.get("username") or token_data.get("email")
         
-        calendar = YandexCalendar(app_password, username)
+        calendar = caldav_pool.get(username, app_password)
         
         # Удаляем событие из календаря
         success = await calendar.delete_event(event_id)
@@ -2463,15 +2598,16 @@ async def delete_calendar_event_from_reminder(callback: CallbackQuery):
             await callback.answer()
             return
         
-        # Создаем клиент календаря
-        calendar_client = YandexCalendar(app_password, username)
+        # Клиент календаря из кэша сессий
+        calendar_client = caldav_pool.get(username, app_password)
         
         # Получаем события календаря
         from datetime import datetime, timedelta
         start_date = datetime.now() - timedelta(days=7)  # Ищем в событиях последней недели
         end_date = datetime.now() + timedelta(days=30)   # И на месяц вперед
         
-        events = await calendar_client.get_events(
+        events = await calendar_cache.get_events(
+            user_id, calendar_client,
             start_date.strftime('%Y-%m-%dT%H:%M:%S'),
             end_date.strftime('%Y-%m-%dT%H:%M:%S')
         )
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Перенос локальных данных из JSON-файлов data/ в базу SQLite
+Запуск: python migrate_to_sqlite.py [--data data] [--db data/bot.db]
+
+Переносятся контакты, токены, настройки, черновики, история переписки
+и ее краткие изложения.
+Повторный запуск безопасен: документы перезаписываются, история пользователя
+переносится, только если в базе ее еще нет. Файлы не удаляются.
+После переноса включите STORAGE_BACKEND=sqlite в .env.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database.sqlite_store import SqliteDatabase
+
+# Таблица -> (подкаталог data/, шаблон имени файла с ID пользователя)
+DOCUMENT_SOURCES = {
+    'contacts': ('contacts', r'user_(\d+)_contacts\.json'),
+    'user_tokens': ('user_tokens', r'user_(\d+)\.json'),
+    'user_settings': ('user_settings', r'user_(\d+)\.json'),
+    'drafts': ('drafts', r'drafts_(\d+)\.json'),
+    'email_drafts': ('drafts', r'user_(\d+)_drafts\.json'),
+    'conversation_summaries': ('summaries', r'user_(\d+)\.json'),
+    'calendar_events': ('calendar_events', r'user_(\d+)\.json'),
+    'search_cache': ('search_cache', r'user_(\d+)_last_search\.json'),
+}
+
+CONVERSATION_FILE = re.compile(r'user_(\d+)\.(jsonl|json)')
+
+
+def _read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _read_conversation(path):
+    """Записи истории из JSONL-журнала или старого JSON-массива"""
+    if path.endswith('.json'):
+        history = _read_json(path)
+        return history if isinstance(history, list) else []
+
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue  # Оборванная строка
+    return records
+
+
+def migrate_documents(db, data_dir):
+    """Перенести документы пользователей; вернуть число по таблицам"""
+    counts = {}
+    for table, (subdir, pattern) in DOCUMENT_SOURCES.items():
+        db.create_document_table(table)
+        directory = os.path.join(data_dir, subdir)
+        rows = []
+        if os.path.isdir(directory):
+            for file_name in os.listdir(directory):
+                match = re.fullmatch(pattern, file_name)
+                if not match:
+                    continue
+                path = os.path.join(directory, file_name)
+                try:
+                    data = json.dumps(_read_json(path), ensure_ascii=False, separators=(',', ':'))
+                except Exception as e:
+                    print(f"Пропущен {path}: {e}")
+                    continue
+                rows.append((int(match.group(1)), data, os.path.getmtime(path)))
+
+        db.run(lambda conn: conn.executemany(
+            f"INSERT INTO {table} (user_id, data, updated_at) VALUES (?, ?, ?) "
+            f"ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+            rows
+        ))
+        counts[table] = len(rows)
+    return counts
+
+
+def migrate_conversations(db, data_dir):
+    """Перенести историю переписки; вернуть число пользователей"""
+    files = {}
+    for file_name in os.listdir(data_dir):
+        match = CONVERSATION_FILE.fullmatch(file_name)
+        if match:
+            # JSONL-журнал новее старого JSON-массива
+            user_id = int(match.group(1))
+            if user_id not in files or match.group(2) == 'jsonl':
+                files[user_id] = os.path.join(data_dir, file_name)
+
+    migrated = 0
+    for user_id, path in sorted(files.items()):
+        try:
+            records = _read_conversation(path)
+        except Exception as e:
+            print(f"Пропущен {path}: {e}")
+            continue
+
+        created_at = os.path.getmtime(path)
+
+        def insert(conn):
+            exists = conn.execute(
+                "SELECT 1 FROM conversations WHERE user_id = ? LIMIT 1", (user_id,)
+            ).fetchone()
+            if exists:
+                return False
+            conn.executemany(
+                "INSERT INTO conversations (user_id, user_message, ai_response, timestamp, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (user_id, r.get('user_message'), r.get('ai_response'), r.get('timestamp', ''), created_at)
+                    for r in records if isinstance(r, dict)
+                ]
+            )
+            return True
+
+        if db.run(insert):
+            migrated += 1
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перенос данных из JSON-файлов в SQLite")
+    parser.add_argument('--data', default='data', help="Каталог с JSON-файлами")
+    parser.add_argument('--db', default=None, help="Путь к базе (по умолчанию SQLITE_PATH)")
+    args = parser.parse_args()
+
+    if args.db is None:
+        from config.settings import settings
+        args.db = settings.SQLITE_PATH
+
+    started = time.monotonic()
+    db = SqliteDatabase(args.db)
+    print(f"Перенос {args.data} -> {args.db}")
+
+    for table, count in migrate_documents(db, args.data).items():
+        print(f"  {table}: {count}")
+    print(f"  conversations: {migrate_conversations(db, args.data)} пользователей")
+
+    db.close()
+    print(f"Готово за {time.monotonic() - started:.1f} с. Включите STORAGE_BACKEND=sqlite в .env")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест кэша AI-переписываний: LRU + TTL, дисковый уровень, один запрос на одинаковые промахи
+"""
+import asyncio
+import os
+import tempfile
+import threading
+import time
+
+from utils.ai_cache import AIResponseCache, make_key
+
+
+def test_key_normalization():
+    """Лишние пробелы не меняют ключ, а шаблон, версия и температура - меняют"""
+    key = make_key('email_subject', 1, 'gpt', 0.1, 'о  встрече ')
+    assert key == make_key('email_subject', 1, 'gpt', 0.1, 'о встрече')
+    assert key != make_key('email_subject', 2, 'gpt', 0.1, 'о встрече')
+    assert key != make_key('email_subject', 1, 'gpt', 0.7, 'о встрече')
+    assert key != make_key('improve_subject', 1, 'gpt', 0.1, 'о встрече')
+
+
+async def _requests(cache, keys):
+    calls = []
+
+    async def factory(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value
+
+    results = await asyncio.gather(*(cache.get_or_create(key, lambda k=key: factory(k)) for key in keys))
+    return results, calls
+
+
+def test_singleflight_and_metrics():
+    """Пять одинаковых запросов - один вызов API"""
+    cache = AIResponseCache(max_entries=10)
+    results, calls = asyncio.run(_requests(cache, ['a'] * 5 + ['b']))
+    assert results == ['a'] * 5 + ['b']
+    assert sorted(calls) == ['a', 'b']
+
+    asyncio.run(_requests(cache, ['a']))
+    metrics = cache.get_metrics()
+    print(f"Метрики: {metrics}")
+    assert metrics['misses'] == 2
+    assert metrics['hits'] == 5
+    assert abs(metrics['hit_rate'] - 5 / 7) < 1e-9
+
+
+def test_errors_not_cached():
+    """None от фабрики (ошибка API) не сохраняется"""
+    cache = AIResponseCache()
+
+    async def failing():
+        return None
+
+    assert asyncio.run(cache.get_or_create('k', failing)) is None
+    assert cache.get('k') is None
+
+
+def test_lru_and_ttl():
+    """Вытеснение самых давних и истечение срока"""
+    cache = AIResponseCache(max_entries=2, ttl=0.05)
+    cache.put('a', '1')
+    cache.put('b', '2')
+    cache.get('a')
+    cache.put('c', '3')
+    assert cache.get('b') is None
+    assert cache.get('a') == '1'
+    time.sleep(0.06)
+    assert cache.get('a') is None
+
+
+def test_disk_tier():
+    """Ответы на диске переживают перезапуск"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'ai_cache.db')
+        cache = AIResponseCache(path=path)
+        cache.put('k', 'Важная встреча')
+        cache.close()
+
+        restarted = AIResponseCache(path=path)
+        assert restarted.get('k') == 'Важная встреча'
+        assert restarted.get_metrics()['disk_hits'] == 1
+        assert restarted.get('k') == 'Важная встреча'
+        assert restarted.get_metrics()['hits'] == 1
+        restarted.close()
+
+
+def test_disk_io_off_event_loop():
+    """get_or_create читает и пишет диск в потоке кэша"""
+    with tempfile.TemporaryDirectory() as directory:
+        cache = AIResponseCache(path=os.path.join(directory, 'ai_cache.db'))
+        threads = []
+        disk_get, disk_put = cache._disk_get, cache._disk_put
+
+        def tracked_get(*args):
+            threads.append(threading.current_thread().name)
+            return disk_get(*args)
+
+        def tracked_put(*args):
+            threads.append(threading.current_thread().name)
+            disk_put(*args)
+
+        cache._disk_get, cache._disk_put = tracked_get, tracked_put
+
+        async def answer():
+            return 'Отчет за месяц'
+
+        assert asyncio.run(cache.get_or_create('k', answer)) == 'Отчет за месяц'
+        cache.close()
+
+        restarted = AIResponseCache(path=os.path.join(directory, 'ai_cache.db'))
+        assert asyncio.run(restarted.get_or_create('k', answer)) == 'Отчет за месяц'
+        assert restarted.get_metrics()['disk_hits'] == 1
+        restarted.close()
+    assert len(threads) == 2 and all(name.startswith('ai_cache') for name in threads)
+
+
+if __name__ == "__main__":
+    print("=== ТЕСТ КЭША AI ===")
+    test_key_normalization()
+    test_singleflight_and_metrics()
+    test_errors_not_cached()
+    test_lru_and_ttl()
+    test_disk_tier()
+    test_disk_io_off_event_loop()
+    print("\nТест успешен!")
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест фоновой очереди: повторы, восстановление из spool, ограничение размера
+"""
+import asyncio
+import os
+import tempfile
+import threading
+
+from utils.background_queue import BackgroundQueue
+
+
+def test_retries_until_success():
+    """Упавшая задача повторяется, после max_attempts отбрасывается"""
+    queue = BackgroundQueue(workers=2, max_attempts=3, retry_delay=0.01)
+    attempts = {'flaky': 0, 'broken': 0}
+
+    @queue.job('flaky')
+    async def flaky(name):
+        attempts[name] += 1
+        if attempts[name] < 2:
+            raise RuntimeError('временная ошибка')
+
+    @queue.job('broken')
+    async def broken(name):
+        attempts[name] += 1
+        raise RuntimeError('постоянная ошибка')
+
+    async def scenario():
+        await queue.start()
+        await queue.enqueue('flaky', name='flaky')
+        await queue.enqueue('broken', name='broken')
+        await queue.join()
+        await queue.stop()
+
+    asyncio.run(scenario())
+    print(f"Метрики: {queue.get_metrics()}")
+    assert attempts == {'flaky': 2, 'broken': 3}
+    assert queue.stats['done'] == 1 and queue.stats['failed'] == 1 and queue.stats['retried'] == 3
+
+
+def test_spool_survives_restart():
+    """Задачи, не выполненные до остановки, выполняются после перезапуска"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'jobs.db')
+        done = []
+        threads = set()
+
+        def make_queue():
+            queue = BackgroundQueue(workers=1, spool_path=path)
+
+            @queue.job('save')
+            async def save(text):
+                done.append(text)
+
+            return queue
+
+        async def before_restart():
+            # Бот остановился до запуска воркеров: задачи только в spool
+            queue = make_queue()
+            await queue.enqueue('save', text='первый')
+            await queue.enqueue('save', text='второй')
+            queue._conn.close()
+
+        async def after_restart():
+            queue = make_queue()
+            spool_remove = queue._spool_remove
+
+            def tracked_remove(job_id):
+                threads.add(threading.current_thread().name)
+                spool_remove(job_id)
+
+            queue._spool_remove = tracked_remove
+            await queue.start()
+            await queue.join()
+            await queue.stop()
+            return queue._spool_load()
+
+        asyncio.run(before_restart())
+        assert done == []
+        remaining = asyncio.run(after_restart())
+        assert done == ['первый', 'второй']
+        assert remaining == []
+        # Запросы к spool выполняются не в event loop
+        assert threads and all(name.startswith('background_spool') for name in threads)
+
+
+def test_backpressure():
+    """Заполненная очередь заставляет enqueue ждать воркера"""
+    queue = BackgroundQueue(workers=1, max_size=1)
+    release = None
+
+    @queue.job('slow')
+    async def slow():
+        await release.wait()
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        await queue.start()
+        await queue.enqueue('slow')
+        await asyncio.sleep(0)
+        await queue.enqueue('slow')
+        third = asyncio.create_task(queue.enqueue('slow'))
+        await asyncio.sleep(0.02)
+        blocked = not third.done()
+        release.set()
+        await third
+        await queue.join()
+        await queue.stop()
+        return blocked
+
+    assert asyncio.run(scenario())
+    assert queue.stats['done'] == 3
+
+
+def test_unknown_job():
+    """Неизвестный вид задачи - ошибка при постановке"""
+    queue = BackgroundQueue()
+    try:
+        asyncio.run(queue.enqueue('missing'))
+    except ValueError:
+        return
+    raise AssertionError('ожидалась ошибка ValueError')
+
+
+if __name__ == "__main__":
+    print("=== ТЕСТ ФОНОВОЙ ОЧЕРЕДИ ===")
+    test_retries_until_success()
+    test_spool_survives_restart()
+    test_backpressure()
+    test_unknown_job()
+    print("\nТест успешен!")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест кэша CalDAV-сессий: один клиент на аккаунт, поиск календаря один раз
+"""
+import asyncio
+
+import caldav
+
+from handlers.yandex_integration import YandexCalendar
+from utils.caldav_pool import CalDAVSessionPool
+
+
+class FakeCalendar:
+    url = 'https://caldav.yandex.ru/calendars/user/events-1/'
+
+    def __init__(self, requests):
+        self.requests = requests
+
+    def date_search(self, start, end):
+        self.requests.append('REPORT')
+        return []
+
+
+class FakeDAVClient:
+    """DAVClient, считающий запросы к серверу"""
+
+    requests = []
+    clients = 0
+
+    def __init__(self, **kwargs):
+        FakeDAVClient.clients += 1
+
+    def principal(self):
+        self.requests.append('PROPFIND principal')
+        client = self
+
+        class Principal:
+            def calendars(self):
+                client.requests.append('PROPFIND calendars')
+                return [FakeCalendar(client.requests)]
+
+        return Principal()
+
+    def calendar(self, url):
+        calendar = FakeCalendar(self.requests)
+        calendar.url = url
+        return calendar
+
+
+def test_pool_reuses_and_renews():
+    """Повторные запросы - тот же клиент; TTL - новый клиент с тем же адресом; смена пароля - сброс"""
+    created = []
+
+    class Client:
+        connection_failed = False
+
+        def __init__(self, app_password, username, calendar_url=None):
+            self.app_password = app_password
+            self.username = username
+            self.calendar_url = calendar_url or 'url-' + username
+            created.append(calendar_url)
+
+    pool = CalDAVSessionPool(ttl=60, factory=Client)
+    first = pool.get('user@yandex.ru', 'secret')
+    assert pool.get('user@yandex.ru', 'secret') is first
+
+    pool.ttl = 0
+    renewed = pool.get('user@yandex.ru', 'secret')
+    assert renewed is not first and created[-1] == 'url-user@yandex.ru'
+
+    pool.ttl = 60
+    changed = pool.get('user@yandex.ru', 'new-secret')
+    assert changed.app_password == 'new-secret' and created[-1] is None
+
+    changed.connection_failed = True
+    assert pool.get('user@yandex.ru', 'new-secret') is not changed
+    print(f"Метрики: {pool.get_metrics()}")
+
+
+def test_single_report_after_discovery():
+    """Первый запрос ищет календарь, следующие - только REPORT, в том числе после TTL"""
+    original = caldav.DAVClient
+    caldav.DAVClient = FakeDAVClient
+    FakeDAVClient.requests = []
+    try:
+        pool = CalDAVSessionPool(ttl=3600, factory=YandexCalendar)
+
+        async def today():
+            calendar = pool.get('user@yandex.ru', 'secret')
+            await calendar.get_events('2026-10-18T00:00:00', '2026-10-18T23:59:59')
+
+        asyncio.run(today())
+        assert FakeDAVClient.requests == ['PROPFIND principal', 'PROPFIND calendars', 'REPORT']
+
+        FakeDAVClient.requests.clear()
+        asyncio.run(today())
+        assert FakeDAVClient.requests == ['REPORT']
+
+        pool.ttl = 0
+        FakeDAVClient.requests.clear()
+        asyncio.run(today())
+        assert FakeDAVClient.requests == ['REPORT']
+    finally:
+        caldav.DAVClient = original
+
+
+if __name__ == "__main__":
+    print("=== ТЕСТ КЭША CALDAV-СЕССИЙ ===")
+    test_pool_reuses_and_renews()
+    test_single_report_after_discovery()
+    print("\nТест успешен!")
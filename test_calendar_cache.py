@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест локального кэша событий календаря: просмотры без сети, загрузка только измененных ресурсов
+"""
+import asyncio
+import tempfile
+
+import caldav
+from caldav.elements import dav
+
+from database.json_store import JsonDocumentStore
+from handlers.yandex_integration import YandexCalendar
+from utils.calendar_cache import CalendarEventCache
+
+
+def ics(uid: str, summary: str, start: str, end: str, rrule: str = "") -> str:
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//test//EN", "BEGIN:VEVENT",
+             f"UID:{uid}", f"SUMMARY:{summary}", f"DTSTART:{start}", f"DTEND:{end}"]
+    if rrule:
+        lines.append(f"RRULE:{rrule}")
+    lines += ["END:VEVENT", "END:VCALENDAR"]
+    return "\r\n".join(lines) + "\r\n"
+
+
+class FakeClient:
+    """Клиент календаря: отдает заранее подготовленные результаты синхронизации"""
+
+    def __init__(self, results):
+        self.username = 'user@yandex.ru'
+        self.modified_at = 0.0
+        self.results = list(results)
+        self.calls = []
+
+    async def sync_events(self, sync_token, ctag, etags):
+        self.calls.append((sync_token, ctag, dict(etags)))
+        return self.results.pop(0)
+
+
+def make_cache(directory: str, interval: float = 60) -> CalendarEventCache:
+    cache = CalendarEventCache(sync_interval=interval)
+    cache.store = JsonDocumentStore(directory, "user_{user_id}.json", dict)
+    return cache
+
+
+def test_views_served_locally():
+    """Повторные просмотры не синхронизируют; изменение через бота - синхронизирует"""
+    first = {'sync_token': 't1', 'ctag': 'c1', 'deleted': [], 'changed': {
+        '/cal/a.ics': ('"e1"', ics('a', 'Планерка', '20261018T100000', '20261018T110000')),
+        '/cal/b.ics': ('"e1"', ics('b', 'Отпуск', '20261025T100000', '20261025T110000')),
+        '/cal/c.ics': ('"e1"', ics('c', 'Спорт', '20261004T070000', '20261004T080000', 'FREQ=WEEKLY')),
+    }}
+    second = {'sync_token': 't2', 'ctag': 'c2', 'deleted': ['/cal/a.ics'], 'changed': {}}
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = make_cache(directory)
+        client = FakeClient([first, second])
+
+        async def scenario():
+            today = await cache.get_events(1, client, '2026-10-18T00:00:00', '2026-10-18T23:59:59')
+            again = await cache.get_events(1, client, '2026-10-18T00:00:00', '2026-10-18T23:59:59')
+            client.modified_at = 10 ** 9
+            after_delete = await cache.get_events(1, client, '2026-10-18T00:00:00', '2026-10-18T23:59:59')
+            return today, again, after_delete
+
+        today, again, after_delete = asyncio.run(scenario())
+        cache.store.flush()
+
+    assert [event['summary'] for event in today] == ['Спорт', 'Планерка']
+    assert today == again
+    assert [event['summary'] for event in after_delete] == ['Спорт']
+    assert len(client.calls) == 2
+    assert client.calls[1][:2] == ('t1', 'c1') and set(client.calls[1][2]) == {'/cal/a.ics', '/cal/b.ics', '/cal/c.ics'}
+    print(f"Метрики: {cache.get_metrics()}")
+
+
+def test_failed_sync_without_data_falls_back():
+    class Client(FakeClient):
+        async def get_events(self, start_date, end_date):
+            return [{'summary': 'напрямую'}]
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = make_cache(directory)
+        events = asyncio.run(cache.get_events(1, Client([None]), '2026-10-18T00:00:00', '2026-10-18T23:59:59'))
+    assert events == [{'summary': 'напрямую'}]
+
+
+class FakeResource:
+    def __init__(self, store, href, etag):
+        self.store = store
+        self.url = FakeURL(href)
+        self.props = {dav.GetEtag.tag: etag}
+        self.data = None
+
+    def load(self):
+        self.store.downloads.append(str(self.url))
+        self.data = self.store.resources[str(self.url)][1]
+
+
+class FakeURL(str):
+    def canonical(self):
+        return self
+
+
+class FakeCollection(list):
+    sync_token = 'fake-2'
+
+
+class FakeDAVCalendar:
+    """Календарь без поддержки sync-token: перечисляет все ресурсы с etag"""
+
+    def __init__(self):
+        self.ctag = 'c1'
+        self.resources = {'/a.ics': ('"1"', ics('a', 'A', '20261018T100000', '20261018T110000')),
+                          '/b.ics': ('"1"', ics('b', 'B', '20261018T120000', '20261018T130000'))}
+        self.downloads = []
+        self.listings = 0
+
+    def get_property(self, prop):
+        return self.ctag
+
+    def get_objects_by_sync_token(self, sync_token, load_objects=False):
+        self.listings += 1
+        if sync_token == 'expired':
+            raise caldav.lib.error.ReportError('valid-sync-token')
+        return FakeCollection(FakeResource(self, href, etag) for href, (etag, _) in self.resources.items())
+
+
+def test_sync_downloads_only_changed():
+    """Неизменный ctag - без перечисления; затем скачивается только ресурс с новым etag"""
+    client = YandexCalendar('secret', 'user@yandex.ru', calendar_url='/cal/')
+    client._connection_tested = client._connection_successful = True
+    client.default_calendar = server = FakeDAVCalendar()
+
+    first = client.sync_events_sync(None, None, {})
+    assert set(first['changed']) == {'/a.ics', '/b.ics'} and first['deleted'] == []
+
+    etags = {href: etag for href, (etag, _) in first['changed'].items()}
+    unchanged = client.sync_events_sync(first['sync_token'], first['ctag'], etags)
+    assert unchanged['changed'] == {} and server.listings == 1
+
+    server.ctag = 'c2'
+    server.resources['/b.ics'] = ('"2"', ics('b', 'B2', '20261018T120000', '20261018T130000'))
+    del server.resources['/a.ics']
+    server.downloads.clear()
+    changed = client.sync_events_sync('fake-1', first['ctag'], etags)
+    assert list(changed['changed']) == ['/b.ics'] and changed['deleted'] == ['/a.ics']
+    assert server.downloads == ['/b.ics']
+
+
+def test_rejected_token_falls_back_to_full_listing():
+    """Отклоненный sync-token - полное перечисление без повторного поиска календаря"""
+    client = YandexCalendar('secret', 'user@yandex.ru', calendar_url='/cal/')
+    client._connection_tested = client._connection_successful = True
+    client.default_calendar = server = FakeDAVCalendar()
+    server.ctag = 'c2'
+
+    result = client.sync_events_sync('expired', 'c1', {'/a.ics': '"1"', '/gone.ics': '"1"'})
+    assert result['sync_token'] == 'fake-2'
+    assert list(result['changed']) == ['/b.ics'] and result['deleted'] == ['/gone.ics']
+    assert server.listings == 2 and client.calendar_url == '/cal/'
+
+
+if __name__ == "__main__":
+    print("=== ТЕСТ КЭША СОБЫТИЙ КАЛЕНДАРЯ ===")
+    test_views_served_locally()
+    test_failed_sync_without_data_falls_back()
+    test_sync_downloads_only_changed()
+    test_rejected_token_falls_back_to_full_listing()
+    print("\nТест успешен!")
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Микро-бенчмарк командных грамматик на корпусе реальных команд
+
+Проверяет, что объединенная грамматика дает тот же результат, что и
+последовательный перебор паттернов, и что время сопоставления не выросло.
+Запуск: python test_command_grammar.py
+"""
+
+import re
+import sys
+import os
+import time
+
+# Добавляем путь для импорта
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from handlers.email_fix import EMAIL_GRAMMAR
+from handlers.intent_router import (
+    CALENDAR_GRAMMAR, EDIT_GRAMMAR, SEARCH_GRAMMAR, WEB_QUESTION_GRAMMAR
+)
+
+# Корпус реальных команд пользователей (из тестов распознавания и логов)
+CORPUS = [
+    "встреча с командой завтра",
+    "добавь встречу завтра в 15:00",
+    "добавь что сегодня встреча с клиентом",
+    "запланируй встречу завтра",
+    "напомни про совещание",
+    "создай событие презентация",
+    "встреча завтра в 15:00 с Петром",
+    "добавь в список покупок молоко",
+    "добавь контакт Анны +79186057593",
+    "сохрани контакт Иван номер 123456",
+    "добавь благодарность в конце",
+    "добавь информацию о встрече",
+    "допиши добрый день Александр",
+    "дописать P.S. жду ответа",
+    "дополни текст важными деталями",
+    "дополнить письмо контактами",
+    "прибавь еще один пункт",
+    "включи информацию о дате",
+    "вставь абзац о проекте",
+    "измени текст на новый",
+    "замени это на другое",
+    "поменяй тему письма",
+    "смени тон на более официальный",
+    "обнови информацию",
+    "исправь ошибки в тексте",
+    "поправь грамматику",
+    "откорректируй стиль письма",
+    "редактируй для лучшего понимания",
+    "правка орфографии нужна",
+    "перепиши это письмо",
+    "перефразируй основную мысль",
+    "переформулируй вежливее",
+    "переработай структуру",
+    "улучши стиль письма",
+    "доработай заключение",
+    "усовершенствуй формулировки",
+    "пиши, добрый день Александр",
+    "напиши еще что мы ждем ответа",
+    "отправь alexlesley01@yandex.ru об важной встрече",
+    "письмо someone@mail.ru об работе",
+    "напиши письмо леониду с просьбой о встрече",
+    "отправь письмо test@example.com о важной встрече завтра в 10 утра",
+    "напиши письмо boss@company.ru - о отчете за месяц",
+    "письмо hr@company.ru тема: документы на отпуск",
+    "найди письма от Ивана",
+    "покажи письма от банка",
+    "поиск писем про отчет",
+    "ищи письма о командировке",
+    "что такое квантовый компьютер",
+    "кто такой Илон Маск?",
+    "где находится Байкал",
+    "сколько стоит биткоин",
+    "расскажи про историю Рима",
+    "актуальные курсы валют",
+    "привет как дела",
+    "спасибо, это очень помогло",
+    "какая сегодня погода?",
+    "объясни разницу между TCP и UDP",
+]
+
+# Бюджет на одно сопоставление грамматики (микросекунды) - ловит регрессии
+MAX_MICROSECONDS_PER_MATCH = 200
+ITERATIONS = 200
+
+def _sequential_patterns(grammar):
+    """Исходный вариант: список отдельных паттернов, проверяемых по очереди"""
+    return [pattern for _, pattern in grammar.rules]
+
+def _sequential_match(patterns, text, flags=re.IGNORECASE):
+    for index, pattern in enumerate(patterns):
+        match = re.search(pattern, text, flags)
+        if match:
+            return index, match.groups()
+    return None
+
+def _corpus_for(grammar):
+    return [text.lower() for text in CORPUS] if grammar is WEB_QUESTION_GRAMMAR else CORPUS
+
+def test_grammar_equivalence():
+    """Объединенная грамматика совпадает с последовательным перебором"""
+    for grammar in (CALENDAR_GRAMMAR, EMAIL_GRAMMAR, EDIT_GRAMMAR, SEARCH_GRAMMAR, WEB_QUESTION_GRAMMAR):
+        patterns = _sequential_patterns(grammar)
+        for text in _corpus_for(grammar):
+            expected = _sequential_match(patterns, text, grammar.flags)
+            found = grammar.match(text)
+            actual = (found.rule_index, found.groups) if found else None
+            assert actual == expected, f"{grammar.name}: '{text}' -> {actual}, ожидалось {expected}"
+
+def test_grammar_iter_matches():
+    """Ленивый перебор правил возвращает все сработавшие правила по порядку"""
+    text = "напиши письмо леониду с просьбой о встрече"
+    patterns = _sequential_patterns(EMAIL_GRAMMAR)
+    expected = [i for i, pattern in enumerate(patterns) if re.search(pattern, text, re.IGNORECASE)]
+    assert [m.rule_index for m in EMAIL_GRAMMAR.iter_matches(text)] == expected
+
+def _measure(func, corpus):
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        for text in corpus:
+            func(text)
+    return (time.perf_counter() - start) / (ITERATIONS * len(corpus)) * 1_000_000
+
+def test_grammar_benchmark():
+    """Время сопоставления укладывается в бюджет"""
+    print(f"{'Грамматика':<12} {'правил':>6} {'комбинир., мкс':>15} {'по очереди, мкс':>16}")
+    for grammar in (CALENDAR_GRAMMAR, EMAIL_GRAMMAR, EDIT_GRAMMAR, SEARCH_GRAMMAR, WEB_QUESTION_GRAMMAR):
+        corpus = _corpus_for(grammar)
+        patterns = _sequential_patterns(grammar)
+        combined_us = _measure(grammar.match, corpus)
+        sequential_us = _measure(lambda text: _sequential_match(patterns, text, grammar.flags), corpus)
+        print(f"{grammar.name:<12} {len(grammar.rules):>6} {combined_us:>15.2f} {sequential_us:>16.2f}")
+        assert combined_us < MAX_MICROSECONDS_PER_MATCH, f"{grammar.name}: {combined_us:.1f} мкс на сообщение"
+
+if __name__ == "__main__":
+    print("=== БЕНЧМАРК КОМАНДНЫХ ГРАММАТИК ===")
+    print(f"Корпус: {len(CORPUS)} команд, {ITERATIONS} итераций")
+    print()
+    test_grammar_equivalence()
+    test_grammar_iter_matches()
+    print("Эквивалентность: OK")
+    print()
+    test_grammar_benchmark()
+    print("\nТест успешен!")
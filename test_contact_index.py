@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест индекса контактов: падежи, опечатки, подстроки, скорость
+"""
+import asyncio
+import tempfile
+import time
+
+from database.contact_index import ContactIndex
+from database.contacts import Contact, ContactsManager
+from database.json_store import JsonDocumentStore
+
+CONTACTS = [
+    {'id': '1', 'name': 'Леонид', 'email': 'leonid@yandex.ru', 'tags': ['Работа']},
+    {'id': '2', 'name': 'Мария Иванова', 'email': 'maria@example.com', 'company': 'Рога и копыта', 'tags': []},
+    {'id': '3', 'name': 'Дмитрий', 'email': 'dima@example.com', 'phone': '+7 999 123-45-67', 'tags': ['друзья']},
+]
+
+
+def test_case_endings():
+    """Имя в косвенном падеже находит контакт"""
+    index = ContactIndex(CONTACTS)
+    for query, expected in [('Леониду', '1'), ('леонида', '1'), ('Марии', '2'), ('Дмитрию', '3')]:
+        best, score, match_type = index.resolve(query)[0]
+        assert best['id'] == expected, query
+        assert score > 0.8 and match_type == 'name'
+
+
+def test_fuzzy_and_email():
+    """Опечатка в имени и поиск по адресу"""
+    index = ContactIndex(CONTACTS)
+    best, score, _ = index.resolve('Леанид')[0]
+    print(f"Опечатка: {best['name']} ({score:.2f})")
+    assert best['id'] == '1' and 0.3 < score <= 0.8
+    assert index.resolve('maria@example.com')[0][:3:2] == (CONTACTS[1], 'email')
+    assert index.resolve('копыта')[0][2] == 'company'
+    assert index.resolve('Зинаида') == []
+
+
+def test_substring_search_and_tags():
+    """Подстрока во всех полях (как прежний перебор) и теги"""
+    index = ContactIndex(CONTACTS)
+    assert [c['id'] for c in index.search('example')] == ['3', '2']
+    assert [c['id'] for c in index.search('999 12')] == ['3']
+    assert [c['id'] for c in index.search('ра')] == ['1']
+    assert [c['id'] for c in index.search('ро')] == ['2']
+    assert [c['id'] for c in index.by_tag('работа')] == ['1']
+
+
+def test_resolution_speed():
+    """Разрешение имени в большой адресной книге - доли миллисекунды"""
+    contacts = [{'id': str(i), 'name': f'Контакт{i} Фамилия{i % 97}', 'email': f'user{i}@example.com', 'tags': []}
+                for i in range(5000)]
+    contacts.append({'id': 'x', 'name': 'Леонид Петров', 'email': 'leonid@yandex.ru', 'tags': []})
+    index = ContactIndex(contacts)
+
+    started = time.perf_counter()
+    for _ in range(100):
+        best = index.resolve('Леониду')[0][0]
+    elapsed = (time.perf_counter() - started) / 100 * 1000
+    print(f"Разрешение имени: {elapsed:.3f} мс на запрос")
+    assert best['id'] == 'x'
+    assert elapsed < 1.0
+
+
+async def _manager_scenario(directory):
+    manager = ContactsManager()
+    manager.store = JsonDocumentStore(directory, "user_{user_id}_contacts.json", lambda: {'contacts': []})
+    await manager.add_contact(1, Contact(name='Иван', email='ivan@example.com'))
+    first = await manager.find_email_by_name(1, 'Ивану')
+    await manager.add_contact(1, Contact(name='Ольга', email='olga@example.com'))
+    second = await manager.find_email_by_name(1, 'Ольге')
+    await manager.store.flush_async()
+    return first, second
+
+
+def test_manager_index_refresh():
+    """Индекс менеджера обновляется после добавления контакта"""
+    with tempfile.TemporaryDirectory() as directory:
+        first, second = asyncio.run(_manager_scenario(directory))
+    assert first == 'ivan@example.com'
+    assert second == 'olga@example.com'
+
+
+if __name__ == "__main__":
+    print("=== ТЕСТ ИНДЕКСА КОНТАКТОВ ===")
+    test_case_endings()
+    test_fuzzy_and_email()
+    test_substring_search_and_tags()
+    test_resolution_speed()
+    test_manager_index_refresh()
+    print("\nТест успешен!")
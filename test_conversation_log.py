@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест журнала переписки: дозапись, чтение с конца, сжатие, перенос старой истории
+"""
+import asyncio
+import json
+import os
+import tempfile
+import threading
+
+import database.conversation_log as conversation_log_module
+from database.conversation_log import ConversationLog
+
+
+def _record(i):
+    return {'user_message': f'вопрос {i}', 'ai_response': f'ответ {i}' * (i % 7), 'timestamp': str(i)}
+
+
+def _lines(log, user_id):
+    with open(log.path(user_id), 'rb') as f:
+        return f.read().count(b'\n')
+
+
+def test_tail_reads_from_end():
+    """Последние записи читаются в хронологическом порядке, в том числе через границы блоков"""
+    original = conversation_log_module._BLOCK_SIZE
+    conversation_log_module._BLOCK_SIZE = 64
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            log = ConversationLog(directory, keep=100)
+            for i in range(50):
+                log.append(1, _record(i))
+            assert [r['timestamp'] for r in log.tail(1, 10)] == [str(i) for i in range(40, 50)]
+            assert len(log.tail(1, 500)) == 50
+            assert log.tail(2, 10) == []
+    finally:
+        conversation_log_module._BLOCK_SIZE = original
+
+
+def test_compaction():
+    """Журнал сжимается до keep записей после compact_after"""
+    with tempfile.TemporaryDirectory() as directory:
+        log = ConversationLog(directory, keep=20)
+        for i in range(41):
+            log.append(1, _record(i))
+        print(f"Строк после сжатия: {_lines(log, 1)}")
+        assert _lines(log, 1) == 20
+        assert log.tail(1, 1)[0]['timestamp'] == '40'
+
+        # Счетчик строк восстанавливается новым экземпляром
+        log = ConversationLog(directory, keep=20)
+        for i in range(41, 62):
+            log.append(1, _record(i))
+        assert _lines(log, 1) == 20
+        assert not [name for name in os.listdir(directory) if name.startswith('.tmp_')]
+
+
+def test_torn_write():
+    """Оборванная последняя строка пропускается, следующая запись не склеивается с ней"""
+    with tempfile.TemporaryDirectory() as directory:
+        log = ConversationLog(directory, keep=20)
+        log.append(1, _record(1))
+        with open(log.path(1), 'ab') as f:
+            f.write('{"user_message": "оборв'.encode('utf-8'))
+        assert [r['timestamp'] for r in log.tail(1, 5)] == ['1']
+
+        log.append(1, _record(2))
+        assert [r['timestamp'] for r in log.tail(1, 5)] == ['1', '2']
+
+
+def test_legacy_migration():
+    """Старая история в JSON-массиве переносится в журнал"""
+    with tempfile.TemporaryDirectory() as directory:
+        legacy = os.path.join(directory, 'user_1.json')
+        with open(legacy, 'w', encoding='utf-8') as f:
+            json.dump([_record(i) for i in range(5)], f, ensure_ascii=False)
+
+        log = ConversationLog(directory, keep=20)
+        assert [r['timestamp'] for r in log.tail(1, 2)] == ['3', '4']
+        assert not os.path.exists(legacy)
+
+        log.append(1, _record(5))
+        assert len(log.tail(1, 10)) == 6
+
+
+def test_async_runs_in_log_thread():
+    """Асинхронная дозапись идет в потоке журнала и сохраняет порядок"""
+    threads = set()
+    with tempfile.TemporaryDirectory() as directory:
+        log = ConversationLog(directory, keep=20)
+        append = log.append
+
+        def tracked_append(user_id, record):
+            threads.add(threading.current_thread().name)
+            append(user_id, record)
+
+        log.append = tracked_append
+
+        async def scenario():
+            await asyncio.gather(*(log.append_async(1, _record(i)) for i in range(30)))
+            return await log.tail_async(1, 30)
+
+        records = asyncio.run(scenario())
+    assert [r['timestamp'] for r in records] == [str(i) for i in range(30)]
+    assert threads and all(name.startswith('conversation_log') for name in threads)
+
+
+if __name__ == "__main__":
+    print("=== ТЕСТ ЖУРНАЛА ПЕРЕПИСКИ ===")
+    test_tail_reads_from_end()
+    test_compaction()
+    test_torn_write()
+    test_legacy_migration()
+    test_async_runs_in_log_thread()
+    print("\nТест успешен!")
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест локального полнотекстового индекса писем
+"""
+from utils import email_sender_real
+from utils.email_index import EmailSearchIndex, build_match_query
+from utils.imap_pool import MailboxCache
+
+ACCOUNT = "user@yandex.ru"
+
+MESSAGES = [
+    {'id': '1', 'sender': 'Иван <ivan@example.com>', 'subject': 'Отчет за май', 'date': 'Mon', 'body': 'Цифры во вложении'},
+    {'id': '2', 'sender': 'Мария <maria@example.com>', 'subject': 'Привет', 'date': 'Tue', 'body': 'Посмотри отчет, пожалуйста'},
+    {'id': '3', 'sender': 'Петр <petr@example.com>', 'subject': 'Встреча', 'date': 'Wed', 'body': 'Завтра в 10:00'},
+    {'id': '4', 'sender': 'Отдел отчетности <reports@example.com>', 'subject': 'Квартальные отчеты', 'date': 'Thu', 'body': 'Готово'},
+]
+
+
+def _index():
+    index = EmailSearchIndex(path=':memory:', enabled=True)
+    index.validate(ACCOUNT, 1)
+    index.add_messages(ACCOUNT, MESSAGES)
+    return index
+
+
+def test_match_query():
+    """Запрос пользователя превращается в безопасное выражение FTS5"""
+    assert build_match_query('Отчет "май"') == '"отчет"* "май"*'
+    assert build_match_query('!!!') is None
+
+
+def test_ranking_and_paging():
+    """Совпадение в теме выше совпадения в тексте, страницы не пересекаются"""
+    index = _index()
+    ranked = index.search(ACCOUNT, 'отчет', limit=10)
+    print(f"Ранжирование: {ranked}")
+    assert set(ranked) == {1, 2, 4}
+    assert ranked[-1] == 2  # Только в тексте письма
+
+    first = index.search(ACCOUNT, 'отчет', limit=2, offset=0)
+    second = index.search(ACCOUNT, 'отчет', limit=2, offset=2)
+    assert first + second == ranked
+
+
+def test_restrict_to_uids():
+    """Ранжирование только среди писем, найденных сервером"""
+    index = _index()
+    assert index.search(ACCOUNT, 'отчет', uids=[2, 3]) == [2]
+    assert index.search(ACCOUNT, 'отчет', uids=[]) == []
+
+
+def test_uidvalidity_reset():
+    """Смена UIDVALIDITY очищает письма ящика"""
+    index = _index()
+    index.validate(ACCOUNT, 2)
+    assert index.search(ACCOUNT, 'отчет') == []
+
+
+def test_get_messages():
+    """Письма восстанавливаются из индекса для поиска без сервера"""
+    index = _index()
+    found = index.get_messages(ACCOUNT, [3])
+    assert found[3]['subject'] == 'Встреча'
+    assert found[3]['sender'].startswith('Петр')
+
+
+class FakeSearchConnection:
+    """IMAP: SEARCH находит старые письма, FETCH отдает их превью"""
+
+    def __init__(self, hits):
+        self.hits = hits
+        self.literal = None
+
+    def uid(self, command, *args):
+        if command == 'SEARCH':
+            return 'OK', [' '.join(str(uid) for uid in self.hits).encode()]
+        data = []
+        for uid in args[0].split(','):
+            data.append((f'{uid} (UID {uid} BODY[HEADER.FIELDS (FROM SUBJECT DATE)] {{30}}'.encode(),
+                         f'Subject: Old report {uid}\r\nFrom: a\r\n\r\n'.encode()))
+            data.append((b' BODY[TEXT]<0> {4}', b'text'))
+            data.append(b')')
+        return 'OK', data
+
+
+class FakeSession:
+    def __init__(self):
+        self.email_addr = ACCOUNT
+        self.cache = MailboxCache()
+
+    def select(self, conn, mailbox='INBOX'):
+        self.cache.validate(1)
+        return 1
+
+
+def test_search_finds_mail_older_than_cache():
+    """Старые совпадения попадают в результат, даже если кэш сессии заполнен новыми письмами"""
+    session = FakeSession()
+    session.select(None)
+    for uid in range(1000, 1000 + session.cache.max_messages + 50):
+        session.cache.put(uid, {'id': str(uid), 'subject': 'New', 'sender': '', 'date': '', 'body': ''})
+
+    original = email_sender_real.email_index
+    email_sender_real.email_index = EmailSearchIndex(path=':memory:', enabled=True)
+    try:
+        sender = email_sender_real.RealEmailSender()
+        found = sender._search_on_server(session, FakeSearchConnection([5, 7, 9]), 'report', 10, 0)
+    finally:
+        email_sender_real.email_index = original
+
+    print(f"Найдено: {[message['subject'] for message in found]}")
+    assert sorted(int(message['id']) for message in found) == [5, 7, 9]
+    assert all(uid not in session.cache.messages for uid in (5, 7, 9))
+
+
+if __name__ == "__main__":
+    print("=== ТЕСТ ИНДЕКСА ПИСЕМ ===")
+    test_match_query()
+    test_ranking_and_paging()
+    test_restrict_to_uids()
+    test_uidvalidity_reset()
+    test_get_messages()
+    test_search_finds_mail_older_than_cache()
+    print("\nТест успешен!")
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест кэша embedding: повторный текст без запроса, одновременные тексты одним вызовом API
+"""
+import asyncio
+
+from utils.embedding_cache import EmbeddingCache
+
+
+class FakeEmbeddings:
+    """Считает вызовы API и возвращает вектор по длине текста"""
+
+    def __init__(self, fail: bool = False):
+        self.calls = []
+        self.fail = fail
+
+    async def __call__(self, texts, model):
+        self.calls.append(list(texts))
+        await asyncio.sleep(0.01)
+        if self.fail:
+            return None
+        return [[float(len(text)), 0.5] for text in texts]
+
+
+def test_repeated_text_hits_cache():
+    """Одно и то же сообщение для двух поисков - один запрос"""
+    api = FakeEmbeddings()
+    cache = EmbeddingCache(api, window=0.001)
+
+    async def scenario():
+        first = await cache.embed('Привет,\nкак дела?')
+        second = await cache.embed('Привет, как  дела?')
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == second == [17.0, 0.5]
+    assert len(api.calls) == 1
+    metrics = cache.get_metrics()
+    print(f"Метрики: {metrics}")
+    assert metrics['hits'] == 1 and metrics['misses'] == 1
+
+
+def test_concurrent_texts_batched():
+    """Разные тексты в одном окне уходят одним вызовом, дубликаты - один раз"""
+    api = FakeEmbeddings()
+    cache = EmbeddingCache(api, window=0.01)
+
+    async def scenario():
+        return await asyncio.gather(*(cache.embed(text) for text in ['а', 'бб', 'а', 'ввв']))
+
+    results = asyncio.run(scenario())
+    assert [r[0] for r in results] == [1.0, 2.0, 1.0, 3.0]
+    assert api.calls == [['а', 'бб', 'ввв']]
+
+
+def test_max_batch():
+    """Пакет отправляется сразу, когда набрано max_batch текстов"""
+    api = FakeEmbeddings()
+    cache = EmbeddingCache(api, window=10, max_batch=2)
+
+    async def scenario():
+        return await asyncio.wait_for(asyncio.gather(cache.embed('один'), cache.embed('два')), 1)
+
+    asyncio.run(scenario())
+    assert api.calls == [['один', 'два']]
+
+
+def test_errors_not_cached():
+    """Ошибка API дает None всем ожидающим и не попадает в кэш"""
+    api = FakeEmbeddings(fail=True)
+    cache = EmbeddingCache(api, window=0.001)
+
+    async def scenario():
+        return await asyncio.gather(cache.embed('текст'), cache.embed('текст'))
+
+    assert asyncio.run(scenario()) == [None, None]
+    assert cache.get('текст') is None
+    assert cache.get_metrics()['entries'] == 0
+
+
+def test_lru_eviction():
+    """Старые векторы вытесняются, возвращаются копии"""
+    cache = EmbeddingCache(FakeEmbeddings(), max_entries=2)
+    cache.put('a', [1.0])
+    cache.put('b', [2.0])
+    cache.get('a').append(5.0)
+    cache.put('c', [3.0])
+    assert cache.get('b') is None
+    assert cache.get('a') == [1.0]
+
+
+if __name__ == "__main__":
+    print("=== ТЕСТ КЭША EMBEDDING ===")
+    test_repeated_text_hits_cache()
+    test_concurrent_texts_batched()
+    test_max_batch()
+    test_errors_not_cached()
+    test_lru_eviction()
+    print("\nТест успешен!")
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест разбора ответов IMAP UID FETCH
+"""
+from utils.imap_pool import parse_uid_fetch
+
+
+def test_preview_sections():
+    """Заголовки и начало текста приходят отдельными литералами одного письма"""
+    data = [
+        (b'1 (UID 15 BODY[HEADER.FIELDS (FROM SUBJECT DATE)] {24}', b'Subject: Hi\r\nFrom: a\r\n\r\n'),
+        (b' BODY[TEXT]<0> {5}', b'Hello'),
+        b')',
+        (b'2 (UID 16 BODY[HEADER.FIELDS (FROM SUBJECT DATE)] {15}', b'Subject: Bye\r\n\r\n'),
+        (b' BODY[TEXT]<0> {3}', b'Bye'),
+        b')',
+    ]
+    result = parse_uid_fetch(data)
+    print(f"Превью: {result}")
+    assert set(result) == {15, 16}
+    assert result[15]['HEADER'].startswith(b'Subject: Hi')
+    assert result[15]['TEXT'] == b'Hello'
+    assert result[16]['TEXT'] == b'Bye'
+
+
+def test_uid_after_literal():
+    """Некоторые серверы присылают UID после литерала"""
+    data = [
+        (b'3 (BODY[] {4}', b'body'),
+        b' UID 42)',
+    ]
+    result = parse_uid_fetch(data)
+    print(f"UID после литерала: {result}")
+    assert result == {42: {'RFC822': b'body'}}
+
+
+def test_rfc822():
+    """Полное письмо (RFC822 / BODY[])"""
+    data = [
+        (b'1 (UID 7 RFC822 {3}', b'abc'),
+        b')',
+        (b'2 (UID 8 BODY[] {3}', b'def'),
+        b')',
+    ]
+    result = parse_uid_fetch(data)
+    assert result == {7: {'RFC822': b'abc'}, 8: {'RFC822': b'def'}}
+
+
+if __name__ == "__main__":
+    print("=== ТЕСТ РАЗБОРА IMAP FETCH ===")
+    test_preview_sections()
+    test_uid_after_literal()
+    test_rfc822()
+    print("\nТест успешен!")
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест пула IMAP-сессий: закрытие старой сессии не задерживает выдачу сессий
+"""
+import threading
+import time
+
+from utils.imap_pool import ImapSessionPool
+
+
+class FakeConnection:
+    def __init__(self):
+        self.logged_out = threading.Event()
+
+    def logout(self):
+        self.logged_out.set()
+
+
+def test_password_change_closes_in_background():
+    """Смена пароля при занятой сессии: новая сессия выдается сразу, старая закрывается позже"""
+    pool = ImapSessionPool()
+    old = pool.get('me@yandex.ru', 'old-password')
+    old._conn = connection = FakeConnection()
+    old.lock.acquire()  # Сессия занята долгой операцией
+    try:
+        started = time.perf_counter()
+        new = pool.get('me@yandex.ru', 'new-password')
+        other = pool.get('other@yandex.ru', 'secret')
+        elapsed = time.perf_counter() - started
+        assert new is not old and new.password == 'new-password'
+        assert other is pool.get('other@yandex.ru', 'secret')
+        assert elapsed < 0.1
+        assert not connection.logged_out.is_set()
+    finally:
+        old.lock.release()
+    assert connection.logged_out.wait(1)
+
+
+def test_invalidate_closes_in_background():
+    pool = ImapSessionPool()
+    session = pool.get('me@yandex.ru', 'secret')
+    session._conn = connection = FakeConnection()
+    session.lock.acquire()
+    try:
+        pool.invalidate('me@yandex.ru')
+        assert pool.get('me@yandex.ru', 'secret') is not session
+    finally:
+        session.lock.release()
+    assert connection.logged_out.wait(1)
+
+
+if __name__ == "__main__":
+    print("=== ТЕСТ ПУЛА IMAP ===")
+    test_password_change_closes_in_background()
+    test_invalidate_closes_in_background()
+    print("\nТест успешен!")
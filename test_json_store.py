@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест хранилища JSON-документов: отложенная запись, атомарная замена файла
+"""
+import asyncio
+import json
+import os
+import tempfile
+
+import database.json_store as json_store_module
+from database.json_store import JsonDocumentStore
+
+
+def _store(directory, **kwargs):
+    return JsonDocumentStore(directory, "user_{user_id}.json", list, **kwargs)
+
+
+def _read(store, user_id):
+    with open(store.path(user_id), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_sync_write_without_loop():
+    """Без event loop запись выполняется сразу"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = _store(directory)
+        store.put(1, [{'text': 'привет'}])
+        assert _read(store, 1) == [{'text': 'привет'}]
+        assert not [name for name in os.listdir(directory) if name.startswith('.tmp_')]
+
+        # Новый экземпляр читает документ с диска
+        assert _store(directory).get(1) == [{'text': 'привет'}]
+
+
+async def _coalesce(directory):
+    store = _store(directory, flush_delay=0.05)
+    writes = []
+    original = store._write_files
+
+    def counting_write(snapshots):
+        writes.append(dict(snapshots))
+        original(snapshots)
+
+    store._write_files = counting_write
+    for i in range(10):
+        await store.update(1, lambda doc, i=i: doc.append(i))
+    assert not os.path.exists(store.path(1))
+
+    await asyncio.sleep(0.2)
+    await store.flush_async()
+    return store, writes
+
+
+def test_write_behind_coalesces():
+    """Десять изменений за flush_delay - одна запись файла"""
+    with tempfile.TemporaryDirectory() as directory:
+        store, writes = asyncio.run(_coalesce(directory))
+        print(f"Записей на диск: {len(writes)}")
+        assert len(writes) == 1
+        assert _read(store, 1) == list(range(10))
+
+
+async def _concurrent(directory):
+    store = _store(directory, flush_delay=0.01)
+
+    async def append(i):
+        async with store.lock(1):
+            document = store.get(1)
+            await asyncio.sleep(0)  # Другие задачи работают между чтением и записью
+            document.append(i)
+            store.put(1, document)
+
+    await asyncio.gather(*(append(i) for i in range(50)))
+    await json_store_module.flush_all()
+    return store
+
+
+def test_concurrent_updates_not_lost():
+    """Параллельные изменения под блокировкой пользователя не теряются"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = asyncio.run(_concurrent(directory))
+        assert sorted(_read(store, 1)) == list(range(50))
+
+
+async def _delete(directory):
+    store = _store(directory, flush_delay=0.01)
+    store.put(1, ['a'])
+    await store.flush_async()
+    store.delete(1)
+    # До записи удаленный документ не читается с диска
+    assert not store.exists(1)
+    assert store.get(1) == []
+    await store.flush_async()
+    return store
+
+
+def test_delete():
+    """Удаление документа удаляет файл"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = asyncio.run(_delete(directory))
+        assert not os.path.exists(store.path(1))
+
+
+def test_preload():
+    """preload читает документ заранее; отсутствующий документ помнится до первой записи"""
+    with tempfile.TemporaryDirectory() as directory:
+        JsonDocumentStore(directory, "user_{user_id}.json", dict).put(1, {'name': 'Иван'})
+        store = JsonDocumentStore(directory, "user_{user_id}.json", dict)
+
+        async def scenario():
+            await store.preload(1)
+            await store.preload(2)
+            loaded = store.view(1), store.exists(2)
+            await store.update(2, lambda doc: doc.update(name='Мария'))
+            return loaded, store.exists(2)
+
+        loaded, created = asyncio.run(scenario())
+        store.flush()
+        assert loaded == ({'name': 'Иван'}, False)
+        assert created and os.path.exists(store.path(2))
+
+
+def test_pending_write_not_evicted():
+    """Документ, снимок которого еще не записан, не вытесняется и не перечитывается со старого файла"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = JsonDocumentStore(directory, "user_{user_id}.json", dict, max_cached=1)
+        store.put(1, {'version': 1})
+
+        async def scenario():
+            store.put(1, {'version': 2})
+            # Снимок снят, задача записи создана, но еще не выполнялась
+            store._start_flush(asyncio.get_running_loop())
+            store.view(2)
+            seen = store.view(1)
+            await store.flush_async()
+            return seen
+
+        seen = asyncio.run(scenario())
+        assert seen == {'version': 2}
+        assert len(store._docs) == 1 and store._writing == {}
+        with open(store.path(1), encoding='utf-8') as f:
+            assert json.load(f) == {'version': 2}
+
+
+if __name__ == "__main__":
+    print("=== ТЕСТ ХРАНИЛИЩА JSON ===")
+    test_sync_write_without_loop()
+    test_write_behind_coalesces()
+    test_concurrent_updates_not_lost()
+    test_delete()
+    test_preload()
+    test_pending_write_not_evicted()
+    print("\nТест успешен!")
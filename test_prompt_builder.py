@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест сборки промпта: бюджет токенов, окно истории, краткое изложение старой переписки
+"""
+import asyncio
+import tempfile
+
+from database.json_store import JsonDocumentStore
+from utils.conversation_summary import ConversationSummaries
+from utils.openai_client import openai_client
+from utils.prompt_builder import PromptBuilder, count_tokens, message_tokens, truncate_to_tokens
+
+
+def history(count, length=50):
+    return [{'user_message': f'вопрос {i} ' + 'слово ' * length, 'ai_response': f'ответ {i} ' + 'текст ' * length,
+             'timestamp': f'2026-01-01T00:{i:02d}:00'} for i in range(count)]
+
+
+def test_budget_is_bounded():
+    """Размер промпта не превышает бюджет при любой длине истории и контекста"""
+    builder = PromptBuilder(budget=1500, recent_turns=6, summary_tokens=200)
+    knowledge = [{'topic': 'Личная информация', 'content': 'Меня зовут Иван ' * 30}] * 5
+    similar = [{'user_message': 'вопрос ' * 50, 'ai_response': 'ответ ' * 50}] * 3
+    for turns in (0, 3, 20, 200):
+        prompt = builder.build('Ты ассистент.', 'Что нового? ' * 400, history(turns),
+                               summary='Пользователь Иван. ' * 200, knowledge=knowledge, similar=similar)
+        total = sum(message_tokens(m) for m in prompt.messages)
+        print(f"Ходов истории: {turns}, токенов: {total}, ходов в промпте: {prompt.history_used}")
+        assert total <= 1500
+        assert total == prompt.tokens
+        assert prompt.messages[0]['content'] == 'Ты ассистент.'
+        assert prompt.messages[-1]['role'] == 'user'
+
+
+def test_recent_history_window():
+    """В промпт идут последние ходы по порядку, не больше recent_turns"""
+    builder = PromptBuilder(budget=100000, recent_turns=3)
+    prompt = builder.build('system', 'сейчас', history(10, length=1), summary='раньше говорили о погоде')
+    contents = [m['content'] for m in prompt.messages]
+    assert prompt.history_used == 3
+    assert contents[1].endswith('раньше говорили о погоде')
+    assert [c.split()[1] for c in contents[2:-1]] == ['7', '7', '8', '8', '9', '9']
+
+
+def test_truncate():
+    text = 'длинный текст ' * 100
+    short = truncate_to_tokens(text, 20)
+    assert count_tokens(short) <= 21 and short.endswith('…')
+    assert truncate_to_tokens('коротко', 20) == 'коротко'
+
+
+def test_summary_update():
+    """Старые ходы пересказываются один раз, изложение хранится у пользователя"""
+    calls = []
+
+    async def fake_chat(messages, temperature=0.7):
+        calls.append(messages[-1]['content'])
+        return 'Пользователь спрашивал про вопросы 0-3.'
+
+    with tempfile.TemporaryDirectory() as directory:
+        summaries = ConversationSummaries()
+        summaries.store = JsonDocumentStore(directory, "user_{user_id}.json", dict)
+        turns = history(10, length=1)
+        pending = summaries.pending_turns(1, turns, recent_turns=6)
+        assert len(pending) == 4
+
+        original = openai_client.chat_completion
+        openai_client.chat_completion = fake_chat
+        try:
+            assert asyncio.run(summaries.update(1, pending))
+            assert asyncio.run(summaries.update(1, pending))
+        finally:
+            openai_client.chat_completion = original
+
+        assert len(calls) == 1 and 'вопрос 3' in calls[0]
+        assert summaries.get(1) == 'Пользователь спрашивал про вопросы 0-3.'
+        assert summaries.pending_turns(1, turns, recent_turns=6) == []
+        assert len(summaries.pending_turns(1, history(12, length=1), recent_turns=6)) == 2
+        summaries.clear(1)
+        assert summaries.get(1) is None
+        summaries.store.flush()
+
+
+if __name__ == "__main__":
+    print("=== ТЕСТ СБОРКИ ПРОМПТА ===")
+    test_budget_is_bounded()
+    test_recent_history_window()
+    test_truncate()
+    test_summary_update()
+    print("\nТест успешен!")
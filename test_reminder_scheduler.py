@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест планировщика напоминаний: куча по времени, изменения из базы, повтор после ошибки,
+запись отметок об отправке
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from utils.reminder_scheduler import ReminderScheduler
+
+
+def reminder(reminder_id, seconds):
+    """Напоминание через seconds секунд от текущего момента"""
+    return {'id': reminder_id, 'user_id': 100, 'title': f'Напоминание {reminder_id}',
+            'remind_at': datetime.now(timezone.utc) + timedelta(seconds=seconds)}
+
+
+class FakeReminderDB:
+    """Напоминания в памяти вместо таблицы reminders"""
+
+    def __init__(self, reminders):
+        self.reminders = {r['id']: r for r in reminders}
+        self.requests = []
+
+    async def get_upcoming_reminders(self, until, grace_minutes=5, reminder_id=None):
+        self.requests.append((reminder_id, grace_minutes))
+        return [dict(r) for r in self.reminders.values()
+                if reminder_id is None or r['id'] == reminder_id]
+
+
+class FlakyReminderDB:
+    """База, которая не смогла записать первую пачку отметок"""
+
+    def __init__(self):
+        self.calls = []
+
+        class DB:
+            enabled = True
+
+        self.db = DB()
+
+    async def mark_reminders_sent(self, reminder_ids):
+        self.calls.append(list(reminder_ids))
+        return len(self.calls) > 1
+
+
+def test_failed_ack_keeps_reminders_in_flight():
+    scheduler = ReminderScheduler(bot=None)
+    scheduler.reminder_db = FlakyReminderDB()
+    scheduler._in_flight.update({1, 2})
+    scheduler._pending_acks = [1, 2]
+
+    asyncio.run(scheduler._flush_acks())
+    assert scheduler._in_flight == {1, 2}
+    assert scheduler._pending_acks == [1, 2]
+
+    scheduler._pending_acks.append(3)
+    scheduler._in_flight.add(3)
+    asyncio.run(scheduler._flush_acks())
+    assert scheduler.reminder_db.calls == [[1, 2], [1, 2, 3]]
+    assert scheduler._in_flight == set() and scheduler._pending_acks == []
+
+
+def test_pop_due_skips_stale_entries():
+    """Перенесенное и удаленное напоминание не извлекаются по старой записи в куче"""
+    scheduler = ReminderScheduler(bot=None)
+    scheduler.schedule(reminder(1, -1))
+    scheduler.schedule(reminder(2, -1))
+    scheduler.schedule(reminder(3, -1))
+    scheduler.schedule(reminder(1, 120))  # Перенесено
+    scheduler.cancel(2)
+
+    assert [r['id'] for r in scheduler._pop_due()] == [3]
+    assert scheduler._pop_due() == []
+    assert set(scheduler._reminders) == {1}
+
+
+def test_next_due_in_exact_delay():
+    """Время ожидания - ровно до ближайшего актуального напоминания"""
+    scheduler = ReminderScheduler(bot=None)
+    assert scheduler._next_due_in() is None
+    scheduler.schedule(reminder(1, 30))
+    scheduler.schedule(reminder(2, 90))
+    scheduler.cancel(1)
+    assert abs(scheduler._next_due_in() - 90) < 0.5
+    assert len(scheduler._heap) == 1
+
+
+def test_change_listener_updates_queue():
+    """Создание, перенос и удаление через ReminderDB меняют кучу без сверки"""
+    scheduler = ReminderScheduler(bot=None)
+    scheduler.reminder_db = FakeReminderDB([reminder(1, 60)])
+    scheduler.is_running = True
+
+    async def scenario():
+        scheduler._on_reminder_changed(1, False)
+        await asyncio.gather(*scheduler._refresh_tasks)
+        scheduled = abs(scheduler._next_due_in() - 60) < 0.5
+
+        scheduler.reminder_db.reminders[1] = reminder(1, 10)
+        scheduler._on_reminder_changed(1, False)
+        await asyncio.gather(*scheduler._refresh_tasks)
+        moved = abs(scheduler._next_due_in() - 10) < 0.5
+
+        # Напоминание выполнено: в выборке базы его больше нет
+        del scheduler.reminder_db.reminders[1]
+        scheduler._on_reminder_changed(1, False)
+        await asyncio.gather(*scheduler._refresh_tasks)
+        return scheduled, moved, scheduler._next_due_in(), scheduler._refresh_tasks
+
+    scheduled, moved, remaining, tasks = asyncio.run(scenario())
+    assert scheduled and moved
+    assert remaining is None and not tasks
+
+    scheduler.schedule(reminder(2, 60))
+    scheduler._on_reminder_changed(2, True)
+    assert scheduler._reminders == {}
+
+
+def test_reconcile_skips_in_flight():
+    """Сверка не ставит заново напоминания, которые сейчас отправляются"""
+    scheduler = ReminderScheduler(bot=None)
+    scheduler.reminder_db = FakeReminderDB([reminder(1, -10), reminder(2, -10)])
+    scheduler._in_flight.add(1)
+
+    asyncio.run(scheduler._reconcile())
+    assert set(scheduler._reminders) == {2}
+    assert [reminder_id for _, reminder_id in scheduler._heap] == [2]
+    assert [r['id'] for r in scheduler._pop_due()] == [2]
+
+
+def test_failed_send_retried_within_grace():
+    """Не отправленное напоминание возвращается в кучу через retry_delay, просроченное - нет"""
+    scheduler = ReminderScheduler(bot=None)
+    scheduler.retry_delay = 30
+
+    async def failing(reminder):
+        return False
+
+    scheduler._send_reminder = failing
+    recent, overdue = reminder(1, -60), {**reminder(2, -290), 'user_id': 200}
+    scheduler._in_flight.update({1, 2})
+
+    async def scenario():
+        await scheduler._deliver(recent)
+        await scheduler._deliver(overdue)
+
+    asyncio.run(scenario())
+    assert scheduler._in_flight == set()
+    assert set(scheduler._reminders) == {1}
+    assert abs(scheduler._next_due_in() - 30) < 0.5
+    assert scheduler._pop_due() == []
+
+    # Сверка сохраняет время повтора, а не отправляет сразу по remind_at
+    scheduler.reminder_db = FakeReminderDB([recent])
+    asyncio.run(scheduler._reconcile())
+    assert abs(scheduler._next_due_in() - 30) < 0.5
+    assert scheduler.stats['failed'] == 2
+
+
+if __name__ == "__main__":
+    print("=== ТЕСТ ПЛАНИРОВЩИКА НАПОМИНАНИЙ ===")
+    test_pop_due_skips_stale_entries()
+    test_next_due_in_exact_delay()
+    test_change_listener_updates_queue()
+    test_reconcile_skips_in_flight()
+    test_failed_send_retried_within_grace()
+    test_failed_ack_keeps_reminders_in_flight()
+    print("\nТест успешен!")
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест объединения одновременных запросов: один вызов на ключ, общий результат и общая ошибка
+"""
+import asyncio
+
+from utils.single_flight import single_flight
+
+
+def test_concurrent_calls_share_result():
+    """Одновременные вызовы с одним ключом выполняют factory один раз"""
+    calls = []
+    inflight = {}
+
+    async def factory():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'ответ'
+
+    async def scenario():
+        results = await asyncio.gather(*(single_flight(inflight, 'k', factory) for _ in range(5)))
+        again = await single_flight(inflight, 'k', factory)
+        return results, again
+
+    results, again = asyncio.run(scenario())
+    assert results == ['ответ'] * 5 and again == 'ответ'
+    assert len(calls) == 2 and inflight == {}
+
+
+def test_error_reaches_waiters():
+    """Исключение первого вызова получают и ожидающие"""
+    inflight = {}
+
+    async def factory():
+        await asyncio.sleep(0.01)
+        raise RuntimeError('сбой API')
+
+    async def scenario():
+        return await asyncio.gather(*(single_flight(inflight, 'k', factory) for _ in range(3)),
+                                    return_exceptions=True)
+
+    errors = asyncio.run(scenario())
+    assert all(isinstance(error, RuntimeError) for error in errors)
+    assert inflight == {}
+
+
+if __name__ == "__main__":
+    print("=== ТЕСТ ОБЪЕДИНЕНИЯ ЗАПРОСОВ ===")
+    test_concurrent_calls_share_result()
+    test_error_reaches_waiters()
+    print("\nТест успешен!")
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест пула SMTP: одна сессия на рассылку, повтор временных ошибок, колбэки статуса
+"""
+import asyncio
+import smtplib
+
+import utils.smtp_pool as smtp_pool_module
+from utils.smtp_pool import SmtpPool
+
+
+class FakeSMTP:
+    """SMTP-сервер в памяти: считает подключения, умеет отвечать 421"""
+
+    connections = 0
+    sent = []
+    fail_next = 0
+    disconnect_next = 0
+
+    def __init__(self, server, port, timeout=None):
+        FakeSMTP.connections += 1
+
+    def starttls(self, context=None):
+        pass
+
+    def login(self, user, password):
+        pass
+
+    def sendmail(self, from_addr, to_addr, message):
+        if FakeSMTP.disconnect_next:
+            FakeSMTP.disconnect_next -= 1
+            raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        if FakeSMTP.fail_next:
+            FakeSMTP.fail_next -= 1
+            raise smtplib.SMTPResponseException(421, b'Try again later')
+        if to_addr.startswith('bad'):
+            raise smtplib.SMTPRecipientsRefused({to_addr: (550, b'No such user')})
+        FakeSMTP.sent.append(to_addr)
+
+    def quit(self):
+        pass
+
+
+def _reset():
+    FakeSMTP.connections = 0
+    FakeSMTP.sent = []
+    FakeSMTP.fail_next = 0
+    FakeSMTP.disconnect_next = 0
+    smtp_pool_module.smtplib.SMTP = FakeSMTP
+
+
+async def _bulk():
+    pool = SmtpPool()
+    recipients = {f"user{i}@example.com": "message" for i in range(20)}
+    results = await pool.send_many("me@yandex.ru", "secret", recipients)
+    await pool.close()
+    return results
+
+
+def test_bulk_single_handshake():
+    """20 писем - одно подключение"""
+    original = smtplib.SMTP
+    _reset()
+    try:
+        results = asyncio.run(_bulk())
+    finally:
+        smtp_pool_module.smtplib.SMTP = original
+    print(f"Отправлено: {sum(results.values())}, подключений: {FakeSMTP.connections}")
+    assert all(results.values())
+    assert FakeSMTP.connections == 1
+
+
+async def _retry():
+    pool = SmtpPool()
+    statuses = []
+
+    def on_status(status, to_email, info):
+        statuses.append((status, to_email))
+
+    sender = pool._sender("me@yandex.ru", "secret")
+    sender.base_delay = 0.01
+    ok = await pool.send("me@yandex.ru", "secret", "friend@example.com", "message", on_status)
+    refused = await pool.send("me@yandex.ru", "secret", "bad@example.com", "message", on_status)
+    await pool.close()
+    return ok, refused, statuses
+
+
+def test_retry_and_status():
+    """421 повторяется, 550 - нет; колбэк получает все статусы"""
+    original = smtplib.SMTP
+    _reset()
+    FakeSMTP.fail_next = 2
+    try:
+        ok, refused, statuses = asyncio.run(_retry())
+    finally:
+        smtp_pool_module.smtplib.SMTP = original
+    print(f"Статусы: {statuses}")
+    assert ok is True
+    assert refused is False
+    assert [status for status, to in statuses if to == "friend@example.com"] == [
+        'queued', 'sending', 'retrying', 'sending', 'retrying', 'sending', 'sent'
+    ]
+    assert statuses[-1] == ('failed', 'bad@example.com')
+
+
+async def _after_idle_disconnect():
+    pool = SmtpPool()
+    statuses = []
+
+    def on_status(status, to_email, info):
+        statuses.append(status)
+
+    await pool.send("me@yandex.ru", "secret", "first@example.com", "message")
+    # Сервер закрыл соединение, пока оно простаивало в пуле
+    FakeSMTP.disconnect_next = 1
+    ok = await pool.send("me@yandex.ru", "secret", "second@example.com", "message", on_status)
+    await pool.close()
+    return ok, statuses
+
+
+def test_stale_connection_reconnects():
+    """Разорванное сервером соединение переоткрывается сразу, без повтора с задержкой"""
+    original = smtplib.SMTP
+    _reset()
+    try:
+        ok, statuses = asyncio.run(_after_idle_disconnect())
+    finally:
+        smtp_pool_module.smtplib.SMTP = original
+    assert ok is True
+    assert statuses == ['queued', 'sending', 'sent']
+    assert FakeSMTP.connections == 2
+    assert FakeSMTP.sent == ['first@example.com', 'second@example.com']
+
+
+if __name__ == "__main__":
+    print("=== ТЕСТ ПУЛА SMTP ===")
+    test_bulk_single_handshake()
+    test_retry_and_status()
+    test_stale_connection_reconnects()
+    print("\nТест успешен!")
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест хранилища SQLite: документы, история переписки, перенос из JSON-файлов
+"""
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from database.sqlite_store import SqliteConversationLog, SqliteDatabase, SqliteDocumentStore
+from migrate_to_sqlite import migrate_conversations, migrate_documents
+
+
+def test_document_store():
+    """Документы переживают новый экземпляр хранилища, удаление убирает строку"""
+    with tempfile.TemporaryDirectory() as directory:
+        db = SqliteDatabase(os.path.join(directory, 'bot.db'))
+        store = SqliteDocumentStore(db, 'contacts', lambda: {'contacts': []})
+
+        async def scenario():
+            await store.update(1, lambda doc: doc['contacts'].append({'name': 'Иван'}))
+            await store.update(2, lambda doc: doc['contacts'].append({'name': 'Мария'}))
+            await store.flush_async()
+            rows = await db.run_async(lambda conn: conn.execute("SELECT user_id FROM contacts ORDER BY user_id").fetchall())
+            store.delete(2)
+            await store.flush_async()
+            return rows
+
+        rows = asyncio.run(scenario())
+        assert [row['user_id'] for row in rows] == [1, 2]
+
+        reopened = SqliteDocumentStore(db, 'contacts', lambda: {'contacts': []})
+        assert reopened.get(1) == {'contacts': [{'name': 'Иван'}]}
+        assert not reopened.exists(2)
+        db.close()
+
+
+def test_preload_reads_in_database_thread():
+    """После preload view/get/exists не обращаются к базе из event loop"""
+    with tempfile.TemporaryDirectory() as directory:
+        db = SqliteDatabase(os.path.join(directory, 'bot.db'))
+        SqliteDocumentStore(db, 'contacts', lambda: {'contacts': []}).put(1, {'contacts': [{'name': 'Иван'}]})
+        store = SqliteDocumentStore(db, 'contacts', lambda: {'contacts': []})
+
+        def no_loop_reads(user_id):
+            raise AssertionError('чтение из event loop')
+
+        async def scenario():
+            await store.preload(1)
+            await store.preload(2)
+            store._read_stored = store._stored_exists = no_loop_reads
+            return store.get(1), store.exists(2), store.view(2)
+
+        assert asyncio.run(scenario()) == ({'contacts': [{'name': 'Иван'}]}, False, {'contacts': []})
+        db.close()
+
+
+def test_conversation_log():
+    """Последние сообщения по порядку, сжатие до keep, удаление старой истории"""
+    with tempfile.TemporaryDirectory() as directory:
+        db = SqliteDatabase(os.path.join(directory, 'bot.db'))
+        log = SqliteConversationLog(db, keep=5)
+        for i in range(11):
+            log.append(1, {'user_message': f'вопрос {i}', 'ai_response': 'ответ', 'timestamp': str(i)})
+
+        assert [r['timestamp'] for r in log.tail(1, 3)] == ['8', '9', '10']
+        count = db.run(lambda conn: conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0])
+        print(f"Сообщений после сжатия: {count}")
+        assert count == 5
+
+        assert log.remove_older_than(time.time() - 60) == []
+        assert log.remove_older_than(time.time() + 60) == [1]
+        assert log.tail(1, 3) == []
+        db.close()
+
+
+def test_conversation_log_async():
+    """Асинхронные операции истории выполняются в потоке базы"""
+    with tempfile.TemporaryDirectory() as directory:
+        db = SqliteDatabase(os.path.join(directory, 'bot.db'))
+        log = SqliteConversationLog(db, keep=5)
+
+        async def scenario():
+            for i in range(11):
+                await log.append_async(1, {'user_message': f'вопрос {i}', 'ai_response': 'ответ', 'timestamp': str(i)})
+            tail = await log.tail_async(1, 10)
+            await log.clear_async(1)
+            return tail, await log.tail_async(1, 10)
+
+        tail, cleared = asyncio.run(scenario())
+        assert [r['timestamp'] for r in tail] == ['6', '7', '8', '9', '10']
+        assert cleared == []
+        db.close()
+
+
+def test_migration():
+    """Перенос JSON-файлов в базу; повторный запуск не дублирует историю"""
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.makedirs(os.path.join(data_dir, 'contacts'))
+        with open(os.path.join(data_dir, 'contacts', 'user_7_contacts.json'), 'w', encoding='utf-8') as f:
+            json.dump({'contacts': [{'name': 'Петр'}]}, f, ensure_ascii=False)
+        with open(os.path.join(data_dir, 'user_7.jsonl'), 'w', encoding='utf-8') as f:
+            for i in range(3):
+                f.write(json.dumps({'user_message': str(i), 'ai_response': 'ok', 'timestamp': str(i)}) + '\n')
+
+        db = SqliteDatabase(os.path.join(data_dir, 'bot.db'))
+        counts = migrate_documents(db, data_dir)
+        assert counts['contacts'] == 1 and counts['user_tokens'] == 0
+        assert migrate_conversations(db, data_dir) == 1
+        assert migrate_conversations(db, data_dir) == 0
+
+        store = SqliteDocumentStore(db, 'contacts', dict)
+        assert store.get(7) == {'contacts': [{'name': 'Петр'}]}
+        assert [r['user_message'] for r in SqliteConversationLog(db, keep=20).tail(7, 10)] == ['0', '1', '2']
+        db.close()
+
+
+if __name__ == "__main__":
+    print("=== ТЕСТ ХРАНИЛИЩА SQLITE ===")
+    test_document_store()
+    test_preload_reads_in_database_thread()
+    test_conversation_log()
+    test_conversation_log_async()
+    test_migration()
+    print("\nТест успешен!")
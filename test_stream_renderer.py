@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест потокового вывода ответа: редкие правки, деление длинного ответа, финальная разметка
+"""
+import asyncio
+
+from utils.stream_renderer import CURSOR, ProgressiveReply
+
+
+class FakeMessage:
+    """Сообщение Telegram: запоминает правки и отправленные продолжения"""
+
+    def __init__(self, chat, text=''):
+        self.chat = chat
+        self.text = text
+        self.parse_mode = None
+        self.reply_markup = None
+        chat.append(self)
+
+    async def edit_text(self, text, parse_mode=None, reply_markup=None):
+        self.chat.edits += 1
+        self.text, self.parse_mode, self.reply_markup = text, parse_mode, reply_markup
+
+    async def answer(self, text, parse_mode=None, reply_markup=None):
+        message = FakeMessage(self.chat, text)
+        message.parse_mode, message.reply_markup = parse_mode, reply_markup
+        return message
+
+
+class Chat(list):
+    edits = 0
+
+
+async def chunks(words, delay):
+    for word in words:
+        await asyncio.sleep(delay)
+        yield word
+
+
+def test_throttled_edits():
+    """Первый текст виден сразу, дальше правки не чаще min_interval"""
+    chat = Chat()
+    user_message = FakeMessage(chat, 'вопрос')
+    status = FakeMessage(chat, '🤖 Думаю...')
+    reply = ProgressiveReply(user_message, status, min_interval=0.05, limit=4000)
+    seen = []
+
+    async def scenario():
+        async def watched():
+            async for chunk in chunks(['слово '] * 40, 0.005):
+                yield chunk
+                seen.append(status.text)
+
+        text = await reply.stream(watched())
+        await reply.finish(text, reply_markup='клавиатура')
+        return text
+
+    text = asyncio.run(scenario())
+    print(f"Правок за поток: {chat.edits}")
+    assert seen[0] == 'слово ' + CURSOR
+    assert 3 <= chat.edits <= 8
+    assert status.text == text and status.parse_mode == 'HTML' and status.reply_markup == 'клавиатура'
+
+
+def test_long_reply_split():
+    """Длинный ответ продолжается новыми сообщениями, клавиатура на первой части"""
+    chat = Chat()
+    user_message = FakeMessage(chat, 'вопрос')
+    status = FakeMessage(chat, '🤖 Думаю...')
+    reply = ProgressiveReply(user_message, status, min_interval=0, limit=10)
+
+    async def scenario():
+        text = await reply.stream(chunks(['абвгд'] * 5, 0))
+        await reply.finish(text, reply_markup='клавиатура')
+
+    asyncio.run(scenario())
+    parts = [m.text for m in chat[1:]]
+    assert parts == ['абвгдабвгд', 'абвгдабвгд', 'абвгд']
+    assert [m.reply_markup for m in chat[1:]] == ['клавиатура', None, None]
+    assert all(m.parse_mode == 'HTML' for m in chat[1:])
+
+
+def test_not_streamed_reply():
+    """Без потока finish сразу показывает ответ одной правкой"""
+    chat = Chat()
+    status = FakeMessage(chat, '🤖 Думаю...')
+    reply = ProgressiveReply(FakeMessage(chat), status, min_interval=1, limit=4000)
+    asyncio.run(reply.finish('Готово'))
+    assert status.text == 'Готово' and chat.edits == 1
+
+
+if __name__ == "__main__":
+    print("=== ТЕСТ ПОТОКОВОГО ОТВЕТА ===")
+    test_throttled_edits()
+    test_long_reply_split()
+    test_not_streamed_reply()
+    print("\nТест успешен!")
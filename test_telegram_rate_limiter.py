@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест ограничителя частоты отправки в Telegram
+"""
+import asyncio
+import time
+
+from utils.telegram_rate_limiter import TelegramRateLimiter
+
+
+async def _send_all(limiter, chat_ids):
+    """Отправить по сообщению в каждый чат, вернуть время слотов относительно старта"""
+    start = time.monotonic()
+    slots = []
+
+    async def send(chat_id):
+        await limiter.acquire(chat_id)
+        slots.append((chat_id, time.monotonic() - start))
+
+    await asyncio.gather(*(send(chat_id) for chat_id in chat_ids))
+    return slots
+
+
+def test_global_rate():
+    """Общий лимит: не больше global_rate сообщений в секунду"""
+    limiter = TelegramRateLimiter(global_rate=50, per_chat_interval=1.0)
+    slots = asyncio.run(_send_all(limiter, range(20)))
+    elapsed = max(at for _, at in slots)
+    print(f"20 чатов при 50/с: {elapsed:.2f} с")
+    assert 0.3 <= elapsed < 0.6
+
+
+def test_per_chat_interval():
+    """Лимит на чат: сообщения в один чат не чаще per_chat_interval"""
+    limiter = TelegramRateLimiter(global_rate=100, per_chat_interval=0.2)
+    slots = asyncio.run(_send_all(limiter, [1, 1, 1, 2]))
+    chat_1 = sorted(at for chat_id, at in slots if chat_id == 1)
+    print(f"Чат 1: {[round(at, 2) for at in chat_1]}")
+    assert all(b - a >= 0.19 for a, b in zip(chat_1, chat_1[1:]))
+    # Другой чат не ждет очереди первого
+    assert next(at for chat_id, at in slots if chat_id == 2) < 0.1
+
+
+def test_retry_after_pause():
+    """После 429 отправка приостанавливается для всех чатов"""
+    limiter = TelegramRateLimiter(global_rate=100, per_chat_interval=0.0)
+    limiter.pause(0.3)
+    assert limiter.paused
+    slots = asyncio.run(_send_all(limiter, [1, 2]))
+    print(f"После паузы 0.3 с: {[round(at, 2) for _, at in slots]}")
+    assert min(at for _, at in slots) >= 0.29
+
+
+if __name__ == "__main__":
+    print("=== ТЕСТ ОГРАНИЧИТЕЛЯ ОТПРАВКИ TELEGRAM ===")
+    test_global_rate()
+    test_per_chat_interval()
+    test_retry_after_pause()
+    print("\nТест успешен!")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест кэша озвучки: один синтез на одинаковый текст, file_id, ограничение размера на диске
+"""
+import asyncio
+import os
+import tempfile
+import threading
+
+from utils.tts_cache import TTSCache, make_key
+
+
+def test_key():
+    """Пробелы не меняют ключ, голос и модель - меняют"""
+    key = make_key('Привет,  мир', 'alloy', 'tts-1')
+    assert key == make_key(' Привет, мир ', 'alloy', 'tts-1')
+    assert key != make_key('Привет, мир', 'nova', 'tts-1')
+    assert key != make_key('Привет, мир', 'alloy', 'tts-1-hd')
+
+
+def test_single_synthesis():
+    """Повторные и одновременные нажатия - один синтез"""
+    cache = TTSCache()
+    calls = []
+
+    async def synthesize():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return b'mp3-data'
+
+    async def scenario():
+        first = await asyncio.gather(*(cache.get_or_create('k', synthesize) for _ in range(3)))
+        second = await cache.get_or_create('k', synthesize)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == [b'mp3-data'] * 3 and second == b'mp3-data'
+    assert len(calls) == 1
+    print(f"Метрики: {cache.get_metrics()}")
+
+
+def test_failures_not_cached():
+    cache = TTSCache()
+
+    async def failing():
+        return None
+
+    assert asyncio.run(cache.get_or_create('k', failing)) is None
+    assert asyncio.run(cache.get_audio('k')) is None
+
+
+def test_memory_limit():
+    """Память ограничена суммарным размером аудио"""
+    cache = TTSCache(max_memory_bytes=10)
+
+    async def scenario():
+        await cache.put_audio('a', b'12345')
+        await cache.put_audio('b', b'12345')
+        await cache.get_audio('a')
+        await cache.put_audio('c', b'12345')
+        return await cache.get_audio('b'), await cache.get_audio('a')
+
+    assert asyncio.run(scenario()) == (None, b'12345')
+
+
+def test_disk_tier_and_file_id():
+    """Аудио и file_id переживают перезапуск; при переполнении диска остается file_id"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'tts.db')
+        cache = TTSCache(path=path, max_disk_bytes=10)
+
+        async def fill():
+            await cache.put_audio('old', b'123456')
+            await cache.set_file_id('old', 'file-old')
+            await cache.put_audio('new', b'123456')
+
+        asyncio.run(fill())
+        assert cache.get_metrics()['disk_bytes'] == 6
+        cache.close()
+
+        restarted = TTSCache(path=path, max_disk_bytes=10)
+        threads = []
+        disk_execute = restarted._disk_execute
+
+        def tracked_execute(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return disk_execute(*args, **kwargs)
+
+        restarted._disk_execute = tracked_execute
+
+        async def reopen():
+            new = await restarted.get_audio('new')
+            old = await restarted.get_audio('old')
+            file_id = await restarted.get_file_id('old')
+            await restarted.forget_file_id('old')
+            return new, old, file_id, await restarted.get_file_id('old')
+
+        assert asyncio.run(reopen()) == (b'123456', None, 'file-old', None)
+        assert restarted.get_metrics()['disk_hits'] == 1
+        assert threads and all(name.startswith('tts_cache') for name in threads)
+        restarted.close()
+
+
+if __name__ == "__main__":
+    print("=== ТЕСТ КЭША ОЗВУЧКИ ===")
+    test_key()
+    test_single_synthesis()
+    test_failures_not_cached()
+    test_memory_limit()
+    test_disk_tier_and_file_id()
+    print("\nТест успешен!")
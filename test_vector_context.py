@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест сборки контекста векторной памяти: источники параллельно, медленный - без контекста
+"""
+import asyncio
+import time
+
+from config.settings import settings
+from database.vector_memory import VectorMemory
+
+
+class SlowDb:
+    """История разговоров с задержкой"""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    async def fetch(self, query, *args):
+        await asyncio.sleep(self.delay)
+        return [{'user_message': 'второй', 'ai_response': 'ok'}, {'user_message': 'первый', 'ai_response': 'ok'}]
+
+
+def make_memory(history_delay, search_delay):
+    memory = VectorMemory.__new__(VectorMemory)
+    memory.db = SlowDb(history_delay)
+    embeddings = []
+
+    async def get_embedding(text):
+        embeddings.append(text)
+        return [0.1, 0.2]
+
+    async def search_similar_conversations(user_id, query, limit=5, query_embedding=None):
+        await asyncio.sleep(search_delay)
+        return [{'user_message': 'похожий'}]
+
+    async def search_knowledge_base(user_id, query, limit=3, query_embedding=None):
+        await asyncio.sleep(0.05)
+        return [{'topic': 'знание'}]
+
+    memory.get_embedding = get_embedding
+    memory.search_similar_conversations = search_similar_conversations
+    memory.search_knowledge_base = search_knowledge_base
+    return memory, embeddings
+
+
+def test_sources_run_concurrently():
+    """Время сборки - максимум по источникам, а не сумма; вектор запрашивается один раз"""
+    memory, embeddings = make_memory(0.05, 0.05)
+    started = time.perf_counter()
+    context = asyncio.run(memory.get_enhanced_context(1, 'вопрос'))
+    elapsed = time.perf_counter() - started
+    print(f"Сборка контекста: {elapsed * 1000:.0f} мс, источники: {context['timings']}")
+    assert elapsed < 0.13
+    assert embeddings == ['вопрос']
+    assert [r['user_message'] for r in context['recent_history']] == ['первый', 'второй']
+    assert context['similar_conversations'] and context['knowledge_base'] and context['has_context']
+    assert set(context['timings']) == {'recent_history', 'similar_conversations', 'knowledge_base', 'total'}
+
+
+def test_slow_source_degrades():
+    """Векторный поиск дольше срока - нет похожих разговоров, ответ не задерживается"""
+    original = settings.CONTEXT_VECTOR_TIMEOUT
+    settings.CONTEXT_VECTOR_TIMEOUT = 0.1
+    try:
+        memory, _ = make_memory(0.01, 5)
+        started = time.perf_counter()
+        context = asyncio.run(memory.get_enhanced_context(1, 'вопрос'))
+        elapsed = time.perf_counter() - started
+    finally:
+        settings.CONTEXT_VECTOR_TIMEOUT = original
+    assert elapsed < 0.5
+    assert context['similar_conversations'] == []
+    assert context['knowledge_base'] and context['recent_history']
+
+
+if __name__ == "__main__":
+    print("=== ТЕСТ КОНТЕКСТА ВЕКТОРНОЙ ПАМЯТИ ===")
+    test_sources_run_concurrently()
+    test_slow_source_degrades()
+    print("\nТест успешен!")
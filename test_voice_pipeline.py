@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест голосового конвейера в памяти: распознавание из буфера без временных файлов
+"""
+import asyncio
+import io
+import os
+
+from utils.openai_client import openai_client
+
+
+class FakeTranscriptions:
+    """Whisper: возвращает содержимое файла как текст, читая его дважды (как при повторе)"""
+
+    def __init__(self):
+        self.names = []
+
+    async def create(self, model, file, language, timeout):
+        name, data = file
+        self.names.append(name)
+        await asyncio.sleep(0.01)
+        first, second = bytes(data), bytes(data)
+        assert first == second
+
+        class Transcript:
+            text = first.decode('utf-8')
+
+        return Transcript()
+
+
+def test_transcribe_from_memory():
+    """Одновременные голосовые одного пользователя не мешают друг другу и не пишут на диск"""
+    fake = FakeTranscriptions()
+    original = openai_client.client.audio.transcriptions
+    openai_client.client.audio.transcriptions = fake
+    files_before = set(os.listdir('.'))
+    try:
+        async def scenario():
+            return await asyncio.gather(
+                openai_client.transcribe_audio(io.BytesIO('первое'.encode('utf-8'))),
+                openai_client.transcribe_audio(io.BytesIO('второе'.encode('utf-8'))),
+                openai_client.transcribe_audio('третье'.encode('utf-8'), filename='voice.mp3')
+            )
+
+        results = asyncio.run(scenario())
+    finally:
+        openai_client.client.audio.transcriptions = original
+
+    assert results == ['первое', 'второе', 'третье']
+    assert fake.names == ['voice.ogg', 'voice.ogg', 'voice.mp3']
+    assert set(os.listdir('.')) == files_before
+
+
+if __name__ == "__main__":
+    print("=== ТЕСТ ГОЛОСОВОГО КОНВЕЙЕРА ===")
+    test_transcribe_from_memory()
+    print("\nТест успешен!")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест распознавания длинных голосовых: разрезы в паузах, параллельные части, порядок текста
+"""
+import asyncio
+import time
+
+from utils import voice_transcriber
+from utils.openai_client import openai_client
+from utils.voice_transcriber import TRANSCRIBE_ERROR, VOICE_GAP, cut_points, transcribe_chunks, transcribe_voice
+
+
+def test_cut_points():
+    """Разрез в ближайшей паузе, без паузы - в целевой точке, хвост не отделяется"""
+    silences = [(9000, 9400), (19500, 20500), (45000, 46000)]
+    assert cut_points(65000, silences, 10000) == [9200, 20000, 30000, 40000, 50000]
+    assert cut_points(14000, silences, 10000) == []
+    assert cut_points(16000, [], 10000) == [10000]
+
+
+def test_parallel_chunks_in_order():
+    """Части распознаются одновременно и склеиваются по порядку; сбой части исправляет повтор"""
+    delays = [0.05, 0.01, 0.03, 0.02]
+    progress = []
+    attempts = []
+
+    async def fake_transcribe(data, filename="voice.ogg"):
+        index = int(data.decode())
+        attempts.append(index)
+        await asyncio.sleep(delays[index])
+        return TRANSCRIBE_ERROR if index == 2 and attempts.count(2) == 1 else f"часть{index}"
+
+    async def on_progress(text, done, total):
+        progress.append((text, done, total))
+
+    original = openai_client.transcribe_audio
+    openai_client.transcribe_audio = fake_transcribe
+    try:
+        started = time.perf_counter()
+        text = asyncio.run(transcribe_chunks([b'0', b'1', b'2', b'3'], 4, on_progress))
+        elapsed = time.perf_counter() - started
+    finally:
+        openai_client.transcribe_audio = original
+
+    print(f"Текст: {text}, {elapsed * 1000:.0f} мс, ход: {progress}")
+    assert text == "часть0 часть1 часть2 часть3"
+    assert attempts.count(2) == 2
+    assert elapsed < 0.12
+    assert progress[0] == ('', 1, 4)
+    assert progress[-1][1] == 3
+
+
+def test_failed_chunk_marked_as_gap():
+    """Часть, не распознанная и с повтором, отмечается в тексте, а не пропадает"""
+    async def fake_transcribe(data, filename="voice.ogg"):
+        return TRANSCRIBE_ERROR if data == b'1' else f"часть{data.decode()}"
+
+    original = openai_client.transcribe_audio
+    openai_client.transcribe_audio = fake_transcribe
+    try:
+        text = asyncio.run(transcribe_chunks([b'0', b'1', b'2'], 2))
+        failed = asyncio.run(transcribe_chunks([b'1', b'1'], 2))
+    finally:
+        openai_client.transcribe_audio = original
+
+    assert text == f"часть0 {VOICE_GAP} часть2"
+    assert failed == TRANSCRIBE_ERROR
+
+
+def test_short_voice_single_request():
+    """Короткое сообщение - один запрос без декодирования"""
+    calls = []
+
+    async def fake_transcribe(data, filename="voice.ogg"):
+        calls.append(data)
+        return "привет"
+
+    def no_split(*args):
+        raise AssertionError('короткое сообщение не должно делиться')
+
+    original = openai_client.transcribe_audio, voice_transcriber.split_audio
+    openai_client.transcribe_audio = fake_transcribe
+    voice_transcriber.split_audio = no_split
+    try:
+        assert asyncio.run(transcribe_voice(b'ogg', duration=5)) == "привет"
+    finally:
+        openai_client.transcribe_audio, voice_transcriber.split_audio = original
+    assert calls == [b'ogg']
+
+
+if __name__ == "__main__":
+    print("=== ТЕСТ РАСПОЗНАВАНИЯ ДЛИННЫХ ГОЛОСОВЫХ ===")
+    test_cut_points()
+    test_parallel_chunks_in_order()
+    test_failed_chunk_marked_as_gap()
+    test_short_voice_single_request()
+    print("\nТест успешен!")
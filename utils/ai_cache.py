@@ -0,0 +1,226 @@
+"""
+Кэш ответов AI для детерминированных переписываний (тема письма, правка текста)
+
+Одинаковые короткие запросы ("о встрече", "отчет за месяц") повторяются у разных
+пользователей, поэтому ответ ищется по хэшу от (шаблон промпта и его версия,
+модель, температура, нормализованный ввод). Первый уровень - LRU в памяти с TTL,
+второй (необязательный) - таблица SQLite на диске, переживающая перезапуск.
+
+Одновременные одинаковые промахи ждут один запрос к API. Ответы с ошибкой
+не кэшируются. Статистика попаданий - get_metrics().
+
+Из асинхронного кода (get_or_create) диск читается и пишется в отдельном
+потоке кэша, event loop запросами SQLite не блокируется.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from config.settings import settings
+from utils.single_flight import single_flight
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_input(text: str) -> str:
+    """Убрать различия в пробелах, не влияющие на ответ"""
+    return '\n'.join(' '.join(line.split()) for line in (text or '').strip().splitlines())
+
+
+def make_key(template: str, version: int, model: str, temperature: float, text: str) -> str:
+    """Ключ кэша: хэш от шаблона, версии, модели, температуры и ввода"""
+    payload = json.dumps([template, version, model, round(temperature, 3), normalize_input(text)],
+                         ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class AIResponseCache:
+    """LRU + TTL в памяти и необязательная таблица SQLite"""
+
+    def __init__(self, max_entries: int = 5000, ttl: float = 7 * 24 * 3600,
+                 path: Optional[str] = None, enabled: bool = True):
+        """
+        Args:
+            max_entries: Размер кэша в памяти
+            ttl: Время жизни ответа, секунды
+            path: Файл SQLite для дискового уровня (None - только память)
+            enabled: Выключенный кэш всегда вызывает API
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._disk_lock = threading.Lock()
+        # Один поток для дискового уровня: запросы SQLite выполняются по очереди
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ai_cache')
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        """Ответ из кэша (память, затем диск)"""
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is None:
+            value = self._disk_found(key, self._disk_get(key, now), now)
+        return value
+
+    def put(self, key: str, value: str):
+        now = time.time()
+        self._remember(key, value, now)
+        self._disk_put(key, value, now + self.ttl)
+
+    async def get_async(self, key: str) -> Optional[str]:
+        """get с чтением диска в потоке кэша"""
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is None and self.path:
+            value = self._disk_found(key, await self._run(self._disk_get, key, now), now)
+        return value
+
+    async def put_async(self, key: str, value: str):
+        """put с записью на диск в потоке кэша"""
+        now = time.time()
+        self._remember(key, value, now)
+        if self.path:
+            await self._run(self._disk_put, key, value, now + self.ttl)
+
+    async def get_or_create(self, key: str, factory: Callable[[], Awaitable[Optional[str]]]) -> Optional[str]:
+        """Ответ из кэша или результат factory(); None от factory не кэшируется"""
+        if not self.enabled:
+            return await factory()
+
+        value = await self.get_async(key)
+        if value is not None:
+            return value
+
+        async def create() -> Optional[str]:
+            value = await factory()
+            if value is not None:
+                await self.put_async(key, value)
+            return value
+
+        if key in self._inflight:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return await single_flight(self._inflight, key, create)
+
+    def get_metrics(self) -> Dict:
+        """Статистика кэша"""
+        hits = self.hits + self.disk_hits
+        total = hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': hits / total if total else 0.0
+        }
+
+    def clear(self):
+        self._entries.clear()
+        with self._disk_lock:
+            if self._connection() is not None:
+                self._conn.execute("DELETE FROM ai_cache")
+                self._conn.commit()
+
+    def close(self):
+        with self._disk_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        self.path = None
+
+    def _memory_get(self, key: str, now: float) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+        return None
+
+    def _disk_found(self, key: str, value: Optional[str], now: float) -> Optional[str]:
+        if value is not None:
+            self.disk_hits += 1
+            self._remember(key, value, now)
+        return value
+
+    async def _run(self, operation: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, operation, *args)
+
+    def _remember(self, key: str, value: str, now: float):
+        self._entries[key] = (now + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """Соединение с дисковым уровнем (вызывать под _disk_lock)"""
+        if self._conn is None and self.path:
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS ai_cache ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                conn.execute("DELETE FROM ai_cache WHERE expires_at < ?", (time.time(),))
+                conn.commit()
+                self._conn = conn
+            except sqlite3.Error as e:
+                logger.warning(f"Дисковый кэш AI недоступен: {e}")
+                self.path = None
+        return self._conn
+
+    def _disk_get(self, key: str, now: float) -> Optional[str]:
+        with self._disk_lock:
+            conn = self._connection()
+            if conn is None:
+                return None
+            try:
+                row = conn.execute(
+                    "SELECT value FROM ai_cache WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка чтения кэша AI: {e}")
+                return None
+        return row[0] if row else None
+
+    def _disk_put(self, key: str, value: str, expires_at: float):
+        with self._disk_lock:
+            conn = self._connection()
+            if conn is None:
+                return
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO ai_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at)
+                )
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка записи кэша AI: {e}")
+
+
+# Глобальный кэш
+ai_cache = AIResponseCache(
+    max_entries=settings.AI_CACHE_MAX_ENTRIES,
+    ttl=settings.AI_CACHE_TTL,
+    path=settings.AI_CACHE_PATH or None,
+    enabled=settings.AI_CACHE_ENABLED
+)
@@ -0,0 +1,292 @@
+"""
+Фоновая очередь работы после ответа пользователю
+
+Запись диалога в память, извлечение знаний и другие действия, результат которых
+пользователю не нужен сразу, ставятся в очередь и выполняются несколькими
+воркерами уже после того, как ответ отправлен.
+
+- Задача - это имя обработчика и JSON-параметры; обработчики регистрируются
+  декоратором job() при импорте модуля.
+- Каждая задача сначала записывается в spool (таблица SQLite) и удаляется из
+  него только после успешного выполнения: задачи, не выполненные до остановки
+  бота, подхватываются при следующем запуске.
+- Ошибка обработчика - повтор с растущей паузой, после max_attempts задача
+  отбрасывается с записью в лог.
+- Очередь в памяти ограничена: когда она заполнена, enqueue() ждет свободного
+  места (обратное давление на обработчики сообщений).
+- Запросы к spool выполняются в отдельном потоке, event loop ими не блокируется.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[..., Awaitable[None]]
+
+
+class BackgroundQueue:
+    """Очередь фоновых задач с воркерами, повторами и spool на диске"""
+
+    def __init__(self, workers: int = 2, max_size: int = 1000, max_attempts: int = 5,
+                 spool_path: Optional[str] = None, retry_delay: float = 1.0):
+        """
+        Args:
+            workers: Число одновременно выполняемых задач
+            max_size: Размер очереди в памяти
+            max_attempts: Сколько раз пытаться выполнить задачу
+            spool_path: Файл SQLite для невыполненных задач (None - только память)
+            retry_delay: Пауза перед первым повтором, дальше удваивается (до минуты)
+        """
+        self.workers = workers
+        self.max_size = max_size
+        self.max_attempts = max_attempts
+        self.spool_path = spool_path
+        self.retry_delay = retry_delay
+        self.is_running = False
+
+        self._handlers: Dict[str, JobHandler] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._known: Set[int] = set()  # Задачи в очереди, в работе или ждущие повтора
+        self._next_id = 0
+        self._workers: List[asyncio.Task] = []
+        self._retries: Set[asyncio.Task] = set()
+        self._conn: Optional[sqlite3.Connection] = None
+        # Один поток для spool: запросы SQLite выполняются по очереди
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='background_spool')
+        self.stats = {'enqueued': 0, 'done': 0, 'retried': 0, 'failed': 0}
+
+    def job(self, kind: str):
+        """Декоратор: зарегистрировать обработчик задач вида kind"""
+        def decorator(handler: JobHandler) -> JobHandler:
+            self._handlers[kind] = handler
+            return handler
+        return decorator
+
+    async def enqueue(self, kind: str, **payload):
+        """Поставить задачу в очередь; ждет, если очередь заполнена"""
+        if kind not in self._handlers:
+            raise ValueError(f"Неизвестный вид фоновой задачи: {kind}")
+
+        job_id = await self._spool_run(self._spool_add, kind, payload)
+        job = {'id': job_id, 'kind': kind, 'payload': payload, 'attempts': 0}
+        self.stats['enqueued'] += 1
+        queue = self._get_queue()
+        if self.is_running:
+            self._known.add(job['id'])
+            await queue.put(job)
+            return
+
+        # Воркеры еще не запущены: ждать места бессмысленно, задача останется в spool
+        try:
+            queue.put_nowait(job)
+            self._known.add(job['id'])
+        except asyncio.QueueFull:
+            if self._conn is None:
+                self.stats['failed'] += 1
+                logger.warning(f"Фоновая очередь заполнена, задача {kind} отброшена")
+
+    async def start(self):
+        """Запустить воркеров и вернуть в очередь задачи, оставшиеся с прошлого запуска"""
+        if self.is_running:
+            logger.warning("Фоновая очередь уже запущена")
+            return
+
+        self.is_running = True
+        queue = self._get_queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+        restored = 0
+        for job in await self._spool_run(self._spool_load):
+            if job['id'] not in self._known:
+                self._known.add(job['id'])
+                await queue.put(job)
+                restored += 1
+        logger.info(f"Фоновая очередь запущена, восстановлено задач: {restored}")
+
+    async def stop(self, timeout: float = 10.0):
+        """Дождаться текущих задач (не дольше timeout) и остановить воркеров
+
+        Невыполненные задачи остаются в spool до следующего запуска.
+        """
+        if not self.is_running:
+            return
+        self.is_running = False
+
+        try:
+            await asyncio.wait_for(self._get_queue().join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Фоновая очередь не успела опустеть за {timeout} с")
+
+        tasks = [*self._workers, *self._retries]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._retries.clear()
+        self._known.clear()
+        self._queue = None
+
+        await self._spool_run(self._spool_close)
+        logger.info(f"Фоновая очередь остановлена: {self.stats}")
+
+    async def join(self):
+        """Дождаться выполнения всех задач в очереди (для тестов и остановки)"""
+        await self._get_queue().join()
+        while self._retries:
+            await asyncio.gather(*self._retries, return_exceptions=True)
+            await self._get_queue().join()
+
+    def get_metrics(self) -> Dict:
+        return {**self.stats, 'queued': self._queue.qsize() if self._queue else 0,
+                'retrying': len(self._retries)}
+
+    def _get_queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_size)
+        return self._queue
+
+    async def _worker(self):
+        """Воркер: выполняет задачи из очереди"""
+        queue = self._get_queue()
+        while True:
+            job = await queue.get()
+            try:
+                await self._run(job)
+            finally:
+                queue.task_done()
+
+    async def _run(self, job: Dict):
+        handler = self._handlers.get(job['kind'])
+        if handler is None:
+            logger.error(f"Нет обработчика фоновой задачи {job['kind']}, задача удалена")
+            await self._finish(job)
+            return
+
+        try:
+            await handler(**job['payload'])
+        except Exception as e:
+            job['attempts'] += 1
+            if job['attempts'] >= self.max_attempts:
+                self.stats['failed'] += 1
+                logger.error(f"Фоновая задача {job['kind']} не выполнена после "
+                             f"{job['attempts']} попыток: {e}")
+                await self._finish(job)
+                return
+
+            self.stats['retried'] += 1
+            delay = min(self.retry_delay * 2 ** (job['attempts'] - 1), 60.0)
+            logger.warning(f"Ошибка фоновой задачи {job['kind']}, повтор через {delay:.1f} с: {e}")
+            await self._spool_run(self._spool_update, job)
+            task = asyncio.create_task(self._retry_later(job, delay))
+            self._retries.add(task)
+            task.add_done_callback(self._retries.discard)
+            return
+
+        self.stats['done'] += 1
+        await self._finish(job)
+
+    async def _retry_later(self, job: Dict, delay: float):
+        await asyncio.sleep(delay)
+        await self._get_queue().put(job)
+
+    async def _finish(self, job: Dict):
+        self._known.discard(job['id'])
+        await self._spool_run(self._spool_remove, job['id'])
+
+    async def _spool_run(self, operation: Callable, *args):
+        """Операция со spool в его потоке (без spool - сразу)"""
+        if not self.spool_path:
+            return operation(*args)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, operation, *args)
+
+    def _spool(self) -> Optional[sqlite3.Connection]:
+        """Соединение со spool (открывается при первом обращении)"""
+        if self._conn is None and self.spool_path:
+            try:
+                os.makedirs(os.path.dirname(self.spool_path) or '.', exist_ok=True)
+                conn = sqlite3.connect(self.spool_path, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS background_jobs ("
+                    "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, payload TEXT NOT NULL, "
+                    "attempts INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL)"
+                )
+                conn.commit()
+                self._conn = conn
+            except sqlite3.Error as e:
+                logger.warning(f"Spool фоновой очереди недоступен: {e}")
+                self.spool_path = None
+        return self._conn
+
+    def _spool_close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _spool_add(self, kind: str, payload: Dict) -> int:
+        data = json.dumps(payload, ensure_ascii=False)
+        conn = self._spool()
+        if conn is not None:
+            try:
+                cursor = conn.execute(
+                    "INSERT INTO background_jobs (kind, payload, created_at) VALUES (?, ?, ?)",
+                    (kind, data, time.time())
+                )
+                conn.commit()
+                return cursor.lastrowid
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка записи в spool фоновой очереди: {e}")
+        # Без spool задачи нумеруются в памяти (отрицательные id не пересекаются с базой)
+        self._next_id -= 1
+        return self._next_id
+
+    def _spool_load(self) -> List[Dict]:
+        conn = self._spool()
+        if conn is None:
+            return []
+        try:
+            rows = conn.execute(
+                "SELECT id, kind, payload, attempts FROM background_jobs ORDER BY id"
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка чтения spool фоновой очереди: {e}")
+            return []
+        return [{'id': row[0], 'kind': row[1], 'payload': json.loads(row[2]), 'attempts': row[3]}
+                for row in rows]
+
+    def _spool_update(self, job: Dict):
+        if job['id'] < 0 or self._spool() is None:
+            return
+        try:
+            self._conn.execute("UPDATE background_jobs SET attempts = ? WHERE id = ?",
+                               (job['attempts'], job['id']))
+            self._conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка записи в spool фоновой очереди: {e}")
+
+    def _spool_remove(self, job_id: int):
+        if job_id < 0 or self._spool() is None:
+            return
+        try:
+            self._conn.execute("DELETE FROM background_jobs WHERE id = ?", (job_id,))
+            self._conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка записи в spool фоновой очереди: {e}")
+
+
+# Глобальная очередь
+background_queue = BackgroundQueue(
+    workers=settings.BACKGROUND_WORKERS,
+    max_size=settings.BACKGROUND_QUEUE_SIZE,
+    max_attempts=settings.BACKGROUND_MAX_ATTEMPTS,
+    spool_path=settings.BACKGROUND_SPOOL_PATH or None
+)
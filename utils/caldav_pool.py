@@ -0,0 +1,86 @@
+"""
+Кэш CalDAV-сессий Яндекс.Календаря по пользователю
+
+Раньше каждый обработчик создавал новый YandexCalendar: DAVClient, principal()
+и calendars() - несколько PROPFIND до первого полезного запроса. Теперь клиент
+одного аккаунта живет в процессе и переиспользует HTTP-сессию (keep-alive) и
+найденный календарь, так что "Сегодня" стоит один REPORT.
+
+Через CALDAV_SESSION_TTL секунд клиент создается заново, но с уже известным
+адресом календаря - без повторного поиска. При смене пароля приложения сессия
+сбрасывается полностью, неудачное подключение не кэшируется.
+"""
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _create_calendar(app_password: str, username: str, calendar_url: Optional[str] = None):
+    # Импорт внутри функции: handlers.yandex_integration сам импортирует utils
+    from handlers.yandex_integration import YandexCalendar
+    return YandexCalendar(app_password, username, calendar_url=calendar_url)
+
+
+class CalDAVSessionPool:
+    """Клиенты YandexCalendar по логину CalDAV"""
+
+    def __init__(self, ttl: float = 1800, factory: Callable = _create_calendar):
+        """
+        Args:
+            ttl: Через сколько секунд пересоздавать клиент (адрес календаря сохраняется)
+            factory: Создание клиента (app_password, username, calendar_url)
+        """
+        self.ttl = ttl
+        self.factory = factory
+        self._sessions: Dict[str, Tuple[object, float]] = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'renewed': 0, 'created': 0}
+
+    def get(self, username: str, app_password: str):
+        """Клиент календаря пользователя; при смене пароля создается новый"""
+        with self._lock:
+            calendar, created = self._sessions.get(username, (None, 0.0))
+            calendar_url = None
+
+            if calendar is not None:
+                if calendar.app_password != app_password or calendar.connection_failed:
+                    calendar = None
+                elif time.monotonic() - created >= self.ttl:
+                    calendar_url = calendar.calendar_url
+                    calendar = None
+                    self.stats['renewed'] += 1
+                else:
+                    self.stats['hits'] += 1
+                    return calendar
+
+            if calendar_url is None:
+                self.stats['created'] += 1
+            calendar = self.factory(app_password, username, calendar_url)
+            self._sessions[username] = (calendar, time.monotonic())
+            return calendar
+
+    def put(self, calendar):
+        """Сохранить уже подключенный клиент (например, после проверки при настройке)"""
+        with self._lock:
+            self._sessions[calendar.username] = (calendar, time.monotonic())
+
+    def invalidate(self, username: str):
+        """Забыть сессию аккаунта"""
+        with self._lock:
+            self._sessions.pop(username, None)
+
+    def get_metrics(self) -> Dict:
+        return {**self.stats, 'sessions': len(self._sessions)}
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+
+# Глобальный кэш сессий
+caldav_pool = CalDAVSessionPool(ttl=settings.CALDAV_SESSION_TTL)
@@ -0,0 +1,202 @@
+"""
+Локальный кэш событий Яндекс.Календаря с инкрементальной синхронизацией
+
+Раньше каждый просмотр "Сегодня"/"Неделя" и каждая синхронизация напоминаний
+делали date_search и заново разбирали все VEVENT. Теперь события пользователя
+хранятся локально (хранилище документов, как контакты и настройки) по ресурсам
+календаря: href -> etag и уже разобранные события.
+
+Обновление (YandexCalendar.sync_events):
+- сначала сравнивается getctag календаря - если он не изменился, запросов больше нет;
+- затем REPORT sync-collection (RFC 6578) с сохраненным sync-token возвращает
+  только измененные href; скачиваются и разбираются лишь ресурсы с новым etag;
+- если сервер не поддерживает sync-token или отклонил устаревший, ресурсы
+  перечисляются полностью, а скачиваются по-прежнему только изменившиеся.
+
+Чаще CALENDAR_SYNC_INTERVAL секунд календарь не синхронизируется: повторное
+открытие меню обслуживается из памяти. Создание или удаление события через бота
+помечает данные устаревшими, и следующий просмотр их обновит.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import date, datetime
+from typing import Dict, List, Tuple
+
+import recurring_ical_events
+from icalendar import Calendar
+
+from config.settings import settings
+from database.storage import create_document_store
+
+logger = logging.getLogger(__name__)
+
+
+def as_naive(value) -> datetime:
+    """Дата или время события как наивное локальное время (для сравнения с диапазоном)"""
+    if isinstance(value, datetime):
+        return value.astimezone().replace(tzinfo=None) if value.tzinfo else value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return datetime.fromisoformat(str(value))
+
+
+def event_dict(component) -> Dict:
+    """VEVENT в формате, который ожидают обработчики календаря"""
+    start = component.get('dtstart')
+    end = component.get('dtend')
+    return {
+        "id": str(component.get('uid', '')),
+        "summary": str(component.get('summary', 'Без названия')),
+        "start": {"dateTime": start.dt.isoformat() if start else ""},
+        "end": {"dateTime": end.dt.isoformat() if end else ""}
+    }
+
+
+def parse_vevents(data: str) -> Tuple[List[Dict], bool]:
+    """Разобрать ресурс календаря: события и признак повторяющихся событий"""
+    cal = Calendar.from_ical(data)
+    events = []
+    recurring = False
+    for component in cal.walk('VEVENT'):
+        if component.get('rrule') or component.get('rdate'):
+            recurring = True
+        events.append(event_dict(component))
+    return events, recurring
+
+
+def overlaps(event: Dict, start: datetime, end: datetime) -> bool:
+    """Пересекается ли событие с диапазоном [start, end]"""
+    event_start = event["start"]["dateTime"]
+    if not event_start:
+        return False
+    event_start = as_naive(datetime.fromisoformat(event_start))
+    event_end = event["end"]["dateTime"]
+    event_end = as_naive(datetime.fromisoformat(event_end)) if event_end else event_start
+    if event_end <= event_start:
+        return start <= event_start <= end
+    return event_start <= end and event_end > start
+
+
+class CalendarEventCache:
+    """События календаря по пользователям"""
+
+    def __init__(self, sync_interval: float = 60):
+        """
+        Args:
+            sync_interval: Сколько секунд данные считаются свежими без обращения к серверу
+        """
+        self.sync_interval = sync_interval
+        self.storage_dir = os.path.join("data", "calendar_events")
+        self.store = create_document_store("calendar_events", self.storage_dir,
+                                           "user_{user_id}.json", dict)
+        self._synced: Dict[int, float] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        # Разобранные ресурсы с повторяющимися событиями: href -> (etag, Calendar)
+        self._recurring: Dict[str, Tuple[str, Calendar]] = {}
+        self.stats = {'local': 0, 'syncs': 0, 'unchanged': 0, 'downloaded': 0, 'failures': 0}
+
+    async def get_events(self, user_id: int, calendar_client, start_date: str, end_date: str) -> List[Dict]:
+        """События в диапазоне: из локального кэша, при необходимости после синхронизации"""
+        synced = await self.refresh(user_id, calendar_client)
+        await self.store.preload(user_id)
+        if not synced and not self.store.view(user_id).get('resources'):
+            # Синхронизировать не удалось, а локальных данных нет - прямой запрос
+            return await calendar_client.get_events(start_date, end_date)
+        return self.query(user_id, start_date, end_date)
+
+    async def refresh(self, user_id: int, calendar_client, force: bool = False) -> bool:
+        """Синхронизировать события, если данные устарели"""
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            last_sync = self._synced.get(user_id)
+            if (not force and last_sync is not None
+                    and time.monotonic() - last_sync < self.sync_interval
+                    and calendar_client.modified_at <= last_sync):
+                self.stats['local'] += 1
+                return True
+
+            await self.store.preload(user_id)
+            document = self.store.view(user_id)
+            if document.get('username') != calendar_client.username:
+                document = {}
+            resources = document.get('resources', {})
+            etags = {href: resource['etag'] for href, resource in resources.items()}
+
+            started = time.monotonic()
+            result = await calendar_client.sync_events(document.get('sync_token'), document.get('ctag'), etags)
+            if result is None:
+                self.stats['failures'] += 1
+                return False
+
+            self.stats['syncs'] += 1
+            if not result['changed'] and not result['deleted']:
+                self.stats['unchanged'] += 1
+            self.stats['downloaded'] += len(result['changed'])
+            await self.store.update(user_id, lambda doc: self._apply(doc, calendar_client.username, result))
+            self._synced[user_id] = started
+            logger.info(f"Календарь {user_id} синхронизирован: изменено {len(result['changed'])}, "
+                        f"удалено {len(result['deleted'])}, {(time.monotonic() - started) * 1000:.0f} мс")
+            return True
+
+    def query(self, user_id: int, start_date: str, end_date: str) -> List[Dict]:
+        """События в диапазоне из локального кэша (без обращения к серверу)"""
+        start = as_naive(datetime.fromisoformat(start_date.replace('Z', '+00:00')))
+        end = as_naive(datetime.fromisoformat(end_date.replace('Z', '+00:00')))
+
+        result = []
+        for href, resource in self.store.view(user_id).get('resources', {}).items():
+            if resource.get('ics'):
+                result.extend(self._expand(href, resource, start, end))
+            else:
+                result.extend(event for event in resource['events'] if overlaps(event, start, end))
+
+        result.sort(key=lambda event: as_naive(datetime.fromisoformat(event["start"]["dateTime"])))
+        return result
+
+    def clear(self, user_id: int):
+        self._synced.pop(user_id, None)
+        self.store.delete(user_id)
+
+    def get_metrics(self) -> Dict:
+        return dict(self.stats)
+
+    def _apply(self, document: Dict, username: str, result: Dict):
+        """Применить изменения синхронизации к документу пользователя"""
+        if document.get('username') != username:
+            document.clear()
+            document['username'] = username
+        resources = document.setdefault('resources', {})
+
+        for href in result['deleted']:
+            resources.pop(href, None)
+        for href, (etag, data) in result['changed'].items():
+            try:
+                events, recurring = parse_vevents(data)
+            except Exception as e:
+                logger.warning(f"Не удалось разобрать событие {href}: {e}")
+                continue
+            # Повторяющиеся события разворачиваются на нужный диапазон при запросе
+            resources[href] = {'etag': etag, 'ics': data} if recurring else {'etag': etag, 'events': events}
+
+        document['sync_token'] = result['sync_token']
+        document['ctag'] = result['ctag']
+        document['synced_at'] = datetime.now().isoformat()
+
+    def _expand(self, href: str, resource: Dict, start: datetime, end: datetime) -> List[Dict]:
+        """Вхождения повторяющихся событий ресурса в диапазоне"""
+        cached = self._recurring.get(href)
+        if cached is None or cached[0] != resource['etag']:
+            cached = (resource['etag'], Calendar.from_ical(resource['ics']))
+            self._recurring[href] = cached
+        cal = cached[1]
+        try:
+            return [event_dict(component) for component in recurring_ical_events.of(cal).between(start, end)]
+        except Exception as e:
+            logger.warning(f"Не удалось развернуть повторяющееся событие {href}: {e}")
+            return []
+
+
+# Глобальный кэш событий календаря
+calendar_cache = CalendarEventCache(sync_interval=settings.CALENDAR_SYNC_INTERVAL)
@@ -286,7 +286,8 @@ class CalendarReminderSync:
         """
         try:
             # Импортируем необходимые модули
-            from handlers.yandex_integration import YandexCalendar
+            from utils.caldav_pool import caldav_pool
+            from utils.calendar_cache import calendar_cache
             from datetime import datetime, timedelta
             
             # DEBUG: Логируем содержимое token_data
@@ -316,14 +317,15 @@ class CalendarReminderSync:
                     "reminders_created": 0
                 }
             
-            # Создаем экземпляр календаря
-            calendar = YandexCalendar(app_password, username)
+            # Клиент календаря из кэша сессий
+            calendar = caldav_pool.get(username, app_password)
             
             # Получаем события на следующие 30 дней
             start_date = datetime.now()
             end_date = start_date + timedelta(days=30)
             
-            events = await calendar.get_events(
+            events = await calendar_cache.get_events(
+                user_id, calendar,
                 start_date.strftime('%Y-%m-%dT%H:%M:%S'),
                 end_date.strftime('%Y-%m-%dT%H:%M:%S')
             )
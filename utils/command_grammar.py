@@ -0,0 +1,121 @@
+"""
+Движок командных грамматик: все паттерны одного намерения в одном регулярном выражении
+
+Правила грамматики объединяются в одну альтернацию без захватов
+    (?:правило0)|(?:правило1)|...
+которая компилируется один раз при импорте. Один вызов search находит самое левое
+совпадение любого правила, поэтому сообщения без команды отсекаются за один проход.
+Сработавшее правило и его захваты затем определяются сопоставлением отдельных
+правил только в найденной позиции.
+
+Семантика совпадает с исходным циклом
+    for pattern in patterns: re.search(pattern, text)
+(побеждает первое по порядку правило, сработавшее где угодно): если найдено
+правило k в позиции p, то правила с меньшим индексом могут сработать только правее p,
+и их проверяет еще один поиск по альтернации правил 0..k-1 начиная с p+1.
+Индекс правила на каждом шаге строго уменьшается, обычно хватает одного-двух проходов.
+
+Захваты внутри правил задаются именованными группами (?P<имя>...);
+имена могут повторяться в разных правилах.
+"""
+import re
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+_NAMED_GROUP_RE = re.compile(r'\(\?P<([A-Za-z_][A-Za-z0-9_]*)>')
+
+
+class GrammarMatch:
+    """Результат сопоставления: сработавшее правило и его захваты"""
+
+    __slots__ = ('grammar', 'rule', 'rule_index', 'captures', 'groups')
+
+    def __init__(self, grammar: str, rule: str, rule_index: int,
+                 captures: Dict[str, Optional[str]], groups: Tuple[Optional[str], ...]):
+        self.grammar = grammar
+        self.rule = rule
+        self.rule_index = rule_index
+        self.captures = captures
+        self.groups = groups
+
+    def __getitem__(self, name: str) -> Optional[str]:
+        return self.captures.get(name)
+
+    def __repr__(self) -> str:
+        return f"GrammarMatch({self.grammar}.{self.rule}, {self.captures})"
+
+
+class CommandGrammar:
+    """Набор правил одного намерения, скомпилированный в одно выражение"""
+
+    def __init__(self, name: str, rules: Sequence[Tuple[str, str]], flags: int = re.IGNORECASE):
+        """
+        Args:
+            name: Имя намерения (calendar, email, edit, ...)
+            rules: Пары (имя правила, паттерн) в порядке приоритета
+            flags: Флаги re для всей грамматики
+        """
+        self.name = name
+        self.rules = list(rules)
+        self.flags = flags
+        self._patterns = [re.compile(pattern, flags) for _, pattern in self.rules]
+        # Скомпилированные альтернации для диапазонов правил [start, end)
+        self._compiled: Dict[Tuple[int, int], re.Pattern] = {}
+        self._compile(0, len(self.rules))
+
+    def _compile(self, start: int, end: int) -> re.Pattern:
+        """Скомпилировать альтернацию правил с индексами [start, end)"""
+        key = (start, end)
+        if key not in self._compiled:
+            # Захватывающие группы вокруг веток отключают оптимизации sre по первому символу,
+            # поэтому в общей альтернации именованные группы заменяются на (?:...)
+            alternatives = [
+                "(?:" + _NAMED_GROUP_RE.sub("(?:", pattern) + ")"
+                for _, pattern in self.rules[start:end]
+            ]
+            self._compiled[key] = re.compile("|".join(alternatives), self.flags)
+        return self._compiled[key]
+
+    def _search(self, text: str, start: int, end: int, pos: int = 0):
+        """Самое левое совпадение правил [start, end); возвращает (match, индекс правила)"""
+        found = self._compile(start, end).search(text, pos)
+        if not found:
+            return None, None
+
+        # В позиции совпадения альтернация выбрала первое подходящее правило
+        position = found.start()
+        for index in range(start, end):
+            match = self._patterns[index].match(text, position)
+            if match:
+                return match, index
+
+        return None, None
+
+    def match(self, text: str, start: int = 0) -> Optional[GrammarMatch]:
+        """Найти первое по приоритету сработавшее правило (с индекса start)"""
+        if start >= len(self.rules):
+            return None
+
+        best, index = self._search(text, start, len(self.rules))
+        if not best:
+            return None
+
+        # Правила выше по приоритету могут сработать только правее найденной позиции
+        while index > start:
+            better, better_index = self._search(text, start, index, best.start() + 1)
+            if not better:
+                break
+            best, index = better, better_index
+
+        return GrammarMatch(self.name, self.rules[index][0], index, best.groupdict(), best.groups())
+
+    def iter_matches(self, text: str, start: int = 0) -> Iterator[GrammarMatch]:
+        """Перебрать сработавшие правила в порядке приоритета (лениво)"""
+        while True:
+            found = self.match(text, start)
+            if not found:
+                return
+            yield found
+            start = found.rule_index + 1
+
+    def __repr__(self) -> str:
+        return f"CommandGrammar({self.name}, {len(self.rules)} rules)"
@@ -45,10 +45,10 @@ class ContactFinder:
     async def _search_contacts(self, query: str, user_id: int) -> Dict:
         """Поиск в контактах пользователя"""
         try:
-            # Получаем все контакты пользователя
-            all_contacts = await contacts_manager.get_user_contacts(user_id)
+            # Индекс контактов: имена с учетом падежа и опечаток, email, компания
+            resolved = await contacts_manager.resolve_name(user_id, query, limit=10)
             
-            if not all_contacts:
+            if not resolved and not await contacts_manager.get_contact_names(user_id, limit=1):
                 return {
                     'type': 'no_contacts',
                     'found': False,
@@ -56,48 +56,25 @@ class ContactFinder:
                     'message': 'У вас пока нет сохраненных контактов'
                 }
             
-            # Поиск по имени (нечеткий поиск)
-            matches = []
-            query_lower = query.lower()
-            
-            for contact in all_contacts:
-                # Проверяем совпадение по имени
-                name_score = self._calculate_similarity(query_lower, contact.name.lower())
-                
-                # Проверяем совпадение по email
-                email_score = 0
-                if contact.email and query_lower in contact.email.lower():
-                    email_score = 0.8
-                
-                # Проверяем совпадение по компании
-                company_score = 0
-                if contact.company and query_lower in contact.company.lower():
-                    company_score = 0.6
-                
-                # Общий скор
-                total_score = max(name_score, email_score, company_score)
-                
-                if total_score > 0.3:  # Порог совпадения
-                    matches.append({
-                        'contact': contact,
-                        'score': total_score,
-                        'match_type': 'name' if name_score == total_score else 'email' if email_score == total_score else 'company'
-                    })
-            
-            # Сортируем по релевантности
-            matches.sort(key=lambda x: x['score'], reverse=True)
+            # Уже отсортировано по релевантности
+            matches = [
+                {'contact': contact, 'score': score, 'match_type': match_type}
+                for contact, score, match_type in resolved
+                if score > 0.3  # Порог совпадения
+            ]
             
             if not matches:
                 return {
                     'type': 'no_matches',
                     'found': False,
-                    'suggestions': [contact.name for contact in all_contacts[:5]],
+                    'suggestions': await contacts_manager.get_contact_names(user_id, limit=5),
                     'message': f'Контакт "{query}" не найден'
                 }
             
-            # Если одно точное совпадение
-            if len(matches) == 1 and matches[0]['score'] > 0.8:
-                contact = matches[0]['contact']
+            # Если одно уверенное совпадение (остальные заметно слабее)
+            confident = [m for m in matches if m['score'] > 0.8]
+            if len(confident) == 1:
+                contact = confident[0]['contact']
                 if contact.email:
                     return {
                         'type': 'contact_found',
@@ -123,28 +100,11 @@ class ContactFinder:
                 'message': f'Ошибка поиска: {str(e)[:50]}...'
             }
     
-    def _calculate_similarity(self, s1: str, s2: str) -> float:
-        """Простой алгоритм вычисления схожести строк"""
-        if s1 == s2:
-            return 1.0
-        
-        if s1 in s2 or s2 in s1:
-            return 0.8
-        
-        # Проверяем общие слова
-        words1 = set(s1.split())
-        words2 = set(s2.split())
-        
-        if words1 & words2:  # Есть общие слова
-            return len(words1 & words2) / len(words1 | words2)
-        
-        return 0.0
-    
     async def _analyze_with_ai(self, user_input: str, user_id: int) -> Dict:
         """Анализ ввода с помощью AI"""
         try:
             # Получаем контакты для контекста
-            contacts = await contacts_manager.get_user_contacts(user_id)
+            contacts = await contacts_manager.get_all_contacts(user_id)
             contacts_context = ""
             
             if contacts:
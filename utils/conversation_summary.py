@@ -0,0 +1,87 @@
+"""
+Краткое изложение старой переписки пользователя
+
+В промпт целиком входят только последние PROMPT_RECENT_TURNS ходов. Более
+старые ходы пересказываются моделью в одно краткое изложение, которое хранится
+у пользователя (хранилище документов, как контакты и настройки) и обновляется
+в фоновой очереди, когда за пределами окна накопилось PROMPT_SUMMARY_BATCH
+еще не пересказанных ходов. Вызывающий код только читает готовый текст.
+"""
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config.settings import settings
+from database.storage import create_document_store
+from utils.prompt_builder import truncate_to_tokens
+
+SUMMARY_PROMPT = (
+    "Ты ведешь краткое содержание переписки пользователя с ассистентом. "
+    "Дополни существующее содержание новыми сообщениями. Сохраняй факты о пользователе, "
+    "его просьбы, договоренности и нерешенные вопросы; опускай приветствия и повторы. "
+    "Пиши на русском языке, в третьем лице, не длиннее {words} слов."
+)
+
+
+def turn_time(item: Dict) -> str:
+    """Отметка времени хода истории (SimpleMemory - timestamp, база - created_at)"""
+    value = item.get('timestamp') or item.get('created_at') or ''
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+class ConversationSummaries:
+    """Краткие изложения переписки по пользователям"""
+
+    def __init__(self):
+        self.storage_dir = os.path.join("data", "summaries")
+        self.store = create_document_store("conversation_summaries", self.storage_dir,
+                                           "user_{user_id}.json", dict)
+
+    def get(self, user_id: int) -> Optional[str]:
+        """Текущее изложение (без обращения к модели)"""
+        return self.store.view(user_id).get('summary') or None
+
+    def pending_turns(self, user_id: int, history: List[Dict], recent_turns: int) -> List[Dict]:
+        """Ходы за пределами окна истории, еще не вошедшие в изложение"""
+        covered_until = self.store.view(user_id).get('covered_until', '')
+        older = history[:-recent_turns] if recent_turns else history
+        return [item for item in older if turn_time(item) > covered_until]
+
+    async def update(self, user_id: int, turns: List[Dict]) -> bool:
+        """Дополнить изложение ходами turns (от старых к новым)"""
+        from utils.openai_client import CHAT_ERROR_RESPONSE, openai_client
+
+        await self.store.preload(user_id)
+        document = self.store.get(user_id)
+        covered_until = document.get('covered_until', '')
+        turns = [item for item in turns if turn_time(item) > covered_until]
+        if not turns:
+            return True
+
+        dialogue = "\n".join(
+            f"Пользователь: {item.get('user_message', '')}\nАссистент: {item.get('ai_response', '')}"
+            for item in turns
+        )
+        previous = document.get('summary') or "(пока пусто)"
+        messages = [
+            {"role": "system", "content": SUMMARY_PROMPT.format(words=settings.PROMPT_SUMMARY_MAX_TOKENS // 2)},
+            {"role": "user", "content": f"Текущее содержание:\n{previous}\n\nНовые сообщения:\n{dialogue}"}
+        ]
+        summary = await openai_client.chat_completion(messages, temperature=0.3)
+        if not summary or summary == CHAT_ERROR_RESPONSE:
+            return False
+
+        def apply(doc):
+            doc['summary'] = truncate_to_tokens(summary.strip(), settings.PROMPT_SUMMARY_MAX_TOKENS)
+            doc['covered_until'] = max(turn_time(turns[-1]), doc.get('covered_until', ''))
+            doc['updated_at'] = datetime.now().isoformat()
+
+        await self.store.update(user_id, apply)
+        return True
+
+    def clear(self, user_id: int):
+        self.store.delete(user_id)
+
+
+# Глобальный экземпляр
+conversation_summaries = ConversationSummaries()
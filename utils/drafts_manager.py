@@ -1,9 +1,9 @@
-import os
-import json
 import uuid
 from typing import List, Dict, Optional
 from datetime import datetime
 
+from database.storage import create_document_store
+
 
 class Draft:
     """Класс для представления черновика письма"""
@@ -55,53 +55,36 @@ class DraftsManager:
     
     def __init__(self):
         self.drafts_dir = "data/drafts"
-        os.makedirs(self.drafts_dir, exist_ok=True)
+        self.store = create_document_store("email_drafts", self.drafts_dir, "user_{user_id}_drafts.json", lambda: {'drafts': []})
     
     def _get_user_drafts_file(self, user_id: int) -> str:
         """Получить путь к файлу черновиков пользователя"""
-        return os.path.join(self.drafts_dir, f"user_{user_id}_drafts.json")
+        return self.store.path(user_id)
     
     async def save_draft(self, user_id: int, draft: Draft) -> bool:
         """Сохранить черновик"""
-        try:
-            drafts_file = self._get_user_drafts_file(user_id)
-            
-            # Загружаем существующие черновики
-            drafts = []
-            if os.path.exists(drafts_file):
-                try:
-                    with open(drafts_file, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        drafts = [Draft.from_dict(d) for d in data.get('drafts', [])]
-                except:
-                    pass
+        def apply(data):
+            drafts = data.get('drafts', [])
             
             # Проверяем, есть ли уже такой черновик (обновляем)
             found = False
             for i, existing_draft in enumerate(drafts):
-                if existing_draft.id == draft.id:
+                if existing_draft.get('id') == draft.id:
                     draft.updated_at = datetime.now().isoformat()
-                    drafts[i] = draft
+                    drafts[i] = draft.to_dict()
                     found = True
                     break
             
             # Если не найден, добавляем новый
             if not found:
-                drafts.append(draft)
+                drafts.append(draft.to_dict())
             
             # Ограничиваем количество черновиков (максимум 50)
-            if len(drafts) > 50:
-                drafts = drafts[-50:]  # Оставляем последние 50
-            
-            # Сохраняем
-            data = {
-                'drafts': [d.to_dict() for d in drafts],
-                'updated_at': datetime.now().isoformat()
-            }
-            
-            with open(drafts_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            
+            data['drafts'] = drafts[-50:]  # Оставляем последние 50
+            data['updated_at'] = datetime.now().isoformat()
+        
+        try:
+            await self.store.update(user_id, apply)
             return True
             
         except Exception as e:
@@ -111,14 +94,9 @@ class DraftsManager:
     async def get_user_drafts(self, user_id: int) -> List[Draft]:
         """Получить все черновики пользователя"""
         try:
-            drafts_file = self._get_user_drafts_file(user_id)
-            
-            if not os.path.exists(drafts_file):
-                return []
-            
-            with open(drafts_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                drafts = [Draft.from_dict(d) for d in data.get('drafts', [])]
+            await self.store.preload(user_id)
+            data = self.store.view(user_id)
+            drafts = [Draft.from_dict(d) for d in data.get('drafts', [])]
             
             # Сортируем по дате обновления (новые сверху)
             drafts.sort(key=lambda x: x.updated_at, reverse=True)
@@ -140,26 +118,21 @@ class DraftsManager:
     
     async def delete_draft(self, user_id: int, draft_id: str) -> bool:
         """Удалить черновик"""
-        try:
-            drafts = await self.get_user_drafts(user_id)
+        def remove(data):
+            drafts = data.get('drafts', [])
             
             # Фильтруем - убираем черновик с нужным ID
-            updated_drafts = [d for d in drafts if d.id != draft_id]
+            updated_drafts = [d for d in drafts if d.get('id') != draft_id]
             
             if len(updated_drafts) == len(drafts):
                 return False  # Черновик не найден
             
-            # Сохраняем обновленный список
-            drafts_file = self._get_user_drafts_file(user_id)
-            data = {
-                'drafts': [d.to_dict() for d in updated_drafts],
-                'updated_at': datetime.now().isoformat()
-            }
-            
-            with open(drafts_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            
+            data['drafts'] = updated_drafts
+            data['updated_at'] = datetime.now().isoformat()
             return True
+        
+        try:
+            return await self.store.update(user_id, remove)
             
         except Exception as e:
             print(f"Ошибка удаления черновика {draft_id} для пользователя {user_id}: {e}")
@@ -81,7 +81,7 @@ class EmailImprover:
                 {"role": "user", "content": f"Тема: {subject}"}
             ]
             
-            improved = await openai_client.chat_completion(messages)
+            improved = await openai_client.cached_chat_completion('improve_subject', 1, subject, messages)
             return improved.strip('"\'')
             
         except:
@@ -95,7 +95,9 @@ class EmailImprover:
                 {"role": "user", "content": f"Тема письма: {subject}\n\nТекст для улучшения:\n{body}"}
             ]
             
-            improved = await openai_client.chat_completion(messages)
+            improved = await openai_client.cached_chat_completion(
+                'improve_body', 1, f"{subject}\n\n{body}", messages
+            )
             return improved
             
         except:
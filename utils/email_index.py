@@ -0,0 +1,214 @@
+"""
+Локальный полнотекстовый индекс писем (SQLite FTS5)
+
+Индекс наполняется письмами, которые уже были загружены при синхронизации
+входящих (заголовки и начало текста или письмо целиком). Он используется для
+ранжирования результатов серверного IMAP SEARCH по bm25 и как запасной вариант
+поиска, если IMAP сервер недоступен.
+
+База открывается при первом обращении. Если SQLite собран без FTS5 или индекс
+выключен в настройках, все методы становятся пустыми и поиск работает только через сервер.
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Веса колонок для bm25: отправитель, тема, текст
+_BM25_WEIGHTS = (5.0, 10.0, 1.0)
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """Преобразовать пользовательский запрос в выражение MATCH (все слова, по префиксу)"""
+    tokens = _TOKEN_RE.findall(query.lower())
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+class EmailSearchIndex:
+    """Индекс писем по ящикам с учетом UIDVALIDITY"""
+
+    def __init__(self, path: Optional[str] = None, enabled: Optional[bool] = None):
+        self.path = path or settings.EMAIL_INDEX_PATH
+        self.enabled = settings.EMAIL_INDEX_ENABLED if enabled is None else enabled
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """Соединение с базой индекса (открывается при первом обращении)"""
+        if self._conn is None and self.enabled:
+            with self._lock:
+                if self._conn is None and self.enabled:
+                    try:
+                        self._open()
+                    except sqlite3.Error as e:
+                        logger.warning(f"Полнотекстовый индекс писем недоступен: {e}")
+                        self.enabled = False
+        return self._conn
+
+    def _open(self):
+        """Открыть базу индекса и создать таблицы"""
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+
+        # Индекс используется из потоков пула, доступ сериализуется через _lock
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5("
+            "account UNINDEXED, uid UNINDEXED, date UNINDEXED, sender, subject, body, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS mailboxes ("
+            "account TEXT PRIMARY KEY, uidvalidity INTEGER NOT NULL)"
+        )
+        conn.commit()
+        self._conn = conn
+
+    def validate(self, account: str, uidvalidity: int):
+        """Удалить письма ящика, если сервер сменил UIDVALIDITY"""
+        conn = self._connection()
+        if conn is None:
+            return
+
+        with self._lock:
+            row = conn.execute(
+                "SELECT uidvalidity FROM mailboxes WHERE account = ?", (account,)
+            ).fetchone()
+            if row and row[0] == uidvalidity:
+                return
+
+            conn.execute("DELETE FROM messages WHERE account = ?", (account,))
+            conn.execute(
+                "INSERT OR REPLACE INTO mailboxes (account, uidvalidity) VALUES (?, ?)",
+                (account, uidvalidity)
+            )
+            conn.commit()
+
+    def add_messages(self, account: str, messages: List[Dict]):
+        """Добавить или обновить письма (словари из RealEmailSender._parse_message)"""
+        conn = self._connection()
+        if conn is None or not messages:
+            return
+
+        rows = [
+            (
+                account,
+                int(message['id']),
+                message.get('date', ''),
+                message.get('sender', ''),
+                message.get('subject', ''),
+                message.get('full_body') or message.get('body', '')
+            )
+            for message in messages
+        ]
+
+        with self._lock:
+            conn.executemany(
+                "DELETE FROM messages WHERE account = ? AND uid = ?",
+                [(row[0], row[1]) for row in rows]
+            )
+            conn.executemany(
+                "INSERT INTO messages (account, uid, date, sender, subject, body) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.commit()
+
+    def remove_missing(self, account: str, uids: set):
+        """Удалить письма, которых больше нет на сервере"""
+        conn = self._connection()
+        if conn is None:
+            return
+
+        with self._lock:
+            indexed = [row[0] for row in conn.execute(
+                "SELECT uid FROM messages WHERE account = ?", (account,)
+            )]
+            stale = [(account, uid) for uid in indexed if uid not in uids]
+            if stale:
+                conn.executemany("DELETE FROM messages WHERE account = ? AND uid = ?", stale)
+                conn.commit()
+
+    def search(self, account: str, query: str, limit: int = 20, offset: int = 0,
+               uids: Optional[List[int]] = None) -> List[int]:
+        """UID писем по убыванию релевантности (bm25)
+
+        Args:
+            account: Адрес ящика
+            query: Текст запроса
+            limit: Размер страницы
+            offset: Смещение страницы
+            uids: Ограничить поиск этими UID (например, результатом IMAP SEARCH)
+        """
+        match = build_match_query(query)
+        conn = self._connection()
+        if conn is None or not match:
+            return []
+
+        sql = (
+            "SELECT uid FROM messages WHERE messages MATCH ? AND account = ?"
+        )
+        params: list = [match, account]
+        if uids is not None:
+            if not uids:
+                return []
+            sql += f" AND uid IN ({','.join('?' * len(uids))})"
+            params.extend(uids)
+
+        sql += " ORDER BY bm25(messages, 0, 0, 0, ?, ?, ?), uid DESC LIMIT ? OFFSET ?"
+        params.extend([*_BM25_WEIGHTS, limit, offset])
+
+        try:
+            with self._lock:
+                return [row[0] for row in conn.execute(sql, params)]
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка поиска по индексу писем: {e}")
+            return []
+
+    def get_messages(self, account: str, uids: List[int]) -> Dict[int, Dict]:
+        """Письма из индекса в формате RealEmailSender (для поиска без сервера)"""
+        conn = self._connection()
+        if conn is None or not uids:
+            return {}
+
+        with self._lock:
+            rows = conn.execute(
+                f"SELECT uid, date, sender, subject, body FROM messages "
+                f"WHERE account = ? AND uid IN ({','.join('?' * len(uids))})",
+                [account, *uids]
+            ).fetchall()
+
+        return {
+            uid: {
+                'id': str(uid),
+                'subject': subject,
+                'sender': sender,
+                'date': date,
+                'body': body[:500] + '...' if len(body) > 500 else body,
+                'full_body': None,
+                'partial': True
+            }
+            for uid, date, sender, subject, body in rows
+        }
+
+    def close(self):
+        """Закрыть базу индекса"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        self.enabled = False
+
+
+# Глобальный индекс
+email_index = EmailSearchIndex()
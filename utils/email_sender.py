@@ -13,8 +13,13 @@ class YandexEmailSender:
         self.smtp_server = "smtp.yandex.ru"
         self.smtp_port = 587
     
-    async def send_email(self, user_id: int, to_email: str, subject: str, body: str) -> bool:
-        """Отправить письмо от имени пользователя"""
+    async def send_email(self, user_id: int, to_email: str, subject: str, body: str,
+                         on_status=None) -> bool:
+        """Отправить письмо от имени пользователя
+        
+        Args:
+            on_status: Необязательный колбэк статуса доставки (см. utils.smtp_pool)
+        """
         try:
             # Проверяем, настроен ли SMTP
             smtp_data = await user_tokens.get_user_info(user_id, "email_smtp")
@@ -26,13 +31,17 @@ class YandexEmailSender:
                 email = smtp_data.get('email')
                 password = smtp_data.get('password')
                 
+                # Сессия уже открыта - проверка подключения не нужна
+                if real_email_sender.has_smtp_session(email, password):
+                    return await real_email_sender.send_email(user_id, to_email, subject, body, on_status)
+                
                 try:
                     # Быстрая проверка SMTP
                     test_result = await real_email_sender.test_connection(email, password)
                     
                     if test_result['success']:
                         # SMTP работает - отправляем обычным способом
-                        return await real_email_sender.send_email(user_id, to_email, subject, body)
+                        return await real_email_sender.send_email(user_id, to_email, subject, body, on_status)
                     elif test_result.get('suggestion') == 'smtp_blocked':
                         # SMTP заблокирован - используем альтернативный способ
                         print("⚠️ SMTP заблокирован, используем альтернативный способ отправки")
@@ -46,7 +55,7 @@ class YandexEmailSender:
                 except Exception as smtp_error:
                     print(f"❌ Ошибка проверки SMTP: {smtp_error}")
                     # Если проверка не работает, пытаемся отправить напрямую
-                    result = await real_email_sender.send_email(user_id, to_email, subject, body)
+                    result = await real_email_sender.send_email(user_id, to_email, subject, body, on_status)
                     if not result:
                         # Если не получилось, используем симуляцию
                         print("⚠️ Переключаемся на симуляцию отправки")
@@ -11,6 +11,16 @@ import asyncio
 import re
 from datetime import datetime
 from database.user_tokens import user_tokens
+from utils.imap_pool import imap_pool, parse_uid_fetch
+from utils.email_index import email_index
+from utils.smtp_pool import smtp_pool, StatusCallback
+
+# Для списка писем достаточно этих заголовков и начала текста
+PREVIEW_HEADER_FIELDS = 'FROM SUBJECT DATE CONTENT-TYPE CONTENT-TRANSFER-ENCODING'
+PREVIEW_BYTES = 2048
+
+# Сколько последних совпадений серверного поиска ранжировать
+SEARCH_CANDIDATES = 100
 
 class RealEmailSender:
     """Реальная отправка и получение писем через SMTP/IMAP"""
@@ -189,29 +199,23 @@ class RealEmailSender:
                 'message': 'Техническая ошибка'
             }
     
-    async def send_email(self, user_id: int, to_email: str, subject: str, body: str) -> bool:
-        """Отправить письмо"""
+    async def send_email(self, user_id: int, to_email: str, subject: str, body: str,
+                         on_status: Optional[StatusCallback] = None) -> bool:
+        """Отправить письмо через очередь SMTP-сессии пользователя
+        
+        Args:
+            on_status: Колбэк статуса доставки on_status(status, to_email, info),
+                       status - 'queued', 'sending', 'retrying', 'sent' или 'failed'
+        """
         try:
-            # Получаем настройки пользователя
-            email_data = await user_tokens.get_user_info(user_id, "email_smtp")
-            if not email_data:
+            credentials = await self._get_credentials(user_id)
+            if not credentials:
                 print("❌ Email не настроен для пользователя")
                 return False
             
-            from_email = email_data.get('email')
-            password = email_data.get('password')
-            
-            if not from_email or not password:
-                print("❌ Нет данных для подключения")
-                return False
-            
-            # Отправляем письмо в отдельном потоке
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                None, 
-                self._send_email_sync, 
-                from_email, password, to_email, subject, body
-            )
+            from_email, password = credentials
+            message = self._build_message(from_email, to_email, subject, body)
+            result = await smtp_pool.send(from_email, password, to_email, message, on_status)
             
             if result:
                 print(f"✅ Письмо отправлено: {from_email} -> {to_email}")
@@ -223,59 +227,74 @@ class RealEmailSender:
             print(f"❌ Ошибка отправки письма: {e}")
             return False
     
-    def _send_email_sync(self, from_email: str, password: str, to_email: str, subject: str, body: str) -> bool:
-        """Синхронная отправка письма"""
+    async def send_bulk(self, user_id: int, recipients: List[str], subject: str, body: str,
+                        on_status: Optional[StatusCallback] = None) -> Dict[str, bool]:
+        """Отправить одно письмо нескольким получателям (отдельным письмом каждому) в одной сессии"""
         try:
-            # Создаем сообщение
-            msg = MIMEMultipart('alternative')
-            msg['From'] = from_email
-            msg['To'] = to_email
-            msg['Subject'] = subject
-            
-            # Добавляем текст (и HTML если нужно)
-            text_part = MIMEText(body, 'plain', 'utf-8')
-            msg.attach(text_part)
-            
-            # HTML версия для красивого отображения
-            html_body = body.replace('\n', '<br>')
-            html_part = MIMEText(f'<div style="font-family: Arial; font-size: 14px;">{html_body}</div>', 'html', 'utf-8')
-            msg.attach(html_part)
-            
-            # Подключаемся и отправляем
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=30)
-            server.starttls()
-            server.login(from_email, password)
-            
-            text = msg.as_string()
-            server.sendmail(from_email, to_email, text)
-            server.quit()
+            credentials = await self._get_credentials(user_id)
+            if not credentials:
+                print("❌ Email не настроен для пользователя")
+                return {to_email: False for to_email in recipients}
             
-            return True
+            from_email, password = credentials
+            messages = {
+                to_email: self._build_message(from_email, to_email, subject, body)
+                for to_email in recipients
+            }
+            results = await smtp_pool.send_many(from_email, password, messages, on_status)
+            
+            print(f"✅ Отправлено {sum(results.values())} из {len(recipients)} писем от {from_email}")
+            return results
             
         except Exception as e:
-            print(f"❌ Ошибка синхронной отправки: {e}")
-            return False
+            print(f"❌ Ошибка массовой отправки: {e}")
+            return {to_email: False for to_email in recipients}
     
-    async def get_inbox_emails(self, user_id: int, limit: int = 10) -> List[Dict]:
-        """Получить входящие письма"""
+    def has_smtp_session(self, email_addr: str, password: str) -> bool:
+        """Есть ли уже рабочая SMTP-сессия (проверка подключения не нужна)"""
+        return smtp_pool.has_session(email_addr, password)
+    
+    def _build_message(self, from_email: str, to_email: str, subject: str, body: str) -> str:
+        """Собрать письмо (текст и HTML-версия)"""
+        msg = MIMEMultipart('alternative')
+        msg['From'] = from_email
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        
+        # Добавляем текст (и HTML если нужно)
+        text_part = MIMEText(body, 'plain', 'utf-8')
+        msg.attach(text_part)
+        
+        # HTML версия для красивого отображения
+        html_body = body.replace('\n', '<br>')
+        html_part = MIMEText(f'<div style="font-family: Arial; font-size: 14px;">{html_body}</div>', 'html', 'utf-8')
+        msg.attach(html_part)
+        
+        return msg.as_string()
+    
+    async def get_inbox_emails(self, user_id: int, limit: int = 10, full: bool = False) -> List[Dict]:
+        """Получить входящие письма
+        
+        Args:
+            user_id: ID пользователя
+            limit: Количество последних писем
+            full: Загрузить письма целиком (full_body). По умолчанию только
+                  заголовки и начало текста для списка писем
+        """
         try:
-            # Получаем настройки пользователя
-            email_data = await user_tokens.get_user_info(user_id, "email_smtp")
-            if not email_data:
+            credentials = await self._get_credentials(user_id)
+            if not credentials:
                 return []
             
-            email_addr = email_data.get('email')
-            password = email_data.get('password')
+            email_addr, password = credentials
             
-            if not email_addr or not password:
-                return []
-            
-            # Получаем письма в отдельном потоке
+            # Получаем письма в отдельном потоке через постоянную сессию
+            imap_pool.start_keepalive()
             loop = asyncio.get_event_loop()
             emails = await loop.run_in_executor(
                 None, 
                 self._get_emails_sync, 
-                email_addr, password, limit
+                email_addr, password, limit, full
             )
             
             return emails
@@ -284,66 +303,159 @@ class RealEmailSender:
             print(f"❌ Ошибка получения писем: {e}")
             return []
     
-    def _get_emails_sync(self, email_addr: str, password: str, limit: int) -> List[Dict]:
-        """Синхронное получение писем"""
+    async def get_email(self, user_id: int, email_id: str) -> Optional[Dict]:
+        """Получить письмо целиком по UID (полный разбор MIME при открытии письма)"""
         try:
-            # Подключаемся к IMAP с timeout
-            import socket
-            socket.setdefaulttimeout(30)
+            credentials = await self._get_credentials(user_id)
+            if not credentials:
+                return None
             
-            mail = imaplib.IMAP4_SSL(self.imap_server, self.imap_port)
-            mail.login(email_addr, password)
-            mail.select('INBOX')
-            
-            # Ищем письма
-            status, messages = mail.search(None, 'ALL')
-            if status != 'OK':
-                return []
-            
-            email_ids = messages[0].split()
-            emails = []
-            
-            # Берем последние письма
-            for email_id in email_ids[-limit:]:
-                try:
-                    # Получаем письмо
-                    status, msg_data = mail.fetch(email_id, '(RFC822)')
-                    if status != 'OK':
-                        continue
-                    
-                    # Парсим письмо
-                    msg = email.message_from_bytes(msg_data[0][1])
-                    
-                    # Извлекаем информацию
-                    subject = self._decode_header(msg.get('Subject', ''))
-                    sender = self._decode_header(msg.get('From', ''))
-                    date = msg.get('Date', '')
-                    
-                    # Получаем текст письма
-                    body = self._get_email_body(msg)
-                    
-                    emails.append({
-                        'id': email_id.decode(),
-                        'subject': subject,
-                        'sender': sender,
-                        'date': date,
-                        'body': body[:500] + '...' if len(body) > 500 else body,
-                        'full_body': body
-                    })
-                    
-                except Exception as e:
-                    print(f"Ошибка обработки письма {email_id}: {e}")
-                    continue
+            email_addr, password = credentials
+            uid = int(email_id)
             
-            mail.logout()
+            imap_pool.start_keepalive()
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(
+                None,
+                lambda: imap_pool.get(email_addr, password).run(
+                    lambda session, conn: self._open_message(session, conn, uid)
+                )
+            )
             
-            # Возвращаем в обратном порядке (новые сначала)
-            return list(reversed(emails))
+        except Exception as e:
+            print(f"❌ Ошибка получения письма {email_id}: {e}")
+            return None
+    
+    async def _get_credentials(self, user_id: int) -> Optional[Tuple[str, str]]:
+        """Адрес и пароль приложения пользователя"""
+        email_data = await user_tokens.get_user_info(user_id, "email_smtp")
+        if not email_data:
+            return None
+        
+        email_addr = email_data.get('email')
+        password = email_data.get('password')
+        
+        if not email_addr or not password:
+            return None
+        
+        return email_addr, password
+    
+    def _get_emails_sync(self, email_addr: str, password: str, limit: int, full: bool = False) -> List[Dict]:
+        """Синхронное получение писем через постоянную IMAP-сессию"""
+        try:
+            session = imap_pool.get(email_addr, password)
+            return session.run(lambda session, conn: self._sync_inbox(session, conn, limit, full))
             
         except Exception as e:
             print(f"❌ Ошибка синхронного получения писем: {e}")
             return []
     
+    def _sync_inbox(self, session, conn, limit: int, full: bool = False) -> List[Dict]:
+        """Синхронизировать последние письма с кэшем сессии, загрузив только новые UID"""
+        session.select(conn, 'INBOX')
+        cache = session.cache
+        
+        # Список UID - это только номера, сами письма загружаются ниже
+        status, messages = conn.uid('SEARCH', None, 'ALL')
+        if status != 'OK':
+            return []
+        
+        all_uids = [int(uid) for uid in messages[0].split()]
+        cache.retain(set(all_uids))
+        email_index.validate(session.email_addr, cache.uidvalidity)
+        email_index.remove_missing(session.email_addr, set(all_uids))
+        
+        # Берем последние письма и догружаем те, которых нет в кэше
+        wanted = all_uids[-limit:] if limit > 0 else []
+        if full:
+            missing = [uid for uid in wanted if uid not in cache.messages or cache.messages[uid]['partial']]
+            self._fetch_full(session, conn, missing)
+        else:
+            missing = [uid for uid in wanted if uid not in cache.messages]
+            self._fetch_previews(session, conn, missing)
+        
+        # Новые сначала
+        return [dict(cache.messages[uid]) for uid in reversed(wanted) if uid in cache.messages]
+    
+    def _open_message(self, session, conn, uid: int) -> Optional[Dict]:
+        """Письмо целиком: из кэша, если уже загружено полностью, иначе с сервера"""
+        session.select(conn, 'INBOX')
+        cached = session.cache.messages.get(uid)
+        if cached and not cached['partial']:
+            return dict(cached)
+        return self._fetch_full(session, conn, [uid]).get(uid)
+    
+    def _fetch_previews(self, session, conn, uids: List[int]) -> Dict[int, Dict]:
+        """Загрузить заголовки и первые PREVIEW_BYTES текста писем одним UID FETCH"""
+        if not uids:
+            return {}
+        
+        status, msg_data = conn.uid(
+            'FETCH',
+            ','.join(str(uid) for uid in uids),
+            f'(BODY.PEEK[HEADER.FIELDS ({PREVIEW_HEADER_FIELDS})] BODY.PEEK[TEXT]<0.{PREVIEW_BYTES}>)'
+        )
+        if status != 'OK':
+            return {}
+        
+        parsed = []
+        for uid, sections in parse_uid_fetch(msg_data).items():
+            try:
+                raw = sections.get('HEADER', b'').rstrip(b'\r\n') + b'\r\n\r\n' + sections.get('TEXT', b'')
+                parsed.append(self._parse_message(uid, raw, partial=True))
+                session.cache.put(uid, parsed[-1])
+            except Exception as e:
+                print(f"Ошибка обработки письма {uid}: {e}")
+        
+        email_index.add_messages(session.email_addr, parsed)
+        return {int(message['id']): dict(message) for message in parsed}
+    
+    def _fetch_full(self, session, conn, uids: List[int]) -> Dict[int, Dict]:
+        """Загрузить письма целиком одним UID FETCH и обновить кэш"""
+        if not uids:
+            return {}
+        
+        status, msg_data = conn.uid('FETCH', ','.join(str(uid) for uid in uids), '(BODY.PEEK[])')
+        if status != 'OK':
+            return {}
+        
+        fetched = {}
+        for uid, sections in parse_uid_fetch(msg_data).items():
+            try:
+                fetched[uid] = self._parse_message(uid, sections.get('RFC822', b''))
+                session.cache.put(uid, fetched[uid])
+            except Exception as e:
+                print(f"Ошибка обработки письма {uid}: {e}")
+        
+        email_index.add_messages(session.email_addr, list(fetched.values()))
+        return {uid: dict(message) for uid, message in fetched.items()}
+    
+    def _parse_message(self, uid: int, raw: bytes, partial: bool = False) -> Dict:
+        """Разобрать письмо в словарь для отображения
+        
+        Для partial=True raw содержит только нужные заголовки и начало текста:
+        этого достаточно для предпросмотра, full_body при этом не заполняется.
+        """
+        msg = email.message_from_bytes(raw)
+        
+        # Извлекаем информацию
+        subject = self._decode_header(msg.get('Subject', ''))
+        sender = self._decode_header(msg.get('From', ''))
+        date = msg.get('Date', '')
+        
+        # Получаем текст письма
+        body = self._get_email_body(msg)
+        
+        return {
+            'id': str(uid),
+            'subject': subject,
+            'sender': sender,
+            'date': date,
+            'body': body[:500] + '...' if len(body) > 500 else body,
+            'full_body': None if partial else body,
+            'partial': partial
+        }
+    
     def _decode_header(self, header: str) -> str:
         """Декодировать заголовок письма"""
         if not header:
@@ -391,33 +503,105 @@ class RealEmailSender:
         except Exception as e:
             return f"Ошибка извлечения текста: {str(e)}"
     
-    async def search_emails(self, user_id: int, query: str, limit: int = 20) -> List[Dict]:
-        """Поиск писем по содержимому"""
+    async def search_emails(self, user_id: int, query: str, limit: int = 20, offset: int = 0) -> List[Dict]:
+        """Поиск писем по содержимому
+        
+        Поиск выполняется на сервере (UID SEARCH TEXT по всему ящику), найденные
+        письма ранжируются по локальному индексу. Если сервер недоступен,
+        поиск идет только по локальному индексу.
+        
+        Args:
+            user_id: ID пользователя
+            query: Поисковый запрос
+            limit: Размер страницы результатов
+            offset: Смещение страницы
+        """
         try:
-            # Получаем все письма
-            all_emails = await self.get_inbox_emails(user_id, limit=50)
-            
-            # Фильтруем по запросу
-            filtered_emails = []
-            query_lower = query.lower()
-            
-            for email_data in all_emails:
-                # Ищем в теме, отправителе и тексте
-                if (query_lower in email_data.get('subject', '').lower() or
-                    query_lower in email_data.get('sender', '').lower() or
-                    query_lower in email_data.get('full_body', '').lower()):
-                    
-                    filtered_emails.append(email_data)
-                
-                if len(filtered_emails) >= limit:
-                    break
+            credentials = await self._get_credentials(user_id)
+            if not credentials or not query.strip():
+                return []
             
-            return filtered_emails
+            email_addr, password = credentials
+            
+            imap_pool.start_keepalive()
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(
+                None,
+                self._search_emails_sync,
+                email_addr, password, query.strip(), limit, offset
+            )
             
         except Exception as e:
             print(f"❌ Ошибка поиска писем: {e}")
             return []
     
+    def _search_emails_sync(self, email_addr: str, password: str, query: str, limit: int, offset: int) -> List[Dict]:
+        """Синхронный поиск: сервер, при ошибке - локальный индекс"""
+        try:
+            session = imap_pool.get(email_addr, password)
+            return session.run(lambda session, conn: self._search_on_server(session, conn, query, limit, offset))
+            
+        except Exception as e:
+            print(f"❌ Ошибка серверного поиска писем, ищем в локальном индексе: {e}")
+            uids = email_index.search(email_addr, query, limit=limit, offset=offset)
+            found = email_index.get_messages(email_addr, uids)
+            return [found[uid] for uid in uids if uid in found]
+    
+    def _search_on_server(self, session, conn, query: str, limit: int, offset: int) -> List[Dict]:
+        """UID SEARCH по всему ящику и ранжирование найденных писем"""
+        uidvalidity = session.select(conn, 'INBOX')
+        email_index.validate(session.email_addr, uidvalidity)
+        
+        # TEXT ищет и в заголовках (From, Subject), и в тексте письма;
+        # запрос передается литералом, чтобы работала кириллица
+        conn.literal = query.encode('utf-8')
+        status, data = conn.uid('SEARCH', 'CHARSET', 'UTF-8', 'TEXT')
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f"SEARCH вернул {status}")
+        
+        # Ранжируем только самые новые совпадения
+        hits = sorted(int(uid) for uid in data[0].split())[-SEARCH_CANDIDATES:]
+        if not hits:
+            return []
+        
+        # Страница собирается из копий: кэш сессии ограничен, и при загрузке старых
+        # писем они вытесняются из него сразу же (кэш хранит самые новые UID)
+        cached = session.cache.messages
+        found = {uid: dict(cached[uid]) for uid in hits if uid in cached}
+        
+        # Превью недостающих писем (заодно попадают в индекс)
+        found.update(self._fetch_previews(session, conn, [uid for uid in hits if uid not in found]))
+        
+        ranked = email_index.search(session.email_addr, query, limit=len(hits), uids=hits)
+        if not ranked:
+            # Индекс выключен: сначала совпадения в теме и отправителе, затем новые
+            ranked = sorted(hits, key=lambda uid: (-self._match_score(found.get(uid), query), -uid))
+        else:
+            # Письма, которые сервер нашел, а индекс нет (например, совпадение в конце текста)
+            ranked_set = set(ranked)
+            ranked += [uid for uid in reversed(hits) if uid not in ranked_set]
+        
+        page = ranked[offset:offset + limit]
+        missing = [uid for uid in page if uid not in found]
+        if missing:
+            found.update(email_index.get_messages(session.email_addr, missing))
+        return [found[uid] for uid in page if uid in found]
+    
+    def _match_score(self, message: Optional[Dict], query: str) -> int:
+        """Простая релевантность без индекса: тема важнее отправителя, отправитель важнее текста"""
+        if not message:
+            return 0
+        
+        score = 0
+        for word in query.lower().split():
+            if word in message.get('subject', '').lower():
+                score += 3
+            if word in message.get('sender', '').lower():
+                score += 2
+            if word in (message.get('full_body') or message.get('body', '')).lower():
+                score += 1
+        return score
+    
     async def can_send_email(self, user_id: int) -> bool:
         """Проверить, может ли пользователь отправлять письма"""
         try:
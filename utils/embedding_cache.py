@@ -0,0 +1,196 @@
+"""
+Кэш и пакетная отправка запросов embedding для векторной памяти
+
+На каждом ходе диалога один и тот же текст сообщения превращается в вектор
+несколько раз (поиск похожих разговоров, поиск в базе знаний), а сохранение
+диалога добавляет еще запрос. Здесь:
+
+- векторы хранятся в LRU процесса по хэшу (модель, нормализованный текст);
+- одновременные запросы одного текста ждут один результат;
+- разные тексты, запрошенные почти одновременно, собираются в один вызов
+  embeddings.create (окно в несколько миллисекунд или до max_batch текстов).
+
+Векторы хранятся в array('d') - в несколько раз компактнее списка float.
+Ошибка API не кэшируется: все ожидающие получают None. Статистика - get_metrics().
+"""
+import asyncio
+import hashlib
+import logging
+from array import array
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config.settings import settings
+from utils.single_flight import single_flight
+
+logger = logging.getLogger(__name__)
+
+EmbeddingsFetcher = Callable[[List[str], str], Awaitable[Optional[List[List[float]]]]]
+
+
+def normalize_text(text: str) -> str:
+    """Текст в том виде, в котором он уходит в API (без переносов и лишних пробелов)"""
+    return ' '.join((text or '').split())
+
+
+def make_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\x00{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+
+class EmbeddingBatcher:
+    """Собирает одновременные запросы в один вызов API"""
+
+    def __init__(self, fetch: EmbeddingsFetcher, model: str,
+                 window: float = 0.01, max_batch: int = 64):
+        """
+        Args:
+            fetch: Функция (тексты, модель) -> векторы в том же порядке или None
+            model: Модель embedding
+            window: Сколько ждать других запросов перед отправкой, секунды
+            max_batch: Отправить сразу, если набралось столько текстов
+        """
+        self.fetch = fetch
+        self.model = model
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.requests = 0
+        self.api_calls = 0
+
+    async def embed(self, text: str) -> Optional[List[float]]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        self.requests += 1
+
+        if len(self._pending) >= self.max_batch:
+            self._send()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._send)
+        return await future
+
+    def _send(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]):
+        # Одинаковые тексты внутри пакета отправляются один раз
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        self.api_calls += 1
+        try:
+            vectors = await self.fetch(texts, self.model)
+            if vectors is not None and len(vectors) != len(texts):
+                logger.error(f"API вернул {len(vectors)} векторов вместо {len(texts)}")
+                vectors = None
+        except Exception as e:
+            logger.error(f"Ошибка пакетного запроса embedding: {e}")
+            vectors = None
+
+        by_text: Dict[str, Optional[List[float]]] = dict(zip(texts, vectors or [None] * len(texts)))
+        for text, future in batch:
+            if not future.done():
+                future.set_result(by_text[text])
+
+
+class EmbeddingCache:
+    """LRU векторов процесса с объединением одинаковых запросов"""
+
+    def __init__(self, fetch: EmbeddingsFetcher, model: str = "text-embedding-ada-002",
+                 max_entries: int = 1000, window: float = 0.01, max_batch: int = 64,
+                 enabled: bool = True):
+        """
+        Args:
+            fetch: Функция (тексты, модель) -> векторы, см. OpenAIClient.create_embeddings
+            model: Модель embedding
+            max_entries: Сколько векторов держать в памяти
+            window: Окно сбора пакета, секунды
+            max_batch: Максимальный размер пакета
+            enabled: Выключенный кэш запрашивает каждый текст (все равно пакетами)
+        """
+        self.model = model
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.batcher = EmbeddingBatcher(fetch, model, window=window, max_batch=max_batch)
+        self._entries: "OrderedDict[str, array]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text: str) -> Optional[List[float]]:
+        """Вектор из кэша без запроса к API"""
+        key = make_key(self.model, text)
+        vector = self._entries.get(key)
+        if vector is None:
+            return None
+        self._entries.move_to_end(key)
+        return vector.tolist()
+
+    def put(self, text: str, vector: List[float]):
+        key = make_key(self.model, text)
+        self._entries[key] = array('d', vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def embed(self, text: str) -> Optional[List[float]]:
+        """Вектор текста: из кэша, из уже идущего запроса или новым пакетом"""
+        text = normalize_text(text)
+        if not text:
+            return None
+        if not self.enabled:
+            return await self.batcher.embed(text)
+
+        vector = self.get(text)
+        if vector is not None:
+            self.hits += 1
+            return vector
+
+        key = make_key(self.model, text)
+        async def create() -> Optional[List[float]]:
+            vector = await self.batcher.embed(text)
+            if vector is not None:
+                self.put(text, vector)
+            return vector
+
+        if key in self._inflight:
+            self.hits += 1
+        else:
+            self.misses += 1
+        vector = await single_flight(self._inflight, key, create)
+        # У каждого вызывающего своя копия списка
+        return None if vector is None else list(vector)
+
+    def get_metrics(self) -> Dict:
+        """Статистика кэша и пакетов"""
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'api_calls': self.batcher.api_calls,
+            'batched_requests': self.batcher.requests
+        }
+
+    def clear(self):
+        self._entries.clear()
+
+
+async def _fetch_openai(texts: List[str], model: str) -> Optional[List[List[float]]]:
+    from utils.openai_client import openai_client
+    return await openai_client.create_embeddings(texts, model=model)
+
+
+# Глобальный кэш векторов
+embedding_cache = EmbeddingCache(
+    _fetch_openai,
+    max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+    window=settings.EMBEDDING_BATCH_WINDOW_MS / 1000,
+    max_batch=settings.EMBEDDING_BATCH_MAX,
+    enabled=settings.EMBEDDING_CACHE_ENABLED
+)
@@ -0,0 +1,276 @@
+"""
+Пул постоянных IMAP-сессий и локальный кэш писем по UID
+
+Для каждого почтового ящика держится одно авторизованное соединение IMAP4_SSL.
+Повторные запросы не тратят время на TLS и LOGIN, а фоновая задача раз в минуту
+отправляет NOOP в простаивающие сессии и закрывает давно неиспользуемые.
+(Команды IDLE в imaplib нет, поэтому соединение поддерживается через NOOP.)
+
+Письма кэшируются по UID. Кэш действителен, пока не изменился UIDVALIDITY папки,
+поэтому при повторном просмотре входящих загружаются только новые UID -
+одним запросом UID FETCH.
+"""
+import asyncio
+import imaplib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_FETCH_UID_RE = re.compile(rb'UID (\d+)')
+_FETCH_START_RE = re.compile(rb'^\d+ \(')
+_FETCH_SECTION_RE = re.compile(rb'(RFC822|BODY\[([^\]]*)\](?:<\d+>)?) \{\d+\}$')
+
+
+class MailboxCache:
+    """Кэш писем одной папки, ключ - UID"""
+
+    def __init__(self, max_messages: int = 200):
+        self.max_messages = max_messages
+        self.uidvalidity: Optional[int] = None
+        self.messages: "OrderedDict[int, Dict]" = OrderedDict()
+
+    def validate(self, uidvalidity: int):
+        """Сбросить кэш, если сервер сменил UIDVALIDITY (старые UID больше не действительны)"""
+        if self.uidvalidity != uidvalidity:
+            self.uidvalidity = uidvalidity
+            self.messages.clear()
+
+    def retain(self, uids: set):
+        """Удалить из кэша письма, которых больше нет на сервере"""
+        for uid in [uid for uid in self.messages if uid not in uids]:
+            del self.messages[uid]
+
+    def put(self, uid: int, message: Dict):
+        """Сохранить письмо, вытесняя самые старые UID"""
+        self.messages[uid] = message
+        while len(self.messages) > self.max_messages:
+            del self.messages[min(self.messages)]
+
+    def clear(self):
+        self.uidvalidity = None
+        self.messages.clear()
+
+
+class ImapSession:
+    """Авторизованное IMAP-соединение одного ящика
+
+    Методы синхронные и вызываются из пула потоков; lock не дает двум потокам
+    одновременно работать с одним соединением.
+    """
+
+    def __init__(self, server: str, port: int, email_addr: str, password: str, timeout: float = 30):
+        self.server = server
+        self.port = port
+        self.email_addr = email_addr
+        self.password = password
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.cache = MailboxCache()
+        self.last_used = 0.0
+        self._conn: Optional[imaplib.IMAP4_SSL] = None
+
+    def connection(self) -> imaplib.IMAP4_SSL:
+        """Получить соединение, подключившись и авторизовавшись при необходимости"""
+        if self._conn is None:
+            conn = imaplib.IMAP4_SSL(self.server, self.port, timeout=self.timeout)
+            conn.login(self.email_addr, self.password)
+            self._conn = conn
+            logger.debug(f"IMAP сессия открыта: {self.email_addr}")
+
+        self.last_used = time.monotonic()
+        return self._conn
+
+    def run(self, operation: Callable[["ImapSession", imaplib.IMAP4_SSL], object]):
+        """Выполнить операцию в сессии; при обрыве соединения переподключиться один раз"""
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    return operation(self, self.connection())
+                except (imaplib.IMAP4.abort, OSError) as e:
+                    logger.warning(f"IMAP соединение {self.email_addr} разорвано: {e}")
+                    self.close()
+                    if attempt:
+                        raise
+
+    def select(self, conn: imaplib.IMAP4_SSL, mailbox: str = 'INBOX') -> int:
+        """Выбрать папку (только чтение) и сверить UIDVALIDITY с кэшем"""
+        status, _ = conn.select(mailbox, readonly=True)
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f"Не удалось открыть папку {mailbox}")
+
+        _, data = conn.response('UIDVALIDITY')
+        uidvalidity = int(data[0]) if data and data[0] else 0
+        self.cache.validate(uidvalidity)
+        return uidvalidity
+
+    def keepalive(self, noop_after: float, close_after: float):
+        """NOOP для простаивающей сессии или закрытие давно неиспользуемой"""
+        if not self.lock.acquire(blocking=False):
+            return  # Сессия сейчас занята запросом
+
+        try:
+            if self._conn is None:
+                return
+
+            idle = time.monotonic() - self.last_used
+            if idle >= close_after:
+                self.close()
+            elif idle >= noop_after:
+                try:
+                    self._conn.noop()
+                except (imaplib.IMAP4.error, OSError):
+                    self.close()
+        finally:
+            self.lock.release()
+
+    def close(self):
+        """Закрыть соединение (кэш писем сохраняется)"""
+        if self._conn is not None:
+            try:
+                self._conn.logout()
+            except Exception:
+                pass
+            self._conn = None
+
+
+def parse_uid_fetch(data: List) -> Dict[int, Dict[str, bytes]]:
+    """Разобрать ответ UID FETCH в словарь {UID: {секция: содержимое}}
+
+    Секции: 'RFC822', 'HEADER' (BODY[HEADER.FIELDS ...]), 'TEXT' (BODY[TEXT]<...>).
+    Несколько секций одного письма приходят отдельными элементами подряд,
+    а UID может стоять как в начале ответа, так и после литералов.
+    """
+    result = {}
+    current_sections: Optional[Dict[str, bytes]] = None
+    current_uid: Optional[int] = None
+
+    def finish():
+        if current_uid is not None and current_sections is not None:
+            result[current_uid] = current_sections
+
+    for item in data:
+        prefix = item[0] if isinstance(item, tuple) else item
+        if not isinstance(prefix, bytes):
+            continue
+
+        # Начало ответа по новому письму: "<номер> (..."
+        if _FETCH_START_RE.match(prefix):
+            finish()
+            current_sections, current_uid = {}, None
+
+        uid_match = _FETCH_UID_RE.search(prefix)
+        if uid_match:
+            current_uid = int(uid_match.group(1))
+
+        if isinstance(item, tuple) and len(item) >= 2 and current_sections is not None:
+            section = _FETCH_SECTION_RE.search(prefix)
+            if section:
+                name = section.group(2).decode() if section.group(2) else 'RFC822'
+                current_sections['HEADER' if name.startswith('HEADER') else name] = item[1]
+
+    finish()
+    return result
+
+
+class ImapSessionPool:
+    """Пул IMAP-сессий по адресу ящика"""
+
+    def __init__(self, server: str = "imap.yandex.ru", port: int = 993,
+                 noop_after: float = 60, close_after: float = 600):
+        """
+        Args:
+            server: IMAP сервер
+            port: Порт IMAP (SSL)
+            noop_after: Через сколько секунд простоя отправлять NOOP
+            close_after: Через сколько секунд простоя закрывать соединение
+        """
+        self.server = server
+        self.port = port
+        self.noop_after = noop_after
+        self.close_after = close_after
+        self._sessions: Dict[str, ImapSession] = {}
+        self._lock = threading.Lock()
+        self._keepalive_task: Optional[asyncio.Task] = None
+
+    def get(self, email_addr: str, password: str) -> ImapSession:
+        """Сессия ящика; при смене пароля старая сессия и ее кэш сбрасываются"""
+        old_session = None
+        with self._lock:
+            session = self._sessions.get(email_addr)
+            if session and session.password != password:
+                old_session, session = session, None
+
+            if session is None:
+                session = ImapSession(self.server, self.port, email_addr, password)
+                self._sessions[email_addr] = session
+
+        if old_session:
+            # LOGOUT по сети и ожидание занятой сессии не должны задерживать другие ящики
+            self._close_in_background(old_session)
+        return session
+
+    def invalidate(self, email_addr: str):
+        """Закрыть сессию ящика и забыть ее кэш (например, после отключения почты)"""
+        with self._lock:
+            session = self._sessions.pop(email_addr, None)
+        if session:
+            self._close_in_background(session)
+
+    async def run(self, email_addr: str, password: str, operation: Callable):
+        """Выполнить синхронную операцию с сессией в пуле потоков"""
+        self.start_keepalive()
+        session = self.get(email_addr, password)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, session.run, operation)
+
+    def start_keepalive(self):
+        """Запустить фоновую поддержку соединений (лениво, внутри event loop)"""
+        if self._keepalive_task is None or self._keepalive_task.done():
+            self._keepalive_task = asyncio.get_running_loop().create_task(self._keepalive_loop())
+
+    async def _keepalive_loop(self):
+        """Раз в минуту NOOP для простаивающих сессий и закрытие неиспользуемых"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.noop_after)
+            with self._lock:
+                sessions = list(self._sessions.values())
+            for session in sessions:
+                try:
+                    await loop.run_in_executor(None, session.keepalive, self.noop_after, self.close_after)
+                except Exception as e:
+                    logger.error(f"Ошибка поддержки IMAP сессии {session.email_addr}: {e}")
+
+    async def close(self):
+        """Остановить фоновую задачу и закрыть все соединения"""
+        if self._keepalive_task:
+            self._keepalive_task.cancel()
+            try:
+                await self._keepalive_task
+            except asyncio.CancelledError:
+                pass
+            self._keepalive_task = None
+
+        with self._lock:
+            sessions = list(self._sessions.values())
+        loop = asyncio.get_running_loop()
+        for session in sessions:
+            await loop.run_in_executor(None, self._close_session, session)
+
+    @classmethod
+    def _close_in_background(cls, session: ImapSession):
+        threading.Thread(target=cls._close_session, args=(session,), daemon=True).start()
+
+    @staticmethod
+    def _close_session(session: ImapSession):
+        with session.lock:
+            session.close()
+
+
+# Глобальный пул
+imap_pool = ImapSessionPool()
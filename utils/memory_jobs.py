@@ -0,0 +1,66 @@
+"""
+Фоновые задачи памяти: запись диалога, извлечение знаний и краткое изложение
+старой переписки после ответа пользователю
+"""
+from typing import Dict, List
+
+from config.settings import settings
+from database.memory import memory
+from database.vector_memory import vector_memory
+from utils.background_queue import background_queue
+from utils.conversation_summary import conversation_summaries, turn_time
+
+
+@background_queue.job('save_turn')
+async def save_turn(user_id: int, user_message: str, ai_response: str):
+    """Сохранить ход диалога в векторную или обычную память"""
+    if vector_memory:
+        saved = await vector_memory.save_conversation(user_id, user_message, ai_response)
+    else:
+        saved = await memory.save_message(user_id, user_message, ai_response)
+
+    if not saved:
+        # Повтор сделает очередь
+        raise RuntimeError(f"диалог пользователя {user_id} не сохранен")
+
+
+@background_queue.job('extract_knowledge')
+async def extract_knowledge(user_id: int, conversation_text: str):
+    """Извлечь важную информацию из диалога в базу знаний"""
+    if vector_memory:
+        await vector_memory.analyze_and_extract_knowledge(user_id, conversation_text)
+
+
+@background_queue.job('update_summary')
+async def update_summary(user_id: int, turns: List[Dict]):
+    """Дополнить краткое изложение переписки"""
+    if not await conversation_summaries.update(user_id, turns):
+        raise RuntimeError(f"изложение переписки пользователя {user_id} не обновлено")
+
+
+async def schedule_save_turn(user_id: int, user_message: str, ai_response: str, extract: bool = True):
+    """Поставить сохранение хода диалога (и извлечение знаний) в фоновую очередь
+
+    Задачи выполняются разными воркерами одновременно, поэтому их embedding
+    уходят одним запросом к API.
+    """
+    await background_queue.enqueue('save_turn', user_id=user_id,
+                                   user_message=user_message, ai_response=ai_response)
+    if extract and vector_memory:
+        await background_queue.enqueue('extract_knowledge', user_id=user_id,
+                                       conversation_text=f"{user_message} {ai_response}")
+
+
+async def schedule_summary_update(user_id: int, history: List[Dict]):
+    """Поставить обновление изложения в очередь, если за окном истории накопились ходы
+
+    Args:
+        history: Ходы истории, показанные модели, от старых к новым
+    """
+    await conversation_summaries.store.preload(user_id)
+    pending = conversation_summaries.pending_turns(user_id, history, settings.PROMPT_RECENT_TURNS)
+    if len(pending) < settings.PROMPT_SUMMARY_BATCH:
+        return
+    turns = [{'user_message': item.get('user_message', ''), 'ai_response': item.get('ai_response', ''),
+              'timestamp': turn_time(item)} for item in pending]
+    await background_queue.enqueue('update_summary', user_id=user_id, turns=turns)
@@ -1,37 +1,132 @@
+import asyncio
 import openai
-import aiofiles
-import aiohttp
-from typing import List, Dict, Optional
+import httpx
+from typing import AsyncIterator, BinaryIO, List, Dict, Optional, Union
 from config.settings import settings
 
+# Ответ chat_completion при ошибке API (такие ответы не кэшируются)
+CHAT_ERROR_RESPONSE = "Извините, произошла ошибка при обращении к AI."
+
+# Модель озвучки (входит в ключ кэша озвучки)
+TTS_MODEL = "tts-1"
+
+CHAT_SYSTEM_PROMPT = (
+    "Ты полезный AI-ассистент. Отвечай на русском языке кратко и по делу. "
+    "Используй контекст предыдущих сообщений для более точных ответов. "
+    "Будь дружелюбным и помогай пользователю."
+)
+
 class OpenAIClient:
     def __init__(self):
-        self.client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
+        # Общий пул соединений с keep-alive для всех запросов к OpenAI
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OPENAI_MAX_CONNECTIONS,
+                keepalive_expiry=60
+            ),
+            timeout=httpx.Timeout(settings.OPENAI_TIMEOUT, connect=10.0)
+        )
+        self.client = openai.AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            http_client=self.http_client,
+            max_retries=2
+        )
+        # Ограничиваем число одновременных запросов к API
+        self._semaphore = asyncio.Semaphore(settings.OPENAI_MAX_CONCURRENCY)
     
     async def chat_completion(self, messages: List[Dict], temperature: float = 0.7) -> str:
         """Получить ответ от ChatGPT"""
         try:
-            response = self.client.chat.completions.create(
-                model=settings.OPENAI_MODEL,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=1000
-            )
+            async with self._semaphore:
+                response = await self.client.chat.completions.create(
+                    model=settings.OPENAI_MODEL,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=1000,
+                    timeout=settings.OPENAI_TIMEOUT
+                )
             
             return response.choices[0].message.content
             
         except Exception as e:
             print(f"Ошибка OpenAI Chat: {e}")
-            return "Извините, произошла ошибка при обращении к AI."
+            return CHAT_ERROR_RESPONSE
+    
+    async def chat_completion_stream(self, messages: List[Dict], temperature: float = 0.7) -> AsyncIterator[str]:
+        """Ответ ChatGPT по частям по мере генерации
+
+        При ошибке до первого фрагмента отдает CHAT_ERROR_RESPONSE, при обрыве
+        посередине ответ заканчивается на уже полученном тексте.
+        """
+        received = False
+        try:
+            async with self._semaphore:
+                stream = await self.client.chat.completions.create(
+                    model=settings.OPENAI_MODEL,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=1000,
+                    timeout=settings.OPENAI_TIMEOUT,
+                    stream=True
+                )
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    content = chunk.choices[0].delta.content
+                    if content:
+                        received = True
+                        yield content
+
+        except Exception as e:
+            print(f"Ошибка OpenAI Chat (поток): {e}")
+            if not received:
+                yield CHAT_ERROR_RESPONSE
+
+    async def cached_chat_completion(self, template: str, version: int, cache_input: str,
+                                     messages: List[Dict], temperature: float = 0.7) -> str:
+        """Ответ ChatGPT через кэш переписываний (utils.ai_cache)
+        
+        Args:
+            template: Имя шаблона промпта
+            version: Версия шаблона - увеличивается при изменении промпта
+            cache_input: Пользовательский ввод, подставленный в шаблон
+            messages: Готовые сообщения для API
+            temperature: Температура
+        """
+        from utils.ai_cache import ai_cache, make_key
+        
+        async def request() -> Optional[str]:
+            response = await self.chat_completion(messages, temperature=temperature)
+            return None if response == CHAT_ERROR_RESPONSE else response
+        
+        key = make_key(template, version, settings.OPENAI_MODEL, temperature, cache_input)
+        response = await ai_cache.get_or_create(key, request)
+        return CHAT_ERROR_RESPONSE if response is None else response
     
-    async def transcribe_audio(self, audio_file_path: str) -> str:
-        """Транскрибировать аудио в текст через Whisper"""
+    async def transcribe_audio(self, audio: Union[str, bytes, BinaryIO], filename: str = "voice.ogg") -> str:
+        """Транскрибировать аудио в текст через Whisper
+        
+        Args:
+            audio: Путь к файлу, байты или буфер в памяти (BytesIO)
+            filename: Имя файла для API - по расширению определяется формат
+        """
         try:
-            with open(audio_file_path, 'rb') as audio_file:
-                transcript = self.client.audio.transcriptions.create(
+            if isinstance(audio, str):
+                with open(audio, 'rb') as audio_file:
+                    data = audio_file.read()
+            elif isinstance(audio, bytes):
+                data = audio
+            else:
+                # Байты, а не сам буфер: при повторе запроса клиент читает их заново
+                data = audio.getvalue() if hasattr(audio, 'getvalue') else audio.read()
+            
+            async with self._semaphore:
+                transcript = await self.client.audio.transcriptions.create(
                     model="whisper-1",
-                    file=audio_file,
-                    language="ru"
+                    file=(filename, data),
+                    language="ru",
+                    timeout=settings.OPENAI_AUDIO_TIMEOUT
                 )
             
             return transcript.text
@@ -43,11 +138,13 @@ class OpenAIClient:
     async def text_to_speech(self, text: str, voice: str = "alloy") -> bytes:
         """Преобразовать текст в речь"""
         try:
-            response = self.client.audio.speech.create(
-                model="tts-1",
-                voice=voice,
-                input=text[:4000]  # Ограничиваем длину текста
-            )
+            async with self._semaphore:
+                response = await self.client.audio.speech.create(
+                    model=TTS_MODEL,
+                    voice=voice,
+                    input=text[:4000],  # Ограничиваем длину текста
+                    timeout=settings.OPENAI_AUDIO_TIMEOUT
+                )
             
             return response.content
             
@@ -55,36 +152,48 @@ class OpenAIClient:
             print(f"Ошибка TTS: {e}")
             return None
     
-    def prepare_messages_with_context(self, current_message: str, history: List[Dict]) -> List[Dict]:
-        """Подготовить сообщения с контекстом для ChatGPT"""
-        messages = [
-            {
-                "role": "system",
-                "content": "Ты полезный AI-ассистент. Отвечай на русском языке кратко и по делу. "
-                          "Используй контекст предыдущих сообщений для более точных ответов. "
-                          "Будь дружелюбным и помогай пользователю."
-            }
-        ]
-        
-        # Добавляем историю
-        for item in history:
-            if item.get('user_message'):
-                messages.append({
-                    "role": "user",
-                    "content": item['user_message']
-                })
-            if item.get('ai_response'):
-                messages.append({
-                    "role": "assistant",
-                    "content": item['ai_response']
-                })
-        
-        # Добавляем текущее сообщение
-        messages.append({
-            "role": "user",
-            "content": current_message
-        })
+    async def create_embedding(self, text: str, model: str = "text-embedding-ada-002") -> Optional[List[float]]:
+        """Получить векторное представление текста"""
+        try:
+            async with self._semaphore:
+                response = await self.client.embeddings.create(
+                    model=model,
+                    input=text.replace("\n", " "),
+                    timeout=settings.OPENAI_TIMEOUT
+                )
+            return response.data[0].embedding
+            
+        except Exception as e:
+            print(f"Ошибка получения embedding: {e}")
+            return None
+
+    async def create_embeddings(self, texts: List[str], model: str = "text-embedding-ada-002") -> Optional[List[List[float]]]:
+        """Получить векторные представления нескольких текстов одним запросом"""
+        try:
+            async with self._semaphore:
+                response = await self.client.embeddings.create(
+                    model=model,
+                    input=[text.replace("\n", " ") for text in texts],
+                    timeout=settings.OPENAI_TIMEOUT
+                )
+            # Порядок ответа задается полем index, а не позицией в списке
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+        except Exception as e:
+            print(f"Ошибка получения embeddings: {e}")
+            return None
+
+    async def close(self):
+        """Закрыть пул HTTP-соединений"""
+        await self.client.close()
+    
+    def prepare_messages_with_context(self, current_message: str, history: List[Dict],
+                                      summary: Optional[str] = None) -> List[Dict]:
+        """Подготовить сообщения с контекстом для ChatGPT (в пределах бюджета токенов)"""
+        from utils.prompt_builder import prompt_builder
         
-        return messages
+        return prompt_builder.build(
+            CHAT_SYSTEM_PROMPT, current_message, history, summary=summary
+        ).messages
 
 openai_client = OpenAIClient()
\ No newline at end of file
@@ -0,0 +1,174 @@
+"""
+Сборка промпта для ChatGPT в пределах бюджета токенов
+
+Раньше в промпт попадали все найденные сообщения истории, знания и похожие
+разговоры целиком, и размер запроса рос вместе с длиной переписки. Теперь
+бюджет (PROMPT_TOKEN_BUDGET) делится между частями промпта:
+
+- системный промпт и текущее сообщение - всегда (длинное сообщение обрезается);
+- база знаний, краткое изложение старой переписки и похожие разговоры - каждая
+  часть не больше своей доли бюджета;
+- недавняя история - все, что осталось, от новых сообщений к старым, не больше
+  PROMPT_RECENT_TURNS ходов. Более старые ходы заменяет краткое изложение
+  (utils.conversation_summary).
+
+Токены считаются через tiktoken, если он установлен, иначе оцениваются по
+длине текста в байтах UTF-8 (для русского текста оценка с запасом).
+"""
+from typing import Dict, List, Optional
+
+from config.settings import settings
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken не установлен или нет словаря
+    _encoding = None
+
+# Служебные токены на каждое сообщение чата
+MESSAGE_OVERHEAD = 4
+
+# Доли бюджета
+CURRENT_MESSAGE_SHARE = 0.4
+KNOWLEDGE_SHARE = 0.15
+SIMILAR_SHARE = 0.15
+
+
+def count_tokens(text: str) -> int:
+    """Число токенов в тексте"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return (len(text.encode('utf-8')) + 3) // 4
+
+
+def message_tokens(message: Dict) -> int:
+    return count_tokens(message.get('content', '')) + MESSAGE_OVERHEAD
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    """Начало текста, укладывающееся в tokens токенов"""
+    if count_tokens(text) <= tokens:
+        return text
+    if tokens <= 0:
+        return ''
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text)[:tokens]) + '…'
+
+    # Двоичный поиск длины по оценке
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle]) <= tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low] + '…'
+
+
+class Prompt:
+    """Собранный промпт"""
+
+    def __init__(self, messages: List[Dict], tokens: int, history_used: int):
+        self.messages = messages
+        self.tokens = tokens
+        self.history_used = history_used  # Сколько последних ходов истории вошло целиком
+
+
+class PromptBuilder:
+    """Распределяет бюджет токенов между частями промпта"""
+
+    def __init__(self, budget: Optional[int] = None, recent_turns: Optional[int] = None,
+                 summary_tokens: Optional[int] = None):
+        """
+        Args:
+            budget: Бюджет входных токенов на запрос
+            recent_turns: Сколько последних ходов истории включать целиком
+            summary_tokens: Доля бюджета для краткого изложения старой переписки
+        """
+        self.budget = settings.PROMPT_TOKEN_BUDGET if budget is None else budget
+        self.recent_turns = settings.PROMPT_RECENT_TURNS if recent_turns is None else recent_turns
+        self.summary_tokens = settings.PROMPT_SUMMARY_MAX_TOKENS if summary_tokens is None else summary_tokens
+
+    def build(self, system_prompt: str, current_message: str, history: List[Dict],
+              summary: Optional[str] = None, knowledge: Optional[List[Dict]] = None,
+              similar: Optional[List[Dict]] = None) -> Prompt:
+        """Собрать сообщения для API
+
+        Args:
+            system_prompt: Системный промпт
+            current_message: Текущее сообщение пользователя
+            history: Ходы истории от старых к новым (user_message, ai_response)
+            summary: Краткое изложение более старой переписки
+            knowledge: Записи базы знаний (topic, content)
+            similar: Похожие разговоры (user_message, ai_response)
+        """
+        system = {"role": "system", "content": system_prompt}
+        current = {
+            "role": "user",
+            "content": truncate_to_tokens(current_message, int(self.budget * CURRENT_MESSAGE_SHARE))
+        }
+        remaining = self.budget - message_tokens(system) - message_tokens(current)
+
+        context_messages = []
+        for content, share in [
+            (self._knowledge_block(knowledge or [], int(self.budget * KNOWLEDGE_SHARE)), None),
+            (summary and "Краткое содержание более ранней переписки:\n" + summary, self.summary_tokens),
+            (self._similar_block(similar or [], int(self.budget * SIMILAR_SHARE)), None),
+        ]:
+            if not content:
+                continue
+            limit = min(remaining, share) if share else remaining
+            message = {"role": "system", "content": truncate_to_tokens(content, limit - MESSAGE_OVERHEAD)}
+            if message['content'] and message_tokens(message) <= remaining:
+                context_messages.append(message)
+                remaining -= message_tokens(message)
+
+        # Недавняя история: от новых ходов к старым, пока хватает бюджета
+        history_messages: List[Dict] = []
+        used = 0
+        for item in reversed(history[-self.recent_turns:] if self.recent_turns else []):
+            turn = []
+            if item.get('user_message'):
+                turn.append({"role": "user", "content": item['user_message']})
+            if item.get('ai_response'):
+                turn.append({"role": "assistant", "content": item['ai_response']})
+            cost = sum(message_tokens(message) for message in turn)
+            if cost > remaining:
+                break
+            history_messages[:0] = turn
+            remaining -= cost
+            used += 1
+
+        messages = [system, *context_messages, *history_messages, current]
+        return Prompt(messages, self.budget - remaining, used)
+
+    @staticmethod
+    def _knowledge_block(knowledge: List[Dict], limit: int) -> str:
+        text = "Важная информация о пользователе:\n"
+        added = False
+        for kb in knowledge:
+            line = f"- {kb['topic']}: {kb['content']}\n"
+            if count_tokens(text + line) > limit:
+                break
+            text += line
+            added = True
+        return text if added else ''
+
+    @staticmethod
+    def _similar_block(similar: List[Dict], limit: int) -> str:
+        text = "Похожие темы из прошлого:\n"
+        added = False
+        for conv in similar[:2]:  # Только первые 2
+            entry = (f"Пользователь спрашивал: {conv['user_message'][:100]}...\n"
+                     f"Ответ был: {conv['ai_response'][:100]}...\n\n")
+            if count_tokens(text + entry) > limit:
+                break
+            text += entry
+            added = True
+        return text if added else ''
+
+
+# Общий сборщик промптов
+prompt_builder = PromptBuilder()
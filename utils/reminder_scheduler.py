@@ -1,15 +1,44 @@
 """
 Планировщик для проверки и отправки напоминаний
+
+Ближайшие напоминания держатся в памяти в куче, упорядоченной по времени.
+Планировщик спит ровно до следующего напоминания и просыпается раньше, если
+напоминание создали, изменили или удалили (ReminderDB сообщает об этом через
+add_change_listener). Периодическая сверка с базой - только страховка.
+
+Наступившие напоминания уходят в очередь доставки, которую разбирают несколько
+воркеров с учетом лимитов Telegram. Не отправленное напоминание возвращается
+в кучу через retry_delay секунд, пока не истекли grace_minutes после его времени.
+Отметки об отправке копятся и записываются в базу одним запросом раз в секунду.
 """
 import asyncio
+import heapq
 import logging
-from datetime import datetime
-from typing import Optional
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, List, Tuple
 from aiogram import Bot
-from database.reminders import ReminderDB
+from aiogram.exceptions import TelegramRetryAfter
+from config.settings import settings
+from database.reminders import ReminderDB, add_change_listener, remove_change_listener
+from utils.telegram_rate_limiter import TelegramRateLimiter
 
 logger = logging.getLogger(__name__)
 
+
+def _timestamp(value: datetime) -> float:
+    """Время напоминания в секундах; naive datetime в базе хранится как UTC"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _due_at(reminder: dict) -> float:
+    """Когда отправлять напоминание: время повтора после ошибки или remind_at"""
+    return reminder.get('retry_at') or _timestamp(reminder['remind_at'])
+
+
 class ReminderScheduler:
     """Класс для управления расписанием напоминаний"""
     
@@ -23,7 +52,36 @@ class ReminderScheduler:
         self.bot = bot
         self.reminder_db = ReminderDB()
         self.is_running = False
-        self.check_interval = 60  # Проверка каждую минуту
+        self.reconcile_interval = 300  # Сверка с базой каждые 5 минут
+        self.lookahead_minutes = 15  # Окно напоминаний, загруженных в память
+        self.grace_minutes = 5  # Насколько можно опоздать с отправкой пропущенного напоминания
+        self.retry_delay = 30.0  # Пауза перед повторной отправкой после ошибки
+        
+        self._heap: List[Tuple[float, int]] = []  # (время, id), устаревшие записи пропускаются
+        self._reminders: Dict[int, dict] = {}  # Актуальные данные напоминаний по id
+        self._in_flight: set = set()  # Напоминания, которые сейчас отправляются
+        self._loaded_until: Optional[datetime] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._refresh_tasks: set = set()  # Перечитывание измененных напоминаний
+        
+        # Доставка
+        self.send_concurrency = settings.REMINDER_SEND_CONCURRENCY
+        self.ack_interval = 1.0  # Как часто записывать отметки об отправке в базу
+        self.max_send_attempts = 5
+        self.rate_limiter = TelegramRateLimiter(
+            global_rate=settings.TELEGRAM_GLOBAL_RATE,
+            per_chat_interval=settings.TELEGRAM_PER_CHAT_INTERVAL
+        )
+        self._queue: Optional[asyncio.Queue] = None
+        self._pending_acks: List[int] = []
+        self._workers: List[asyncio.Task] = []
+        self._ack_task: Optional[asyncio.Task] = None
+        
+        # Метрики доставки
+        self._sent_times: deque = deque()  # Время отправки за последнюю минуту
+        self._lag_window: deque = deque(maxlen=1000)  # Задержки относительно remind_at
+        self.stats = {'sent': 0, 'failed': 0, 'rate_limited': 0}
         
     async def start(self):
         """Запуск планировщика"""
@@ -32,54 +90,310 @@ class ReminderScheduler:
             return
         
         self.is_running = True
+        self._wakeup = asyncio.Event()
+        self._queue = asyncio.Queue()
+        add_change_listener(self._on_reminder_changed)
         logger.info("Планировщик напоминаний запущен")
         
         # Запускаем фоновую задачу
-        asyncio.create_task(self._run_scheduler())
+        self._task = asyncio.create_task(self._run_scheduler())
+        self._workers = [
+            asyncio.create_task(self._delivery_worker())
+            for _ in range(self.send_concurrency)
+        ]
+        self._ack_task = asyncio.create_task(self._ack_loop())
     
     async def stop(self):
         """Остановка планировщика"""
         self.is_running = False
+        remove_change_listener(self._on_reminder_changed)
+        
+        tasks = [task for task in [self._task, self._ack_task, *self._workers, *self._refresh_tasks] if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._ack_task = None
+        self._workers = []
+        self._refresh_tasks.clear()
+        
+        # Не теряем отметки об уже отправленных напоминаниях
+        await self._flush_acks()
         logger.info("Планировщик напоминаний остановлен")
     
+    def schedule(self, reminder: dict):
+        """Добавить или обновить напоминание в очереди"""
+        reminder_id = reminder['id']
+        if reminder_id in self._in_flight:
+            return
+        
+        # Напоминания за пределами окна подхватит следующая сверка
+        if self._loaded_until and reminder['remind_at'] > self._loaded_until:
+            self.cancel(reminder_id)
+            return
+        
+        self._reminders[reminder_id] = reminder
+        heapq.heappush(self._heap, (_due_at(reminder), reminder_id))
+        self._wake()
+    
+    def cancel(self, reminder_id: int):
+        """Убрать напоминание из очереди (запись в куче станет устаревшей)"""
+        if self._reminders.pop(reminder_id, None) is not None:
+            self._wake()
+    
+    async def refresh(self, reminder_id: int):
+        """Перечитать напоминание из базы и обновить очередь"""
+        until = datetime.now(timezone.utc) + timedelta(minutes=self.lookahead_minutes)
+        reminders = await self.reminder_db.get_upcoming_reminders(
+            until, grace_minutes=self.grace_minutes, reminder_id=reminder_id
+        )
+        
+        if reminders:
+            self.schedule(reminders[0])
+        else:
+            self.cancel(reminder_id)
+    
+    def _on_reminder_changed(self, reminder_id: int, deleted: bool):
+        """Обработчик изменений из ReminderDB"""
+        if not self.is_running:
+            return
+        
+        if deleted:
+            self.cancel(reminder_id)
+        else:
+            task = asyncio.create_task(self.refresh(reminder_id))
+            self._refresh_tasks.add(task)
+            task.add_done_callback(self._refresh_done)
+    
+    def _refresh_done(self, task: asyncio.Task):
+        self._refresh_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Ошибка обновления напоминания в очереди: {task.exception()}")
+    
+    def _wake(self):
+        """Разбудить цикл планировщика, чтобы он пересчитал время ожидания"""
+        if self._wakeup:
+            self._wakeup.set()
+    
     async def _run_scheduler(self):
         """Основной цикл планировщика"""
+        next_reconcile = 0.0
+        
         while self.is_running:
             try:
-                # Проверяем напоминания
+                self._wakeup.clear()
+                
+                if time.monotonic() >= next_reconcile:
+                    await self._reconcile()
+                    next_reconcile = time.monotonic() + self.reconcile_interval
+                
+                # Отправляем все наступившие напоминания
                 await self._check_reminders()
                 
-                # Ждем до следующей проверки
-                await asyncio.sleep(self.check_interval)
+                # Спим до ближайшего напоминания, сверки или изменения очереди
+                timeout = next_reconcile - time.monotonic()
+                next_due = self._next_due_in()
+                if next_due is not None:
+                    timeout = min(timeout, next_due)
                 
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(timeout, 0))
+                except asyncio.TimeoutError:
+                    pass
+                
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
                 logger.error(f"Ошибка в планировщике напоминаний: {e}")
-                await asyncio.sleep(self.check_interval)
+                await asyncio.sleep(1)
+    
+    async def _reconcile(self):
+        """Загрузить окно ближайших напоминаний из базы и пересобрать очередь"""
+        until = datetime.now(timezone.utc) + timedelta(minutes=self.lookahead_minutes)
+        reminders = await self.reminder_db.get_upcoming_reminders(until, grace_minutes=self.grace_minutes)
+        
+        previous = self._reminders
+        self._loaded_until = until
+        self._reminders = {}
+        for reminder in reminders:
+            if reminder['id'] in self._in_flight:
+                continue
+            # Ждущее повтора напоминание не отправляется раньше времени повтора
+            old = previous.get(reminder['id'])
+            if old and old.get('retry_at') and old['remind_at'] == reminder['remind_at']:
+                reminder = {**reminder, 'retry_at': old['retry_at']}
+            self._reminders[reminder['id']] = reminder
+        self._heap = [(_due_at(r), r['id']) for r in self._reminders.values()]
+        heapq.heapify(self._heap)
+        
+        logger.debug(f"Сверка напоминаний: в очереди {len(self._reminders)}")
+    
+    def _next_due_in(self) -> Optional[float]:
+        """Секунд до ближайшего актуального напоминания"""
+        while self._heap:
+            due_at, reminder_id = self._heap[0]
+            reminder = self._reminders.get(reminder_id)
+            if reminder is None or _due_at(reminder) != due_at:
+                heapq.heappop(self._heap)  # Устаревшая запись
+                continue
+            return due_at - time.time()
+        return None
+    
+    def _pop_due(self) -> List[dict]:
+        """Извлечь из очереди все напоминания, время которых наступило"""
+        due = []
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            due_at, reminder_id = heapq.heappop(self._heap)
+            reminder = self._reminders.get(reminder_id)
+            if reminder is None or _due_at(reminder) != due_at:
+                continue  # Напоминание удалено или перенесено
+            del self._reminders[reminder_id]
+            due.append(reminder)
+        return due
     
     async def _check_reminders(self):
-        """Проверка и отправка напоминаний"""
+        """Передача наступивших напоминаний в очередь доставки"""
         try:
-            # Получаем активные напоминания
-            reminders = await self.reminder_db.get_active_reminders(time_window_minutes=5)
+            reminders = self._pop_due()
             
             if not reminders:
                 return
             
-            logger.info(f"Найдено {len(reminders)} активных напоминаний")
+            logger.info(f"Наступило {len(reminders)} напоминаний, в очереди {self._queue.qsize()}")
             
-            # Отправляем каждое напоминание
+            # Напоминание остается в _in_flight, пока отметка об отправке не записана в базу
             for reminder in reminders:
-                await self._send_reminder(reminder)
+                self._in_flight.add(reminder['id'])
+                self._queue.put_nowait(reminder)
                 
         except Exception as e:
             logger.error(f"Ошибка проверки напоминаний: {e}")
     
-    async def _send_reminder(self, reminder: dict):
+    async def _delivery_worker(self):
+        """Воркер доставки: берет напоминания из очереди и отправляет с учетом лимитов"""
+        while True:
+            reminder = await self._queue.get()
+            try:
+                await self._deliver(reminder)
+            except Exception as e:
+                logger.error(f"Ошибка доставки напоминания {reminder.get('id')}: {e}")
+                self._in_flight.discard(reminder['id'])
+                self._retry_later(reminder)
+            finally:
+                self._queue.task_done()
+    
+    async def _deliver(self, reminder: dict):
+        """Отправить напоминание, повторяя попытку после 429"""
+        for attempt in range(self.max_send_attempts):
+            await self.rate_limiter.acquire(reminder['user_id'])
+            
+            try:
+                sent = await self._send_reminder(reminder)
+            except TelegramRetryAfter as e:
+                self.stats['rate_limited'] += 1
+                logger.warning(f"Telegram просит подождать {e.retry_after} с (напоминание {reminder['id']})")
+                self.rate_limiter.pause(e.retry_after)
+                continue
+            
+            if sent:
+                self._record_sent(reminder)
+                self._pending_acks.append(reminder['id'])
+                return
+            break
+        
+        self.stats['failed'] += 1
+        self._in_flight.discard(reminder['id'])
+        self._retry_later(reminder)
+    
+    def _retry_later(self, reminder: dict):
+        """Вернуть неотправленное напоминание в кучу через retry_delay, пока не истек grace_minutes"""
+        reminder_id = reminder['id']
+        if reminder_id in self._reminders:
+            return  # Напоминание уже изменено и поставлено заново
+        
+        retry_at = time.time() + self.retry_delay
+        if retry_at > _timestamp(reminder['remind_at']) + self.grace_minutes * 60:
+            logger.warning(f"Напоминание {reminder_id} не отправлено: время отправки истекло")
+            return
+        
+        self._reminders[reminder_id] = {**reminder, 'retry_at': retry_at}
+        heapq.heappush(self._heap, (retry_at, reminder_id))
+        self._wake()
+    
+    async def _ack_loop(self):
+        """Периодическая запись отметок об отправке в базу"""
+        while True:
+            await asyncio.sleep(self.ack_interval)
+            try:
+                await self._flush_acks()
+            except Exception as e:
+                logger.error(f"Ошибка записи отметок напоминаний: {e}")
+    
+    async def _flush_acks(self):
+        """Записать накопленные отметки об отправке одним запросом"""
+        if not self._pending_acks:
+            return
+        
+        reminder_ids, self._pending_acks = self._pending_acks, []
+        if not self.reminder_db.db.enabled:
+            # Без базы отметки записывать некуда (и сверка ничего не загрузит)
+            self._in_flight.difference_update(reminder_ids)
+            return
+        if not await self.reminder_db.mark_reminders_sent(reminder_ids):
+            # Отметка не записана: напоминания остаются в _in_flight (иначе сверка отправит
+            # их повторно), запись повторится на следующем шаге
+            self._pending_acks = reminder_ids + self._pending_acks
+            logger.warning(f"Отметки {len(reminder_ids)} напоминаний не записаны, повторим позже")
+            return
+        
+        # После записи в базу напоминания больше не вернутся при сверке
+        self._in_flight.difference_update(reminder_ids)
+        
+        metrics = self.get_metrics()
+        logger.info(
+            f"Отправлено напоминаний: {len(reminder_ids)}, "
+            f"{metrics['sent_per_second']:.1f}/с, очередь {metrics['queue_depth']}, "
+            f"задержка {metrics['lag_avg']:.2f} с (макс {metrics['lag_max']:.2f} с)"
+        )
+    
+    def _record_sent(self, reminder: dict):
+        """Учесть отправку в метриках"""
+        now = time.time()
+        self.stats['sent'] += 1
+        self._sent_times.append(now)
+        if reminder.get('remind_at'):
+            self._lag_window.append(max(now - _timestamp(reminder['remind_at']), 0.0))
+    
+    def get_metrics(self) -> Dict[str, float]:
+        """Метрики доставки: скорость, глубина очереди, задержка относительно remind_at"""
+        now = time.time()
+        while self._sent_times and self._sent_times[0] < now - 60:
+            self._sent_times.popleft()
+        
+        # Скорость считается по последним 10 секундам
+        recent = sum(1 for sent_at in self._sent_times if sent_at >= now - 10)
+        lags = list(self._lag_window)
+        
+        return {
+            'sent_per_second': recent / 10,
+            'sent_last_minute': len(self._sent_times),
+            'queue_depth': self._queue.qsize() if self._queue else 0,
+            'in_flight': len(self._in_flight),
+            'lag_avg': sum(lags) / len(lags) if lags else 0.0,
+            'lag_max': max(lags) if lags else 0.0,
+            **self.stats
+        }
+    
+    async def _send_reminder(self, reminder: dict) -> bool:
         """
         Отправка напоминания пользователю
         
         Args:
             reminder: Словарь с данными напоминания
+            
+        Returns:
+            True если сообщение доставлено. TelegramRetryAfter пробрасывается наружу
         """
         try:
             user_id = reminder['user_id']
@@ -134,13 +448,14 @@ class ReminderScheduler:
                 reply_markup=builder.as_markup()
             )
             
-            # Отмечаем напоминание как отправленное
-            await self.reminder_db.mark_reminder_sent(reminder['id'])
-            
-            logger.info(f"Напоминание {reminder['id']} отправлено пользователю {user_id}")
+            logger.debug(f"Напоминание {reminder['id']} отправлено пользователю {user_id}")
+            return True
             
+        except TelegramRetryAfter:
+            raise
         except Exception as e:
             logger.error(f"Ошибка отправки напоминания {reminder.get('id')}: {e}")
+            return False
     
     async def send_test_reminder(self, user_id: int):
         """
@@ -0,0 +1,102 @@
+"""
+Склонения русских имен: приведение к именительному падежу и основы для поиска
+"""
+
+# Словарь частых окончаний русских имен в разных падежах
+NAME_CORRECTIONS = {
+    # Мужские имена
+    'александра': 'Александр',
+    'леонида': 'Леонид', 
+    'владимира': 'Владимир',
+    'дмитрия': 'Дмитрий',
+    'сергея': 'Сергей',
+    'андрея': 'Андрей',
+    'алексея': 'Алексей',
+    'николая': 'Николай',
+    'михаила': 'Михаил',
+    'павла': 'Павел',
+    'игоря': 'Игорь',
+    'олега': 'Олег',
+    'антона': 'Антон',
+    'романа': 'Роман',
+    'максима': 'Максим',
+    'артема': 'Артем',
+    'ивана': 'Иван',
+    'петра': 'Петр',
+    'юрия': 'Юрий',
+    'виктора': 'Виктор',
+    'евгения': 'Евгений',
+    'константина': 'Константин',
+    'валерия': 'Валерий',
+
+    # Женские имена
+    'анны': 'Анна',
+    'елены': 'Елена', 
+    'марии': 'Мария',
+    'ольги': 'Ольга',
+    'татьяны': 'Татьяна',
+    'наталии': 'Наталия',
+    'наталье': 'Наталья',
+    'светланы': 'Светлана',
+    'ирины': 'Ирина',
+    'людмилы': 'Людмила',
+    'галины': 'Галина',
+    'валентины': 'Валентина',
+    'нины': 'Нина',
+    'любови': 'Любовь',
+    'екатерины': 'Екатерина',
+    'алены': 'Алена',
+    'юлии': 'Юлия',
+    'анастасии': 'Анастасия',
+    'дарьи': 'Дарья',
+    'веры': 'Вера',
+    'надежды': 'Надежда',
+    'софии': 'София',
+    'виктории': 'Виктория'
+}
+
+# Падежные окончания, отбрасываемые при построении основы (длинные раньше коротких)
+_CASE_ENDINGS = (
+    'ией', 'ием', 'ами', 'ями', 'ого', 'его', 'ому', 'ему',
+    'ой', 'ей', 'ом', 'ем', 'ою', 'ею', 'ам', 'ям', 'ах', 'ях', 'ий', 'ия', 'ию', 'ии', 'ие',
+    'а', 'я', 'у', 'ю', 'е', 'ы', 'и', 'о', 'ь', 'й',
+)
+
+
+def correct_name_case(name: str) -> str:
+    """Исправляет склонение русских имен в именительный падеж"""
+    if not name:
+        return name
+    
+    name_lower = name.lower().strip()
+    
+    # Проверяем точное совпадение
+    if name_lower in NAME_CORRECTIONS:
+        return NAME_CORRECTIONS[name_lower]
+    
+    # Проверяем по паттернам окончаний
+    if name_lower.endswith('а') and len(name_lower) > 3:
+        # Мужские имена на -а (Леонида -> Леонид)
+        base_name = name_lower[:-1]
+        if base_name + 'а' in NAME_CORRECTIONS:
+            return NAME_CORRECTIONS[base_name + 'а']
+        # Попробуем добавить "д" (Леонида -> Леонид)
+        if not base_name.endswith('д'):
+            test_name = base_name + 'д'
+            if test_name.capitalize() in ['Леонид', 'Давид', 'Эдуард']:
+                return test_name.capitalize()
+    
+    # Если не нашли соответствие, просто делаем первую букву заглавной
+    return name.strip().capitalize()
+
+
+def name_stem(word: str) -> str:
+    """Основа слова для поиска: "Леониду", "Леонида" и "Леонид" дают одну основу"""
+    word = word.lower().replace('ё', 'е').strip()
+    if word in NAME_CORRECTIONS:
+        word = NAME_CORRECTIONS[word].lower()
+
+    for ending in _CASE_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
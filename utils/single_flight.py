@@ -0,0 +1,39 @@
+"""
+Объединение одновременных одинаковых запросов (single flight)
+
+Кэши ответов AI, векторов и озвучки одинаково обрабатывают промах: первый
+вызов с ключом выполняет запрос, а вызовы с тем же ключом, пришедшие до его
+завершения, ждут тот же результат (или то же исключение) вместо повторного
+запроса к API.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+async def single_flight(inflight: Dict[str, asyncio.Future], key: str,
+                        factory: Callable[[], Awaitable[Any]]) -> Any:
+    """Результат factory(); одновременные вызовы с ключом key ждут первый
+
+    Args:
+        inflight: Запросы, которые сейчас выполняются (ключ -> future), у каждого кэша свой
+        key: Ключ запроса
+        factory: Запрос; вызывается, только если запроса с этим ключом еще нет
+    """
+    future = inflight.get(key)
+    if future is not None:
+        # shield: отмена одного ожидающего не отменяет запрос для остальных
+        return await asyncio.shield(future)
+
+    future = asyncio.get_running_loop().create_future()
+    inflight[key] = future
+    try:
+        result = await factory()
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        # Исключение получат ожидающие; здесь оно уже обработано
+        future.exception()
+        raise
+    finally:
+        del inflight[key]
@@ -0,0 +1,304 @@
+"""
+Пул SMTP-сессий с асинхронной очередью отправки
+
+Для каждого ящика держится одно авторизованное SMTP-соединение (STARTTLS + LOGIN
+выполняются один раз) и одна очередь писем. Воркер ящика забирает из очереди все
+накопившиеся письма и отправляет их подряд в одной сессии, поэтому рассылка
+на 20 адресов стоит одного рукопожатия, а не двадцати.
+
+Соединение, которое сервер закрыл за время простоя, переоткрывается сразу, без
+траты попытки. Остальные временные ошибки (обрыв соединения, ответы 4xx)
+повторяются с экспоненциальной задержкой; постоянные (5xx, неверный пароль, адрес отклонен) сразу завершают
+отправку. О ходе доставки сообщает необязательный колбэк on_status.
+"""
+import asyncio
+import inspect
+import logging
+import smtplib
+import ssl
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Колбэк статуса доставки: on_status(status, to_email, info)
+# status: 'queued', 'sending', 'retrying', 'sent', 'failed'
+StatusCallback = Callable[[str, str, Dict], Union[None, Awaitable[None]]]
+
+
+class SendJob:
+    """Письмо в очереди отправки"""
+
+    __slots__ = ('to_email', 'message', 'future', 'on_status', 'attempt', 'error')
+
+    def __init__(self, to_email: str, message: str, future: asyncio.Future,
+                 on_status: Optional[StatusCallback] = None):
+        self.to_email = to_email
+        self.message = message
+        self.future = future
+        self.on_status = on_status
+        self.attempt = 0
+        self.error: Optional[str] = None
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Стоит ли повторять отправку после этой ошибки"""
+    if isinstance(error, (smtplib.SMTPAuthenticationError, smtplib.SMTPRecipientsRefused,
+                          smtplib.SMTPSenderRefused)):
+        return False
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    return isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError))
+
+
+class SmtpSession:
+    """Авторизованное SMTP-соединение одного ящика (синхронное, вызывается из пула потоков)"""
+
+    def __init__(self, server: str, port: int, email_addr: str, password: str, timeout: float = 30):
+        self.server = server
+        self.port = port
+        self.email_addr = email_addr
+        self.password = password
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.last_used = 0.0
+        self._conn: Optional[smtplib.SMTP] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._conn is not None
+
+    def connection(self) -> smtplib.SMTP:
+        """Соединение, при необходимости с подключением, STARTTLS и авторизацией"""
+        if self._conn is None:
+            conn = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+            conn.starttls(context=ssl.create_default_context())
+            conn.login(self.email_addr, self.password)
+            self._conn = conn
+            logger.debug(f"SMTP сессия открыта: {self.email_addr}")
+        return self._conn
+
+    def send(self, to_email: str, message: str):
+        """Отправить одно письмо; соединение, разорванное сервером, открывается заново один раз"""
+        reused = self._conn is not None
+        try:
+            self._send_once(to_email, message)
+        except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+            if not reused:
+                raise
+            # Сервер закрыл простаивавшее соединение - это не сбой отправки
+            logger.info(f"SMTP сессия {self.email_addr} разорвана сервером, переподключение: {e}")
+            self._send_once(to_email, message)
+
+    def _send_once(self, to_email: str, message: str):
+        """Отправить письмо в текущей сессии; при ошибке сессия закрывается"""
+        try:
+            self.connection().sendmail(self.email_addr, to_email, message)
+            self.last_used = time.monotonic()
+        except smtplib.SMTPRecipientsRefused:
+            # Сессия остается рабочей, отклонен только адрес
+            raise
+        except Exception:
+            self.close()
+            raise
+
+    def keepalive(self, close_after: float):
+        """Закрыть давно неиспользуемое соединение"""
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            if self._conn is not None and time.monotonic() - self.last_used >= close_after:
+                self.close()
+        finally:
+            self.lock.release()
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.quit()
+            except Exception:
+                pass
+            self._conn = None
+
+
+class AccountSender:
+    """Очередь и воркер отправки одного ящика"""
+
+    def __init__(self, session: SmtpSession, max_attempts: int = 4,
+                 base_delay: float = 1.0, max_batch: int = 50):
+        self.session = session
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_batch = max_batch
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._worker: Optional[asyncio.Task] = None
+
+    def submit(self, job: SendJob):
+        """Поставить письмо в очередь и запустить воркер при необходимости"""
+        self.queue.put_nowait(job)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        """Забирать письма пачками и отправлять их в одной сессии"""
+        loop = asyncio.get_running_loop()
+        while not self.queue.empty():
+            batch: List[SendJob] = [self.queue.get_nowait()]
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            retry: List[SendJob] = []
+            for job in batch:
+                job.attempt += 1
+                await _notify(job, 'sending')
+                try:
+                    await loop.run_in_executor(None, self._send_locked, job)
+                except Exception as e:
+                    job.error = str(e)
+                    if is_transient_error(e) and job.attempt < self.max_attempts:
+                        retry.append(job)
+                    else:
+                        logger.error(f"Письмо {self.session.email_addr} -> {job.to_email} не отправлено: {e}")
+                        await _notify(job, 'failed')
+                        _resolve(job, False)
+                    continue
+
+                await _notify(job, 'sent')
+                _resolve(job, True)
+
+            if retry:
+                # Экспоненциальная задержка по самой "старой" попытке в пачке
+                delay = self.base_delay * 2 ** (max(job.attempt for job in retry) - 1)
+                for job in retry:
+                    await _notify(job, 'retrying', delay=delay)
+                logger.warning(f"SMTP {self.session.email_addr}: повтор {len(retry)} писем через {delay:.0f} с")
+                await asyncio.sleep(delay)
+                for job in retry:
+                    self.queue.put_nowait(job)
+
+    def _send_locked(self, job: SendJob):
+        with self.session.lock:
+            self.session.send(job.to_email, job.message)
+
+    async def close(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        # Письма, оставшиеся в очереди, считаются неотправленными
+        while not self.queue.empty():
+            _resolve(self.queue.get_nowait(), False)
+
+
+async def _notify(job: SendJob, status: str, **info):
+    """Вызвать колбэк статуса; ошибки колбэка не влияют на отправку"""
+    if job.on_status is None:
+        return
+    try:
+        result = job.on_status(status, job.to_email, {'attempt': job.attempt, 'error': job.error, **info})
+        if inspect.isawaitable(result):
+            await result
+    except Exception as e:
+        logger.error(f"Ошибка колбэка статуса письма: {e}")
+
+
+def _resolve(job: SendJob, success: bool):
+    if not job.future.done():
+        job.future.set_result(success)
+
+
+class SmtpPool:
+    """Отправители по адресу ящика"""
+
+    def __init__(self, server: str = "smtp.yandex.ru", port: int = 587, close_after: float = 300):
+        """
+        Args:
+            server: SMTP сервер
+            port: Порт (STARTTLS)
+            close_after: Через сколько секунд простоя закрывать соединение
+        """
+        self.server = server
+        self.port = port
+        self.close_after = close_after
+        self._senders: Dict[str, AccountSender] = {}
+        self._keepalive_task: Optional[asyncio.Task] = None
+
+    def has_session(self, email_addr: str, password: str) -> bool:
+        """Есть ли уже авторизованная сессия ящика с этим паролем"""
+        sender = self._senders.get(email_addr)
+        return bool(sender and sender.session.password == password and sender.session.connected)
+
+    def _sender(self, email_addr: str, password: str) -> AccountSender:
+        sender = self._senders.get(email_addr)
+        if sender and sender.session.password != password:
+            # Пароль сменился: старая сессия закроется, очередь продолжит работу с новой
+            old_session = sender.session
+            sender.session = SmtpSession(self.server, self.port, email_addr, password)
+            threading.Thread(target=self._close_session, args=(old_session,), daemon=True).start()
+
+        if sender is None:
+            sender = AccountSender(SmtpSession(self.server, self.port, email_addr, password))
+            self._senders[email_addr] = sender
+
+        return sender
+
+    async def send(self, email_addr: str, password: str, to_email: str, message: str,
+                   on_status: Optional[StatusCallback] = None) -> bool:
+        """Поставить письмо в очередь ящика и дождаться результата"""
+        self._start_keepalive()
+        future = asyncio.get_running_loop().create_future()
+        job = SendJob(to_email, message, future, on_status)
+        await _notify(job, 'queued')
+        self._sender(email_addr, password).submit(job)
+        return await future
+
+    async def send_many(self, email_addr: str, password: str, messages: Dict[str, str],
+                        on_status: Optional[StatusCallback] = None) -> Dict[str, bool]:
+        """Отправить несколько писем (адрес -> текст письма) в одной сессии"""
+        results = await asyncio.gather(*(
+            self.send(email_addr, password, to_email, message, on_status)
+            for to_email, message in messages.items()
+        ))
+        return dict(zip(messages.keys(), results))
+
+    def _start_keepalive(self):
+        if self._keepalive_task is None or self._keepalive_task.done():
+            self._keepalive_task = asyncio.get_running_loop().create_task(self._keepalive_loop())
+
+    async def _keepalive_loop(self):
+        """Закрывать соединения, простаивающие дольше close_after"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(60)
+            for sender in list(self._senders.values()):
+                await loop.run_in_executor(None, sender.session.keepalive, self.close_after)
+
+    @staticmethod
+    def _close_session(session: SmtpSession):
+        with session.lock:
+            session.close()
+
+    async def close(self):
+        """Остановить очереди и закрыть все соединения"""
+        if self._keepalive_task:
+            self._keepalive_task.cancel()
+            try:
+                await self._keepalive_task
+            except asyncio.CancelledError:
+                pass
+            self._keepalive_task = None
+
+        loop = asyncio.get_running_loop()
+        for sender in list(self._senders.values()):
+            await sender.close()
+            await loop.run_in_executor(None, self._close_session, sender.session)
+        self._senders.clear()
+
+
+# Глобальный пул
+smtp_pool = SmtpPool()
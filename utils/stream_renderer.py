@@ -0,0 +1,113 @@
+"""
+Постепенный вывод потокового ответа AI в Telegram
+
+Ответ показывается правками статусного сообщения ("🤖 Думаю...") по мере
+генерации. Правки не чаще одной в min_interval секунд (лимит Telegram - около
+одного сообщения в секунду в чат); промежуточные версии, не успевшие попасть
+в интервал, пропускаются - в чат уходит только последний текст.
+
+Текст длиннее limit делится на части, как и раньше в обработчике: заполненная
+часть фиксируется в своем сообщении, продолжение идет новым сообщением.
+Промежуточные правки отправляются без разметки (незакрытый HTML-тег вызвал бы
+ошибку), финальные - в HTML с клавиатурой на первой части.
+"""
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, List, Optional
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import InlineKeyboardMarkup, Message
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Признак того, что ответ еще пишется
+CURSOR = " ▌"
+
+
+def split_text(text: str, limit: int) -> List[str]:
+    """Части текста не длиннее limit (пустой текст - одна пустая часть)"""
+    return [text[i:i + limit] for i in range(0, len(text), limit)] or ['']
+
+
+class ProgressiveReply:
+    """Ответ, который дописывается в чате по мере генерации"""
+
+    def __init__(self, message: Message, status_message: Message,
+                 min_interval: Optional[float] = None, limit: Optional[int] = None):
+        """
+        Args:
+            message: Сообщение пользователя (для отправки продолжений)
+            status_message: Статусное сообщение, в которое пишется ответ
+            min_interval: Минимальный интервал между правками, секунды
+            limit: Максимальная длина одного сообщения
+        """
+        self.message = message
+        self.messages: List[Message] = [status_message]
+        self.min_interval = settings.STREAM_EDIT_INTERVAL if min_interval is None else min_interval
+        self.limit = settings.MAX_MESSAGE_LENGTH if limit is None else limit
+        self._shown: List[Optional[tuple]] = [None]  # (текст, разметка, клавиатура) каждого сообщения
+        self._next_edit = 0.0
+        self.edits = 0
+
+    async def stream(self, chunks: AsyncIterator[str]) -> str:
+        """Показать поток по мере поступления; вернуть полный текст"""
+        text = ''
+        async for chunk in chunks:
+            text += chunk
+            if time.monotonic() >= self._next_edit:
+                await self._render(text, final=False)
+        return text
+
+    async def finish(self, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None):
+        """Окончательный вид ответа: разметка HTML и клавиатура на первой части"""
+        await self._render(text, final=True, reply_markup=reply_markup)
+
+    async def _render(self, text: str, final: bool, reply_markup: Optional[InlineKeyboardMarkup] = None):
+        parts = split_text(text, self.limit)
+        for index, part in enumerate(parts):
+            last = index == len(parts) - 1
+            if final:
+                await self._show(index, part, "HTML", reply_markup if index == 0 else None, final=True)
+            elif not last:
+                # Заполненная часть больше не меняется до финальной правки
+                await self._show(index, part, None)
+            elif part.strip():
+                await self._show(index, part + CURSOR, None)
+        self._next_edit = max(self._next_edit, time.monotonic() + self.min_interval)
+
+    async def _show(self, index: int, text: str, parse_mode: Optional[str],
+                    reply_markup: Optional[InlineKeyboardMarkup] = None, final: bool = False):
+        """Показать text в сообщении index (создав его при необходимости)"""
+        state = (text, parse_mode, reply_markup)
+        if index < len(self.messages) and self._shown[index] == state:
+            return
+
+        try:
+            if index < len(self.messages):
+                await self.messages[index].edit_text(text, parse_mode=parse_mode, reply_markup=reply_markup)
+            else:
+                self.messages.append(await self.message.answer(text, parse_mode=parse_mode,
+                                                               reply_markup=reply_markup))
+                self._shown.append(None)
+            self._shown[index] = state
+            self.edits += 1
+        except TelegramRetryAfter as e:
+            if not final:
+                # Промежуточные правки пропускаем до конца паузы
+                self._next_edit = time.monotonic() + e.retry_after
+                return
+            await asyncio.sleep(e.retry_after)
+            await self._show(index, text, parse_mode, reply_markup, final=True)
+        except TelegramBadRequest as e:
+            if 'message is not modified' in str(e):
+                self._shown[index] = state
+            elif final and parse_mode:
+                # Разметка сломалась (например, тег разрезан на границе частей)
+                await self._show(index, text, None, reply_markup, final=True)
+            elif final:
+                raise
+            else:
+                logger.warning(f"Не удалось обновить потоковый ответ: {e}")
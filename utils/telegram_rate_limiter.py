@@ -0,0 +1,68 @@
+"""
+Ограничитель частоты отправки сообщений в Telegram
+
+Telegram допускает около 30 сообщений в секунду на бота и не больше одного
+сообщения в секунду в один чат. При превышении API отвечает 429 с retry_after -
+в этом случае отправка приостанавливается для всех чатов.
+"""
+import asyncio
+import time
+from typing import Dict
+
+
+class TelegramRateLimiter:
+    """Общий лимит отправки и лимит на каждый чат"""
+
+    def __init__(self, global_rate: float = 25, per_chat_interval: float = 1.0):
+        """
+        Args:
+            global_rate: Сообщений в секунду на весь бот
+            per_chat_interval: Минимальный интервал между сообщениями в один чат (сек)
+        """
+        self.global_interval = 1.0 / global_rate
+        self.per_chat_interval = per_chat_interval
+        self._next_global = 0.0
+        self._next_chat: Dict[int, float] = {}
+        self._paused_until = 0.0
+
+    async def acquire(self, chat_id: int):
+        """Дождаться слота на отправку сообщения в чат"""
+        while True:
+            now = time.monotonic()
+            wait = max(self._paused_until, self._next_chat.get(chat_id, 0.0)) - now
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            # Бронируем слот без await между чтением и записью - гонок в event loop нет
+            slot = max(now, self._next_global)
+            self._next_global = slot + self.global_interval
+            self._next_chat[chat_id] = slot + self.per_chat_interval
+            self._prune(now)
+
+            if slot > now:
+                await asyncio.sleep(slot - now)
+
+            # Пока ждали слот, Telegram мог попросить паузу
+            if self._paused_until > time.monotonic():
+                continue
+
+            return
+
+    def pause(self, seconds: float):
+        """Приостановить всю отправку (ответ 429 с retry_after)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    @property
+    def paused(self) -> bool:
+        """Действует ли пауза от Telegram"""
+        return self._paused_until > time.monotonic()
+
+    def _prune(self, now: float):
+        """Удалить устаревшие отметки чатов, чтобы словарь не рос бесконечно"""
+        if len(self._next_chat) > 10000:
+            self._next_chat = {
+                chat_id: next_at
+                for chat_id, next_at in self._next_chat.items()
+                if next_at > now
+            }
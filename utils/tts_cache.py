@@ -0,0 +1,256 @@
+"""
+Кэш озвучки ответов (TTS)
+
+Кнопку "🎤 Озвучить" часто нажимают повторно на одном и том же ответе. Аудио
+ищется по хэшу от (модель, голос, очищенный текст):
+
+- Telegram file_id уже отправленного голосового сообщения - повтор уходит
+  по file_id, без синтеза и без загрузки файла;
+- LRU в памяти, ограниченный суммарным размером аудио;
+- таблица SQLite на диске, ограниченная размером: при превышении удаляются
+  давно не использованные записи (file_id при этом сохраняется).
+
+Одновременные одинаковые промахи ждут один запрос синтеза. Запросы к SQLite
+выполняются в отдельном потоке кэша, не блокируя event loop. Статистика - get_metrics().
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Optional
+
+from config.settings import settings
+from utils.single_flight import single_flight
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    return ' '.join((text or '').split())
+
+
+def make_key(text: str, voice: str, model: str) -> str:
+    payload = json.dumps([model, voice, normalize_text(text)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class TTSCache:
+    """Аудио и file_id озвученных текстов"""
+
+    def __init__(self, max_memory_bytes: int = 32 * 1024 * 1024, path: Optional[str] = None,
+                 max_disk_bytes: int = 256 * 1024 * 1024, enabled: bool = True):
+        """
+        Args:
+            max_memory_bytes: Суммарный размер аудио в памяти
+            path: Файл SQLite для дискового уровня (None - только память)
+            max_disk_bytes: Суммарный размер аудио на диске
+            enabled: Выключенный кэш всегда синтезирует заново
+        """
+        self.max_memory_bytes = max_memory_bytes
+        self.path = path
+        self.max_disk_bytes = max_disk_bytes
+        self.enabled = enabled
+        self._audio: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._file_ids: Dict[str, str] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._disk_bytes = 0
+        self._disk_lock = threading.Lock()
+        # Один поток для дискового уровня: запросы SQLite выполняются по очереди
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tts_cache')
+        self.stats = {'file_id_hits': 0, 'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+
+    async def get_file_id(self, key: str) -> Optional[str]:
+        """file_id уже загруженного в Telegram голосового сообщения"""
+        if not self.enabled:
+            return None
+        file_id = self._file_ids.get(key)
+        if file_id is None:
+            row = await self._run(self._disk_execute, "SELECT file_id FROM tts_cache WHERE key = ?", (key,), True)
+            file_id = row[0] if row else None
+            if file_id:
+                self._file_ids[key] = file_id
+        if file_id:
+            self.stats['file_id_hits'] += 1
+        return file_id
+
+    async def set_file_id(self, key: str, file_id: str):
+        if not self.enabled or not file_id:
+            return
+        self._file_ids[key] = file_id
+        await self._run(
+            self._disk_execute,
+            "INSERT INTO tts_cache (key, file_id, size, last_used) VALUES (?, ?, 0, ?) "
+            "ON CONFLICT(key) DO UPDATE SET file_id = excluded.file_id",
+            (key, file_id, time.time())
+        )
+
+    async def forget_file_id(self, key: str):
+        """file_id больше не принимается Telegram - отправим аудио заново"""
+        self._file_ids.pop(key, None)
+        await self._run(self._disk_execute, "UPDATE tts_cache SET file_id = NULL WHERE key = ?", (key,))
+
+    async def get_audio(self, key: str) -> Optional[bytes]:
+        """Аудио из памяти или с диска"""
+        audio = self._audio.get(key)
+        if audio is not None:
+            self._audio.move_to_end(key)
+            self.stats['memory_hits'] += 1
+            return audio
+
+        audio = await self._run(self._disk_audio, key)
+        if audio is None:
+            return None
+        self.stats['disk_hits'] += 1
+        self._remember(key, audio)
+        return audio
+
+    async def put_audio(self, key: str, audio: bytes):
+        self._remember(key, audio)
+        await self._run(self._disk_put, key, audio)
+
+    async def get_or_create(self, key: str, factory: Callable[[], Awaitable[Optional[bytes]]]) -> Optional[bytes]:
+        """Аудио из кэша или результат factory(); None (ошибка синтеза) не кэшируется"""
+        if not self.enabled:
+            return await factory()
+
+        audio = await self.get_audio(key)
+        if audio is not None:
+            return audio
+
+        async def create() -> Optional[bytes]:
+            audio = await factory()
+            if audio:
+                await self.put_audio(key, audio)
+            return audio
+
+        if key in self._inflight:
+            self.stats['memory_hits'] += 1
+        else:
+            self.stats['misses'] += 1
+        return await single_flight(self._inflight, key, create)
+
+    def get_metrics(self) -> Dict:
+        return {**self.stats, 'memory_bytes': self._memory_bytes, 'disk_bytes': self._disk_bytes}
+
+    def close(self):
+        with self._disk_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        self.path = None
+
+    async def _run(self, operation: Callable, *args):
+        """Операция с диском в потоке кэша (без дискового уровня - сразу)"""
+        if not self.path:
+            return operation(*args)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, operation, *args)
+
+    def _remember(self, key: str, audio: bytes):
+        if len(audio) > self.max_memory_bytes:
+            return
+        previous = self._audio.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._audio[key] = audio
+        self._memory_bytes += len(audio)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._audio.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """Соединение с дисковым уровнем (вызывать под _disk_lock)"""
+        if self._conn is None and self.path:
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS tts_cache ("
+                    "key TEXT PRIMARY KEY, audio BLOB, size INTEGER NOT NULL DEFAULT 0, "
+                    "file_id TEXT, last_used REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS tts_cache_last_used ON tts_cache (last_used)")
+                conn.commit()
+                self._disk_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM tts_cache").fetchone()[0]
+                self._conn = conn
+            except sqlite3.Error as e:
+                logger.warning(f"Дисковый кэш озвучки недоступен: {e}")
+                self.path = None
+        return self._conn
+
+    def _disk_execute(self, query: str, params: tuple, fetch: bool = False):
+        with self._disk_lock:
+            conn = self._connection()
+            if conn is None:
+                return None
+            try:
+                cursor = conn.execute(query, params)
+                if fetch:
+                    return cursor.fetchone()
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка кэша озвучки: {e}")
+            return None
+
+    def _disk_audio(self, key: str) -> Optional[bytes]:
+        row = self._disk_execute("SELECT audio FROM tts_cache WHERE key = ? AND audio IS NOT NULL",
+                                 (key,), fetch=True)
+        if not row:
+            return None
+        self._disk_execute("UPDATE tts_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+        return bytes(row[0])
+
+    def _disk_put(self, key: str, audio: bytes):
+        if len(audio) > self.max_disk_bytes:
+            return
+        with self._disk_lock:
+            conn = self._connection()
+            if conn is None:
+                return
+            try:
+                row = conn.execute("SELECT size FROM tts_cache WHERE key = ?", (key,)).fetchone()
+                conn.execute(
+                    "INSERT INTO tts_cache (key, audio, size, last_used) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET audio = excluded.audio, size = excluded.size, "
+                    "last_used = excluded.last_used",
+                    (key, audio, len(audio), time.time())
+                )
+                self._disk_bytes += len(audio) - (row[0] if row else 0)
+                self._evict_disk(conn)
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка записи кэша озвучки: {e}")
+
+    def _evict_disk(self, conn: sqlite3.Connection):
+        """Удалить аудио давно не использованных записей, пока размер выше лимита"""
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+        rows = conn.execute(
+            "SELECT key, size FROM tts_cache WHERE size > 0 ORDER BY last_used"
+        ).fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            evicted.append((key,))
+            self._disk_bytes -= size
+        # Запись с file_id остается: по нему сообщение можно отправить и без аудио
+        conn.executemany("UPDATE tts_cache SET audio = NULL, size = 0 WHERE key = ?", evicted)
+        conn.execute("DELETE FROM tts_cache WHERE audio IS NULL AND file_id IS NULL")
+
+
+# Глобальный кэш озвучки
+tts_cache = TTSCache(
+    max_memory_bytes=settings.TTS_CACHE_MEMORY_MB * 1024 * 1024,
+    path=settings.TTS_CACHE_PATH or None,
+    max_disk_bytes=settings.TTS_CACHE_DISK_MB * 1024 * 1024,
+    enabled=settings.TTS_CACHE_ENABLED
+)
@@ -1,19 +1,20 @@
-import os
-import json
+import copy
 from typing import Optional, Dict, Any
 from datetime import datetime
 
+from database.storage import create_document_store
+
 
 class UserSettings:
     """Управление настройками пользователей"""
     
     def __init__(self):
         self.settings_dir = "data/user_settings"
-        os.makedirs(self.settings_dir, exist_ok=True)
+        self.store = create_document_store("user_settings", self.settings_dir, "user_{user_id}.json", dict)
     
     def _get_user_file(self, user_id: int) -> str:
         """Получить путь к файлу настроек пользователя"""
-        return os.path.join(self.settings_dir, f"user_{user_id}.json")
+        return self.store.path(user_id)
     
     def _get_default_settings(self) -> Dict[str, Any]:
         """Настройки по умолчанию"""
@@ -39,15 +40,13 @@ class UserSettings:
     def get_user_settings(self, user_id: int) -> Dict[str, Any]:
         """Получить все настройки пользователя"""
         try:
-            user_file = self._get_user_file(user_id)
             default_settings = self._get_default_settings()
             
-            if os.path.exists(user_file):
-                with open(user_file, 'r', encoding='utf-8') as f:
-                    settings = json.load(f)
-                    # Объединяем с настройками по умолчанию
-                    self._merge_settings(default_settings, settings)
-                    return default_settings
+            if self.store.exists(user_id):
+                settings = self.store.get(user_id)
+                # Объединяем с настройками по умолчанию
+                self._merge_settings(default_settings, settings)
+                return default_settings
             else:
                 # Создаем файл с настройками по умолчанию
                 self._save_user_settings(user_id, default_settings)
@@ -60,11 +59,10 @@ class UserSettings:
     def _save_user_settings(self, user_id: int, settings: Dict[str, Any]):
         """Сохранить настройки пользователя"""
         try:
-            user_file = self._get_user_file(user_id)
             settings["updated_at"] = datetime.now().isoformat()
             
-            with open(user_file, 'w', encoding='utf-8') as f:
-                json.dump(settings, f, ensure_ascii=False, indent=2)
+            # Вызывающий код может продолжать менять свой словарь
+            self.store.put(user_id, copy.deepcopy(settings))
                 
         except Exception as e:
             print(f"Error saving settings for user {user_id}: {e}")
@@ -123,15 +121,11 @@ class UserSettings:
     async def get_user_name(self, user_id: int) -> Optional[str]:
         """Получить сохраненное имя пользователя"""
         try:
-            user_file = self._get_user_file(user_id)
-            
-            if not os.path.exists(user_file):
+            await self.store.preload(user_id)
+            if not self.store.exists(user_id):
                 return None
             
-            with open(user_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            return data.get('display_name')
+            return self.store.view(user_id).get('display_name')
             
         except Exception as e:
             print(f"Ошибка получения имени пользователя {user_id}: {e}")
@@ -140,25 +134,11 @@ class UserSettings:
     async def save_user_name(self, user_id: int, name: str) -> bool:
         """Сохранить имя пользователя"""
         try:
-            user_file = self._get_user_file(user_id)
-            
-            # Загружаем существующие настройки
-            data = {}
-            if os.path.exists(user_file):
-                try:
-                    with open(user_file, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                except:
-                    pass
-            
-            # Обновляем имя
-            data['display_name'] = name.strip()
-            data['updated_at'] = __import__('datetime').datetime.now().isoformat()
-            
-            # Сохраняем
-            with open(user_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            def set_name(data):
+                data['display_name'] = name.strip()
+                data['updated_at'] = datetime.now().isoformat()
             
+            await self.store.update(user_id, set_name)
             return True
             
         except Exception as e:
@@ -0,0 +1,143 @@
+"""
+Распознавание длинных голосовых сообщений по частям
+
+Короткое сообщение уходит в Whisper одним запросом, как раньше. Длинное
+(дольше полутора VOICE_CHUNK_SECONDS) делится через pydub на части примерно
+по VOICE_CHUNK_SECONDS - разрез ставится в паузе речи рядом с целевой точкой,
+а если паузы нет, то ровно в ней. Части распознаются параллельно (не больше
+VOICE_TRANSCRIBE_CONCURRENCY запросов одновременно) и склеиваются по порядку.
+Время распознавания близко ко времени самой длинной части.
+
+По мере готовности частей вызывается on_progress с уже склеенным началом
+текста, чтобы показывать его в статусном сообщении. Неудачная часть
+распознается повторно; если и повтор не удался, на ее месте в тексте стоит
+VOICE_GAP - вызывающий код не должен разбирать такой текст как команду.
+
+Для деления нужны pydub и ffmpeg; без них сообщение распознается целиком.
+"""
+import asyncio
+import io
+import logging
+from typing import Awaitable, Callable, List, Optional, Sequence, Tuple
+
+from config.settings import settings
+from utils.openai_client import openai_client
+
+logger = logging.getLogger(__name__)
+
+# Ответ transcribe_audio при ошибке распознавания
+TRANSCRIBE_ERROR = "Не удалось распознать речь."
+
+# Место нераспознанной части в склеенном тексте
+VOICE_GAP = "[…не распознано…]"
+
+# Паузы, в которых можно резать: не короче MIN_SILENCE_MS и тише средней громкости на SILENCE_DB
+MIN_SILENCE_MS = 400
+SILENCE_DB = 16
+
+ProgressCallback = Callable[[str, int, int], Awaitable[None]]
+
+
+def cut_points(duration_ms: int, silences: Sequence[Tuple[int, int]], chunk_ms: int) -> List[int]:
+    """Точки разреза записи длиной duration_ms на части около chunk_ms
+
+    Разрез ставится в середину паузы, ближайшей к целевой точке (не дальше
+    трети части от нее); короткий хвост присоединяется к последней части.
+    """
+    points = []
+    position = 0
+    while duration_ms - position > chunk_ms * 1.5:
+        target = position + chunk_ms
+        window = chunk_ms // 3
+        candidates = [(start + end) // 2 for start, end in silences
+                      if target - window <= (start + end) // 2 <= target + window]
+        cut = min(candidates, key=lambda point: abs(point - target)) if candidates else target
+        points.append(cut)
+        position = cut
+    return points
+
+
+def split_audio(data: bytes, fmt: str = "ogg", chunk_seconds: float = 30) -> List[bytes]:
+    """Разделить запись на части по паузам (блокирующий вызов - запускать в потоке)"""
+    from pydub import AudioSegment
+    from pydub.silence import detect_silence
+
+    audio = AudioSegment.from_file(io.BytesIO(data), format=fmt)
+    chunk_ms = int(chunk_seconds * 1000)
+    if len(audio) <= chunk_ms * 1.5:
+        return [data]
+
+    silences = detect_silence(audio, min_silence_len=MIN_SILENCE_MS,
+                              silence_thresh=audio.dBFS - SILENCE_DB, seek_step=10)
+    bounds = [0, *cut_points(len(audio), silences, chunk_ms), len(audio)]
+
+    chunks = []
+    for start, end in zip(bounds, bounds[1:]):
+        buffer = io.BytesIO()
+        audio[start:end].export(buffer, format="ogg", codec="libopus")
+        chunks.append(buffer.getvalue())
+    return chunks
+
+
+async def transcribe_chunks(chunks: List[bytes], concurrency: int,
+                            on_progress: Optional[ProgressCallback] = None) -> str:
+    """Распознать части параллельно и склеить по порядку"""
+    semaphore = asyncio.Semaphore(concurrency)
+    texts: List[Optional[str]] = [None] * len(chunks)
+
+    async def transcribe(index: int):
+        async with semaphore:
+            for attempt in range(2):
+                text = await openai_client.transcribe_audio(chunks[index], filename=f"chunk_{index}.ogg")
+                if text != TRANSCRIBE_ERROR:
+                    return index, text.strip()
+                logger.warning(f"Часть {index + 1}/{len(chunks)} не распознана (попытка {attempt + 1})")
+        return index, VOICE_GAP
+
+    done = 0
+    for finished in asyncio.as_completed([transcribe(i) for i in range(len(chunks))]):
+        index, text = await finished
+        texts[index] = text
+        done += 1
+        if on_progress and done < len(chunks):
+            # Показываем только непрерывное начало - без пропусков посередине
+            prefix = []
+            for part in texts:
+                if part is None:
+                    break
+                prefix.append(part)
+            try:
+                await on_progress(' '.join(filter(None, prefix)), done, len(chunks))
+            except Exception as e:
+                logger.warning(f"Не удалось показать ход распознавания: {e}")
+
+    if all(text == VOICE_GAP for text in texts):
+        return TRANSCRIBE_ERROR
+    return ' '.join(filter(None, texts))
+
+
+async def transcribe_voice(data: bytes, duration: Optional[float] = None,
+                           on_progress: Optional[ProgressCallback] = None) -> str:
+    """Распознать голосовое сообщение (OGG/Opus)
+
+    Args:
+        data: Содержимое файла
+        duration: Длительность в секундах из Telegram - короткие записи не декодируются
+        on_progress: async (начало текста, готово частей, всего частей)
+    """
+    chunk_seconds = settings.VOICE_CHUNK_SECONDS
+    if not duration or duration <= chunk_seconds * 1.5:
+        return await openai_client.transcribe_audio(data, filename="voice.ogg")
+
+    try:
+        chunks = await asyncio.to_thread(split_audio, data, "ogg", chunk_seconds)
+    except Exception as e:
+        # Нет pydub/ffmpeg или не удалось декодировать - распознаем целиком
+        logger.warning(f"Не удалось разделить голосовое сообщение: {e}")
+        chunks = [data]
+
+    if len(chunks) == 1:
+        return await openai_client.transcribe_audio(chunks[0], filename="voice.ogg")
+
+    logger.info(f"Голосовое сообщение {duration} с разделено на {len(chunks)} частей")
+    return await transcribe_chunks(chunks, settings.VOICE_TRANSCRIBE_CONCURRENCY, on_progress)